@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class TopicConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "myapps.Topic"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from . import tasks  # noqa: F401  註冊背景工作處理函式
+        from .difficulty_registry import invalidate
+        from .leaderboard import forget
+        from .models import DifficultyLevels, UserFamiliarity
+
+        # 難度等級被修改或刪除時清除 process 內快取
+        post_save.connect(invalidate, sender=DifficultyLevels, dispatch_uid="difficulty_registry_save")
+        post_delete.connect(invalidate, sender=DifficultyLevels, dispatch_uid="difficulty_registry_delete")
+        # 熟悉度記錄被刪除時從排行分布扣除
+        post_delete.connect(forget, sender=UserFamiliarity, dispatch_uid="leaderboard_forget")
@@ -0,0 +1,163 @@
+# 作答紀錄與每日彙總
+# - record_attempts：SubmitAnswerView 在同一個交易內批次寫入 Attempt（一次提交一個 INSERT）
+# - rollup：以 Attempt.id 為水位，把新的作答增量加進 AttemptDailyRollup（python manage.py rollup_attempts）
+# - daily_stats：讀彙總（O(天數)），加上還沒彙總的最新作答
+# 彙總只處理 answered_at 早於 ATTEMPT_ROLLUP_SETTLE_SECONDS 秒前的作答，避免還沒提交的交易（id 較小）被水位跳過。
+import logging
+import os
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from myapps.log_utils import log_event
+from .models import Attempt, AttemptDailyRollup
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_ROLLUP_SETTLE_SECONDS = int(os.getenv("ATTEMPT_ROLLUP_SETTLE_SECONDS", "60"))
+
+ROLLUP_FIELDS = ("attempts", "correct", "runs")
+
+
+def record_attempts(user_id, quiz_id, source, answers):
+    """answers：[(topic_id, difficulty_id, 是否答對)]；同一次提交共用 answered_at"""
+    if not answers or quiz_id is None:
+        return 0
+    answered_at = timezone.now()
+    Attempt.objects.bulk_create([
+        Attempt(
+            user_id=user_id,
+            quiz_id=quiz_id,
+            topic_id=topic_id,
+            difficulty_id=difficulty_id or 1,
+            correct=bool(correct),
+            source=source,
+            answered_at=answered_at,
+        )
+        for topic_id, difficulty_id, correct in answers
+    ])
+    return len(answers)
+
+
+def watermark():
+    return AttemptDailyRollup.objects.aggregate(value=Max("last_attempt_id"))["value"] or 0
+
+
+def _grouped(queryset):
+    """依 (user, quiz, 日期, 難度) 彙總"""
+    return (
+        queryset.annotate(day=TruncDate("answered_at"))
+        .values("user_id", "quiz_id", "day", "difficulty_id")
+        .annotate(
+            attempts=Count("id"),
+            correct=Count("id", filter=Q(correct=True)),
+            runs=Count("answered_at", distinct=True, filter=Q(source=Attempt.SOURCE_RUN)),
+            last=Max("id"),
+        )
+        .order_by()
+    )
+
+
+def _next_upper(start, batch_size, cutoff):
+    """這一批可彙總的最大 Attempt.id；不跨過尚未穩定的作答，也不把同一次提交切成兩批"""
+    settled = Attempt.objects.filter(id__gt=start, answered_at__lte=cutoff)
+    unsettled = Attempt.objects.filter(id__gt=start, answered_at__gt=cutoff).aggregate(value=Min("id"))["value"]
+    if unsettled is not None:
+        # 上限取實際存在的 id（rollback 或自動遞增會留下空號，unsettled - 1 不一定有這一列）
+        settled = settled.filter(id__lt=unsettled)
+    ids = list(settled.order_by("id").values_list("id", flat=True)[:batch_size])
+    if not ids:
+        return None
+    last = Attempt.objects.filter(id=ids[-1]).values("user_id", "quiz_id", "answered_at").first()
+    if last is None:
+        return ids[-1]
+    return settled.filter(**last).aggregate(value=Max("id"))["value"]
+
+
+def rollup(batch_size=10000, settle_seconds=None):
+    """把水位之後的作答加進每日彙總，回傳 (處理的作答數, 更新的彙總列數)"""
+    settle = ATTEMPT_ROLLUP_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    cutoff = timezone.now() - timedelta(seconds=settle)
+    processed = touched = 0
+    while True:
+        with transaction.atomic():
+            start = watermark()
+            upper = _next_upper(start, batch_size, cutoff)
+            if upper is None:
+                break
+            groups = list(_grouped(Attempt.objects.filter(id__gt=start, id__lte=upper)))
+            keys = {(g["user_id"], g["quiz_id"], g["day"], g["difficulty_id"]) for g in groups}
+            existing = {
+                (row.user_id, row.quiz_id, row.day, row.difficulty_id): row
+                for row in AttemptDailyRollup.objects.select_for_update().filter(
+                    user_id__in={k[0] for k in keys},
+                    quiz_id__in={k[1] for k in keys},
+                    day__in={k[2] for k in keys},
+                )
+                if (row.user_id, row.quiz_id, row.day, row.difficulty_id) in keys
+            }
+            to_update, to_create = [], []
+            for g in groups:
+                key = (g["user_id"], g["quiz_id"], g["day"], g["difficulty_id"])
+                row = existing.get(key)
+                if row is None:
+                    row = AttemptDailyRollup(user_id=key[0], quiz_id=key[1], day=key[2], difficulty_id=key[3])
+                    to_create.append(row)
+                else:
+                    to_update.append(row)
+                for field in ROLLUP_FIELDS:
+                    setattr(row, field, getattr(row, field) + g[field])
+                # 水位記在這一批的所有列上，下一批從 upper 之後開始
+                row.last_attempt_id = upper
+            AttemptDailyRollup.objects.bulk_create(to_create, batch_size=1000)
+            AttemptDailyRollup.objects.bulk_update(to_update, [*ROLLUP_FIELDS, "last_attempt_id"], batch_size=1000)
+            processed += Attempt.objects.filter(id__gt=start, id__lte=upper).count()
+            touched += len(groups)
+    log_event(logger, logging.INFO, "作答彙總完成", attempts=processed, rows=touched)
+    return processed, touched
+
+
+def daily_stats(user_id, quiz_id=None, days=30):
+    """
+    用戶每日作答統計 [{day, quiz_topic_id, difficulty_id, attempts, correct, runs}]，依日期排序
+    讀 AttemptDailyRollup，再加上水位之後（尚未彙總）的作答
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rollups = AttemptDailyRollup.objects.filter(user_id=user_id, day__gte=since)
+    recent = Attempt.objects.filter(user_id=user_id, id__gt=watermark())
+    if quiz_id is not None:
+        rollups = rollups.filter(quiz_id=quiz_id)
+        recent = recent.filter(quiz_id=quiz_id)
+
+    stats = {}
+    rows = list(rollups.values("quiz_id", "day", "difficulty_id", *ROLLUP_FIELDS)) + list(_grouped(recent))
+    for row in rows:
+        if row["day"] < since:
+            continue
+        key = (row["day"], row["quiz_id"], row["difficulty_id"])
+        entry = stats.setdefault(key, {
+            "day": row["day"].isoformat(),
+            "quiz_topic_id": row["quiz_id"],
+            "difficulty_id": row["difficulty_id"],
+            **dict.fromkeys(ROLLUP_FIELDS, 0),
+        })
+        for field in ROLLUP_FIELDS:
+            entry[field] += row[field]
+    return [stats[key] for key in sorted(stats)]
+
+
+def totals_by_quiz(quiz_ids=None):
+    """{quiz_id: 作答題數}（所有來源），讀彙總加上尚未彙總的作答"""
+    rollups = AttemptDailyRollup.objects.all()
+    recent = Attempt.objects.filter(id__gt=watermark())
+    if quiz_ids is not None:
+        rollups = rollups.filter(quiz_id__in=quiz_ids)
+        recent = recent.filter(quiz_id__in=quiz_ids)
+    totals = {}
+    for queryset, aggregate in ((rollups, Sum("attempts")), (recent, Count("id"))):
+        for quiz_id, value in queryset.values("quiz_id").annotate(value=aggregate).order_by().values_list("quiz_id", "value"):
+            totals[quiz_id] = totals.get(quiz_id, 0) + value
+    return totals
@@ -0,0 +1,165 @@
+# AI 聊天上下文管理
+# 只把最近幾輪對話（在 token 預算內）原文送給 AI，更早的對話折疊成每個 (user, topic) 一份的滾動摘要。
+# 摘要是增量更新：每次只把「上次摘要之後、又被擠出預算」的對話連同舊摘要交給 Flask 重新濃縮，
+# 不會重算整段歷史，所以不論聊多久，每則訊息的查詢量與 prompt 大小都維持固定。
+# 折疊排入工作佇列（chat_fold，見 tasks.py），由 run_jobs 的 worker 執行，失敗時依退避時間重試。
+import logging
+import os
+
+import requests
+
+from myapps.log_utils import log_event
+from .jobs import QueueFull, enqueue
+from .models import Chat, ChatSummary, Job
+
+logger = logging.getLogger(__name__)
+
+FLASK_BASE_URL = os.getenv("FLASK_BASE_URL", "https://aaron-website9-ml.onrender.com")
+
+# 最近對話的 token 預算（不含摘要與系統提示）
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))
+# 尚未摘要、又不在預算內的對話累積超過這個量才觸發一次折疊，避免每則訊息都呼叫 AI
+CHAT_SUMMARY_TRIGGER_TOKENS = int(os.getenv("CHAT_SUMMARY_TRIGGER_TOKENS", "600"))
+# 每次最多讀取的未摘要對話筆數（摘要落後時也不會一次讀出整段歷史）
+CHAT_CONTEXT_MAX_ROWS = int(os.getenv("CHAT_CONTEXT_MAX_ROWS", "200"))
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓文字約 1 字 1 token，其他字元約 4 字 1 token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if '　' <= ch <= '鿿' or '가' <= ch <= '힯' or '＀' <= ch <= '￯')
+    return cjk + (len(text) - cjk + 3) // 4 + 4  # +4：每則訊息的角色標記開銷
+
+
+def split_recent(turns, budget):
+    """
+    turns 依時間由舊到新；從最新往回取，直到超過預算
+    回傳 (最近對話, 超出預算的較舊對話)；最新一則（當前訊息）一定保留
+    """
+    used = 0
+    start = len(turns)
+    for i in range(len(turns) - 1, -1, -1):
+        cost = estimate_tokens(turns[i]['content'])
+        if used + cost > budget and start < len(turns):
+            break
+        used += cost
+        start = i
+    return turns[start:], turns[:start]
+
+
+def _pending_chats(user_id, topic_id, summarized_until):
+    return Chat.objects.filter(
+        user_id=user_id,
+        topic_id=topic_id,
+        deleted_at__isnull=True,
+        id__gt=summarized_until,
+    )
+
+
+def _recent_window(user_id, topic_id, summarized_until):
+    """
+    讀最新的 CHAT_CONTEXT_MAX_ROWS 筆未摘要對話（由舊到新），依預算切開
+    回傳 (最近對話, 讀到的範圍內超出預算的對話, 讀取上限之外是否還有更早的未摘要對話)
+    """
+    rows = list(
+        _pending_chats(user_id, topic_id, summarized_until)
+        .order_by('-id').values('id', 'content', 'sender')[:CHAT_CONTEXT_MAX_ROWS + 1]
+    )
+    more = len(rows) > CHAT_CONTEXT_MAX_ROWS
+    rows = rows[:CHAT_CONTEXT_MAX_ROWS]
+    rows.reverse()
+    recent, overflow = split_recent(rows, CHAT_CONTEXT_TOKEN_BUDGET)
+    return recent, overflow, more
+
+
+def build_chat_context(user_id, topic_instance):
+    """
+    回傳 (chat_history, summary)
+    - chat_history：預算內的最近對話（由舊到新，最後一則是當前用戶訊息）
+    - summary：先前對話的摘要（沒有則為空字串）
+    超出預算的舊對話累積足夠時，排入 chat_fold 工作把它們折疊進摘要
+    """
+    state = ChatSummary.objects.filter(user_id=user_id, topic=topic_instance).values(
+        'summary', 'summarized_until'
+    ).first()
+    summary = state['summary'] if state else ''
+    summarized_until = state['summarized_until'] if state else 0
+
+    recent, overflow, more = _recent_window(user_id, topic_instance.id, summarized_until)
+    # 讀取上限之外還有更早的未摘要對話時，不論累積量多少都要折疊，否則它們永遠進不了上下文
+    if more or sum(estimate_tokens(t['content']) for t in overflow) >= CHAT_SUMMARY_TRIGGER_TOKENS:
+        schedule_fold(user_id, topic_instance.id, summarized_until)
+
+    history = [{'content': t['content'], 'sender': t['sender']} for t in recent]
+    return history, summary
+
+
+def schedule_fold(user_id, topic_id, summarized_until):
+    """排入一次摘要折疊（chat_fold 工作）；同一個 (user, topic) 已有等待中或執行中的折疊時不重複排入"""
+    pending = Job.objects.filter(
+        kind="chat_fold",
+        status__in=(Job.STATUS_QUEUED, Job.STATUS_RUNNING),
+        payload__user_id=user_id,
+        payload__topic_id=topic_id,
+    )
+    if pending.exists():
+        return False
+    try:
+        enqueue("chat_fold", {"user_id": user_id, "topic_id": topic_id, "summarized_until": summarized_until})
+    except QueueFull:
+        # 摘要只是附加資訊：沒排入時下一則訊息會再觸發
+        log_event(logger, logging.WARNING, "對話摘要未排入（佇列已滿）", user_id=user_id, topic_id=topic_id)
+        return False
+    return True
+
+
+def _summarize(summary, turns):
+    response = requests.post(
+        f'{FLASK_BASE_URL}/api/chat/summarize',
+        json={
+            'summary': summary,
+            'turns': [{'content': t['content'], 'sender': t['sender']} for t in turns],
+        },
+        timeout=(5, 30)
+    )
+    response.raise_for_status()
+    return response.json().get('summary', '').strip()
+
+
+def fold_overflow(user_id, topic_id, summarized_until):
+    """
+    把預算外的舊對話連同目前摘要交給 Flask 濃縮，回傳是否有更新
+    由 summarized_until 之後最舊的對話開始，每次最多 CHAT_CONTEXT_MAX_ROWS 筆，直到剩下的對話都在預算內；
+    每一批都以條件更新推進 summarized_until，中途失敗時已折疊的部分不會重做
+    """
+    state, _ = ChatSummary.objects.get_or_create(user_id=user_id, topic_id=topic_id)
+    if state.summarized_until != summarized_until:
+        return False  # 其他 worker 已經折疊過
+
+    recent, _, _ = _recent_window(user_id, topic_id, summarized_until)
+    if not recent:
+        return False
+    keep_from = recent[0]['id']  # 這一則（含）之後的對話原文送出，不需要摘要
+
+    summary = state.summary
+    folded = False
+    while True:
+        chunk = list(
+            _pending_chats(user_id, topic_id, summarized_until)
+            .filter(id__lt=keep_from).order_by('id').values('id', 'content', 'sender')[:CHAT_CONTEXT_MAX_ROWS]
+        )
+        if not chunk:
+            return folded
+        summary = _summarize(summary, chunk)
+        if not summary:
+            return folded
+
+        # 條件更新：只有在沒有人搶先折疊時才寫入
+        updated = ChatSummary.objects.filter(pk=state.pk, summarized_until=summarized_until).update(
+            summary=summary,
+            summarized_until=chunk[-1]['id'],
+        )
+        if updated != 1:
+            return folded
+        summarized_until = chunk[-1]['id']
+        folded = True
@@ -0,0 +1,114 @@
+# 難度等級快取
+# DifficultyLevels 只有幾筆，卻在每次提交答案時被查詢 1~3 次。這裡在 process 內載入一次，
+# 以不可變的 Level 物件提供 id / 名稱查詢，cap 與 alpha 也預先算好（與 services._get_cap / _get_alpha 相同）。
+# - DifficultyLevels 的 post_save / post_delete 會清除快取（於 TopicConfig.ready() 連接）
+# - 訊號只會通知目前的 process；其他 gunicorn worker 或 QuerySet.update() 的修改靠 DIFFICULTY_REGISTRY_TTL 過期重新載入
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping
+
+from .models import DifficultyLevels
+
+DIFFICULTY_REGISTRY_TTL = float(os.getenv("DIFFICULTY_REGISTRY_TTL", "300"))
+
+
+@dataclass(frozen=True)
+class Level:
+    id: int
+    name: str
+    familiarity_cap: Decimal
+    weight_coefficients: Mapping
+    created_at: datetime
+    cap: Decimal    # 熟悉度上限（0~1，4 位小數）
+    alpha: Decimal  # 權重平均的 alpha（4 位小數）
+
+    def to_instance(self):
+        """轉成未查詢資料庫的 DifficultyLevels 實例（給外鍵指派或序列化用），每次回傳新的物件"""
+        return DifficultyLevels(
+            id=self.id,
+            level_name=self.name,
+            familiarity_cap=self.familiarity_cap,
+            weight_coefficients=dict(self.weight_coefficients),
+            created_at=self.created_at,
+        )
+
+
+@dataclass(frozen=True)
+class Registry:
+    by_id: Mapping[int, Level]
+    by_name: Mapping[str, Level]
+    loaded_at: float
+
+
+_lock = threading.Lock()
+_registry = None
+
+
+def _load():
+    from .services import _get_alpha, _get_cap
+
+    levels = [
+        Level(
+            id=row.id,
+            name=row.level_name,
+            familiarity_cap=row.familiarity_cap,
+            weight_coefficients=MappingProxyType(dict(row.weight_coefficients or {})),
+            created_at=row.created_at,
+            cap=_get_cap(row),
+            alpha=_get_alpha(row),
+        )
+        for row in DifficultyLevels.objects.all()
+    ]
+    return Registry(
+        by_id=MappingProxyType({level.id: level for level in levels}),
+        by_name=MappingProxyType({level.name: level for level in levels}),
+        loaded_at=time.monotonic(),
+    )
+
+
+def get_registry():
+    global _registry
+    registry = _registry
+    if registry is None or time.monotonic() - registry.loaded_at > DIFFICULTY_REGISTRY_TTL:
+        with _lock:
+            registry = _registry
+            if registry is None or time.monotonic() - registry.loaded_at > DIFFICULTY_REGISTRY_TTL:
+                registry = _registry = _load()
+    return registry
+
+
+def invalidate(**kwargs):
+    """清除快取，下次查詢時重新載入（可直接作為訊號接收函式）"""
+    global _registry
+    with _lock:
+        _registry = None
+
+
+def get_level(level_id=None, name=None):
+    """依 id 或名稱取得 Level；找不到時與 ORM 一樣丟出 DifficultyLevels.DoesNotExist"""
+    registry = get_registry()
+    if level_id is not None:
+        level = registry.by_id.get(int(level_id))
+    elif name is not None:
+        level = registry.by_name.get(name)
+    else:
+        raise ValueError("difficulty_level_id 或 difficulty_level_name 需擇一提供")
+    if level is None:
+        raise DifficultyLevels.DoesNotExist(f"DifficultyLevels {level_id if level_id is not None else name} not found")
+    return level
+
+
+def level_or_default(name, default="beginner"):
+    """依名稱取得 Level，找不到時改用 default；兩者都沒有時回傳 None"""
+    registry = get_registry()
+    return registry.by_name.get(name) or registry.by_name.get(default)
+
+
+def instances():
+    """{id: DifficultyLevels 實例}，取代 DifficultyLevels.objects.all() 的查詢"""
+    return {level_id: level.to_instance() for level_id, level in get_registry().by_id.items()}
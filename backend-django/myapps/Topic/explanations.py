@@ -0,0 +1,129 @@
+# AI 題目解析
+# 解析結果依題目存進 TopicExplanation，之後的請求直接讀取，不再重新呼叫 AI。
+# 同一題同時只會有一個生成在進行：要開始生成的請求必須先以條件更新「認領」該筆記錄，
+# 認領成功的那一個才會排入 parse_answer 工作，其他請求只回傳目前狀態（跨 worker 也成立，靠的是資料庫而不是記憶體中的鎖）。
+# 實際呼叫 Flask 的是工作佇列的 worker（見 tasks.py），失敗會由佇列依退避時間重試。
+import logging
+import os
+from datetime import timedelta
+
+import requests
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from myapps.log_utils import log_event
+from .jobs import QueueFull, enqueue
+from .models import TopicExplanation
+
+logger = logging.getLogger(__name__)
+
+FLASK_BASE_URL = os.getenv("FLASK_BASE_URL", "https://aaron-website9-ml.onrender.com")
+
+# 生成中超過這個秒數仍未完成，視為 worker 中斷，允許下一個請求重新認領
+EXPLANATION_STALE_SECONDS = int(os.getenv("EXPLANATION_STALE_SECONDS", "120"))
+# 失敗超過這個次數就不再自動重試
+EXPLANATION_MAX_ATTEMPTS = int(os.getenv("EXPLANATION_MAX_ATTEMPTS", "3"))
+
+
+def answer_text(topic):
+    """正確答案選項的文字"""
+    return {
+        'A': topic.option_A,
+        'B': topic.option_B,
+        'C': topic.option_C,
+        'D': topic.option_D,
+    }.get(topic.Ai_answer, "選項不存在")
+
+
+def _claim(explanation):
+    """
+    嘗試認領一筆解析來生成，回傳是否認領成功
+    只有「失敗且未超過重試上限」或「生成中但已逾時」的記錄可以被認領；條件更新保證只有一個請求成功
+    """
+    now = timezone.now()
+    if explanation.status == TopicExplanation.STATUS_FAILED:
+        if explanation.attempts >= EXPLANATION_MAX_ATTEMPTS:
+            return False
+    elif explanation.status == TopicExplanation.STATUS_PENDING:
+        if explanation.updated_at > now - timedelta(seconds=EXPLANATION_STALE_SECONDS):
+            return False
+    else:
+        return False
+
+    updated = TopicExplanation.objects.filter(
+        pk=explanation.pk,
+        status=explanation.status,
+        updated_at=explanation.updated_at,
+    ).update(status=TopicExplanation.STATUS_PENDING, updated_at=now, error='')
+    if updated:
+        explanation.status = TopicExplanation.STATUS_PENDING
+        explanation.updated_at = now
+    return updated == 1
+
+
+def request_explanation(topic, user=None):
+    """
+    取得題目解析；需要時排入背景生成工作
+    回傳 (TopicExplanation, 這次是否開始了新的生成)；佇列已滿時丟出 QueueFull
+    """
+    try:
+        explanation, created = TopicExplanation.objects.get_or_create(topic=topic)
+    except IntegrityError:
+        # 另一個請求同時建立了同一題的記錄，由它負責生成
+        return TopicExplanation.objects.get(topic=topic), False
+
+    started = created or _claim(explanation)
+    if started:
+        payload = {"explanation_id": explanation.pk, "title": topic.title, "Ai_answer": answer_text(topic)}
+        try:
+            enqueue("parse_answer", payload, user=user, max_attempts=EXPLANATION_MAX_ATTEMPTS)
+        except QueueFull:
+            # 沒排進佇列就不算生成中，下一個請求可以再認領（不計入嘗試次數）
+            TopicExplanation.objects.filter(pk=explanation.pk).update(
+                status=TopicExplanation.STATUS_FAILED, error="queue full", updated_at=timezone.now()
+            )
+            raise
+    return explanation, started
+
+
+def generate_explanation(explanation_id, payload, final=True):
+    """
+    呼叫 Flask 生成解析並寫回資料庫，回傳是否成功
+    final=False 表示失敗後還會重試：狀態維持生成中，不讓其他請求重複排入
+    """
+    TopicExplanation.objects.filter(pk=explanation_id).update(
+        status=TopicExplanation.STATUS_PENDING, attempts=F('attempts') + 1, updated_at=timezone.now()
+    )
+    try:
+        response = requests.post(f'{FLASK_BASE_URL}/api/parse_answer', json=payload, timeout=(5, 45))
+        response.raise_for_status()
+        content = (response.json().get('parsed_answer') or '').strip()
+        if not content:
+            raise ValueError("empty parsed_answer")
+    except Exception as e:
+        log_event(logger, logging.ERROR, "題目解析生成失敗", explanation_id=explanation_id, error=str(e), final=final)
+        TopicExplanation.objects.filter(pk=explanation_id, status=TopicExplanation.STATUS_PENDING).update(
+            status=TopicExplanation.STATUS_FAILED if final else TopicExplanation.STATUS_PENDING,
+            error=str(e)[:500], updated_at=timezone.now()
+        )
+        return False
+
+    TopicExplanation.objects.filter(pk=explanation_id).update(
+        status=TopicExplanation.STATUS_READY, content=content, error='', updated_at=timezone.now()
+    )
+    log_event(logger, logging.INFO, "題目解析已完成", explanation_id=explanation_id, chars=len(content))
+    return True
+
+
+def serialize_explanation(explanation):
+    data = {
+        "topic_id": explanation.topic_id,
+        "status": explanation.status,
+        "updated_at": explanation.updated_at,
+    }
+    if explanation.status == TopicExplanation.STATUS_READY:
+        data["parsed_answer"] = explanation.content
+    elif explanation.status == TopicExplanation.STATUS_FAILED:
+        data["retryable"] = explanation.attempts < EXPLANATION_MAX_ATTEMPTS
+    return data
@@ -0,0 +1,230 @@
+# 熟悉度寫入緩衝（write-behind）
+# 連續玩同一個 Quiz 的好幾輪，每一輪都會對同一列 UserFamiliarity 做一次上鎖的讀改寫。
+# 開啟 services.FAMILIARITY_WRITE_BEHIND 後，同一個 (user, quiz_topic) 的提交先在記憶體中依序套用權重平均
+# （與 services.upsert_familiarity 相同的整數運算，結果完全一致），每個 key 在 FAMILIARITY_FLUSH_WINDOW 秒內只寫入一次。
+# - 第一次提交讀一次目前的記錄當作基準，之後同一個 key 的提交不碰資料庫，直接回傳套用後的熟悉度
+# - 寫入以「熟悉度仍等於基準值」為條件（樂觀鎖）；其他 process 先改過時重新讀取、重播尚未寫入的提交再寫
+# - 統計欄位以 F() 累加，與單題提交等其他寫入互不覆蓋
+# - 背景執行緒定期寫入到期的 key，process 結束時（atexit）全部寫入
+# 緩衝只存在於目前的 process：其他 gunicorn worker 在寫入前讀到的是資料庫裡的舊值（最多落後一個視窗）。
+import atexit
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from myapps.log_utils import log_event
+from .leaderboard import track as track_histogram
+from .models import Note, Quiz, UserFamiliarity
+from .review import next_review_at
+from .services import COUNTER_FIELDS, _familiarity_step, _next_familiarity_units
+
+logger = logging.getLogger(__name__)
+
+FAMILIARITY_FLUSH_WINDOW = float(os.getenv("FAMILIARITY_FLUSH_WINDOW", "2"))
+# 緩衝中的 key 超過此數量時，新的 key 直接寫入資料庫（不再緩衝）
+FAMILIARITY_BUFFER_MAX_KEYS = int(os.getenv("FAMILIARITY_BUFFER_MAX_KEYS", "10000"))
+# 樂觀鎖連續失敗的重試上限
+FLUSH_MAX_RETRIES = 5
+
+
+class _Pending:
+    """單一 (user, quiz_topic) 的緩衝：資料庫基準值與尚未寫入的提交"""
+
+    def __init__(self, user_id, quiz_topic_id, row):
+        self.user_id = user_id
+        self.quiz_topic_id = quiz_topic_id
+        self.lock = threading.Lock()
+        self.closed = False  # 已寫入並移出緩衝，之後的提交要建立新的 _Pending
+        self.rebase(row)
+        self.steps = []      # [(cap4, keep4, gain8)]，依提交順序
+        self.counters = dict.fromkeys(COUNTER_FIELDS, 0)
+        self.level_id = None
+        self.cap4 = None     # 最後一次提交的難度上限，用來排程下次複習
+        self.note_id = None
+        self.first_at = None
+
+    def rebase(self, row):
+        """row 為 (id, familiarity) 或 None（尚無記錄）"""
+        self.uf_id, self.base = row if row else (None, None)
+
+    @property
+    def base_units(self):
+        return int(self.base * 100) if self.base is not None else 0
+
+    def familiarity(self):
+        units = self.base_units
+        for cap4, keep4, gain8 in self.steps:
+            units = _next_familiarity_units(units, cap4, keep4, gain8)
+        return Decimal(units).scaleb(-2)
+
+
+_lock = threading.Lock()
+_pending = {}
+_flusher = None
+
+
+def _load(user_id, quiz_topic_id):
+    row = UserFamiliarity.objects.filter(user_id=user_id, quiz_topic_id=quiz_topic_id).values_list("id", "familiarity").first()
+    if row is None and not Quiz.objects.filter(pk=quiz_topic_id).exists():
+        raise Quiz.DoesNotExist(f"Quiz {quiz_topic_id} not found")
+    return row
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_loop, name="familiarity-flush", daemon=True)
+        _flusher.start()
+
+
+def submit(*, user, quiz_topic_id, note_id=None, **kwargs):
+    """
+    與 services.upsert_familiarity 相同的參數與回傳值，但只更新記憶體中的緩衝
+    緩衝已滿且是新的 key 時回傳 None，由呼叫端直接寫入資料庫
+    """
+    step = _familiarity_step(**kwargs)
+    key = (user.id, int(quiz_topic_id))
+    while True:
+        with _lock:
+            entry = _pending.get(key)
+            if entry is None and len(_pending) >= FAMILIARITY_BUFFER_MAX_KEYS:
+                return None
+        if entry is None:
+            # 讀取基準值時不持有全域鎖；兩個執行緒同時建立時以先放進去的為準
+            entry = _Pending(*key, _load(*key))
+            with _lock:
+                entry = _pending.setdefault(key, entry)
+                _ensure_flusher()
+        with entry.lock:
+            if entry.closed:
+                continue
+            entry.steps.append((step["cap4"], step["keep4"], step["gain8"]))
+            for field in COUNTER_FIELDS:
+                entry.counters[field] += step[field]
+            entry.level_id = step["level_id"]
+            entry.cap4 = step["cap4"]
+            if note_id is not None:
+                entry.note_id = note_id
+            if entry.first_at is None:
+                entry.first_at = time.monotonic()
+            return entry.familiarity()
+
+
+def pending_familiarity(user_id, quiz_topic_id=None):
+    """
+    尚未寫入資料庫的熟悉度
+    指定 quiz_topic_id 時回傳 Decimal 或 None；否則回傳該用戶所有 {quiz_topic_id: Decimal}
+    """
+    with _lock:
+        entries = [entry for (uid, qid), entry in _pending.items()
+                   if uid == user_id and (quiz_topic_id is None or qid == int(quiz_topic_id))]
+    result = {}
+    for entry in entries:
+        with entry.lock:
+            if entry.steps and not entry.closed:
+                result[entry.quiz_topic_id] = entry.familiarity()
+    if quiz_topic_id is not None:
+        return result.get(int(quiz_topic_id))
+    return result
+
+
+def _write(entry):
+    """把 entry 的提交寫成一個語句；呼叫端持有 entry.lock。基準值已被其他 process 改過時回傳 False"""
+    familiarity = entry.familiarity()
+    note_id = entry.note_id if entry.note_id and Note.objects.filter(pk=entry.note_id).exists() else None
+    now = timezone.now()
+    review_at = next_review_at(familiarity, Decimal(entry.cap4).scaleb(-4), base=now)
+    if entry.uf_id is None:
+        uf = UserFamiliarity(
+            user_id=entry.user_id,
+            quiz_topic_id=entry.quiz_topic_id,
+            note_id=note_id,
+            difficulty_level_id=entry.level_id,
+            familiarity=familiarity,
+            next_review_at=review_at,
+            **entry.counters,
+        )
+        with transaction.atomic():
+            uf.save(force_insert=True)
+        entry.rebase((uf.id, familiarity))
+        return True
+
+    values = {field: F(field) + value for field, value in entry.counters.items()}
+    if note_id is not None:
+        values["note_id"] = note_id
+    updated = UserFamiliarity.objects.filter(id=entry.uf_id, familiarity=entry.base).update(
+        familiarity=familiarity, difficulty_level_id=entry.level_id, next_review_at=review_at, updated_at=now, **values
+    )
+    if updated:
+        entry.rebase((entry.uf_id, familiarity))
+    return bool(updated)
+
+
+def _flush_entry(entry):
+    """寫入單一 key；其他 process 先改過熟悉度時重新讀取基準值後重試"""
+    with entry.lock:
+        if entry.closed or not entry.steps:
+            return
+        steps = len(entry.steps)
+        for _ in range(FLUSH_MAX_RETRIES):
+            try:
+                if _write(entry):
+                    break
+            except IntegrityError:
+                # 其他 process 在這段期間建立了同一個 key 的記錄
+                pass
+            row = UserFamiliarity.objects.filter(
+                user_id=entry.user_id, quiz_topic_id=entry.quiz_topic_id
+            ).values_list("id", "familiarity").first()
+            entry.rebase(row)
+        else:
+            log_event(logger, logging.WARNING, "熟悉度緩衝寫入衝突過多，保留至下次寫入",
+                      user_id=entry.user_id, quiz_topic_id=entry.quiz_topic_id, steps=steps)
+            return
+        # 已寫入；分布更新失敗只記錄，不能讓這些提交被重播
+        track_histogram(entry.uf_id, None, entry.base)
+        entry.steps.clear()
+        entry.counters = dict.fromkeys(COUNTER_FIELDS, 0)
+        entry.note_id = None
+        entry.first_at = None
+        entry.closed = True
+    with _lock:
+        if _pending.get((entry.user_id, entry.quiz_topic_id)) is entry:
+            del _pending[(entry.user_id, entry.quiz_topic_id)]
+    log_event(logger, logging.DEBUG, "熟悉度緩衝已寫入",
+              user_id=entry.user_id, quiz_topic_id=entry.quiz_topic_id, steps=steps)
+
+
+def flush(all_keys=False):
+    """寫入到期（或全部）的 key，回傳處理的 key 數"""
+    deadline = time.monotonic() - FAMILIARITY_FLUSH_WINDOW
+    with _lock:
+        entries = [entry for entry in _pending.values()
+                   if all_keys or (entry.first_at is not None and entry.first_at <= deadline)]
+    for entry in entries:
+        try:
+            _flush_entry(entry)
+        except Exception as e:
+            log_event(logger, logging.ERROR, "熟悉度緩衝寫入失敗",
+                      user_id=entry.user_id, quiz_topic_id=entry.quiz_topic_id, error=str(e))
+    return len(entries)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(max(FAMILIARITY_FLUSH_WINDOW / 2, 0.05))
+        close_old_connections()
+        flush()
+        close_old_connections()
+
+
+@atexit.register
+def _flush_on_exit():
+    if _pending:
+        flush(all_keys=True)
@@ -0,0 +1,71 @@
+# 熟悉度批次重算（NumPy）
+# 修改 DifficultyLevels 的 familiarity_cap 或 weight_coefficients['alpha'] 後，用新參數重播每個 (user, quiz) 的作答紀錄：
+#   new = old*(1-alpha) + accuracy*cap*alpha，已達上限（old >= cap）的那一輪不變
+# 所有數值換成整數定點（accuracy / cap / alpha 為 1e-4、熟悉度為 0.01%）計算，
+# 進位方式與 services.update_familiarity_weighted_average 的 Decimal 完全相同（quantize 預設 HALF_EVEN、百分比 HALF_UP）。
+#
+# 向量化方式：EMA 本身有先後順序，無法對同一個 key 平行；但不同 key 互不相關。
+# 把每一輪依「在該 key 中是第幾輪」分組，第 j 步一次更新所有擁有第 j 輪的 key，
+# 總共只需「最多輪數」次 NumPy 運算，與 key 的數量無關。
+import numpy as np
+
+SCALE = 10000  # accuracy / cap / alpha 以 1e-4 為單位
+
+
+def to_fixed(value):
+    """Decimal → 1e-4 定點整數（value 需已是 services._q 的結果）"""
+    return int(value * SCALE)
+
+
+def accuracy_fixed(correct, total):
+    """correct / total 以 1e-4 為單位，HALF_EVEN 進位（與 _q(correct / total) 相同）"""
+    correct = np.asarray(correct, dtype=np.int64)
+    total = np.asarray(total, dtype=np.int64)
+    q, r = np.divmod(correct * SCALE, total)
+    twice = 2 * r
+    round_up = (twice > total) | ((twice == total) & (q % 2 == 1))
+    return np.clip(q + round_up, 0, SCALE)
+
+
+def replay(keys, acc4, cap4, alpha4, n_keys, initial=None):
+    """
+    keys：每一輪所屬的 key 編號（0..n_keys-1），同一個 key 的輪次須依時間排序
+    acc4 / cap4 / alpha4：每一輪的正確率、上限、alpha（1e-4 定點）
+    initial：每個 key 的起始熟悉度（0.01% 單位），預設 0
+    回傳每個 key 的最終熟悉度（0.01% 單位，int64）
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    state = np.zeros(n_keys, dtype=np.int64) if initial is None else np.asarray(initial, dtype=np.int64).copy()
+    if len(keys) == 0:
+        return state
+
+    # 每一輪在所屬 key 中的序號：穩定排序後，以 key 區段起點相減
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_keys)) + 1]
+    lengths = np.diff(np.r_[starts, len(sorted_keys)])
+    position = np.arange(len(sorted_keys)) - np.repeat(starts, lengths)
+
+    # 依序號分組：by_step[j] 是所有 key 的第 j 輪
+    step_order = order[np.argsort(position, kind="stable")]
+    bounds = np.r_[0, np.cumsum(np.bincount(position))]
+
+    # this_run = (acc * cap).quantize(1e-4)，HALF_EVEN
+    product = np.asarray(acc4, dtype=np.int64) * np.asarray(cap4, dtype=np.int64)
+    q, r = np.divmod(product, SCALE)
+    this_run = q + ((2 * r > SCALE) | ((2 * r == SCALE) & (q % 2 == 1)))
+    cap4 = np.asarray(cap4, dtype=np.int64)
+    alpha4 = np.asarray(alpha4, dtype=np.int64)
+
+    for j in range(len(bounds) - 1):
+        idx = step_order[bounds[j]:bounds[j + 1]]
+        k = keys[idx]
+        old = state[k]
+        # old 與 cap 都換成 0.01% 單位比較（cap 1e-4 = 0.01%）
+        active = old < cap4[idx]
+        # new01 以 1e-8 為單位：old(1e-4) * (1-alpha)(1e-4) + this_run(1e-4) * alpha(1e-4)
+        new01 = np.clip(old * (SCALE - alpha4[idx]) + this_run[idx] * alpha4[idx], 0, SCALE * SCALE)
+        # 轉回百分比兩位小數（0.01% = 1e-4），HALF_UP
+        new_pct = (new01 + SCALE // 2) // SCALE
+        state[k] = np.where(active, new_pct, old)
+    return state
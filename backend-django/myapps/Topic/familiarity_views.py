@@ -6,11 +6,17 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from .models import DifficultyLevels, UserFamiliarity
 from .serializers import QuizSimplifiedSerializer
-from .services import update_familiarity_weighted_average, update_familiarity_weighted_average_optimized
+from .services import update_familiarity_weighted_average, update_familiarity_weighted_average_optimized, update_familiarity, FAMILIARITY_WRITE_BEHIND
+from .familiarity_buffer import pending_familiarity
+from .difficulty_registry import get_level
 from .models import DifficultyLevels , UserFamiliarity , Quiz
 from .serializers import UserFamiliaritySerializer ,QuizSimplifiedSerializer ,QuizSerializer
 from django.core.validators import MinValueValidator
 from decimal import Decimal
+from myapps.log_utils import log_sampled
+import logging
+
+logger = logging.getLogger(__name__)
 
 class SubmitAttemptView(APIView):
     permission_classes = [IsAuthenticated]
@@ -48,16 +54,9 @@ class SubmitAttemptView(APIView):
         correct_answers = request.data.get('correct_answers')
         accuracy = request.data.get('accuracy')
         
-        # 添加調試信息
-        print(f"=== SubmitAttemptView 調試信息 ===")
-        print(f"接收到的數據: {request.data}")
-        print(f"quiz_topic_id: {quiz_topic_id}")
-        print(f"difficulty_level_id: {difficulty_level_id}")
-        print(f"difficulty_level_name: {difficulty_level_name}")
-        print(f"total_questions: {total_questions}")
-        print(f"correct_answers: {correct_answers}")
-        print(f"accuracy: {accuracy}")
-        print("=" * 50)
+        log_sampled(logger, logging.INFO, "提交熟悉度計算", user_id=request.user.id, quiz_topic_id=quiz_topic_id,
+                    difficulty_level_id=difficulty_level_id, difficulty_level_name=difficulty_level_name,
+                    total_questions=total_questions, correct_answers=correct_answers, accuracy=accuracy)
 
         if quiz_topic_id is None:
             return Response({"error": "quiz_topic_id (or topic_id) is required"}, status=400)
@@ -65,8 +64,7 @@ class SubmitAttemptView(APIView):
         # 難度處理：支援 ID 或名稱
         if difficulty_level_id is not None:
             try:
-                difficulty_level = DifficultyLevels.objects.get(pk=difficulty_level_id)
-                difficulty_level_name = difficulty_level.level_name
+                difficulty_level_name = get_level(level_id=difficulty_level_id).name
             except DifficultyLevels.DoesNotExist:
                 return Response({"error": f"DifficultyLevels with ID {difficulty_level_id} not found"}, status=400)
         elif difficulty_level_name is None:
@@ -85,18 +83,22 @@ class SubmitAttemptView(APIView):
             ).first()
             
             if difficulty_level_id:
-                difficulty_level = DifficultyLevels.objects.get(pk=difficulty_level_id)
+                difficulty_level = get_level(level_id=difficulty_level_id)
             else:
-                difficulty_level = DifficultyLevels.objects.get(level_name=difficulty_level_name)
+                difficulty_level = get_level(name=difficulty_level_name)
             
             cap_pct = difficulty_level.familiarity_cap * 100  # 轉成百分比
             already_reached_cap = False
             
-            if current_uf and current_uf.familiarity >= cap_pct:
+            # 寫入緩衝中尚未寫入資料庫的值優先
+            current_familiarity = pending_familiarity(request.user.id, quiz_topic_id) if FAMILIARITY_WRITE_BEHIND else None
+            if current_familiarity is None and current_uf:
+                current_familiarity = current_uf.familiarity
+            if current_familiarity is not None and current_familiarity >= cap_pct:
                 already_reached_cap = True
 
-            # 呼叫服務函數（使用優化版本提升性能）
-            new_fam = update_familiarity_weighted_average_optimized(
+            # 呼叫服務函數（預設為單一 SQL 的 upsert，見 services.FAMILIARITY_UPSERT）
+            new_fam = update_familiarity(
                 user=request.user,
                 quiz_topic_id=quiz_topic_id,
                 difficulty_level_name=difficulty_level_name,
@@ -125,6 +127,8 @@ class SubmitAttemptView(APIView):
         try:
             # 獲取用戶的所有熟悉度記錄，並使用 select_related 或 prefetch_related 優化查詢
             familiarities = UserFamiliarity.objects.filter(user=user, quiz_topic__deleted_at__isnull=True).select_related('quiz_topic')
+            # 寫入緩衝中尚未寫入資料庫的值優先
+            pending = pending_familiarity(user.id) if FAMILIARITY_WRITE_BEHIND else {}
             # 將結果序列化
             data = []
             for uf in familiarities:
@@ -140,7 +144,14 @@ class SubmitAttemptView(APIView):
                 
                 data.append({
                     "quiz_topic": quiz_topic_data,
-                    "familiarity": float(uf.familiarity)
+                    "familiarity": float(pending.pop(uf.quiz_topic_id, uf.familiarity))
+                })
+
+            # 還沒寫入資料庫的新記錄（與上面相同，不列出已軟刪除的 Quiz）
+            for quiz in Quiz.objects.filter(id__in=list(pending), deleted_at__isnull=True):
+                data.append({
+                    "quiz_topic": QuizSimplifiedSerializer(quiz).data,
+                    "familiarity": float(pending[quiz.id])
                 })
 
             return Response(data)
@@ -0,0 +1,170 @@
+# 背景工作佇列（以資料庫為儲存）
+# - enqueue：把工作寫進 Job 資料表；等待中的工作超過上限時丟出 QueueFull，由呼叫端回應 503（背壓）
+# - claim_jobs：worker 以 SELECT ... FOR UPDATE SKIP LOCKED 取出可執行的工作，多個 worker 不會拿到同一筆
+# - run_job：執行註冊的處理函式；失敗時依指數退避（加隨機抖動）重新排入，超過 max_attempts 標記為 failed
+# - requeue_stale：執行中卻超過 JOBS_LOCK_TIMEOUT 沒結束的工作（worker 被重啟、當機）重新排入
+# 工作由 `python manage.py run_jobs` 執行；處理函式定義在 tasks.py，於 TopicConfig.ready() 匯入時註冊
+import logging
+import os
+import random
+import socket
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from myapps.log_utils import log_event, truncate
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# 等待中的工作數上限，超過時拒絕新工作
+JOBS_MAX_QUEUED = int(os.getenv("JOBS_MAX_QUEUED", "1000"))
+JOBS_DEFAULT_MAX_ATTEMPTS = int(os.getenv("JOBS_DEFAULT_MAX_ATTEMPTS", "3"))
+# 第 n 次失敗後等待 JOBS_BACKOFF_BASE * 2^(n-1) 秒（不超過 JOBS_BACKOFF_MAX）再重試
+JOBS_BACKOFF_BASE = float(os.getenv("JOBS_BACKOFF_BASE", "5"))
+JOBS_BACKOFF_MAX = float(os.getenv("JOBS_BACKOFF_MAX", "600"))
+# 執行超過這個秒數仍未結束，視為 worker 中斷
+JOBS_LOCK_TIMEOUT = int(os.getenv("JOBS_LOCK_TIMEOUT", "300"))
+
+# kind -> 處理函式 handler(job)，回傳值（需可 JSON 序列化）存進 job.result
+HANDLERS = {}
+
+
+class QueueFull(Exception):
+    """等待中的工作已達 JOBS_MAX_QUEUED"""
+
+
+def register(kind):
+    """註冊工作處理函式的裝飾器"""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, user=None, priority=0, delay=0, max_attempts=None):
+    """
+    建立一筆工作並回傳 Job
+    在交易內呼叫時，工作會跟著交易一起提交（rollback 就不會執行），worker 只看得到已提交的工作
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"unknown job kind: {kind}")
+    if Job.objects.filter(status=Job.STATUS_QUEUED).count() >= JOBS_MAX_QUEUED:
+        log_event(logger, logging.WARNING, "工作佇列已滿，拒絕新工作", kind=kind, limit=JOBS_MAX_QUEUED)
+        raise QueueFull(kind)
+    job = Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        user=user,
+        priority=priority,
+        max_attempts=max_attempts or JOBS_DEFAULT_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    log_event(logger, logging.DEBUG, "工作已排入", job_id=job.id, kind=kind, priority=priority)
+    return job
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_jobs(worker_id, limit, kinds=None):
+    """取出最多 limit 筆可執行的工作並標記為 running，回傳 Job 列表"""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = Job.objects.filter(status=Job.STATUS_QUEUED, run_after__lte=now)
+        if kinds:
+            queryset = queryset.filter(kind__in=kinds)
+        # SQLite 不支援 FOR UPDATE，Django 會忽略；下面的條件更新仍保證同一筆只會被一個 worker 取走
+        candidates = list(
+            queryset.select_for_update(skip_locked=True)
+            .order_by('-priority', 'run_after', 'id')[:limit]
+        )
+        claimed = []
+        for job in candidates:
+            updated = Job.objects.filter(pk=job.pk, status=Job.STATUS_QUEUED).update(
+                status=Job.STATUS_RUNNING, locked_by=worker_id, locked_at=now,
+                attempts=F('attempts') + 1, updated_at=now,
+            )
+            if updated:
+                job.status = Job.STATUS_RUNNING
+                job.locked_by = worker_id
+                job.locked_at = now
+                job.attempts += 1
+                claimed.append(job)
+    return claimed
+
+
+def backoff_seconds(attempts):
+    delay = min(JOBS_BACKOFF_BASE * (2 ** max(attempts - 1, 0)), JOBS_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _finish(job, **fields):
+    """只在工作仍由這個 worker 持有時寫回結果（被 requeue_stale 收回的就不覆寫）"""
+    fields["updated_at"] = timezone.now()
+    return Job.objects.filter(
+        pk=job.pk, status=Job.STATUS_RUNNING, locked_by=job.locked_by, attempts=job.attempts
+    ).update(locked_at=None, **fields)
+
+
+def run_job(job):
+    """執行一筆已取出的工作，回傳最後的狀態"""
+    handler = HANDLERS.get(job.kind)
+    started = timezone.now()
+    try:
+        if handler is None:
+            raise LookupError(f"no handler registered for {job.kind}")
+        result = handler(job)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if job.attempts < job.max_attempts:
+            delay = backoff_seconds(job.attempts)
+            _finish(job, status=Job.STATUS_QUEUED, last_error=error[:2000],
+                    run_after=timezone.now() + timedelta(seconds=delay))
+            log_event(logger, logging.WARNING, "工作失敗，稍後重試", job_id=job.id, kind=job.kind,
+                      attempts=job.attempts, retry_in=round(delay, 1), error=truncate(error))
+            return Job.STATUS_QUEUED
+        _finish(job, status=Job.STATUS_FAILED, last_error=error[:2000], finished_at=timezone.now())
+        log_event(logger, logging.ERROR, "工作重試次數用盡", job_id=job.id, kind=job.kind,
+                  attempts=job.attempts, error=truncate(error))
+        return Job.STATUS_FAILED
+
+    _finish(job, status=Job.STATUS_SUCCEEDED, result=result, last_error='', finished_at=timezone.now())
+    log_event(logger, logging.INFO, "工作完成", job_id=job.id, kind=job.kind, attempts=job.attempts,
+              elapsed_ms=round((timezone.now() - started).total_seconds() * 1000))
+    return Job.STATUS_SUCCEEDED
+
+
+def requeue_stale():
+    """把執行逾時的工作重新排入（已用盡次數的直接標記失敗），回傳處理筆數"""
+    cutoff = timezone.now() - timedelta(seconds=JOBS_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=cutoff)
+    now = timezone.now()
+    error = f"worker 逾時 {JOBS_LOCK_TIMEOUT} 秒未回報，視為中斷"
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED, locked_at=None, last_error=error, finished_at=now, updated_at=now,
+    )
+    requeued = stale.update(status=Job.STATUS_QUEUED, locked_at=None, last_error=error, run_after=now, updated_at=now)
+    if failed or requeued:
+        log_event(logger, logging.WARNING, "收回逾時的工作", requeued=requeued, failed=failed)
+    return failed + requeued
+
+
+def serialize_job(job):
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "run_after": job.run_after,
+        "last_error": job.last_error,
+        "result": job.result,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
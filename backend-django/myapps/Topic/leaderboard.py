@@ -0,0 +1,172 @@
+# 熟悉度排行與百分位
+# 每個題目名稱（Quiz.quiz_topic，不同用戶的同名 Quiz 視為同一個題目）維護一份熟悉度分布：
+# FamiliarityHistogram 以 1% 為一格（0~100 共 101 格），每個 (user, quiz) 計一筆。
+# UserFamiliarity.histogram_bucket 記錄該列目前計在哪一格，熟悉度跨格時才需要搬移（-1 / +1），
+# 以 select_for_update 讀取該欄位後更新，可重複呼叫、不會重複計數。
+# - 百分位：讀該題目的 101 格，O(格數)，不排序 UserFamiliarity
+# - 前 N 名：由分布找出第 N 名所在的格，只讀 histogram_bucket 不低於該格的列
+# 軟刪除的 Quiz 仍計入分布；分布有偏差時以 python manage.py rebuild_leaderboard 重建。
+import logging
+
+from django.db import transaction
+from django.db.models import F
+
+from myapps.log_utils import log_event
+from .models import FamiliarityHistogram, Quiz, UserFamiliarity
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = 101
+
+
+def bucket_of(familiarity):
+    """熟悉度（0~100）所在的格；無條件捨去到整數百分比"""
+    return min(max(int(familiarity), 0), BUCKETS - 1)
+
+
+def _apply(deltas):
+    """deltas：{(topic, bucket): 增減數}，一格一個 UPDATE，沒有的格新建；依固定順序更新避免互相等鎖"""
+    for (topic, bucket), delta in sorted(deltas.items()):
+        if delta == 0:
+            continue
+        updated = FamiliarityHistogram.objects.filter(topic=topic, bucket=bucket).update(count=F("count") + delta)
+        if not updated:
+            _, created = FamiliarityHistogram.objects.get_or_create(topic=topic, bucket=bucket, defaults={"count": delta})
+            if not created:
+                FamiliarityHistogram.objects.filter(topic=topic, bucket=bucket).update(count=F("count") + delta)
+
+
+def sync_buckets(uf_ids):
+    """把這些 UserFamiliarity 搬到目前熟悉度所在的格，回傳搬移的列數"""
+    if not uf_ids:
+        return 0
+    with transaction.atomic():
+        rows = list(
+            UserFamiliarity.objects.select_for_update(of=("self",))
+            .filter(id__in=uf_ids)
+            .values_list("id", "familiarity", "histogram_bucket", "quiz_topic__quiz_topic")
+        )
+        deltas = {}
+        moved = []
+        for uf_id, familiarity, old_bucket, topic in rows:
+            new_bucket = bucket_of(familiarity)
+            if new_bucket == old_bucket:
+                continue
+            if old_bucket is not None:
+                deltas[(topic, old_bucket)] = deltas.get((topic, old_bucket), 0) - 1
+            deltas[(topic, new_bucket)] = deltas.get((topic, new_bucket), 0) + 1
+            moved.append(UserFamiliarity(id=uf_id, histogram_bucket=new_bucket))
+        if moved:
+            UserFamiliarity.objects.bulk_update(moved, ["histogram_bucket"], batch_size=1000)
+            _apply(deltas)
+    return len(moved)
+
+
+def track(uf_id, old_bucket, familiarity):
+    """熟悉度更新後呼叫：仍在原本的格就不碰資料庫"""
+    if old_bucket is not None and bucket_of(familiarity) == old_bucket:
+        return
+    try:
+        sync_buckets([uf_id])
+    except Exception as e:
+        # 排行只是附加資訊，不影響熟悉度本身；偏差由 rebuild_leaderboard 修正
+        log_event(logger, logging.WARNING, "熟悉度分布更新失敗", uf_id=uf_id, error=str(e))
+
+
+def forget(sender, instance, **kwargs):
+    """UserFamiliarity 被刪除時扣掉它所在的格（post_delete 訊號，於 TopicConfig.ready() 連接）"""
+    if instance.histogram_bucket is None:
+        return
+    topic = Quiz.all_objects.filter(id=instance.quiz_topic_id).values_list("quiz_topic", flat=True).first()
+    if topic is not None:
+        _apply({(topic, instance.histogram_bucket): -1})
+
+
+def rename_topic(quiz_id, old_topic, new_topic):
+    """Quiz 改名時，把它的熟悉度從舊題目的分布搬到新題目"""
+    if old_topic == new_topic:
+        return
+    with transaction.atomic():
+        deltas = {}
+        for bucket in UserFamiliarity.objects.select_for_update().filter(
+            quiz_topic_id=quiz_id, histogram_bucket__isnull=False
+        ).values_list("histogram_bucket", flat=True):
+            deltas[(old_topic, bucket)] = deltas.get((old_topic, bucket), 0) - 1
+            deltas[(new_topic, bucket)] = deltas.get((new_topic, bucket), 0) + 1
+        _apply(deltas)
+
+
+def histogram(topic):
+    counts = [0] * BUCKETS
+    for bucket, count in FamiliarityHistogram.objects.filter(topic=topic).values_list("bucket", "count"):
+        counts[bucket] = max(count, 0)
+    return counts
+
+
+def percentile(topic, familiarity):
+    """
+    熟悉度在該題目中的百分位（0~100）：低於這一格的人數加上同一格的一半，除以總人數
+    回傳 (百分位, 總人數)；沒有人時百分位為 None
+    """
+    counts = histogram(topic)
+    total = sum(counts)
+    if total == 0:
+        return None, 0
+    bucket = bucket_of(familiarity)
+    below = sum(counts[:bucket])
+    return round((below + counts[bucket] / 2) / total * 100, 1), total
+
+
+def top(topic, limit=10):
+    """
+    前 N 名 [(user_id, username, familiarity)]
+    由分布找出第 N 名所在的格，只讀 histogram_bucket 不低於該格的列（idx_uf_quiz_bucket 範圍讀取），
+    排序只發生在這幾格的列上，不會把整個題目的 UserFamiliarity 拿來 filesort
+    """
+    counts = histogram(topic)
+    seen = 0
+    floor = 0
+    for bucket in range(BUCKETS - 1, -1, -1):
+        seen += counts[bucket]
+        if seen >= limit:
+            floor = bucket
+            break
+    quiz_ids = Quiz.objects.filter(quiz_topic=topic).values("id")
+    queryset = UserFamiliarity.objects.filter(quiz_topic__in=quiz_ids).order_by(
+        "-familiarity", "updated_at"
+    ).values_list("user_id", "user__username", "familiarity")
+    rows = list(queryset.filter(histogram_bucket__gte=floor)[:limit])
+    if len(rows) < limit and floor > 0:
+        # 分布含軟刪除的 Quiz（也可能有尚未計入分布的列），範圍內不足 N 筆時才放寬
+        rows = list(queryset[:limit])
+    return rows
+
+
+def rebuild(chunk_size=5000):
+    """由 UserFamiliarity 重新計算所有分布與 histogram_bucket，回傳 (列數, 修正的列數)"""
+    counts = {}
+    moved = []
+    total = fixed = 0
+    with transaction.atomic():
+        rows = UserFamiliarity.objects.select_for_update(of=("self",)).values_list(
+            "id", "familiarity", "histogram_bucket", "quiz_topic__quiz_topic"
+        )
+        for uf_id, familiarity, old_bucket, topic in rows.iterator(chunk_size=chunk_size):
+            bucket = bucket_of(familiarity)
+            counts[(topic, bucket)] = counts.get((topic, bucket), 0) + 1
+            total += 1
+            if bucket != old_bucket:
+                moved.append(UserFamiliarity(id=uf_id, histogram_bucket=bucket))
+                if len(moved) >= chunk_size:
+                    UserFamiliarity.objects.bulk_update(moved, ["histogram_bucket"])
+                    fixed += len(moved)
+                    moved = []
+        if moved:
+            UserFamiliarity.objects.bulk_update(moved, ["histogram_bucket"])
+            fixed += len(moved)
+        FamiliarityHistogram.objects.all().delete()
+        FamiliarityHistogram.objects.bulk_create(
+            [FamiliarityHistogram(topic=topic, bucket=bucket, count=count) for (topic, bucket), count in counts.items()],
+            batch_size=1000,
+        )
+    return total, fixed
@@ -0,0 +1,77 @@
+# 熟悉度排行 API（計算方式見 leaderboard.py）
+# GET /api/leaderboard/percentile/?quiz_topic_id=12     目前用戶在該題目的百分位
+# GET /api/leaderboard/top/?quiz_topic_id=12&n=10      該題目的前 N 名（也可用 ?topic=題目名稱）
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .familiarity_buffer import pending_familiarity
+from .leaderboard import percentile, top
+from .models import Quiz, UserFamiliarity
+from .services import FAMILIARITY_WRITE_BEHIND
+
+TOP_MAX = 100
+
+
+def _quiz_id(request):
+    try:
+        return int(request.query_params["quiz_topic_id"])
+    except (KeyError, ValueError):
+        return None
+
+
+class LeaderboardPercentileView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        quiz_topic_id = _quiz_id(request)
+        if quiz_topic_id is None:
+            return Response({"error": "quiz_topic_id is required"}, status=400)
+        quiz = Quiz.objects.filter(id=quiz_topic_id, user=request.user).values_list("quiz_topic", flat=True).first()
+        if quiz is None:
+            return Response({"error": f"Quiz with ID {quiz_topic_id} not found"}, status=404)
+
+        familiarity = pending_familiarity(request.user.id, quiz_topic_id) if FAMILIARITY_WRITE_BEHIND else None
+        if familiarity is None:
+            familiarity = UserFamiliarity.objects.filter(
+                user=request.user, quiz_topic_id=quiz_topic_id
+            ).values_list("familiarity", flat=True).first()
+        if familiarity is None:
+            return Response({"error": "No familiarity record for this quiz"}, status=404)
+
+        value, total = percentile(quiz, familiarity)
+        return Response({
+            "quiz_topic_id": quiz_topic_id,
+            "topic": quiz,
+            "familiarity": float(familiarity),
+            "percentile": value,
+            "total": total,
+        })
+
+
+class LeaderboardTopView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get("n", 10)), 1), TOP_MAX)
+        except ValueError:
+            return Response({"error": "n must be an integer"}, status=400)
+
+        topic = request.query_params.get("topic")
+        if not topic:
+            quiz_topic_id = _quiz_id(request)
+            if quiz_topic_id is None:
+                return Response({"error": "quiz_topic_id or topic is required"}, status=400)
+            topic = Quiz.objects.filter(id=quiz_topic_id).values_list("quiz_topic", flat=True).first()
+            if topic is None:
+                return Response({"error": f"Quiz with ID {quiz_topic_id} not found"}, status=404)
+
+        rows = top(topic, limit)
+        return Response({
+            "topic": topic,
+            "results": [
+                {"rank": rank, "user_id": user_id, "username": username, "familiarity": float(familiarity)}
+                for rank, (user_id, username, familiarity) in enumerate(rows, 1)
+            ],
+        })
@@ -0,0 +1,112 @@
+# 熟悉度更新的兩種派送方式延遲比較
+#   python manage.py bench_familiarity_dispatch --iterations 200
+#   python manage.py bench_familiarity_dispatch --base-url http://127.0.0.1:8000   # 打已啟動的 gunicorn
+# - http：舊做法，POST 自己的 /api/familiarity/（含 HTTP、JWT 驗證、另一個 worker 的處理）
+# - inprocess：SubmitAnswerView 現在的做法，交易提交後直接呼叫 services
+# 只會寫入專用的測試用戶與 Quiz，結束時刪除（--keep 保留）
+import statistics
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+import requests
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from rest_framework_simplejwt.tokens import AccessToken
+
+from myapps.Authorization.models import User
+from myapps.Topic.models import DifficultyLevels, Quiz, UserFamiliarity
+from myapps.Topic.services import apply_familiarity_submission
+
+BENCH_USERNAME = "bench_familiarity_user"
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        "max": ordered[-1],
+    }
+
+
+class Command(BaseCommand):
+    help = "比較熟悉度更新走 HTTP 自我呼叫與 process 內呼叫的延遲"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=100)
+        parser.add_argument("--base-url", help="已啟動的 Django 服務網址（省略時在本 process 內啟動一個 WSGI 伺服器）")
+        parser.add_argument("--difficulty", default="beginner")
+        parser.add_argument("--keep", action="store_true", help="保留測試用戶與資料")
+
+    def handle(self, *args, **options):
+        if not DifficultyLevels.objects.filter(level_name=options["difficulty"]).exists():
+            self.stderr.write(self.style.ERROR(f"找不到難度 {options['difficulty']}"))
+            return
+
+        user, _ = User.objects.get_or_create(
+            username=BENCH_USERNAME, defaults={"email": f"{BENCH_USERNAME}@example.com"}
+        )
+        quizzes = {path: Quiz.objects.create(quiz_topic=f"bench familiarity {path}", user=user)
+                   for path in ("http", "inprocess")}
+
+        server = None
+        base_url = options["base_url"]
+        if not base_url:
+            server = make_server("127.0.0.1", 0, get_wsgi_application(), handler_class=_QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+
+        def payload(path, i):
+            return {
+                "quiz_topic_id": quizzes[path].id,
+                "difficulty_level": options["difficulty"],
+                "total_questions": 5,
+                "correct_answers": i % 6,
+            }
+
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {AccessToken.for_user(user)}"
+
+        def via_http(i):
+            response = session.post(f"{base_url}/api/familiarity/", json=payload("http", i), timeout=30)
+            response.raise_for_status()
+            return response.json()["familiarity"]
+
+        def in_process(i):
+            return apply_familiarity_submission(user, payload("inprocess", i))["familiarity"]
+
+        results = {}
+        try:
+            for name, func in (("http", via_http), ("inprocess", in_process)):
+                func(0)  # 暖機（建立連線、載入 URLConf）
+                samples = []
+                for i in range(options["iterations"]):
+                    start = time.perf_counter()
+                    func(i)
+                    samples.append((time.perf_counter() - start) * 1000)
+                results[name] = _summary(samples)
+
+            # 兩種方式算出的熟悉度必須一致
+            values = list(UserFamiliarity.objects.filter(user=user).order_by("quiz_topic_id").values_list("familiarity", flat=True))
+        finally:
+            if server:
+                server.shutdown()
+            if not options["keep"]:
+                UserFamiliarity.objects.filter(user=user).delete()
+                Quiz.all_objects.filter(user=user).delete()
+                user.delete()
+
+        self.stdout.write(f"{'方式':<12}{'平均 ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        self.stdout.write("-" * 52)
+        for name, s in results.items():
+            self.stdout.write(f"{name:<12}{s['mean']:>10.2f}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['max']:>10.2f}")
+        if len(results) == 2:
+            self.stdout.write(f"\nhttp / inprocess（平均）= {results['http']['mean'] / results['inprocess']['mean']:.1f}x")
+        self.stdout.write(f"最終熟悉度 http / inprocess：{[float(v) for v in values]}")
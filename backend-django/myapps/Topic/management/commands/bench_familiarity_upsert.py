@@ -0,0 +1,318 @@
+# 熟悉度更新在併發提交下的吞吐量、延遲與鎖競爭比較
+#   python manage.py bench_familiarity_upsert --threads 1 4 8 --iterations 200 --quizzes 4
+#   python manage.py bench_familiarity_upsert --threads 8 --layout per-thread   # 併發下比對最終熟悉度
+# - weighted：update_familiarity_weighted_average（select_for_update 後 5~7 次往返）
+# - optimized：update_familiarity_weighted_average_optimized
+# - upsert：upsert_familiarity（單一 INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE）
+# 第一個會取得列鎖 / 寫鎖的語句（FOR UPDATE、INSERT、UPDATE）：
+# - 等鎖時間 = 該語句的執行時間（包含等待其他交易釋放鎖）
+# - 持鎖時間 = 該語句完成到交易提交
+# - 等鎖次數 = 等鎖時間超過 --wait-threshold 毫秒的提交數；死結 / 鎖逾時依資料庫錯誤分類
+# 每個執行緒依自己的種子產生一串隨機提交，每種方式重播同一組提交流：
+# - shared：所有執行緒共用 --quizzes 個 Quiz，競爭最激烈；最終熟悉度取決於交錯順序，只檢查統計欄位沒有遺失更新
+# - per-thread：每個執行緒各自 --quizzes 個 Quiz，同一列的提交順序固定，三種方式的最終熟悉度必須完全相同
+#   （SQLite 整個資料庫只有一把寫鎖，仍然互相競爭；MySQL 只剩索引與 gap lock 的競爭）
+# --verify 另外以單執行緒隨機序列逐步比對三種方式；任何不一致都會讓指令以錯誤結束
+# MySQL：以 DB_ENGINE=django.db.backends.mysql 與 DB_HOST / DB_PORT 等指向本機的 MySQL / MariaDB（見 OPTIMIZATION_SUMMARY.md），
+# 先 migrate 再執行；不要指向正式資料庫。
+# 只會寫入專用的測試用戶與 Quiz，結束時刪除（--keep 保留）
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+
+from myapps.Authorization.models import User
+from myapps.Topic.difficulty_registry import get_registry
+from myapps.Topic.models import Quiz, UserFamiliarity
+from myapps.Topic.services import (
+    _familiarity_step,
+    _next_familiarity_units,
+    update_familiarity_weighted_average,
+    update_familiarity_weighted_average_optimized,
+    upsert_familiarity,
+)
+
+BENCH_USERNAME = "bench_familiarity_upsert_user"
+
+FUNCTIONS = {
+    "weighted": update_familiarity_weighted_average,
+    "optimized": update_familiarity_weighted_average_optimized,
+    "upsert": upsert_familiarity,
+}
+
+VERIFY_FIELDS = ("familiarity", "total_questions", "correct_answers", "weighted_total", "weighted_correct", "cap_weighted_sum")
+
+
+def _is_locking(sql):
+    head = sql.lstrip()[:6].upper()
+    return head in ("INSERT", "UPDATE") or "FOR UPDATE" in sql.upper()
+
+
+def _percentile(ordered, p):
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def _classify(error, elapsed):
+    """
+    資料庫錯誤分類：MySQL 1213 死結 / 1205 鎖逾時
+    SQLite 兩者都是 'database is locked'：沒等滿 busy timeout 就失敗的，是 deferred 交易由讀鎖升級寫鎖時
+    與另一個寫入者互等（SQLite 直接放棄其中一方），視為死結
+    """
+    code = error.args[0] if error.args and isinstance(error.args[0], int) else None
+    message = str(error).lower()
+    if code == 1213 or "deadlock" in message:
+        return "deadlocks"
+    if "database is locked" in message:
+        timeout = connection.settings_dict.get("OPTIONS", {}).get("timeout", 5)
+        return "deadlocks" if elapsed < timeout * 0.9 else "lock_timeouts"
+    if code == 1205 or "lock wait timeout" in message:
+        return "lock_timeouts"
+    return "other_errors"
+
+
+def _stream(seed, iterations, quizzes, levels):
+    """一個執行緒的提交流 [(Quiz 索引, 難度, 題數, 答對數)]；同一個種子每種方式都相同"""
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(iterations):
+        total = rng.randint(1, 10)
+        stream.append((rng.randrange(quizzes), rng.choice(levels), total, rng.randint(0, total)))
+    return stream
+
+
+class Command(BaseCommand):
+    help = "比較三種熟悉度更新方式在併發提交下的吞吐量、延遲與鎖競爭，並比對結果"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, nargs="+", default=[8], help="執行緒數（可指定多個，依序量測）")
+        parser.add_argument("--iterations", type=int, default=100, help="每個執行緒的提交次數")
+        parser.add_argument("--quizzes", type=int, default=4, help="Quiz 數（shared：全部共用；per-thread：每個執行緒各自）")
+        parser.add_argument("--layout", choices=["shared", "per-thread"], default="shared", help="執行緒是否共用 Quiz")
+        parser.add_argument("--wait-threshold", type=float, default=1.0, help="等鎖超過幾毫秒計為一次等鎖")
+        parser.add_argument("--only", choices=sorted(FUNCTIONS), action="append", help="只測這些方式（可重複指定）")
+        parser.add_argument("--verify", type=int, default=200, help="結果比對的隨機序列數（0 = 不比對）")
+        parser.add_argument("--keep", action="store_true", help="保留測試用戶與資料")
+
+    def handle(self, *args, **options):
+        levels = [level.name for level in get_registry().by_id.values()]
+        if not levels:
+            self.stderr.write(self.style.ERROR("沒有任何 DifficultyLevels"))
+            return
+
+        user, _ = User.objects.get_or_create(
+            username=BENCH_USERNAME, defaults={"email": f"{BENCH_USERNAME}@example.com"}
+        )
+        self.stdout.write(
+            f"資料庫：{connection.vendor}，{'/'.join(map(str, options['threads']))} 執行緒 × {options['iterations']} 次，"
+            f"{options['quizzes']} 個 Quiz（{options['layout']}）"
+        )
+        failures = 0
+        results = {}
+        try:
+            if options["verify"]:
+                failures += self.verify(user, levels, options["verify"])
+            for threads in options["threads"]:
+                streams = [_stream(seed, options["iterations"], options["quizzes"], levels) for seed in range(threads)]
+                for name in options["only"] or FUNCTIONS:
+                    quiz_count = options["quizzes"] * (threads if options["layout"] == "per-thread" else 1)
+                    quiz_ids = [Quiz.objects.create(quiz_topic=f"bench upsert {name} {threads} {i}", user=user).id
+                                for i in range(quiz_count)]
+                    results[(threads, name)] = self.run(FUNCTIONS[name], user, quiz_ids, streams, options)
+                    failures += self.check_counters(name, quiz_ids, streams, results[(threads, name)], options)
+                    if options["layout"] == "per-thread":
+                        failures += self.check_finals(name, quiz_ids, streams, results[(threads, name)], options)
+        finally:
+            if not options["keep"]:
+                UserFamiliarity.objects.filter(user=user).delete()
+                Quiz.all_objects.filter(user=user).delete()
+                user.delete()
+
+        self.stdout.write(
+            f"\n{'執行緒':>6} {'方式':<10}{'次/秒':>9}{'p50 ms':>9}{'p99 ms':>9}{'等鎖次數':>9}{'等鎖p99':>9}"
+            f"{'持鎖p50':>9}{'持鎖p99':>9}{'語句數':>8}{'死結':>6}{'鎖逾時':>7}{'其他':>6}"
+        )
+        self.stdout.write("-" * 106)
+        for (threads, name), r in results.items():
+            self.stdout.write(
+                f"{threads:>6} {name:<10}{r['throughput']:>9.1f}{r['p50']:>9.2f}{r['p99']:>9.2f}{r['waits']:>9}"
+                f"{r['wait_p99']:>9.2f}{r['hold_p50']:>9.2f}{r['hold_p99']:>9.2f}{r['statements']:>8.1f}"
+                f"{r['deadlocks']:>6}{r['lock_timeouts']:>7}{r['other_errors']:>6}"
+            )
+        for (threads, name), r in results.items():
+            for error, count in r["error_kinds"].items():
+                self.stdout.write(f"  {name}（{threads} 執行緒）錯誤 {count} 次：{error}")
+        if failures:
+            raise CommandError(f"結果不一致 {failures} 項")
+
+    def run(self, func, user, quiz_ids, streams, options):
+        latencies, waits, holds, statements = [], [], [], []
+        error_kinds = {}
+        errors = dict.fromkeys(("deadlocks", "lock_timeouts", "other_errors"), 0)
+        applied = [[] for _ in streams]  # 各執行緒成功的提交在提交流中的位置，給 check_counters / check_finals 使用
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(streams))
+        per_thread = options["quizzes"] if options["layout"] == "per-thread" else 0
+
+        def worker(index):
+            state = {}
+            done = []
+
+            def wrapper(execute, sql, params, many, context):
+                state["statements"] += 1
+                if state["lock_at"] is not None or not _is_locking(sql):
+                    return execute(sql, params, many, context)
+                start = time.perf_counter()
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    state["lock_at"] = time.perf_counter()
+                    state["wait"] = state["lock_at"] - start
+
+            local_latency, local_wait, local_hold, local_statements, local_errors = [], [], [], [], {}
+            try:
+                with connection.execute_wrapper(wrapper):
+                    barrier.wait()
+                    for position, (quiz, level, total, correct) in enumerate(streams[index]):
+                        state.update(lock_at=None, wait=0.0, statements=0)
+                        start = time.perf_counter()
+                        try:
+                            func(
+                                user=user,
+                                quiz_topic_id=quiz_ids[index * per_thread + quiz],
+                                difficulty_level_name=level,
+                                total_questions_this_run=total,
+                                correct_answers_this_run=correct,
+                            )
+                        except DatabaseError as e:
+                            key = f"{type(e).__name__}: {str(e)[:80]}"
+                            local_errors[key] = local_errors.get(key, 0) + 1
+                            done.append((position, _classify(e, time.perf_counter() - start)))
+                            continue
+                        end = time.perf_counter()
+                        done.append((position, None))
+                        local_latency.append((end - start) * 1000)
+                        local_wait.append(state["wait"] * 1000)
+                        local_hold.append((end - (state["lock_at"] or end)) * 1000)
+                        local_statements.append(state["statements"])
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(local_latency)
+                waits.extend(local_wait)
+                holds.extend(local_hold)
+                statements.extend(local_statements)
+                for key, count in local_errors.items():
+                    error_kinds[key] = error_kinds.get(key, 0) + count
+                for _, kind in done:
+                    if kind is not None:
+                        errors[kind] += 1
+                applied[index] = [position for position, kind in done if kind is None]
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(streams))]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        waits.sort()
+        holds.sort()
+        threshold = options["wait_threshold"]
+        if not latencies:
+            latencies = waits = holds = [0.0]
+        return {
+            "throughput": len(statements) / elapsed,
+            "p50": _percentile(latencies, 0.5),
+            "p99": _percentile(latencies, 0.99),
+            "waits": sum(1 for wait in waits if wait > threshold),
+            "wait_p99": _percentile(waits, 0.99),
+            "hold_p50": _percentile(holds, 0.5),
+            "hold_p99": _percentile(holds, 0.99),
+            "hold_max": holds[-1],
+            "statements": statistics.fmean(statements) if statements else 0.0,
+            **errors,
+            "error_kinds": error_kinds,
+            "applied": applied,
+        }
+
+    def check_counters(self, name, quiz_ids, streams, result, options):
+        """成功的提交都要累加進 total_questions / correct_answers（沒有遺失更新）；optimized 達上限時會跳過累加，不檢查"""
+        if name == "optimized":
+            return 0
+        per_thread = options["quizzes"] if options["layout"] == "per-thread" else 0
+        expected = {quiz_id: [0, 0] for quiz_id in quiz_ids}
+        for index, positions in enumerate(result["applied"]):
+            for position in positions:
+                quiz, _, total, correct = streams[index][position]
+                counter = expected[quiz_ids[index * per_thread + quiz]]
+                counter[0] += total
+                counter[1] += correct
+        actual = {
+            quiz_id: [total, correct]
+            for quiz_id, total, correct in UserFamiliarity.objects.filter(quiz_topic_id__in=quiz_ids)
+            .values_list("quiz_topic_id", "total_questions", "correct_answers")
+        }
+        lost = sum(1 for quiz_id, counter in expected.items() if actual.get(quiz_id, [0, 0]) != counter)
+        if lost:
+            self.stdout.write(self.style.ERROR(f"{name}（{len(streams)} 執行緒）：{lost} 個 Quiz 的統計欄位與成功的提交不符（遺失更新）"))
+        return lost
+
+    def check_finals(self, name, quiz_ids, streams, result, options):
+        """
+        per-thread：每一列只由一個執行緒依序寫入，最終熟悉度必須等於依序重播成功提交的結果
+        （與 upsert 相同的整數運算，--verify 確認過與 Decimal 版本一致）；三種方式因此彼此相同
+        """
+        per_thread = options["quizzes"]
+        expected = {}
+        for index, positions in enumerate(result["applied"]):
+            for position in positions:
+                quiz, level, total, correct = streams[index][position]
+                step = _familiarity_step(
+                    difficulty_level_name=level, total_questions_this_run=total, correct_answers_this_run=correct
+                )
+                quiz_id = quiz_ids[index * per_thread + quiz]
+                expected[quiz_id] = _next_familiarity_units(expected.get(quiz_id, 0), step["cap4"], step["keep4"], step["gain8"])
+        actual = dict(
+            UserFamiliarity.objects.filter(quiz_topic_id__in=quiz_ids).values_list("quiz_topic_id", "familiarity")
+        )
+        mismatches = sum(
+            1 for quiz_id in set(expected) | set(actual)
+            if quiz_id not in expected or actual.get(quiz_id) != Decimal(expected[quiz_id]).scaleb(-2)
+        )
+        style = self.style.SUCCESS if mismatches == 0 else self.style.ERROR
+        self.stdout.write(style(
+            f"{name}（{len(streams)} 執行緒）併發後最終熟悉度與依序重播比對：{len(expected)} 列，不一致 {mismatches} 列"
+        ))
+        return mismatches
+
+    def verify(self, user, levels, sequences):
+        """同一組隨機提交序列分別交給三種方式（各自的 Quiz），逐步比對熟悉度與統計欄位"""
+        rng = random.Random(0)
+        mismatches = steps = 0
+        for _ in range(sequences):
+            quiz_ids = {name: Quiz.objects.create(quiz_topic=f"bench verify {name}", user=user).id for name in FUNCTIONS}
+            for _ in range(rng.randint(1, 8)):
+                total = rng.randint(1, 12)
+                kwargs = {
+                    "difficulty_level_name": rng.choice(levels),
+                    "total_questions_this_run": total,
+                    "correct_answers_this_run": rng.randint(0, total),
+                }
+                returned = {name: func(user=user, quiz_topic_id=quiz_ids[name], **kwargs) for name, func in FUNCTIONS.items()}
+                rows = {name: UserFamiliarity.objects.filter(quiz_topic_id=quiz_ids[name]).values(*VERIFY_FIELDS).get()
+                        for name in FUNCTIONS}
+                steps += 1
+                # optimized 已達上限時會跳過統計累加，只比對熟悉度
+                if (len(set(returned.values())) != 1
+                        or rows["weighted"] != rows["upsert"]
+                        or rows["weighted"]["familiarity"] != rows["optimized"]["familiarity"]):
+                    mismatches += 1
+        style = self.style.SUCCESS if mismatches == 0 else self.style.ERROR
+        self.stdout.write(style(f"結果比對：{sequences} 組序列、{steps} 次提交，不一致 {mismatches} 次"))
+        return mismatches
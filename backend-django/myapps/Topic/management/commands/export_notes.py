@@ -0,0 +1,36 @@
+# 匯出筆記內容給 ml-service 統計關鍵詞 IDF
+#   python manage.py export_notes --output notes.jsonl
+#   （ml-service）python -m keyword_engine build-idf notes.jsonl keyword_idf.json
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from myapps.Topic.models import Note
+
+
+class Command(BaseCommand):
+    help = "以 JSONL 匯出未刪除筆記的內容（每行一個 {\"id\", \"content\"}），供 ml-service 建立關鍵詞 IDF"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="輸出檔案（預設寫到 stdout）")
+        parser.add_argument("--limit", type=int, help="最多匯出幾篇（由新到舊）")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        queryset = Note.objects.exclude(content="").order_by("-id").values_list("id", "content")
+        if options["limit"]:
+            queryset = queryset[:options["limit"]]
+
+        out = open(options["output"], "w", encoding="utf-8") if options["output"] else sys.stdout
+        count = 0
+        try:
+            # iterator 分批讀取，筆記很多時也不會整批載入記憶體
+            for note_id, content in queryset.iterator(chunk_size=options["chunk_size"]):
+                out.write(json.dumps({"id": note_id, "content": content}, ensure_ascii=False) + "\n")
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        self.stderr.write(self.style.SUCCESS(f"✅ 已匯出 {count} 篇筆記"))
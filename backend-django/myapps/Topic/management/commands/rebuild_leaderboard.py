@@ -0,0 +1,22 @@
+# 由 UserFamiliarity 重建熟悉度分布（FamiliarityHistogram）與每列的 histogram_bucket
+#   python manage.py rebuild_leaderboard
+# 第一次部署、手動修改熟悉度或懷疑分布有偏差時執行；平常由 services / familiarity_buffer 增量維護
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapps.Topic.leaderboard import rebuild
+
+
+class Command(BaseCommand):
+    help = "重建熟悉度排行分布"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="讀取與 bulk_update 的批次大小")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total, fixed = rebuild(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ 已重建 {total} 筆熟悉度的分布（修正 {fixed} 筆 histogram_bucket），耗時 {time.perf_counter() - started:.2f}s"
+        ))
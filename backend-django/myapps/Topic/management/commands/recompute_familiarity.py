@@ -0,0 +1,230 @@
+# 依目前的 DifficultyLevels 參數重算所有 UserFamiliarity.familiarity
+#   python manage.py recompute_familiarity --dry-run          # 只列出差異，不寫入
+#   python manage.py recompute_familiarity --quiz 12 --quiz 15
+#   python manage.py recompute_familiarity --synthetic 1000000 # 不碰資料庫，只量測重算核心的速度
+#   python manage.py recompute_familiarity --source topics     # Attempt 上線前的歷史
+#
+# --source attempts（預設）：讀 Attempt 的整輪提交，同一個 Quiz 相同 answered_at 即為一輪，難度取該輪第一題。
+#   只重算作答紀錄完整的組合：UserFamiliarity.total_questions 必須等於 Attempt 的總題數（由每日彙總取得），
+#   否則代表有 Attempt 上線前的作答，改用 --source topics。
+# --source topics：Topic 上只有最後一次的 User_answer，單題提交也無法分辨，以 Topic 推估每一輪：
+#   同一個 Quiz 依建立時間排序，難度改變或相鄰題目的建立時間相差超過 --run-gap 秒就視為新的一輪。
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapps.Topic.attempts import totals_by_quiz
+from myapps.Topic.difficulty_registry import get_registry, invalidate, level_or_default
+from myapps.Topic.familiarity_replay import accuracy_fixed, replay, to_fixed
+from myapps.Topic.leaderboard import sync_buckets
+from myapps.Topic.models import Attempt, Topic, UserFamiliarity
+from myapps.Topic.review import cap_of, next_review_at
+
+# SubmitAnswerView 對這個難度（error / test）不計算熟悉度
+EXCLUDED_DIFFICULTY_ID = 5
+
+
+class Command(BaseCommand):
+    help = "以目前的難度上限與 alpha 重播作答紀錄，批次重算熟悉度"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="只顯示差異，不寫入資料庫")
+        parser.add_argument("--source", choices=["attempts", "topics"], default="attempts", help="作答紀錄來源")
+        parser.add_argument("--quiz", type=int, action="append", help="只重算這些 Quiz（可重複指定）")
+        parser.add_argument("--user", type=int, action="append", help="只重算這些用戶（可重複指定）")
+        parser.add_argument("--run-gap", type=float, default=300, help="--source topics：同一輪題目的建立時間最大間隔（秒）")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="讀取作答紀錄的批次大小")
+        parser.add_argument("--batch-size", type=int, default=1000, help="bulk_update 的批次大小")
+        parser.add_argument("--show", type=int, default=20, help="dry-run 時列出差異最大的前幾筆")
+        parser.add_argument("--synthetic", type=int, help="以 N 組隨機 (user, quiz) 量測重算速度，不讀寫資料庫")
+
+    def handle(self, *args, **options):
+        if options["synthetic"]:
+            return self.run_synthetic(options["synthetic"])
+
+        invalidate()  # 一定使用資料庫裡最新的參數
+        levels = get_registry().by_id
+        if not levels:
+            self.stderr.write(self.style.ERROR("沒有任何 DifficultyLevels"))
+            return
+        default_level = level_or_default("beginner") or levels[min(levels)]
+        # 難度 id → 陣列索引，cap / alpha 以 1e-4 定點查表
+        level_ids = sorted(levels)
+        level_index = {level_id: i for i, level_id in enumerate(level_ids)}
+        cap_table = np.array([to_fixed(levels[i].cap) for i in level_ids], dtype=np.int64)
+        alpha_table = np.array([to_fixed(levels[i].alpha) for i in level_ids], dtype=np.int64)
+
+        started = time.perf_counter()
+        load = self.load_attempts if options["source"] == "attempts" else self.load_answers
+        quiz_ids, user_of_quiz, difficulty, created, correct = load(options, level_index, level_index[default_level.id])
+        loaded = time.perf_counter()
+        if len(quiz_ids) == 0:
+            self.stdout.write("沒有可重算的作答紀錄")
+            return
+
+        # 切出每一輪：Attempt 以 Quiz 或 answered_at 改變為界；Topic 另外以難度改變或建立時間間隔過大推估
+        if options["source"] == "attempts":
+            boundary = np.r_[True, (np.diff(quiz_ids) != 0) | (np.diff(created) != 0)]
+        else:
+            boundary = np.r_[True, (np.diff(quiz_ids) != 0) | (np.diff(difficulty) != 0) | (np.diff(created) > options["run_gap"])]
+        starts = np.flatnonzero(boundary)
+        run_quiz = quiz_ids[starts]
+        run_level = difficulty[starts]
+        run_total = np.diff(np.r_[starts, len(quiz_ids)])
+        run_correct = np.add.reduceat(correct, starts)
+
+        keep = run_level != level_index.get(EXCLUDED_DIFFICULTY_ID, -1)
+        run_quiz, run_level, run_total, run_correct = run_quiz[keep], run_level[keep], run_total[keep], run_correct[keep]
+
+        unique_quiz, keys = np.unique(run_quiz, return_inverse=True)
+        result = replay(keys, accuracy_fixed(run_correct, run_total), cap_table[run_level], alpha_table[run_level], len(unique_quiz))
+        computed = time.perf_counter()
+
+        changes, incomplete = self.diff(unique_quiz, result, user_of_quiz, options)
+        self.stdout.write(
+            f"作答 {len(quiz_ids)} 題、{len(run_quiz)} 輪、{len(unique_quiz)} 組 (user, quiz)；"
+            f"讀取 {loaded - started:.2f}s、重算 {computed - loaded:.2f}s"
+        )
+        if incomplete:
+            self.stdout.write(self.style.WARNING(f"作答紀錄不完整、略過 {incomplete} 組（有 Attempt 上線前的作答，請用 --source topics）"))
+        self.stdout.write(f"熟悉度有變動：{len(changes)} 筆")
+
+        if options["dry_run"]:
+            self.show_changes(changes, options["show"])
+            return
+
+        written = self.write(changes, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"✅ 已更新 {written} 筆，總耗時 {time.perf_counter() - started:.2f}s"))
+
+    def load_answers(self, options, level_index, default_index):
+        """串流讀取已作答的 Topic，回傳依 (quiz, 建立時間) 排序的 NumPy 陣列"""
+        queryset = Topic.objects.filter(
+            User_answer__isnull=False,
+            quiz_topic__deleted_at__isnull=True,
+            quiz_topic__user__isnull=False,
+        ).exclude(User_answer="")
+        if options["quiz"]:
+            queryset = queryset.filter(quiz_topic_id__in=options["quiz"])
+        if options["user"]:
+            queryset = queryset.filter(quiz_topic__user_id__in=options["user"])
+        rows = queryset.order_by("quiz_topic_id", "created_at", "id").values_list(
+            "quiz_topic_id", "quiz_topic__user_id", "difficulty_id", "created_at", "User_answer", "Ai_answer"
+        )
+
+        quiz_ids, difficulty, created, correct = [], [], [], []
+        user_of_quiz = {}
+        for quiz_id, user_id, difficulty_id, created_at, user_answer, ai_answer in rows.iterator(chunk_size=options["chunk_size"]):
+            quiz_ids.append(quiz_id)
+            user_of_quiz[quiz_id] = user_id
+            difficulty.append(level_index.get(difficulty_id, default_index))
+            created.append(created_at.timestamp())
+            correct.append(user_answer == ai_answer)
+        return (
+            np.array(quiz_ids, dtype=np.int64),
+            user_of_quiz,
+            np.array(difficulty, dtype=np.int64),
+            np.array(created, dtype=np.float64),
+            np.array(correct, dtype=np.int64),
+        )
+
+    def load_attempts(self, options, level_index, default_index):
+        """串流讀取計入熟悉度的 Attempt，回傳依 (quiz, answered_at) 排序的 NumPy 陣列（與 load_answers 相同格式）"""
+        queryset = Attempt.objects.filter(source=Attempt.SOURCE_RUN)
+        if options["quiz"]:
+            queryset = queryset.filter(quiz_id__in=options["quiz"])
+        if options["user"]:
+            queryset = queryset.filter(user_id__in=options["user"])
+        rows = queryset.order_by("quiz_id", "answered_at", "id").values_list(
+            "quiz_id", "user_id", "difficulty_id", "answered_at", "correct"
+        )
+
+        quiz_ids, difficulty, answered, correct = [], [], [], []
+        user_of_quiz = {}
+        for quiz_id, user_id, difficulty_id, answered_at, is_correct in rows.iterator(chunk_size=options["chunk_size"]):
+            quiz_ids.append(quiz_id)
+            user_of_quiz[quiz_id] = user_id
+            difficulty.append(level_index.get(difficulty_id, default_index))
+            answered.append(answered_at.timestamp())
+            correct.append(is_correct)
+        return (
+            np.array(quiz_ids, dtype=np.int64),
+            user_of_quiz,
+            np.array(difficulty, dtype=np.int64),
+            np.array(answered, dtype=np.float64),
+            np.array(correct, dtype=np.int64),
+        )
+
+    def diff(self, unique_quiz, result, user_of_quiz, options):
+        """
+        和目前的 UserFamiliarity 比較，回傳 ([(id, user_id, quiz_id, 舊值, 新值)], 略過的組合數)；沒有記錄的組合不新建
+        --source attempts 時略過作答紀錄不完整的組合
+        """
+        new_value = dict(zip(unique_quiz.tolist(), result.tolist()))
+        changes = []
+        incomplete = 0
+        quiz_list = unique_quiz.tolist()
+        for i in range(0, len(quiz_list), options["batch_size"]):
+            chunk = quiz_list[i:i + options["batch_size"]]
+            totals = totals_by_quiz(chunk) if options["source"] == "attempts" else None
+            existing = UserFamiliarity.objects.filter(quiz_topic_id__in=chunk).values_list(
+                "id", "user_id", "quiz_topic_id", "familiarity", "total_questions"
+            )
+            for uf_id, user_id, quiz_id, familiarity, total_questions in existing:
+                if user_of_quiz.get(quiz_id) != user_id:
+                    continue
+                if totals is not None and totals.get(quiz_id, 0) != total_questions:
+                    incomplete += 1
+                    continue
+                new = Decimal(new_value[quiz_id]).scaleb(-2)
+                if new != familiarity:
+                    changes.append((uf_id, user_id, quiz_id, familiarity, new))
+        return changes, incomplete
+
+    def show_changes(self, changes, limit):
+        if not changes:
+            return
+        deltas = np.array([float(new - old) for _, _, _, old, new in changes])
+        self.stdout.write(f"平均變動 {deltas.mean():+.2f}、最大增加 {deltas.max():+.2f}、最大減少 {deltas.min():+.2f}")
+        self.stdout.write(f"\n{'user':>8}{'quiz':>10}{'目前':>10}{'重算後':>10}{'差異':>10}")
+        for uf_id, user_id, quiz_id, old, new in sorted(changes, key=lambda c: abs(c[4] - c[3]), reverse=True)[:limit]:
+            self.stdout.write(f"{user_id:>8}{quiz_id:>10}{old:>10}{new:>10}{new - old:>+10}")
+
+    def write(self, changes, batch_size):
+        """分批 bulk_update，每批一個交易；下次複習時間以最後作答時間（updated_at）重新排程"""
+        written = 0
+        for i in range(0, len(changes), batch_size):
+            batch = changes[i:i + batch_size]
+            schedule = {
+                uf_id: (level_id, updated_at)
+                for uf_id, level_id, updated_at in UserFamiliarity.objects.filter(
+                    id__in=[c[0] for c in batch]
+                ).values_list("id", "difficulty_level_id", "updated_at")
+            }
+            objs = [
+                UserFamiliarity(
+                    id=uf_id,
+                    familiarity=new,
+                    next_review_at=next_review_at(new, cap_of(schedule[uf_id][0]), base=schedule[uf_id][1]),
+                )
+                for uf_id, _, _, _, new in batch
+                if uf_id in schedule
+            ]
+            with transaction.atomic():
+                UserFamiliarity.objects.bulk_update(objs, ["familiarity", "next_review_at"])
+                sync_buckets([obj.id for obj in objs])
+            written += len(objs)
+        return written
+
+    def run_synthetic(self, pairs, runs_per_pair=5):
+        rng = np.random.default_rng(0)
+        keys = np.repeat(np.arange(pairs), runs_per_pair)
+        total = np.full(len(keys), 5)
+        correct = rng.integers(0, 6, len(keys))
+        cap = rng.choice([2500, 5000, 7500, 10000], len(keys))
+        alpha = np.full(len(keys), 2000)
+        started = time.perf_counter()
+        replay(keys, accuracy_fixed(correct, total), cap, alpha, pairs)
+        self.stdout.write(f"{pairs} 組 × {runs_per_pair} 輪：重算 {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,25 @@
+# 把新的作答紀錄增量加進每日彙總（AttemptDailyRollup）
+#   python manage.py rollup_attempts                 # 排程定期執行（例如每 5 分鐘）
+#   python manage.py rollup_attempts --settle 0      # 測試用：不等待最近的作答穩定
+# 以 Attempt.id 為水位，重複執行不會重複累加；中途中斷時已提交的批次不會重做。
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapps.Topic.attempts import rollup, watermark
+
+
+class Command(BaseCommand):
+    help = "增量彙總作答紀錄為每日統計"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000, help="每個交易處理的作答數")
+        parser.add_argument("--settle", type=int, help="只彙總幾秒前的作答（預設 ATTEMPT_ROLLUP_SETTLE_SECONDS）")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        before = watermark()
+        processed, rows = rollup(batch_size=options["batch_size"], settle_seconds=options["settle"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ 彙總 {processed} 筆作答、更新 {rows} 列（水位 {before} → {watermark()}），耗時 {time.perf_counter() - started:.2f}s"
+        ))
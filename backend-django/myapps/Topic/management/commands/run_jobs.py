@@ -0,0 +1,70 @@
+# 背景工作 worker
+#   python manage.py run_jobs --concurrency 4
+#   python manage.py run_jobs --once          # 處理完目前可執行的工作就結束（cron / 測試用）
+# 收到 SIGTERM / SIGINT 時停止取新工作，等執行中的工作結束後才離開
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from myapps.Topic.jobs import claim_jobs, default_worker_id, requeue_stale, run_job
+
+
+class Command(BaseCommand):
+    help = "執行資料庫工作佇列中的背景工作"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="同時執行的工作數")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="沒有工作時的輪詢間隔（秒）")
+        parser.add_argument("--kinds", help="只處理這些種類（逗號分隔）")
+        parser.add_argument("--once", action="store_true", help="沒有可執行的工作時就結束")
+
+    def handle(self, *args, **options):
+        concurrency = max(options["concurrency"], 1)
+        kinds = [k.strip() for k in options["kinds"].split(",")] if options["kinds"] else None
+        worker_id = default_worker_id()
+        stopping = threading.Event()
+        # 目前空出的執行槽數；取工作前先扣，完成後歸還，取出的工作不會多於能同時執行的數量
+        slots = threading.Semaphore(concurrency)
+
+        def stop(signum, frame):
+            self.stderr.write(f"收到訊號 {signum}，等待執行中的工作結束…")
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        def execute(job):
+            try:
+                run_job(job)
+            finally:
+                close_old_connections()
+                slots.release()
+
+        self.stdout.write(f"✅ worker {worker_id} 啟動，concurrency={concurrency}")
+        last_reap = 0.0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job") as pool:
+            while not stopping.is_set():
+                if time.monotonic() - last_reap > 30:
+                    requeue_stale()
+                    last_reap = time.monotonic()
+
+                free = 0
+                while slots.acquire(blocking=False):
+                    free += 1
+                jobs = claim_jobs(worker_id, free, kinds=kinds) if free else []
+                for _ in range(free - len(jobs)):
+                    slots.release()
+                for job in jobs:
+                    pool.submit(execute, job)
+
+                if jobs:
+                    continue
+                if options["once"] and free == concurrency:
+                    break
+                close_old_connections()
+                stopping.wait(options["poll_interval"])
+        self.stdout.write(f"worker {worker_id} 已結束")
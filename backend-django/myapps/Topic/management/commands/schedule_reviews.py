@@ -0,0 +1,21 @@
+# 補上 UserFamiliarity.next_review_at（以 updated_at 為最後作答時間）
+#   python manage.py schedule_reviews          # 只處理尚未排程的列（加上欄位後執行一次）
+#   python manage.py schedule_reviews --all    # 調整 REVIEW_MIN_HOURS / REVIEW_MAX_DAYS 或難度上限後全部重新排程
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapps.Topic.review import backfill
+
+
+class Command(BaseCommand):
+    help = "排程熟悉度記錄的下次複習時間"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="重新排程所有記錄（預設只處理 next_review_at 為空的記錄）")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="每批更新的筆數（每批一個交易）")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = backfill(chunk_size=options["chunk_size"], all_rows=options["all"])
+        self.stdout.write(self.style.SUCCESS(f"✅ 已排程 {written} 筆，耗時 {time.perf_counter() - started:.2f}s"))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Topic', '0010_chatsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicExplanation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='pending', max_length=16)),
+                ('content', models.TextField(blank=True, default='')),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('topic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_explanation', to='Topic.topic')),
+            ],
+            options={
+                'db_table': 'TopicExplanation',
+            },
+        ),
+    ]
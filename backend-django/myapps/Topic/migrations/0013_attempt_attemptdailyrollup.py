@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Topic', '0012_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.PositiveIntegerField()),
+                ('quiz_id', models.PositiveIntegerField()),
+                ('topic_id', models.PositiveIntegerField()),
+                ('difficulty_id', models.PositiveSmallIntegerField()),
+                ('correct', models.BooleanField()),
+                ('source', models.PositiveSmallIntegerField(choices=[(1, 'run'), (2, 'single'), (3, 'test')])),
+                ('answered_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'Attempt',
+                'indexes': [models.Index(fields=['user_id', 'quiz_id', 'answered_at'], name='idx_attempt_user_quiz'), models.Index(fields=['quiz_id', 'answered_at'], name='idx_attempt_quiz_time')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AttemptDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.PositiveIntegerField()),
+                ('quiz_id', models.PositiveIntegerField()),
+                ('day', models.DateField()),
+                ('difficulty_id', models.PositiveSmallIntegerField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('runs', models.PositiveIntegerField(default=0)),
+                ('last_attempt_id', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'AttemptDailyRollup',
+                'indexes': [models.Index(fields=['user_id', 'day'], name='idx_rollup_user_day'), models.Index(fields=['last_attempt_id'], name='idx_rollup_watermark')],
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'quiz_id', 'day', 'difficulty_id'), name='uq_rollup_user_quiz_day')],
+            },
+        ),
+    ]
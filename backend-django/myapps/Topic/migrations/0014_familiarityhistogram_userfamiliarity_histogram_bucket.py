@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Topic', '0013_attempt_attemptdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfamiliarity',
+            name='histogram_bucket',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='FamiliarityHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=254)),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'FamiliarityHistogram',
+                'constraints': [models.UniqueConstraint(fields=('topic', 'bucket'), name='uq_histogram_topic_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Topic', '0014_familiarityhistogram_userfamiliarity_histogram_bucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfamiliarity',
+            name='next_review_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='userfamiliarity',
+            index=models.Index(fields=['user', 'next_review_at'], name='idx_uf_user_review'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Topic', '0015_userfamiliarity_next_review_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userfamiliarity',
+            index=models.Index(fields=['quiz_topic', 'histogram_bucket'], name='idx_uf_quiz_bucket'),
+        ),
+    ]
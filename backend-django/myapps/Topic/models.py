@@ -209,6 +209,10 @@ class UserFamiliarity(models.Model):
     cap_weighted_sum = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal("0.00"))
 
     familiarity = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    # 目前計入 FamiliarityHistogram 的哪一格（leaderboard.sync_buckets 維護；NULL = 尚未計入）
+    histogram_bucket = models.PositiveSmallIntegerField(null=True, blank=True)
+    # 下次複習時間（review.next_review_at 依熟悉度與難度上限計算；NULL = 尚未排程）
+    next_review_at = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -224,6 +228,9 @@ class UserFamiliarity(models.Model):
             models.Index(fields=["quiz_topic", "difficulty_level"]),
             models.Index(fields=["familiarity", "updated_at"]),
             models.Index(fields=["user", "familiarity"]),
+            models.Index(fields=["user", "next_review_at"], name="idx_uf_user_review"),
+            # leaderboard.top：每個 Quiz 只範圍讀取分布上層幾格的列
+            models.Index(fields=["quiz_topic", "histogram_bucket"], name="idx_uf_quiz_bucket"),
         ]
 
 
@@ -311,6 +318,167 @@ class Chat(models.Model):
     class Meta:
         db_table = "Chat"
 
+# AI Chat 滾動摘要
+# 每個 (user, topic) 一筆，較舊的對話折疊成摘要，只把最近幾輪原文送給 AI
+# user: 使用者ID
+# topic: 題目ID
+# summary: 摘要內容
+# summarized_until: 已折疊進摘要的最後一筆 Chat ID（之後的對話尚未摘要）
+# updated_at: 更新時間
+class ChatSummary(models.Model):
+    user = models.ForeignKey("Authorization.User", on_delete=models.CASCADE)
+    topic = models.ForeignKey("Topic.Topic", on_delete=models.CASCADE)
+    summary = models.TextField(blank=True, default='')
+    summarized_until = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        db_table = "ChatSummary"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'topic'], name='uq_chat_summary_user_topic'),
+        ]
+
+# -----------------
+# AI 題目解析資料庫
+# 每題只生成一次解析，之後的請求直接讀取
+# topic: 題目ID（一對一）
+# status: pending 生成中 / ready 完成 / failed 失敗（下次請求會重試）
+# content: 解析內容
+# error: 最後一次失敗的原因
+# attempts: 已嘗試生成的次數
+# updated_at: 狀態更新時間（生成中卡太久視為中斷，可由下一個請求接手）
+class TopicExplanation(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+
+    topic = models.OneToOneField("Topic.Topic", on_delete=models.CASCADE, related_name='ai_explanation')
+    status = models.CharField(max_length=16, default=STATUS_PENDING, choices=[
+        (STATUS_PENDING, 'pending'),
+        (STATUS_READY, 'ready'),
+        (STATUS_FAILED, 'failed'),
+    ])
+    content = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+    class Meta:
+        db_table = "TopicExplanation"
+
+# -----------------
+# 背景工作佇列
+# 取代在 gunicorn worker 內直接開 daemon thread：工作先寫進資料表，由 run_jobs 指令取出執行，
+# worker 重啟或逾時都不會遺失，失敗會依退避時間自動重試
+# kind: 工作種類（對應 jobs.register 註冊的處理函式）
+# payload: 處理函式的參數（JSON）
+# status: queued 等待中 / running 執行中 / succeeded 完成 / failed 重試用盡
+# priority: 數字越大越先執行
+# attempts / max_attempts: 已執行次數 / 最多執行次數
+# run_after: 這個時間之後才可執行（重試退避用）
+# locked_by / locked_at: 執行中的 worker 與開始時間（逾時視為 worker 中斷，會被重新排入）
+# user: 建立工作的用戶（查詢狀態時只能看自己的工作）
+class Job(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, default=STATUS_QUEUED, choices=[
+        (STATUS_QUEUED, 'queued'),
+        (STATUS_RUNNING, 'running'),
+        (STATUS_SUCCEEDED, 'succeeded'),
+        (STATUS_FAILED, 'failed'),
+    ])
+    priority = models.SmallIntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    user = models.ForeignKey("Authorization.User", on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        db_table = "Job"
+        indexes = [
+            # worker 取工作：WHERE status='queued' AND run_after<=now ORDER BY priority DESC, run_after
+            models.Index(fields=['status', 'priority', 'run_after'], name='idx_job_claim'),
+            models.Index(fields=['status', 'locked_at'], name='idx_job_locked'),
+        ]
+
+# 每個題目名稱的熟悉度分布（leaderboard 增量維護）
+# topic: Quiz.quiz_topic
+# bucket: 熟悉度整數百分比（0~100）
+# count: 該格的 (user, quiz) 數
+class FamiliarityHistogram(models.Model):
+    topic = models.CharField(max_length=254)
+    bucket = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+    class Meta:
+        db_table = "FamiliarityHistogram"
+        constraints = [
+            models.UniqueConstraint(fields=['topic', 'bucket'], name='uq_histogram_topic_bucket'),
+        ]
+
+# 作答紀錄（只新增不修改）
+# Topic.User_answer 會被下一次作答覆寫，這裡保留每一題每一次的作答；欄位都是窄整數，不建外鍵
+# user_id / quiz_id / topic_id / difficulty_id: 作答當下的用戶、Quiz、題目與難度
+# correct: 是否答對
+# source: 1 = 整輪提交（計入熟悉度）、2 = 單題提交、3 = TEST 模式或 error 難度（不計入熟悉度）
+# answered_at: 作答時間；同一次提交的所有題目相同，用來還原每一輪
+class Attempt(models.Model):
+    SOURCE_RUN = 1
+    SOURCE_SINGLE = 2
+    SOURCE_TEST = 3
+
+    user_id = models.PositiveIntegerField()
+    quiz_id = models.PositiveIntegerField()
+    topic_id = models.PositiveIntegerField()
+    difficulty_id = models.PositiveSmallIntegerField()
+    correct = models.BooleanField()
+    source = models.PositiveSmallIntegerField(choices=[
+        (SOURCE_RUN, 'run'),
+        (SOURCE_SINGLE, 'single'),
+        (SOURCE_TEST, 'test'),
+    ])
+    answered_at = models.DateTimeField(default=timezone.now)
+    class Meta:
+        db_table = "Attempt"
+        indexes = [
+            models.Index(fields=['user_id', 'quiz_id', 'answered_at'], name='idx_attempt_user_quiz'),
+            # recompute_familiarity：依 Quiz、時間順序讀取
+            models.Index(fields=['quiz_id', 'answered_at'], name='idx_attempt_quiz_time'),
+        ]
+
+# 作答每日彙總（rollup_attempts 以 Attempt.id 為水位增量更新）
+# day: 作答日期（settings.TIME_ZONE）
+# attempts / correct: 作答題數 / 答對題數
+# runs: 計入熟悉度的整輪提交次數
+# last_attempt_id: 已彙總的最大 Attempt.id，全表最大值即下一次彙總的起點
+class AttemptDailyRollup(models.Model):
+    user_id = models.PositiveIntegerField()
+    quiz_id = models.PositiveIntegerField()
+    day = models.DateField()
+    difficulty_id = models.PositiveSmallIntegerField()
+    attempts = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    runs = models.PositiveIntegerField(default=0)
+    last_attempt_id = models.BigIntegerField(default=0)
+    class Meta:
+        db_table = "AttemptDailyRollup"
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'quiz_id', 'day', 'difficulty_id'], name='uq_rollup_user_quiz_day'),
+        ]
+        indexes = [
+            models.Index(fields=['user_id', 'day'], name='idx_rollup_user_day'),
+            models.Index(fields=['last_attempt_id'], name='idx_rollup_watermark'),
+        ]
+
 # AI 提示資料庫
 # 儲存 AI 提示內容
 # prompt: 提示內容
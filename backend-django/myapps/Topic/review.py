@@ -0,0 +1,67 @@
+# 間隔複習排程
+# UserFamiliarity.next_review_at = 這次作答時間 + 複習間隔，間隔由熟悉度與這次難度的上限決定：
+#   進度 = 熟悉度 / 難度上限（0~1），最長間隔 = REVIEW_MAX_DAYS × 難度上限（上限超過 1 視為 1）
+#   間隔 = REVIEW_MIN_HOURS × (最長間隔 / REVIEW_MIN_HOURS) ^ 進度   # 進度越高，間隔呈指數拉長
+# 例：熟悉度 0 → 12 小時後；master（上限 1.0）達 100% → 60 天後；beginner（上限 0.25）最多 15 天後。
+# services、familiarity_buffer、recompute_familiarity 寫入熟悉度時一併更新；
+# /api/review/due/ 以 (user, next_review_at) 索引做範圍查詢。舊資料以 python manage.py schedule_reviews 補上。
+import os
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .difficulty_registry import get_registry
+from .models import UserFamiliarity
+
+REVIEW_MIN_HOURS = float(os.getenv("REVIEW_MIN_HOURS", "12"))
+REVIEW_MAX_DAYS = float(os.getenv("REVIEW_MAX_DAYS", "60"))
+
+
+def review_interval(familiarity, cap) -> timedelta:
+    """familiarity：百分比（0~100）；cap：難度上限（0~1，即 Level.cap）"""
+    cap = min(float(cap), 1.0)
+    if cap <= 0:
+        return timedelta(hours=REVIEW_MIN_HOURS)
+    progress = min(max(float(familiarity) / (cap * 100), 0.0), 1.0)
+    longest = max(REVIEW_MAX_DAYS * 24 * cap, REVIEW_MIN_HOURS)
+    return timedelta(hours=REVIEW_MIN_HOURS * (longest / REVIEW_MIN_HOURS) ** progress)
+
+
+def next_review_at(familiarity, cap, base=None):
+    return (base or timezone.now()) + review_interval(familiarity, cap)
+
+
+def cap_of(level_id) -> Decimal:
+    """難度上限；沒有難度或難度已刪除時視為 1.0"""
+    level = get_registry().by_id.get(level_id) if level_id is not None else None
+    return level.cap if level else Decimal("1")
+
+
+def due(user_id, now=None, within=None):
+    """到期（或 within 時間內將到期）的熟悉度記錄，依到期時間排序；軟刪除的 Quiz 不列入"""
+    until = (now or timezone.now()) + (within or timedelta(0))
+    return (
+        UserFamiliarity.objects.filter(user_id=user_id, next_review_at__lte=until, quiz_topic__deleted_at__isnull=True)
+        .order_by("next_review_at")
+    )
+
+
+def backfill(chunk_size=5000, all_rows=False):
+    """以 updated_at 為作答時間重新排程（預設只處理 next_review_at 為 NULL 的列），回傳更新的列數"""
+    queryset = UserFamiliarity.objects.all() if all_rows else UserFamiliarity.objects.filter(next_review_at__isnull=True)
+    rows = queryset.order_by("id").values_list("id", "familiarity", "difficulty_level_id", "updated_at")
+    last_id = written = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return written
+        objs = [
+            UserFamiliarity(id=uf_id, next_review_at=next_review_at(familiarity, cap_of(level_id), base=updated_at))
+            for uf_id, familiarity, level_id, updated_at in chunk
+        ]
+        with transaction.atomic():
+            UserFamiliarity.objects.bulk_update(objs, ["next_review_at"])
+        written += len(objs)
+        last_id = chunk[-1][0]
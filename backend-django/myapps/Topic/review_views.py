@@ -0,0 +1,43 @@
+# 間隔複習 API（排程方式見 review.py）
+# GET /api/review/due/?limit=20&within_hours=0    目前用戶到期（或 within_hours 小時內到期）的題目，最早到期的在前
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .review import due
+
+DUE_LIMIT_MAX = 100
+
+
+class ReviewDueView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), DUE_LIMIT_MAX)
+            within = timedelta(hours=max(float(request.query_params.get("within_hours", 0)), 0))
+        except ValueError:
+            return Response({"error": "limit and within_hours must be numbers"}, status=400)
+
+        now = timezone.now()
+        rows = due(request.user.id, now=now, within=within).values(
+            "quiz_topic_id", "quiz_topic__quiz_topic", "familiarity", "difficulty_level_id", "next_review_at", "updated_at"
+        )[:limit]
+        return Response({
+            "now": now.isoformat(),
+            "results": [
+                {
+                    "quiz_topic_id": row["quiz_topic_id"],
+                    "quiz_topic": row["quiz_topic__quiz_topic"],
+                    "familiarity": float(row["familiarity"]),
+                    "difficulty_level_id": row["difficulty_level_id"],
+                    "next_review_at": row["next_review_at"].isoformat(),
+                    "last_reviewed_at": row["updated_at"].isoformat() if row["updated_at"] else None,
+                    "overdue_seconds": int((now - row["next_review_at"]).total_seconds()),
+                }
+                for row in rows
+            ],
+        })
@@ -1,11 +1,16 @@
 # apps/learning/services.py
+import os
 from decimal import Decimal, ROUND_HALF_UP
-from django.db import transaction
+from django.db import connection, transaction
+from django.utils import timezone
 from django.db.models import F
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth import get_user_model
 
 from .models import UserFamiliarity ,Quiz, Note, DifficultyLevels 
+from .difficulty_registry import get_level, level_or_default
+from .leaderboard import track as track_histogram
+from .review import next_review_at
 # 你的 UserFamiliarity 定義在這個 app
 
 User = get_user_model()
@@ -15,6 +20,11 @@ DEC2 = Decimal('0.01')
 ONE  = Decimal('1')
 HUNDRED = Decimal('100')
 
+# 提交答案時使用單一 SQL upsert 更新熟悉度（0 = 改回 update_familiarity_weighted_average_optimized）
+FAMILIARITY_UPSERT = os.getenv("FAMILIARITY_UPSERT", "1") == "1"
+# 同一個 (user, quiz_topic) 的連續提交先在記憶體合併再寫入（見 familiarity_buffer）
+FAMILIARITY_WRITE_BEHIND = os.getenv("FAMILIARITY_WRITE_BEHIND", "0") == "1"
+
 def _q(x) -> Decimal:
     """to Decimal & quantize 4位小數（計算用）"""
     return Decimal(str(x)).quantize(DEC4)
@@ -65,15 +75,11 @@ def update_familiarity_weighted_average(
     # 1) 取 Quiz / Difficulty level
     quiz = Quiz.objects.select_for_update().get(pk=quiz_topic_id)
 
-    if difficulty_level_id is not None:
-        level = DifficultyLevels.objects.get(pk=difficulty_level_id)
-    elif difficulty_level_name is not None:
-        level = DifficultyLevels.objects.get(level_name=difficulty_level_name)
-    else:
-        raise ValueError("difficulty_level_id 或 difficulty_level_name 需擇一提供")
+    # 難度從 process 內快取取得，不查詢資料庫
+    level = get_level(difficulty_level_id, difficulty_level_name)
 
-    cap   = _get_cap(level)      # 0.3 / 0.5 / 0.7 / 1.0
-    alpha = _get_alpha(level)    # 例：0.20
+    cap   = level.cap      # 0.3 / 0.5 / 0.7 / 1.0
+    alpha = level.alpha    # 例：0.20
 
     # 2) 算 accuracy（0~1）
     if accuracy is None:
@@ -95,7 +101,7 @@ def update_familiarity_weighted_average(
         quiz_topic=quiz,
         defaults={
             "note_id": note_id,
-            "difficulty_level": level,
+            "difficulty_level_id": level.id,
             "total_questions": 0,
             "correct_answers": 0,
             "weighted_total": Decimal('0.00'),
@@ -145,18 +151,20 @@ def update_familiarity_weighted_average(
             uf.note = Note.objects.get(pk=note_id)
         except ObjectDoesNotExist:
             pass
-    uf.difficulty_level = level
+    uf.difficulty_level_id = level.id
 
-    # 10) 寫回熟悉度
+    # 10) 寫回熟悉度與下次複習時間
     uf.familiarity = new_pct  # 百分比
+    uf.next_review_at = next_review_at(new_pct, cap)
     uf.save(update_fields=[
         "note", "difficulty_level", "total_questions", "correct_answers",
         "weighted_total", "weighted_correct", "cap_weighted_sum",
-        "familiarity", "updated_at"
+        "familiarity", "next_review_at", "updated_at"
     ])
 
     # 拿 F() 後的實值
     uf.refresh_from_db(fields=["familiarity"])
+    track_histogram(uf.id, uf.histogram_bucket, uf.familiarity)
 
     return uf.familiarity  # 百分比（0~100）
 
@@ -197,15 +205,11 @@ def update_familiarity_weighted_average_optimized(
     # 1) 獲取 Quiz 和 Difficulty level（不使用 select_for_update，減少鎖定）
     quiz = Quiz.objects.get(pk=quiz_topic_id)
 
-    if difficulty_level_id is not None:
-        level = DifficultyLevels.objects.get(pk=difficulty_level_id)
-    elif difficulty_level_name is not None:
-        level = DifficultyLevels.objects.get(level_name=difficulty_level_name)
-    else:
-        raise ValueError("difficulty_level_id 或 difficulty_level_name 需擇一提供")
+    # 難度從 process 內快取取得，不查詢資料庫
+    level = get_level(difficulty_level_id, difficulty_level_name)
 
-    cap = _get_cap(level)      # 0.3 / 0.5 / 0.7 / 1.0
-    alpha = _get_alpha(level)  # 例：0.20
+    cap = level.cap      # 0.3 / 0.5 / 0.7 / 1.0
+    alpha = level.alpha  # 例：0.20
 
     # 2) 計算 accuracy（0~1）
     if accuracy is None:
@@ -228,8 +232,9 @@ def update_familiarity_weighted_average_optimized(
         current_familiarity_pct = _q(uf.familiarity)
         difficulty_cap_pct = cap * HUNDRED
         
-        # 快速檢查：如果已達上限，直接返回，不進行任何更新
+        # 快速檢查：如果已達上限，只重新排程下次複習，不更新熟悉度與統計
         if current_familiarity_pct >= difficulty_cap_pct:
+            UserFamiliarity.objects.filter(pk=uf.pk).update(next_review_at=next_review_at(uf.familiarity, cap))
             return uf.familiarity
             
         # 需要更新，使用 select_for_update 鎖定
@@ -242,7 +247,7 @@ def update_familiarity_weighted_average_optimized(
             user=user,
             quiz_topic_id=quiz_topic_id,
             note_id=note_id,
-            difficulty_level=level,
+            difficulty_level_id=level.id,
             total_questions=0,
             correct_answers=0,
             weighted_total=Decimal('0.00'),
@@ -264,18 +269,20 @@ def update_familiarity_weighted_average_optimized(
     new_pct = (new01 * HUNDRED).quantize(DEC2, rounding=ROUND_HALF_UP)
 
     # 8) 累加統計欄位（保持原有邏輯）
+    # 新記錄直接填值：INSERT 不能使用 F() 表達式
     if total_questions_this_run:
-        uf.total_questions = F('total_questions') + int(total_questions_this_run)
+        add = (lambda field, value: value) if created else (lambda field, value: F(field) + value)
+        uf.total_questions = add('total_questions', int(total_questions_this_run))
         if correct_answers_this_run is not None:
-            uf.correct_answers = F('correct_answers') + int(correct_answers_this_run)
+            uf.correct_answers = add('correct_answers', int(correct_answers_this_run))
 
         # 加權統計（以 cap 當作權重）
         add_w_total = (Decimal(str(total_questions_this_run)) * cap).quantize(DEC2)
         add_w_correct = (Decimal(str(correct_answers_this_run or 0)) * cap).quantize(DEC2)
 
-        uf.weighted_total = F('weighted_total') + add_w_total
-        uf.weighted_correct = F('weighted_correct') + add_w_correct
-        uf.cap_weighted_sum = F('cap_weighted_sum') + cap.quantize(DEC2)
+        uf.weighted_total = add('weighted_total', add_w_total)
+        uf.weighted_correct = add('weighted_correct', add_w_correct)
+        uf.cap_weighted_sum = add('cap_weighted_sum', cap.quantize(DEC2))
 
     # 9) 設置 Note 與難度記錄（可選）
     if note_id is not None:
@@ -283,10 +290,11 @@ def update_familiarity_weighted_average_optimized(
             uf.note = Note.objects.get(pk=note_id)
         except ObjectDoesNotExist:
             pass
-    uf.difficulty_level = level
+    uf.difficulty_level_id = level.id
 
-    # 10) 寫回熟悉度
+    # 10) 寫回熟悉度與下次複習時間
     uf.familiarity = new_pct  # 百分比
+    uf.next_review_at = next_review_at(new_pct, cap)
     
     if created:
         # 新記錄，直接保存
@@ -296,11 +304,249 @@ def update_familiarity_weighted_average_optimized(
         uf.save(update_fields=[
             "note", "difficulty_level", "total_questions", "correct_answers",
             "weighted_total", "weighted_correct", "cap_weighted_sum",
-            "familiarity", "updated_at"
+            "familiarity", "next_review_at", "updated_at"
         ])
 
     # 11) 獲取最終值（優化：只在必要時 refresh）
     if not created:
         uf.refresh_from_db(fields=["familiarity"])
+    track_histogram(uf.id, uf.histogram_bucket, uf.familiarity)
 
     return uf.familiarity  # 百分比（0~100）
+
+
+# 單一 SQL 的熟悉度 upsert
+# 上限檢查、權重平均與統計累加都在一個 INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE 內完成，
+# 鎖只在這一個語句到 commit 之間持有（原本是 select_for_update 之後的 5~7 次往返）。
+# 資料庫端以整數定點計算（熟悉度 0.01% = 1e-4、alpha / this_run 1e-4、new01 1e-8），
+# 進位結果與上面的 Decimal 版本完全相同（familiarity_replay 用的是同一套換算）。
+_UPSERT_SQL = {
+    "sqlite": {"int": "INTEGER", "div": "/", "least": "MIN", "greatest": "MAX"},
+    "mysql": {"int": "SIGNED", "div": "DIV", "least": "LEAST", "greatest": "GREATEST"},
+}
+
+
+def _next_familiarity_units(old_units: int, cap4: int, keep4: int, gain8: int) -> int:
+    """與 SQL 相同的整數運算：old_units 為 0.01% 單位，回傳新的 0.01% 單位"""
+    if old_units >= cap4:
+        return old_units
+    new01 = min(max(min(max(old_units, 0), 10000) * keep4 + gain8, 0), 100000000)
+    return (new01 + 5000) // 10000
+
+
+# 每次提交累加的統計欄位（順序即 _familiarity_upsert_sql 的欄位順序）
+COUNTER_FIELDS = ("total_questions", "correct_answers", "weighted_total", "weighted_correct", "cap_weighted_sum")
+
+
+def _familiarity_step(
+    *,
+    difficulty_level_id: int | None = None,
+    difficulty_level_name: str | None = None,
+    accuracy: float | Decimal | None = None,
+    total_questions_this_run: int | None = None,
+    correct_answers_this_run: int | None = None,
+) -> dict:
+    """
+    一次提交換算成定點參數（new01(1e-8) = old(1e-4) * keep4 + gain8，old >= cap4 時不變）
+    與 COUNTER_FIELDS 的增量；條件與進位和 update_familiarity_weighted_average 相同
+    """
+    level = get_level(difficulty_level_id, difficulty_level_name)
+    cap = level.cap
+    alpha = level.alpha
+
+    if accuracy is None:
+        if total_questions_this_run is None or correct_answers_this_run is None:
+            raise ValueError("accuracy 未提供時，必須提供 total_questions_this_run 與 correct_answers_this_run")
+        if total_questions_this_run <= 0:
+            raise ValueError("total_questions_this_run 必須 > 0")
+        accuracy = correct_answers_this_run / total_questions_this_run
+    this_run = (_clamp01(_q(accuracy)) * cap).quantize(DEC4)
+
+    alpha4 = int(alpha * 10000)
+    step = {
+        "level_id": level.id,
+        "cap4": int(cap * 10000),
+        "keep4": 10000 - alpha4,
+        "gain8": int(this_run * 10000) * alpha4,
+        "total_questions": 0,
+        "correct_answers": 0,
+        "weighted_total": Decimal('0.00'),
+        "weighted_correct": Decimal('0.00'),
+        "cap_weighted_sum": Decimal('0.00'),
+    }
+    if total_questions_this_run:
+        step["total_questions"] = int(total_questions_this_run)
+        if correct_answers_this_run is not None:
+            step["correct_answers"] = int(correct_answers_this_run)
+        step["weighted_total"] = (Decimal(str(total_questions_this_run)) * cap).quantize(DEC2)
+        step["weighted_correct"] = (Decimal(str(correct_answers_this_run or 0)) * cap).quantize(DEC2)
+        step["cap_weighted_sum"] = cap.quantize(DEC2)
+    return step
+
+
+def _familiarity_upsert_sql(vendor: str) -> str:
+    ops = _UPSERT_SQL[vendor]
+    uf, quiz, note = (connection.ops.quote_name(name) for name in ("UserFamiliarity", "Quiz", "Note"))
+    old = f"CAST(ROUND({uf}.familiarity * 100) AS {ops['int']})"
+    clamped = f"{ops['least']}({ops['greatest']}({old}, 0), 10000)"
+    new01 = f"{ops['least']}({ops['greatest']}({clamped} * %s + %s, 0), 100000000)"
+    familiarity = f"CASE WHEN {old} >= %s THEN {uf}.familiarity ELSE (({new01} + 5000) {ops['div']} 10000) / 100.0 END"
+    note_id = f"(SELECT id FROM {note} WHERE id = %s)"
+    assignments = {
+        "familiarity": familiarity,
+        "note_id": f"COALESCE({note_id}, {uf}.note_id)",
+        "difficulty_level_id": "%s",
+        "total_questions": f"{uf}.total_questions + %s",
+        "correct_answers": f"{uf}.correct_answers + %s",
+        "weighted_total": f"{uf}.weighted_total + %s",
+        "weighted_correct": f"{uf}.weighted_correct + %s",
+        "cap_weighted_sum": f"{uf}.cap_weighted_sum + %s",
+        "updated_at": "%s",
+    }
+    columns = ", ".join(["user_id", "quiz_topic_id", *assignments])
+    select = f"SELECT %s, id, %s, {note_id}, %s, %s, %s, %s, %s, %s, %s FROM {quiz} WHERE id = %s AND deleted_at IS NULL"
+    updates = ", ".join(f"{column} = {expression}" for column, expression in assignments.items())
+    if vendor == "mysql":
+        return f"INSERT INTO {uf} ({columns}) {select} ON DUPLICATE KEY UPDATE {updates}"
+    # SQLite：INSERT ... SELECT 接 ON CONFLICT 時 WHERE 不可省略（已有 deleted_at 條件）
+    return (f"INSERT INTO {uf} ({columns}) {select} ON CONFLICT (user_id, quiz_topic_id) DO UPDATE SET {updates} "
+            f"RETURNING CAST(ROUND(familiarity * 100) AS {ops['int']}), id, histogram_bucket")
+
+
+def upsert_familiarity(
+    *,
+    user: User,
+    quiz_topic_id: int,
+    difficulty_level_id: int | None = None,
+    difficulty_level_name: str | None = None,
+    accuracy: float | Decimal | None = None,
+    total_questions_this_run: int | None = None,
+    correct_answers_this_run: int | None = None,
+    note_id: int | None = None,
+) -> Decimal:
+    """
+    與 update_familiarity_weighted_average 相同的參數、公式與回傳值，但只送一個寫入語句：
+      - 已達難度上限時熟悉度不變，統計欄位照樣累加（與原版相同；optimized 版會直接跳過）
+      - Quiz 不存在或已軟刪除時丟出 Quiz.DoesNotExist
+      - SQLite 以 RETURNING 取回新值；MySQL 不支援，在同一個交易內再讀一次（列鎖仍在手上）
+      - 下次複習時間取決於新的熟悉度，取回後在同一個交易內以主鍵更新
+    其他資料庫改用 update_familiarity_weighted_average
+    """
+    vendor = connection.vendor
+    if vendor not in _UPSERT_SQL:
+        return update_familiarity_weighted_average(
+            user=user, quiz_topic_id=quiz_topic_id, difficulty_level_id=difficulty_level_id,
+            difficulty_level_name=difficulty_level_name, accuracy=accuracy,
+            total_questions_this_run=total_questions_this_run,
+            correct_answers_this_run=correct_answers_this_run, note_id=note_id,
+        )
+
+    step = _familiarity_step(
+        difficulty_level_id=difficulty_level_id, difficulty_level_name=difficulty_level_name, accuracy=accuracy,
+        total_questions_this_run=total_questions_this_run, correct_answers_this_run=correct_answers_this_run,
+    )
+    cap4, keep4, gain8 = step["cap4"], step["keep4"], step["gain8"]
+    counters = [step[field] for field in COUNTER_FIELDS]
+
+    answered_at = timezone.now()
+    now = connection.ops.adapt_datetimefield_value(answered_at)
+    initial = Decimal(_next_familiarity_units(0, cap4, keep4, gain8)).scaleb(-2)
+    params = [
+        # INSERT ... SELECT（新記錄，舊熟悉度視為 0）
+        user.id, initial, note_id, step["level_id"], *counters, now, quiz_topic_id,
+        # UPDATE（既有記錄）
+        cap4, keep4, gain8, note_id, step["level_id"], *counters, now,
+    ]
+    sql = _familiarity_upsert_sql(vendor)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if vendor == "mysql":
+            if cursor.rowcount == 0:
+                raise Quiz.DoesNotExist(f"Quiz {quiz_topic_id} not found")
+            cursor.execute(
+                f"SELECT CAST(ROUND(familiarity * 100) AS SIGNED), id, histogram_bucket FROM {connection.ops.quote_name('UserFamiliarity')} "
+                "WHERE user_id = %s AND quiz_topic_id = %s",
+                [user.id, quiz_topic_id],
+            )
+        row = cursor.fetchone()
+        if row is None:
+            raise Quiz.DoesNotExist(f"Quiz {quiz_topic_id} not found")
+        familiarity = Decimal(row[0]).scaleb(-2)
+        # 複習間隔要用新的熟悉度計算，同一個交易內以主鍵更新（列鎖已在手上）
+        cursor.execute(
+            f"UPDATE {connection.ops.quote_name('UserFamiliarity')} SET next_review_at = %s WHERE id = %s",
+            [connection.ops.adapt_datetimefield_value(
+                next_review_at(familiarity, Decimal(cap4).scaleb(-4), base=answered_at)), row[1]],
+        )
+    # 分布在交易提交後另外更新，不延長這一列的持鎖時間
+    track_histogram(row[1], row[2], familiarity)
+    return familiarity
+
+
+def update_familiarity(**kwargs) -> Decimal:
+    """提交答案時使用的熟悉度更新（FAMILIARITY_WRITE_BEHIND 先進緩衝；FAMILIARITY_UPSERT 決定走單一 SQL 或 ORM 版本）"""
+    if FAMILIARITY_WRITE_BEHIND:
+        from .familiarity_buffer import submit
+
+        familiarity = submit(**kwargs)
+        if familiarity is not None:
+            return familiarity
+    if FAMILIARITY_UPSERT:
+        return upsert_familiarity(**kwargs)
+    return update_familiarity_weighted_average_optimized(**kwargs)
+
+
+def apply_familiarity_submission(user: User, payload: dict) -> dict:
+    """
+    提交答案後的熟悉度更新（SubmitAnswerView 與背景工作共用，直接在 process 內計算，不再繞一圈 HTTP）
+    payload 與 /api/familiarity/ 相同：quiz_topic_id / difficulty_level / total_questions / correct_answers
+    回傳與 /api/familiarity/ 相同欄位的 dict
+    """
+    new_fam = update_familiarity(
+        user=user,
+        quiz_topic_id=payload["quiz_topic_id"],
+        difficulty_level_name=payload.get("difficulty_level") or "beginner",
+        total_questions_this_run=payload.get("total_questions"),
+        correct_answers_this_run=payload.get("correct_answers"),
+    )
+    return {
+        "familiarity": float(new_fam),
+        "quiz_topic_id": payload["quiz_topic_id"],
+        "difficulty_level": payload.get("difficulty_level") or "beginner",
+    }
+
+
+def ensure_familiarity_record(
+    user: User,
+    quiz_topic_id: int,
+    difficulty_name: str | None,
+    total_questions: int,
+    correct_answers: int,
+) -> UserFamiliarity:
+    """
+    不計算熟悉度的提交（單一題目、TEST / error 模式）：確保熟悉度記錄存在並累加題數
+    新記錄熟悉度為 0%，一併計入排行分布並排程複習
+    """
+    level = level_or_default(difficulty_name)
+    uf, created = UserFamiliarity.objects.get_or_create(
+        user=user,
+        quiz_topic_id=quiz_topic_id,
+        defaults={
+            "difficulty_level_id": level.id if level else None,
+            "total_questions": total_questions,
+            "correct_answers": correct_answers,
+            "weighted_total": Decimal('0.00'),
+            "weighted_correct": Decimal('0.00'),
+            "cap_weighted_sum": Decimal('0.00'),
+            "familiarity": Decimal('0.00'),
+            "next_review_at": next_review_at(0, 1),  # 熟悉度 0：REVIEW_MIN_HOURS 後複習
+        },
+    )
+    if created:
+        track_histogram(uf.id, None, uf.familiarity)
+    else:
+        uf.total_questions = F('total_questions') + total_questions
+        uf.correct_answers = F('correct_answers') + correct_answers
+        uf.save(update_fields=['total_questions', 'correct_answers', 'updated_at'])
+    return uf
@@ -0,0 +1,58 @@
+# 背景工作處理函式
+# 由 TopicConfig.ready() 匯入註冊，實際在 `python manage.py run_jobs` 的 worker 內執行。
+# 處理函式丟出例外即視為失敗，由 jobs.run_job 依退避時間重試。
+import logging
+import os
+
+import requests
+
+from myapps.Authorization.models import User
+from myapps.log_utils import log_event
+from .chat_context import fold_overflow
+from .explanations import generate_explanation
+from .jobs import register
+from .models import Note
+from .serializers import NoteSerializer
+from .services import apply_familiarity_submission
+
+logger = logging.getLogger(__name__)
+
+FLASK_BASE_URL = os.getenv("FLASK_BASE_URL", "https://aaron-website9-ml.onrender.com")
+
+
+@register("retest")
+def run_retest(job):
+    """筆記內容傳至 Flask 重新整理（RetestView）"""
+    note = Note.objects.select_related("quiz_topic").get(id=job.payload["note_id"], deleted_at__isnull=True)
+    response = requests.post(f'{FLASK_BASE_URL}/api/retest', json=NoteSerializer(note).data, timeout=(5, 30))
+    response.raise_for_status()
+    return {"content": response.json().get("content")}
+
+
+@register("parse_answer")
+def run_parse_answer(job):
+    """生成題目解析並存進 TopicExplanation（ParseAnswerView）"""
+    payload = job.payload
+    final = job.attempts >= job.max_attempts
+    if not generate_explanation(payload["explanation_id"], {"title": payload["title"], "Ai_answer": payload["Ai_answer"]}, final=final):
+        raise RuntimeError("題目解析生成失敗")
+    return {"explanation_id": payload["explanation_id"]}
+
+
+@register("familiarity")
+def run_familiarity(job):
+    """提交答案後計算熟悉度（SubmitAnswerView 在 process 內計算失敗時才會排入）"""
+    payload = dict(job.payload)
+    user = User.objects.get(id=payload.pop("user_id"))
+    result = apply_familiarity_submission(user, payload)
+    log_event(logger, logging.DEBUG, "熟悉度計算完成", user_id=user.id,
+              quiz_topic_id=payload.get("quiz_topic_id"), familiarity=result["familiarity"])
+    return result
+
+
+@register("chat_fold")
+def run_chat_fold(job):
+    """把超出預算的舊對話折疊進滾動摘要（build_chat_context 觸發）"""
+    payload = job.payload
+    folded = fold_overflow(payload["user_id"], payload["topic_id"], payload["summarized_until"])
+    return {"folded": folded}
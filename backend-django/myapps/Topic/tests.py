@@ -1,3 +1,744 @@
-from django.test import TestCase
+# 熟悉度、作答彙總、排行與複習排程的行為測試
+# migrations 含 MySQL 專用的 RunSQL；在 SQLite 上執行時需以 TEST MIGRATE=False 的設定建立測試資料庫
+import io
+import random
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from myapps.Authorization.models import User
+from . import attempts, chat_context, explanations, familiarity_buffer, jobs, leaderboard, review, services
+from .difficulty_registry import get_level, invalidate
+from .familiarity_replay import accuracy_fixed, replay, to_fixed
+from .models import (
+    Attempt, AttemptDailyRollup, Chat, ChatSummary, DifficultyLevels, Job, Note, Quiz, Topic, TopicExplanation,
+    UserFamiliarity,
+)
+
+# (名稱, familiarity_cap, alpha)；odd / hot 用來檢查非整數上限與 alpha > 1 時的進位
+LEVELS = [
+    ("beginner", Decimal("0.25"), 0.3),
+    ("intermediate", Decimal("0.50"), 0.2),
+    ("advanced", Decimal("0.75"), 0.35),
+    ("master", Decimal("1.00"), 0.2),
+    ("test", Decimal("100.00"), 0.2),
+    ("odd", Decimal("0.33"), 0.1234),
+    ("hot", Decimal("1.00"), 1.5),
+]
+
+ROW_FIELDS = (
+    "familiarity", "total_questions", "correct_answers", "weighted_total", "weighted_correct",
+    "cap_weighted_sum", "difficulty_level_id", "note_id", "histogram_bucket",
+)
+
+
+class FamiliarityTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for level_id, (name, cap, alpha) in enumerate(LEVELS, 1):
+            DifficultyLevels.objects.create(id=level_id, level_name=name, familiarity_cap=cap,
+                                            weight_coefficients={"alpha": alpha})
+        cls.user = User.objects.create(username="student", email="student@example.com")
+
+    def setUp(self):
+        invalidate()
+        self.addCleanup(invalidate)
+
+    def row(self, quiz):
+        return UserFamiliarity.objects.filter(user=self.user, quiz_topic=quiz).values(*ROW_FIELDS).get()
+
+
+def random_run(rng):
+    """一次提交的參數：題數 / 答對數，或直接給 accuracy（含超出 0~1 的值）"""
+    kwargs = {"difficulty_level_name": rng.choice(LEVELS)[0]}
+    if rng.random() < 0.2:
+        kwargs["accuracy"] = rng.choice([0.0, 1.0, 0.33333, rng.random(), 1.2])
+    else:
+        total = rng.randint(1, 12)
+        kwargs.update(total_questions_this_run=total, correct_answers_this_run=rng.randint(0, total))
+    return kwargs
+
+
+class UpsertFamiliarityTest(FamiliarityTestCase):
+    def test_matches_weighted_average(self):
+        note = Note.objects.create(user=self.user, content="筆記")
+        rng = random.Random(0)
+        for _ in range(60):
+            orm = Quiz.objects.create(quiz_topic="orm", user=self.user)
+            sql = Quiz.objects.create(quiz_topic="sql", user=self.user)
+            for _ in range(rng.randint(1, 8)):
+                kwargs = random_run(rng)
+                note_id = rng.choice([None, note.id])
+                expected = services.update_familiarity_weighted_average(
+                    user=self.user, quiz_topic_id=orm.id, note_id=note_id, **kwargs)
+                actual = services.upsert_familiarity(user=self.user, quiz_topic_id=sql.id, note_id=note_id, **kwargs)
+                self.assertEqual(actual, expected, kwargs)
+                self.assertEqual(self.row(sql), self.row(orm), kwargs)
+
+    def test_capped_familiarity_still_counts_questions(self):
+        quiz = Quiz.objects.create(quiz_topic="capped", user=self.user)
+        for _ in range(30):
+            services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id, difficulty_level_name="hot", accuracy=1)
+        capped = services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id, difficulty_level_name="beginner",
+                                             total_questions_this_run=4, correct_answers_this_run=0)
+        row = self.row(quiz)
+        self.assertEqual(capped, Decimal("100.00"))
+        self.assertEqual(row["familiarity"], Decimal("100.00"))
+        self.assertEqual((row["total_questions"], row["correct_answers"]), (4, 0))
+
+    def test_schedules_next_review(self):
+        quiz = Quiz.objects.create(quiz_topic="review", user=self.user)
+        services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id, difficulty_level_name="master", accuracy=1)
+        self.assertIsNotNone(UserFamiliarity.objects.get(quiz_topic=quiz).next_review_at)
+
+    def test_missing_or_soft_deleted_quiz(self):
+        deleted = Quiz.objects.create(quiz_topic="deleted", user=self.user, deleted_at=timezone.now())
+        for quiz_id in (deleted.id, 10 ** 9):
+            with self.assertRaises(Quiz.DoesNotExist):
+                services.upsert_familiarity(user=self.user, quiz_topic_id=quiz_id,
+                                            difficulty_level_name="master", accuracy=0.5)
+        self.assertFalse(UserFamiliarity.objects.filter(user=self.user).exists())
+
+
+class FamiliarityReplayTest(FamiliarityTestCase):
+    """NumPy 重播（familiarity_replay / recompute_familiarity）與逐次 upsert_familiarity 的結果逐筆相同"""
+
+    def test_replay_matches_upsert(self):
+        rng = random.Random(2)
+        quizzes = [Quiz.objects.create(quiz_topic=f"replay-{key}", user=self.user) for key in range(60)]
+        keys, acc4, cap4, alpha4 = [], [], [], []
+        # 各 Quiz 的輪次交錯出現，重播需依 key 分組並維持原本的先後順序
+        for _ in range(400):
+            key = rng.randrange(len(quizzes))
+            kwargs = random_run(rng)
+            services.upsert_familiarity(user=self.user, quiz_topic_id=quizzes[key].id, **kwargs)
+            level = get_level(name=kwargs["difficulty_level_name"])
+            if "accuracy" in kwargs:
+                acc4.append(to_fixed(services._clamp01(services._q(kwargs["accuracy"]))))
+            else:
+                acc4.append(int(accuracy_fixed(kwargs["correct_answers_this_run"], kwargs["total_questions_this_run"])))
+            keys.append(key)
+            cap4.append(to_fixed(level.cap))
+            alpha4.append(to_fixed(level.alpha))
+
+        result = replay(keys, acc4, cap4, alpha4, len(quizzes))
+        for key, (quiz, value) in enumerate(zip(quizzes, result.tolist())):
+            if key in keys:
+                self.assertEqual(self.row(quiz)["familiarity"], Decimal(value).scaleb(-2), quiz.quiz_topic)
+
+    def test_recompute_command_matches_upsert(self):
+        rng = random.Random(3)
+        levels = [name for name, _, _ in LEVELS if name != "test"]  # SubmitAnswerView 不計算 test 難度
+        base = timezone.now() - timedelta(days=1)
+        expected = {}
+        for key in range(30):
+            quiz = Quiz.objects.create(quiz_topic=f"recompute-{key}", user=self.user)
+            for run in range(rng.randint(1, 8)):
+                level = get_level(name=rng.choice(levels))
+                answers = [rng.random() < 0.6 for _ in range(rng.randint(1, 12))]
+                Attempt.objects.bulk_create([
+                    Attempt(user_id=self.user.id, quiz_id=quiz.id, topic_id=i + 1, difficulty_id=level.id,
+                            correct=correct, source=Attempt.SOURCE_RUN,
+                            answered_at=base + timedelta(minutes=key * 10 + run))
+                    for i, correct in enumerate(answers)
+                ])
+                services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id, difficulty_level_id=level.id,
+                                            total_questions_this_run=len(answers),
+                                            correct_answers_this_run=sum(answers))
+            expected[quiz.id] = self.row(quiz)["familiarity"]
+
+        UserFamiliarity.objects.update(familiarity=Decimal("0.00"))
+        call_command("recompute_familiarity", stdout=io.StringIO())
+        self.assertEqual(dict(UserFamiliarity.objects.values_list("quiz_topic_id", "familiarity")), expected)
+
+
+class FamiliarityBufferTest(FamiliarityTestCase):
+    """write-behind：背景執行緒不啟動，測試中直接呼叫 flush()"""
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(services, "FAMILIARITY_WRITE_BEHIND", True),
+            mock.patch.object(familiarity_buffer, "FAMILIARITY_FLUSH_WINDOW", 3600),
+            mock.patch.object(familiarity_buffer, "_ensure_flusher"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(familiarity_buffer._pending.clear)
+
+    def submit(self, quiz, **kwargs):
+        return services.update_familiarity(user=self.user, quiz_topic_id=quiz.id, **kwargs)
+
+    def test_flush_matches_direct_upserts(self):
+        rng = random.Random(1)
+        pairs = []
+        for i in range(20):
+            buffered = Quiz.objects.create(quiz_topic="buffered", user=self.user)
+            direct = Quiz.objects.create(quiz_topic="direct", user=self.user)
+            pairs.append((buffered, direct))
+            if i % 2:
+                # 已有記錄：緩衝以資料庫中的值為基準
+                for quiz in (buffered, direct):
+                    services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id,
+                                                difficulty_level_name="master", accuracy=0.8)
+            for _ in range(rng.randint(1, 6)):
+                kwargs = random_run(rng)
+                expected = services.upsert_familiarity(user=self.user, quiz_topic_id=direct.id, **kwargs)
+                self.assertEqual(self.submit(buffered, **kwargs), expected, kwargs)
+                self.assertEqual(familiarity_buffer.pending_familiarity(self.user.id, buffered.id), expected)
+
+        self.assertEqual(familiarity_buffer.flush(), 0)
+        self.assertEqual(familiarity_buffer.flush(all_keys=True), len(pairs))
+        self.assertEqual(familiarity_buffer._pending, {})
+        self.assertEqual(familiarity_buffer.pending_familiarity(self.user.id), {})
+        for buffered, direct in pairs:
+            self.assertEqual(self.row(buffered), self.row(direct))
+
+    def test_repeated_submits_do_not_touch_database(self):
+        quiz = Quiz.objects.create(quiz_topic="burst", user=self.user)
+        self.submit(quiz, difficulty_level_name="master", total_questions_this_run=5, correct_answers_this_run=4)
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                self.submit(quiz, difficulty_level_name="master", total_questions_this_run=5, correct_answers_this_run=4)
+        self.assertFalse(UserFamiliarity.objects.filter(quiz_topic=quiz).exists())
+
+        familiarity_buffer.flush(all_keys=True)
+        row = self.row(quiz)
+        self.assertEqual((row["total_questions"], row["correct_answers"]), (55, 44))
+
+    def test_flush_waits_for_window(self):
+        quiz = Quiz.objects.create(quiz_topic="window", user=self.user)
+        self.submit(quiz, difficulty_level_name="master", accuracy=1)
+        self.assertEqual(familiarity_buffer.flush(), 0)
+        with mock.patch.object(familiarity_buffer, "FAMILIARITY_FLUSH_WINDOW", 0):
+            self.assertEqual(familiarity_buffer.flush(), 1)
+        self.assertEqual(self.row(quiz)["familiarity"], Decimal("20.00"))
+
+    def test_conflicting_write_is_replayed(self):
+        # 緩衝期間另一個 process 改了同一列：寫入時以新值為基準，重播緩衝中的提交
+        buffered = Quiz.objects.create(quiz_topic="buffered", user=self.user)
+        serial = Quiz.objects.create(quiz_topic="serial", user=self.user)
+        for quiz in (buffered, serial):
+            services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id, difficulty_level_name="master", accuracy=0.5)
+
+        self.submit(buffered, difficulty_level_name="master", accuracy=1.0)
+        services.upsert_familiarity(user=self.user, quiz_topic_id=buffered.id,
+                                    difficulty_level_name="advanced", accuracy=0.3)
+        self.submit(buffered, difficulty_level_name="master", accuracy=0.9)
+        familiarity_buffer.flush(all_keys=True)
+
+        for kwargs in (dict(difficulty_level_name="advanced", accuracy=0.3),
+                       dict(difficulty_level_name="master", accuracy=1.0),
+                       dict(difficulty_level_name="master", accuracy=0.9)):
+            services.upsert_familiarity(user=self.user, quiz_topic_id=serial.id, **kwargs)
+        self.assertEqual(self.row(buffered), self.row(serial))
+
+    def test_full_buffer_writes_directly(self):
+        quiz = Quiz.objects.create(quiz_topic="full", user=self.user)
+        with mock.patch.object(familiarity_buffer, "FAMILIARITY_BUFFER_MAX_KEYS", 0):
+            familiarity = self.submit(quiz, difficulty_level_name="master", accuracy=1)
+        self.assertEqual(familiarity_buffer._pending, {})
+        self.assertEqual(self.row(quiz)["familiarity"], familiarity)
+
+    def test_missing_quiz(self):
+        with self.assertRaises(Quiz.DoesNotExist):
+            self.submit(Quiz(id=10 ** 9), difficulty_level_name="master", accuracy=1)
+        self.assertEqual(familiarity_buffer._pending, {})
+
+
+class AttemptRollupTest(TestCase):
+    USER_ID = 7
+
+    def add_attempts(self, rng, submissions):
+        """隨機產生幾次提交（同一次提交共用 answered_at），跨越數天、兩個 Quiz、兩個難度與兩個用戶"""
+        now = timezone.now()
+        for _ in range(submissions):
+            answered_at = now - timedelta(days=rng.randint(0, 40), minutes=rng.randint(2, 600))
+            user_id = rng.choice([self.USER_ID, self.USER_ID + 1])
+            quiz_id = rng.choice([1, 2])
+            source = rng.choice([Attempt.SOURCE_RUN, Attempt.SOURCE_SINGLE, Attempt.SOURCE_TEST])
+            Attempt.objects.bulk_create([
+                Attempt(user_id=user_id, quiz_id=quiz_id, topic_id=rng.randint(1, 50), difficulty_id=rng.choice([1, 4]),
+                        correct=rng.random() < 0.6, source=source, answered_at=answered_at)
+                for _ in range(rng.randint(1, 5))
+            ])
+
+    def add_single(self, answered_at):
+        return Attempt.objects.create(user_id=self.USER_ID, quiz_id=1, topic_id=1, difficulty_id=1, correct=True,
+                                      source=Attempt.SOURCE_SINGLE, answered_at=answered_at)
+
+    def expected_stats(self, user_id, quiz_id=None, days=30):
+        """直接由 Attempt 逐筆計算"""
+        since = timezone.localdate() - timedelta(days=days - 1)
+        stats = {}
+        runs = {}
+        for attempt in Attempt.objects.filter(user_id=user_id):
+            day = timezone.localdate(attempt.answered_at)
+            if day < since or (quiz_id is not None and attempt.quiz_id != quiz_id):
+                continue
+            key = (day, attempt.quiz_id, attempt.difficulty_id)
+            entry = stats.setdefault(key, {
+                "day": day.isoformat(), "quiz_topic_id": attempt.quiz_id, "difficulty_id": attempt.difficulty_id,
+                "attempts": 0, "correct": 0, "runs": 0,
+            })
+            entry["attempts"] += 1
+            entry["correct"] += attempt.correct
+            if attempt.source == Attempt.SOURCE_RUN:
+                runs.setdefault(key, set()).add(attempt.answered_at)
+        for key, times in runs.items():
+            stats[key]["runs"] = len(times)
+        return [stats[key] for key in sorted(stats)]
+
+    def assertStats(self):
+        for user_id in (self.USER_ID, self.USER_ID + 1):
+            self.assertEqual(attempts.daily_stats(user_id), self.expected_stats(user_id))
+            self.assertEqual(attempts.daily_stats(user_id, quiz_id=2, days=7),
+                             self.expected_stats(user_id, quiz_id=2, days=7))
+
+    def test_rollup_matches_raw_attempts(self):
+        rng = random.Random(2)
+        self.add_attempts(rng, 80)
+        self.assertStats()
+
+        processed, _ = attempts.rollup(batch_size=7, settle_seconds=0)
+        self.assertEqual(processed, Attempt.objects.count())
+        self.assertEqual(attempts.watermark(), Attempt.objects.latest("id").id)
+        self.assertStats()
+
+        # 彙總之後的新作答由 daily_stats 直接讀 Attempt 補上
+        self.add_attempts(rng, 20)
+        self.assertStats()
+        attempts.rollup(batch_size=1000, settle_seconds=0)
+        self.assertStats()
+
+    def test_rerun_is_idempotent(self):
+        self.add_attempts(random.Random(3), 30)
+        attempts.rollup(settle_seconds=0)
+        before = list(AttemptDailyRollup.objects.order_by("id").values())
+        self.assertEqual(attempts.rollup(settle_seconds=0), (0, 0))
+        self.assertEqual(list(AttemptDailyRollup.objects.order_by("id").values()), before)
+
+    def test_small_batches_do_not_split_a_submission(self):
+        self.add_attempts(random.Random(4), 40)
+        attempts.rollup(batch_size=1, settle_seconds=0)
+        self.assertStats()
+        for row in AttemptDailyRollup.objects.filter(runs__gt=0):
+            self.assertLessEqual(row.runs, row.attempts)
+
+    def test_recent_attempts_wait_to_settle(self):
+        attempts.record_attempts(self.USER_ID, 1, Attempt.SOURCE_RUN, [(1, 1, True), (2, 1, False)])
+        self.assertEqual(attempts.rollup(settle_seconds=60), (0, 0))
+        self.assertEqual(attempts.watermark(), 0)
+        self.assertStats()
+        self.assertEqual(attempts.totals_by_quiz(), {1: 2})
+
+    def test_unsettled_attempt_after_an_id_gap(self):
+        # id 順序與作答時間不一致（並行的提交先後 commit），且尚未穩定的作答前面是空號（rollback 的 INSERT）
+        old = timezone.now() - timedelta(hours=1)
+        first = self.add_single(old)
+        self.add_single(old).delete()
+        self.add_single(timezone.now())
+        self.add_single(old - timedelta(minutes=1))
+
+        self.assertEqual(attempts.rollup(settle_seconds=60), (1, 1))
+        self.assertEqual(attempts.watermark(), first.id)
+        self.assertStats()
+        self.assertEqual(attempts.totals_by_quiz([1]), {1: 3})
+
+
+class LeaderboardTest(FamiliarityTestCase):
+    TOPIC = "光合作用"
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(5)
+        self.users = [User.objects.create(username=f"u{i}", email=f"u{i}@example.com") for i in range(30)]
+        self.quizzes = []
+        for user in self.users:
+            for topic in (self.TOPIC, "細胞"):
+                quiz = Quiz.objects.create(quiz_topic=topic, user=user)
+                self.quizzes.append(quiz)
+                for _ in range(rng.randint(0, 6)):
+                    services.upsert_familiarity(user=user, quiz_topic_id=quiz.id, **random_run(rng))
+
+    def rows(self, topic, include_deleted=True):
+        queryset = UserFamiliarity.objects.filter(quiz_topic__quiz_topic=topic)
+        if not include_deleted:
+            queryset = queryset.filter(quiz_topic__deleted_at__isnull=True)
+        return queryset
+
+    def test_histogram_matches_rebuild(self):
+        histogram = {topic: leaderboard.histogram(topic) for topic in (self.TOPIC, "細胞")}
+        for topic, counts in histogram.items():
+            self.assertEqual(sum(counts), self.rows(topic).count())
+        total, fixed = leaderboard.rebuild()
+        self.assertEqual((total, fixed), (UserFamiliarity.objects.count(), 0))
+        self.assertEqual({topic: leaderboard.histogram(topic) for topic in histogram}, histogram)
+
+    def test_percentile_matches_counting_rows(self):
+        familiarities = [leaderboard.bucket_of(f) for f in self.rows(self.TOPIC).values_list("familiarity", flat=True)]
+        for familiarity in (0, 0.5, 12.34, 50, 99.99, 100, *familiarities):
+            bucket = leaderboard.bucket_of(familiarity)
+            below = sum(1 for b in familiarities if b < bucket)
+            same = sum(1 for b in familiarities if b == bucket)
+            expected = round((below + same / 2) / len(familiarities) * 100, 1)
+            self.assertEqual(leaderboard.percentile(self.TOPIC, familiarity), (expected, len(familiarities)))
+        self.assertEqual(leaderboard.percentile("沒有人", 50), (None, 0))
+
+    def test_top_matches_order_by(self):
+        # 軟刪除的 Quiz 仍在分布中，但不列入排行
+        Quiz.objects.filter(id__in=[quiz.id for quiz in self.quizzes[:10]]).update(deleted_at=timezone.now())
+        expected = list(
+            self.rows(self.TOPIC, include_deleted=False).order_by("-familiarity", "updated_at")
+            .values_list("user_id", "user__username", "familiarity")
+        )
+        for limit in (1, 3, 10, len(expected), len(expected) + 5):
+            self.assertEqual(leaderboard.top(self.TOPIC, limit), expected[:limit], limit)
+
+    def test_top_reads_only_upper_buckets(self):
+        # 第 3 名所在格以下的列不會被讀取，也不參與排序
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(leaderboard.top(self.TOPIC, 3)), 3)
+        sql = queries.captured_queries[-1]["sql"]
+        self.assertIn("histogram_bucket", sql)
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn("idx_uf_quiz_bucket", plan)
+
+    def test_moves_between_buckets_on_update(self):
+        quiz = Quiz.objects.create(quiz_topic=self.TOPIC, user=self.user)
+        before = leaderboard.histogram(self.TOPIC)
+        services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id, difficulty_level_name="master", accuracy=1)
+        services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id, difficulty_level_name="master", accuracy=1)
+        after = leaderboard.histogram(self.TOPIC)
+        self.assertEqual(UserFamiliarity.objects.get(quiz_topic=quiz).histogram_bucket, 36)
+        self.assertEqual([a - b for a, b in zip(after, before)], [int(bucket == 36) for bucket in range(leaderboard.BUCKETS)])
+
+    def test_rename_and_delete(self):
+        quiz = Quiz.objects.create(quiz_topic=self.TOPIC, user=self.user)
+        services.upsert_familiarity(user=self.user, quiz_topic_id=quiz.id, difficulty_level_name="master", accuracy=1)
+        total = sum(leaderboard.histogram(self.TOPIC))
+
+        Quiz.objects.filter(id=quiz.id).update(quiz_topic="葉綠體")
+        leaderboard.rename_topic(quiz.id, self.TOPIC, "葉綠體")
+        self.assertEqual(sum(leaderboard.histogram(self.TOPIC)), total - 1)
+        self.assertEqual(leaderboard.histogram("葉綠體")[20], 1)
+
+        UserFamiliarity.objects.filter(quiz_topic=quiz).delete()
+        self.assertEqual(sum(leaderboard.histogram("葉綠體")), 0)
+        UserFamiliarity.objects.filter(quiz_topic__quiz_topic="細胞").delete()
+        self.assertEqual(sum(leaderboard.histogram("細胞")), 0)
+        self.assertEqual(leaderboard.rebuild()[1], 0)
+        self.assertEqual(sum(leaderboard.histogram(self.TOPIC)), total - 1)
+
+
+@mock.patch.object(review, "REVIEW_MAX_DAYS", 60)
+@mock.patch.object(review, "REVIEW_MIN_HOURS", 12)
+class ReviewIntervalTest(SimpleTestCase):
+    def hours(self, familiarity, cap):
+        return review.review_interval(familiarity, cap) / timedelta(hours=1)
+
+    def test_endpoints(self):
+        self.assertAlmostEqual(self.hours(0, 1), 12)
+        self.assertAlmostEqual(self.hours(100, 1), 60 * 24)
+        # beginner（上限 0.25）達上限時最多 15 天
+        self.assertAlmostEqual(self.hours(25, Decimal("0.25")), 15 * 24)
+        self.assertAlmostEqual(self.hours(50, 1), 12 * 120 ** 0.5)
+
+    def test_out_of_range_inputs_are_clamped(self):
+        self.assertAlmostEqual(self.hours(-5, 1), 12)
+        self.assertAlmostEqual(self.hours(100, Decimal("0.25")), 15 * 24)
+        self.assertAlmostEqual(self.hours(100, 100), 60 * 24)
+        self.assertAlmostEqual(self.hours(50, 0), 12)
+
+    def test_monotonic_in_familiarity(self):
+        for cap in (Decimal("0.25"), Decimal("0.5"), Decimal("0.75"), 1):
+            intervals = [review.review_interval(familiarity, cap) for familiarity in range(0, 101)]
+            self.assertEqual(intervals, sorted(intervals), cap)
+
+    def test_next_review_at(self):
+        base = timezone.now()
+        self.assertEqual(review.next_review_at(Decimal("37.5"), Decimal("0.75"), base=base),
+                         base + review.review_interval(Decimal("37.5"), Decimal("0.75")))
+
+
+class ReviewScheduleTest(FamiliarityTestCase):
+    def test_due_skips_future_and_soft_deleted(self):
+        now = timezone.now()
+        rows = {}
+        for name, offset, deleted in (("late", -2, False), ("today", -1, False), ("soon", 3, False),
+                                      ("later", 48, False), ("deleted", -5, True)):
+            quiz = Quiz.objects.create(quiz_topic=name, user=self.user, deleted_at=now if deleted else None)
+            rows[name] = UserFamiliarity.objects.create(user=self.user, quiz_topic=quiz,
+                                                        next_review_at=now + timedelta(hours=offset))
+        self.assertEqual(list(review.due(self.user.id, now=now)), [rows["late"], rows["today"]])
+        self.assertEqual(list(review.due(self.user.id, now=now, within=timedelta(hours=6))),
+                         [rows["late"], rows["today"], rows["soon"]])
+
+    def test_backfill(self):
+        quiz = Quiz.objects.create(quiz_topic="backfill", user=self.user)
+        other = Quiz.objects.create(quiz_topic="scheduled", user=self.user)
+        beginner = DifficultyLevels.objects.get(level_name="beginner")
+        pending = UserFamiliarity.objects.create(user=self.user, quiz_topic=quiz, difficulty_level=beginner,
+                                                 familiarity=Decimal("12.50"))
+        scheduled_at = timezone.now() + timedelta(days=3)
+        scheduled = UserFamiliarity.objects.create(user=self.user, quiz_topic=other, next_review_at=scheduled_at)
+
+        self.assertEqual(review.backfill(chunk_size=1), 1)
+        pending.refresh_from_db()
+        scheduled.refresh_from_db()
+        self.assertEqual(pending.next_review_at,
+                         pending.updated_at + review.review_interval(Decimal("12.50"), Decimal("0.25")))
+        self.assertEqual(scheduled.next_review_at, scheduled_at)
+        self.assertEqual(review.backfill(), 0)
+        self.assertEqual(review.backfill(all_rows=True), 2)
+
+
+@mock.patch.object(chat_context, "CHAT_SUMMARY_TRIGGER_TOKENS", 1000)
+@mock.patch.object(chat_context, "CHAT_CONTEXT_TOKEN_BUDGET", 35)
+@mock.patch.object(chat_context, "CHAT_CONTEXT_MAX_ROWS", 5)
+class ChatContextTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="chatter", email="chatter@example.com")
+        quiz = Quiz.objects.create(quiz_topic="光合作用", user=cls.user)
+        cls.topic = Topic.objects.create(quiz_topic=quiz, title="光合作用的產物？")
+
+    def add_turns(self, count):
+        # 每則 11 token：預算內只放得下最新的 3 則
+        return [Chat.objects.create(topic=self.topic, user=self.user, content=f"第{i:03d}則訊息內容", sender="user")
+                for i in range(count)]
+
+    def summarize(self, summary, turns):
+        self.batches.append([t["id"] for t in turns])
+        return (summary + " " + ",".join(str(t["id"]) for t in turns)).strip()
+
+    def setUp(self):
+        self.batches = []
+        patcher = mock.patch.object(chat_context, "_summarize", side_effect=self.summarize)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fold_reaches_turns_beyond_the_row_limit(self):
+        turns = self.add_turns(23)
+        history, _ = chat_context.build_chat_context(self.user.id, self.topic)
+        self.assertEqual([t["content"] for t in history], [t.content for t in turns[-3:]])
+
+        self.assertTrue(chat_context.fold_overflow(self.user.id, self.topic.id, 0))
+        # 由最舊的開始，每批不超過 CHAT_CONTEXT_MAX_ROWS，預算內的最新 3 則不摘要
+        folded = [chat_id for batch in self.batches for chat_id in batch]
+        self.assertEqual(folded, [t.id for t in turns[:-3]])
+        self.assertTrue(all(len(batch) <= 5 for batch in self.batches))
+        state = ChatSummary.objects.get(user=self.user, topic=self.topic)
+        self.assertEqual(state.summarized_until, turns[-4].id)
+        self.assertEqual(state.summary.replace(" ", ",").split(","), [str(t.id) for t in turns[:-3]])
+
+        history, summary = chat_context.build_chat_context(self.user.id, self.topic)
+        self.assertEqual(summary, state.summary)
+        self.assertEqual(len(history), 3)
+
+    def test_backlog_beyond_the_row_limit_schedules_a_fold(self):
+        self.add_turns(8)
+        with mock.patch.object(chat_context, "schedule_fold") as schedule_fold:
+            chat_context.build_chat_context(self.user.id, self.topic)
+        schedule_fold.assert_called_once_with(self.user.id, self.topic.id, 0)
+
+        ChatSummary.objects.all().delete()
+        Chat.objects.all().delete()
+        self.add_turns(5)
+        with mock.patch.object(chat_context, "schedule_fold") as schedule_fold:
+            chat_context.build_chat_context(self.user.id, self.topic)
+        schedule_fold.assert_not_called()
+
+    def test_fold_runs_as_a_job(self):
+        turns = self.add_turns(12)
+        chat_context.build_chat_context(self.user.id, self.topic)
+        chat_context.build_chat_context(self.user.id, self.topic)
+        job = Job.objects.get()
+        self.assertEqual((job.kind, job.payload["summarized_until"]), ("chat_fold", 0))
+
+        [claimed] = jobs.claim_jobs("test-worker", 5)
+        self.assertEqual(jobs.run_job(claimed), Job.STATUS_SUCCEEDED)
+        self.assertEqual(Job.objects.get().result, {"folded": True})
+        self.assertEqual(ChatSummary.objects.get().summarized_until, turns[-4].id)
+
+    def test_stale_fold_does_nothing(self):
+        self.add_turns(10)
+        ChatSummary.objects.create(user=self.user, topic=self.topic, summary="舊摘要", summarized_until=1)
+        self.assertFalse(chat_context.fold_overflow(self.user.id, self.topic.id, 0))
+        self.assertEqual(self.batches, [])
+
+
+class ExplanationClaimTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="reader", email="reader@example.com")
+        quiz = Quiz.objects.create(quiz_topic="光合作用", user=cls.user)
+        cls.topic = Topic.objects.create(quiz_topic=quiz, title="光合作用的產物？", option_A="氧氣", option_B="氮氣",
+                                         option_C="氦氣", option_D="氖氣", Ai_answer="A")
+
+    def parse_jobs(self):
+        return Job.objects.filter(kind="parse_answer").count()
+
+    def test_second_request_does_not_regenerate(self):
+        explanation, started = explanations.request_explanation(self.topic, self.user)
+        self.assertTrue(started)
+        again, started = explanations.request_explanation(self.topic, self.user)
+        self.assertEqual((again.pk, again.status, started), (explanation.pk, TopicExplanation.STATUS_PENDING, False))
+        self.assertEqual(self.parse_jobs(), 1)
+
+        response = mock.Mock(**{"json.return_value": {"parsed_answer": " 光反應產生氧氣 "}})
+        [job] = jobs.claim_jobs("worker", 5)
+        with mock.patch.object(explanations.requests, "post", return_value=response):
+            self.assertEqual(jobs.run_job(job), Job.STATUS_SUCCEEDED)
+        ready, started = explanations.request_explanation(self.topic, self.user)
+        self.assertEqual((ready.status, ready.content, started), (TopicExplanation.STATUS_READY, "光反應產生氧氣", False))
+        self.assertEqual(self.parse_jobs(), 1)
+
+    def test_only_one_of_two_claimers_wins(self):
+        TopicExplanation.objects.create(topic=self.topic, status=TopicExplanation.STATUS_FAILED, attempts=1)
+        # 兩個請求讀到同一個版本的記錄，條件更新只讓先到的那一個成功
+        first = TopicExplanation.objects.get(topic=self.topic)
+        second = TopicExplanation.objects.get(topic=self.topic)
+        self.assertTrue(explanations._claim(first))
+        self.assertFalse(explanations._claim(second))
+        self.assertEqual(TopicExplanation.objects.get().status, TopicExplanation.STATUS_PENDING)
+
+    def test_failed_enqueue_releases_the_claim(self):
+        with mock.patch.object(jobs, "JOBS_MAX_QUEUED", 0):
+            with self.assertRaises(jobs.QueueFull):
+                explanations.request_explanation(self.topic, self.user)
+        explanation = TopicExplanation.objects.get()
+        self.assertEqual((explanation.status, explanation.error, explanation.attempts),
+                         (TopicExplanation.STATUS_FAILED, "queue full", 0))
+        self.assertEqual(self.parse_jobs(), 0)
+
+        _, started = explanations.request_explanation(self.topic, self.user)
+        self.assertTrue(started)
+        self.assertEqual(self.parse_jobs(), 1)
+
+    def test_stale_pending_is_reclaimed(self):
+        explanation = TopicExplanation.objects.create(topic=self.topic)
+        self.assertFalse(explanations._claim(explanation))
+        stale = timezone.now() - timedelta(seconds=explanations.EXPLANATION_STALE_SECONDS + 1)
+        TopicExplanation.objects.filter(pk=explanation.pk).update(updated_at=stale)
+        _, started = explanations.request_explanation(self.topic, self.user)
+        self.assertTrue(started)
+        self.assertGreater(TopicExplanation.objects.get().updated_at, stale)
+
+    def test_exhausted_failures_are_not_reclaimed(self):
+        TopicExplanation.objects.create(topic=self.topic, status=TopicExplanation.STATUS_FAILED,
+                                        attempts=explanations.EXPLANATION_MAX_ATTEMPTS)
+        explanation, started = explanations.request_explanation(self.topic, self.user)
+        self.assertFalse(started)
+        self.assertEqual(explanation.status, TopicExplanation.STATUS_FAILED)
+        self.assertFalse(explanations.serialize_explanation(explanation)["retryable"])
+        self.assertEqual(self.parse_jobs(), 0)
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.calls = []
+        patcher = mock.patch.dict(jobs.HANDLERS, {"echo": self.echo, "boom": self.boom})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def echo(self, job):
+        self.calls.append(job.id)
+        return {"echo": job.payload["value"]}
+
+    def boom(self, job):
+        self.calls.append(job.id)
+        raise RuntimeError("Flask 503")
+
+    def test_enqueue_claim_succeed(self):
+        job = jobs.enqueue("echo", {"value": 1})
+        [claimed] = jobs.claim_jobs("worker-a", 5)
+        self.assertEqual(jobs.claim_jobs("worker-b", 5), [])
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (job.id, Job.STATUS_RUNNING, 1))
+
+        self.assertEqual(jobs.run_job(claimed), Job.STATUS_SUCCEEDED)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.attempts), (Job.STATUS_SUCCEEDED, {"echo": 1}, 1))
+        self.assertIsNone(job.locked_at)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(jobs.claim_jobs("worker-a", 5), [])
+
+    def test_claim_order_and_filters(self):
+        low = jobs.enqueue("echo", {"value": 1})
+        high = jobs.enqueue("echo", {"value": 2}, priority=5)
+        jobs.enqueue("echo", {"value": 3}, delay=60)
+        other = jobs.enqueue("boom")
+        self.assertEqual([job.id for job in jobs.claim_jobs("worker", 2, kinds=["echo"])], [high.id, low.id])
+        self.assertEqual([job.id for job in jobs.claim_jobs("worker", 5)], [other.id])
+        self.assertEqual(jobs.claim_jobs("worker", 0), [])
+
+    def test_enqueue_rejects_unknown_kind_and_full_queue(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue("missing")
+        with mock.patch.object(jobs, "JOBS_MAX_QUEUED", 2):
+            jobs.enqueue("echo", {"value": 1})
+            jobs.enqueue("echo", {"value": 2})
+            with self.assertRaises(jobs.QueueFull):
+                jobs.enqueue("echo", {"value": 3})
+        self.assertEqual(Job.objects.count(), 2)
+
+    @mock.patch.object(jobs.random, "uniform", return_value=1.0)
+    @mock.patch.object(jobs, "JOBS_BACKOFF_MAX", 600)
+    @mock.patch.object(jobs, "JOBS_BACKOFF_BASE", 5)
+    def test_failure_backs_off_then_fails(self, uniform):
+        job = jobs.enqueue("boom", max_attempts=3)
+        for attempt, delay in ((1, 5), (2, 10)):
+            [claimed] = jobs.claim_jobs("worker", 5)
+            before = timezone.now()
+            self.assertEqual(jobs.run_job(claimed), Job.STATUS_QUEUED)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, attempt))
+            self.assertIn("Flask 503", job.last_error)
+            self.assertGreaterEqual(job.run_after, before + timedelta(seconds=delay))
+            self.assertLessEqual(job.run_after, timezone.now() + timedelta(seconds=delay))
+            # 退避時間未到不會被取走
+            self.assertEqual(jobs.claim_jobs("worker", 5), [])
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+        [claimed] = jobs.claim_jobs("worker", 5)
+        self.assertEqual(jobs.run_job(claimed), Job.STATUS_FAILED)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 3))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(jobs.claim_jobs("worker", 5), [])
+        self.assertEqual(len(self.calls), 3)
+
+    def test_backoff_is_capped(self):
+        with mock.patch.object(jobs.random, "uniform", return_value=1.0):
+            self.assertEqual([jobs.backoff_seconds(n) for n in (1, 2, 3)],
+                             [jobs.JOBS_BACKOFF_BASE * 2 ** (n - 1) for n in (1, 2, 3)])
+            self.assertEqual(jobs.backoff_seconds(100), jobs.JOBS_BACKOFF_MAX)
+
+    def test_stale_running_jobs_are_recovered(self):
+        retry = jobs.enqueue("echo", {"value": 1})
+        exhausted = jobs.enqueue("echo", {"value": 2}, max_attempts=1)
+        fresh = jobs.enqueue("echo", {"value": 3})
+        claimed = {job.id: job for job in jobs.claim_jobs("crashed-worker", 5)}
+        old = timezone.now() - timedelta(seconds=jobs.JOBS_LOCK_TIMEOUT + 1)
+        Job.objects.filter(pk__in=[retry.pk, exhausted.pk]).update(locked_at=old)
+
+        self.assertEqual(jobs.requeue_stale(), 2)
+        statuses = dict(Job.objects.values_list("id", "status"))
+        self.assertEqual(statuses, {retry.id: Job.STATUS_QUEUED, exhausted.id: Job.STATUS_FAILED,
+                                    fresh.id: Job.STATUS_RUNNING})
+
+        # 被收回的工作，原本的 worker 晚到的結果不會覆寫
+        jobs.run_job(claimed[retry.id])
+        self.assertEqual(Job.objects.get(pk=retry.pk).status, Job.STATUS_QUEUED)
+        [again] = jobs.claim_jobs("worker", 5)
+        self.assertEqual((again.id, again.attempts), (retry.id, 2))
+        self.assertEqual(jobs.run_job(again), Job.STATUS_SUCCEEDED)
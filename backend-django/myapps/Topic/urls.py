@@ -1,8 +1,10 @@
 from django.urls import path
 from django.http import JsonResponse
-from .views import QuizViewSet , TopicDetailViewSet, QuizTopicsViewSet , AddFavoriteViewSet , ChatViewSet , ChatContentToNoteView,NoteEdit , NoteListView , CreateQuizTopicView ,UserQuizView ,RetestView ,ParseAnswerView ,UsersQuizAndNote , SubmitAnswerView , NoteEditQuizTopicView
+from .views import QuizViewSet , QuizStreamView , TopicDetailViewSet, QuizTopicsViewSet , AddFavoriteViewSet , ChatViewSet , ChatStreamView , ChatContentToNoteView,NoteEdit , NoteListView , CreateQuizTopicView ,UserQuizView ,RetestView ,ParseAnswerView ,UsersQuizAndNote , SubmitAnswerView , NoteEditQuizTopicView , JobStatusView , AttemptDailyStatsView
 from .soft_delete_views import SoftDeleteManagementViewSet
 from .familiarity_views import SubmitAttemptView
+from .leaderboard_views import LeaderboardPercentileView, LeaderboardTopView
+from .review_views import ReviewDueView
 
 # API根端點
 def api_root(request):
@@ -12,14 +14,21 @@ def api_root(request):
         "version": "v1",
         "endpoints": {
             "quiz": "/api/quiz/",
+            "quiz_stream": "/api/quiz/stream/",
             "topics": "/api/topic/<id>/",
             "notes": "/api/notes/",
             "chat": "/api/chat/",
+            "chat_stream": "/api/chat/stream/",
             "user_quiz_and_notes": "/api/user_quiz_and_notes/",
             "submit_answer": "/api/submit_answer/",
             "familiarity": "/api/familiarity/",
             "create_quiz": "/api/create_quiz/",
-            "add_favorite": "/api/add-favorite/"
+            "add_favorite": "/api/add-favorite/",
+            "job_status": "/api/jobs/<id>/",
+            "attempts_daily": "/api/attempts/daily/",
+            "leaderboard_percentile": "/api/leaderboard/percentile/",
+            "leaderboard_top": "/api/leaderboard/top/",
+            "review_due": "/api/review/due/"
         }
     })
 
@@ -29,6 +38,8 @@ urlpatterns = [
     
     # 創建題目和獲取所有題目
     path('quiz/', QuizViewSet.as_view(), name='quiz'),
+    # 串流產生題目（NDJSON，每題完成即推送）
+    path('quiz/stream/', QuizStreamView.as_view(), name='quiz_stream'),
     
     # 根據題目ID獲取單個題目詳細資料
     path('topic/<int:topic_id>/', TopicDetailViewSet.as_view(), name='topic_detail'),
@@ -45,6 +56,8 @@ urlpatterns = [
 
     # AI聊天室
     path('chat/', ChatViewSet.as_view(), name='ai_chat'),
+    # 串流聊天（NDJSON，逐 token 推送）
+    path('chat/stream/', ChatStreamView.as_view(), name='ai_chat_stream'),
     path('chat/addtonote/', ChatContentToNoteView.as_view(), name='add_to_note'),
     path('notes/<int:note_id>/', NoteEdit.as_view(), name='note_edit'),
     path('notes/', NoteListView.as_view(), name='note-list'),
@@ -58,12 +71,26 @@ urlpatterns = [
 
     # 解析答案
     path('parse_answer/', ParseAnswerView.as_view(), name='parse_answer'),
+    path('parse_answer/<int:topic_id>/', ParseAnswerView.as_view(), name='parse_answer_result'),
+
+    # 背景工作狀態
+    path('jobs/<int:job_id>/', JobStatusView.as_view(), name='job_status'),
+
+    # 每日作答統計
+    path('attempts/daily/', AttemptDailyStatsView.as_view(), name='attempts_daily'),
 
     # 取得用戶的所有quiz 和 note
     path('user_quiz_and_notes/', UsersQuizAndNote.as_view(), name='user_quiz_and_notes'),
 
     # 熟悉度計算
     path('familiarity/', SubmitAttemptView.as_view(), name='familiarity'),
+
+    # 熟悉度排行
+    path('leaderboard/percentile/', LeaderboardPercentileView.as_view(), name='leaderboard_percentile'),
+    path('leaderboard/top/', LeaderboardTopView.as_view(), name='leaderboard_top'),
+
+    # 間隔複習
+    path('review/due/', ReviewDueView.as_view(), name='review_due'),
     
 
     # 前端回傳用戶答案
@@ -1,8 +1,15 @@
 
 from django.shortcuts import render , get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from .serializers import UserFavoriteSerializer, TopicSerializer,  NoteSerializer, ChatSerializer, AiPromptSerializer ,AiInteractionSerializer ,QuizSerializer, UserFamiliaritySerializer, DifficultyLevelsSerializer , QuizSimplifiedSerializer ,UserFamiliaritySimplifiedSerializer , NoteSimplifiedSerializer , TopicSimplifiedSerializer , AddFavoriteTopicSerializer
-from .models import UserFavorite, Topic,  Note, Chat, AiPrompt,AiInteraction , Quiz , UserFamiliarity, DifficultyLevels
+from .models import UserFavorite, Topic,  Note, Chat, AiPrompt,AiInteraction , Quiz , UserFamiliarity, TopicExplanation, Job, Attempt
+from .chat_context import build_chat_context
+from .explanations import request_explanation, answer_text, serialize_explanation
+from .jobs import enqueue, serialize_job, QueueFull
+from .difficulty_registry import instances as difficulty_instances
+from .services import apply_familiarity_submission, ensure_familiarity_record
+from .attempts import daily_stats, record_attempts
+from .leaderboard import rename_topic
 from myapps.Authorization.serializers import UserSerializer
 from myapps.Authorization.models import User
 from rest_framework.viewsets import ModelViewSet
@@ -13,12 +20,14 @@ from django.utils import timezone
 from rest_framework.response import Response
 from django.db import transaction
 import os , requests
+import json
+import logging
 import time
-import threading
-import asyncio
 from functools import wraps
-from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from myapps.log_utils import log_event, log_sampled, truncate
+
+logger = logging.getLogger(__name__)
 
 # 資料庫查詢效能監控裝飾器
 def monitor_query_performance(func):
@@ -33,9 +42,7 @@ def monitor_query_performance(func):
             end_time = time.time()
             execution_time = end_time - start_time
             
-            print(f"=== 效能監控: {func.__name__} ===")
-            print(f"執行時間: {execution_time:.4f} 秒")
-            print("=" * 50)
+            log_sampled(logger, logging.INFO, "效能監控", func=func.__name__, seconds=round(execution_time, 4))
             
             return result
             
@@ -43,10 +50,8 @@ def monitor_query_performance(func):
             end_time = time.time()
             execution_time = end_time - start_time
             
-            print(f"=== 效能監控錯誤: {func.__name__} ===")
-            print(f"執行時間: {execution_time:.4f} 秒")
-            print(f"錯誤: {str(e)}")
-            print("=" * 50)
+            log_event(logger, logging.ERROR, "效能監控錯誤", func=func.__name__,
+                      seconds=round(execution_time, 4), error=str(e))
             
             raise
     
@@ -101,26 +106,54 @@ def add_cors_headers(response):
     return response
 
 FLASK_BASE_URL = os.getenv("FLASK_BASE_URL", "https://aaron-website9-ml.onrender.com")
-DJANGO_BASE_URL = os.getenv("DJANGO_BASE_URL", "https://aaron-website9-backend.onrender.com")
 
-# 優化：異步Flask API調用函數，使用線程池提升效能
-def async_flask_call(url, data, timeout=10):
-    """異步調用Flask API，使用線程池避免創建過多線程"""
-    def _make_request():
-        try:
-            response = requests.post(url, json=data, timeout=timeout)
-            print(f"異步Flask API調用完成: {url}, 狀態碼: {response.status_code}")
-            return response
-        except Exception as e:
-            print(f"異步Flask API調用失敗: {url}, 錯誤: {str(e)}")
-            return None
-    
-    # 使用線程池執行，避免線程創建開銷
-    future = executor.submit(_make_request)
-    return future
+# 背景工作佇列已滿（背壓）：請前端稍後重試
+def queue_full_response():
+    response = Response({"error": "Server busy, please retry later"}, status=503)
+    response["Retry-After"] = "30"
+    return response
+
+# 先判斷 quiz_topic 是否有未軟刪除的 Quiz，有則不再新建
+def get_or_create_user_quiz(quiz_topic_name, user_instance):
+    """取得用戶同名且未刪除的 Quiz，沒有則新建並自動加入收藏"""
+    quiz = Quiz.objects.filter(quiz_topic=quiz_topic_name, user=user_instance, deleted_at__isnull=True).first()
+    if quiz:
+        logger.debug("Found existing Quiz: %s (ID: %s) for user: %s", quiz.quiz_topic, quiz.id, user_instance.id)
+        return quiz
+
+    quiz = Quiz.objects.create(
+        quiz_topic=quiz_topic_name,
+        user=user_instance
+    )
+    logger.info("Created new Quiz: %s (ID: %s) for user: %s", quiz.quiz_topic, quiz.id, user_instance.id)
+
+    # 自動添加到用戶收藏
+    try:
+        UserFavorite.objects.create(
+            user=user_instance,
+            quiz=quiz
+        )
+    except Exception as e:
+        logger.warning("添加收藏失敗: %s", e)
+        # 不阻止主流程繼續
+    return quiz
+
+def build_topic(quiz, question, difficulty_map):
+    """把 Flask 回傳的題目轉成 Topic 物件（尚未存檔）"""
+    difficulty_id = question.get('difficulty_id', 1)
+    difficulty_instance = difficulty_map.get(difficulty_id, difficulty_map.get(1))
+    return Topic(
+        quiz_topic=quiz,
+        title=question.get('title'),
+        option_A=question.get('option_A'),
+        option_B=question.get('option_B'),
+        option_C=question.get('option_C'),
+        option_D=question.get('option_D'),
+        difficulty=difficulty_instance,
+        Ai_answer=question.get('Ai_answer'),
+        explanation_text=question.get('explanation_text')
+    )
 
-# 線程池執行器
-executor = ThreadPoolExecutor(max_workers=5)
 # Create your views here.
 
 # flask api接口
@@ -145,14 +178,8 @@ class QuizViewSet(APIView):
             
             result = flask_response.json()
             
-            # 調試: 印出 Flask 回應
-            print(f"=== Flask API 回應 ===")
-            print(f"回應狀態碼: {flask_response.status_code}")
-            print(f"回應內容: {result}")
-            print(f"題目數量: {len(result.get('questions', []))}")
-            for i, q in enumerate(result.get('questions', []), 1):
-                print(f"題目 {i}: {q.get('title', 'No title')}")
-            print("=" * 50)
+            log_event(logger, logging.DEBUG, "Flask API 回應", status=flask_response.status_code,
+                      questions=len(result.get('questions', [])), result=result)
             
             # 從請求中獲取 user_id（可能來自 Flask 的回應或原始請求）
             user_id = request.data.get('user_id') or result.get('user')
@@ -167,63 +194,20 @@ class QuizViewSet(APIView):
                 }, status=400)
             
             # 返回結果 寫回資料庫
-            # 先判斷 quiz_topic 是否有未軟刪除的 Quiz，有則不再新建
-            quiz_topic_name = result.get('quiz_topic')
-            quiz = Quiz.objects.filter(quiz_topic=quiz_topic_name, user_id=user_id, deleted_at__isnull=True).first()
-            if quiz:
-                print(f"Found existing Quiz: {quiz.quiz_topic} (ID: {quiz.id}) for user: {user_instance}")
-            else:
-                quiz = Quiz.objects.create(
-                    quiz_topic=quiz_topic_name,
-                    user=user_instance
-                )
-                print(f"Created new Quiz: {quiz.quiz_topic} (ID: {quiz.id}) for user: {user_instance}")
-                
-                # 自動添加到用戶收藏
-                try:
-                    UserFavorite.objects.create(
-                        user=user_instance,
-                        quiz=quiz
-                    )
-                    print(f"✅ 自動添加Quiz到用戶收藏: {quiz.quiz_topic}")
-                except Exception as e:
-                    print(f"⚠️ 添加收藏失敗: {str(e)}")
-                    # 不阻止主流程繼續
+            quiz = get_or_create_user_quiz(result.get('quiz_topic'), user_instance)
             
             # 優化：批量創建 Topic，大幅提升資料庫寫入效能
             topics = []
             new_topic_ids = []
-            print(f"=== 開始批量創建 Topic ===")
-            print(f"準備創建 {len(result.get('questions', []))} 個 Topic")
             
-            # 預先獲取所有難度等級，避免重複查詢
-            difficulty_ids = set(q.get('difficulty_id', 1) for q in result.get('questions', []))
-            difficulty_map = {
-                diff.id: diff for diff in DifficultyLevels.objects.filter(id__in=difficulty_ids)
-            }
+            # 難度等級由 process 內快取提供，不查詢資料庫
+            difficulty_map = difficulty_instances()
             
             # 準備批量創建的Topic對象列表
             topic_objects = []
-            for i, q in enumerate(result.get('questions', []), 1):
-                print(f"準備第 {i} 個 Topic: {q.get('title', 'No title')}")
-                
-                # 處理難度等級
-                difficulty_id = q.get('difficulty_id', 1)
-                difficulty_instance = difficulty_map.get(difficulty_id, difficulty_map.get(1))
-                
+            for q in result.get('questions', []):
                 # 創建Topic對象但不保存到資料庫
-                topic = Topic(
-                    quiz_topic=quiz,
-                    title=q.get('title'),
-                    option_A=q.get('option_A'),
-                    option_B=q.get('option_B'),
-                    option_C=q.get('option_C'),
-                    option_D=q.get('option_D'),
-                    difficulty=difficulty_instance,
-                    Ai_answer=q.get('Ai_answer'),
-                    explanation_text=q.get('explanation_text')
-                )
-                topic_objects.append(topic)
+                topic_objects.append(build_topic(quiz, q, difficulty_map))
             
             # 使用bulk_create批量創建，效能提升10-50倍
             created_topics = Topic.objects.bulk_create(
@@ -233,7 +217,7 @@ class QuizViewSet(APIView):
             
             # 檢查bulk_create是否成功
             if not created_topics:
-                print(f"❌ 批量創建Topic失敗：沒有題目被創建")
+                logger.error("批量創建Topic失敗：沒有題目被創建 (quiz=%s)", quiz.id)
                 return Response({
                     'error': 'Failed to create topics in database. Please try again.'
                 }, status=500)
@@ -242,8 +226,7 @@ class QuizViewSet(APIView):
             topics = created_topics
             new_topic_ids = [topic.id for topic in created_topics]
             
-            print(f"✅ 批量創建完成，總共創建了 {len(topics)} 個 Topic")
-            print("=" * 50)
+            log_sampled(logger, logging.INFO, "批量創建 Topic 完成", quiz_id=quiz.id, count=len(topics))
 
             # 重新從資料庫獲取 quiz 實例以確保最新資料
             quiz.refresh_from_db()
@@ -273,10 +256,6 @@ class QuizViewSet(APIView):
             # 使用優化查詢工具函數，大幅提升查詢效能
             quizzes = optimize_quiz_query(request.user)
             
-            print(f"=== GET 方法除錯 ===")
-            print(f"用戶: {request.user}")
-            print(f"找到 {quizzes.count()} 個 Quiz")
-            
             quiz_list = []
             for quiz in quizzes:
                 # 使用預先載入的 topic_set，避免額外查詢
@@ -310,6 +289,85 @@ class QuizViewSet(APIView):
                 'error': f'Internal server error: {str(e)}'
             }, status=500)
 
+# 串流版產生題目：轉發 Flask /api/quiz/stream 的 NDJSON，
+# 每收到一題就寫入 Topic 並立即推送給前端，遊戲頁拿到第一題即可開始
+class QuizStreamView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user_id = request.data.get('user_id')
+        try:
+            user_instance = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response({
+                'error': f'User with ID {user_id} not found'
+            }, status=400)
+
+        try:
+            flask_response = requests.post(
+                f'{FLASK_BASE_URL}/api/quiz/stream',
+                json=request.data,
+                stream=True,
+                timeout=(5, 60)  # 連線 5 秒；兩行之間最多等 60 秒
+            )
+        except requests.exceptions.ConnectionError:
+            return Response({
+                'error': 'Cannot connect to Flask service. Make sure it is running on port 5000.'
+            }, status=503)
+
+        if flask_response.status_code != 200:
+            details = flask_response.text
+            flask_response.close()
+            return Response({
+                'error': f'Flask service error: {flask_response.status_code}',
+                'details': details
+            }, status=500)
+
+        # 難度等級由 process 內快取提供，不查詢資料庫
+        difficulty_map = difficulty_instances()
+
+        def relay():
+            quiz = None
+            count = 0
+            try:
+                for line in flask_response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line.decode('utf-8'))
+                    event_type = event.get('type')
+
+                    if event_type == 'start':
+                        quiz = get_or_create_user_quiz(event.get('quiz_topic'), user_instance)
+                        yield json.dumps({
+                            "type": "start",
+                            "quiz": QuizSerializer(quiz).data,
+                            "total": event.get('total')
+                        }, ensure_ascii=False) + "\n"
+
+                    elif event_type == 'question' and quiz is not None:
+                        topic = build_topic(quiz, event.get('question', {}), difficulty_map)
+                        topic.save()
+                        count += 1
+                        yield json.dumps({
+                            "type": "topic",
+                            "index": event.get('index'),
+                            "topic": TopicSerializer(topic).data
+                        }, ensure_ascii=False) + "\n"
+
+                    elif event_type in ('done', 'error'):
+                        event['count'] = count
+                        yield json.dumps(event, ensure_ascii=False) + "\n"
+
+            except Exception as e:
+                yield json.dumps({"type": "error", "error": str(e), "count": count}, ensure_ascii=False) + "\n"
+            finally:
+                flask_response.close()
+
+        response = StreamingHttpResponse(relay(), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 # 根據題目ID獲取單個題目詳細資料
 class TopicDetailViewSet(APIView):
     permission_classes = [IsAuthenticated]
@@ -420,8 +478,12 @@ class QuizTopicsViewSet(APIView):
 
         try:
             quiz = Quiz.objects.get(id=quiz_id, deleted_at__isnull=True)
-            quiz.quiz_topic = new_quiz_topic
-            quiz.save()
+            old_quiz_topic = quiz.quiz_topic
+            with transaction.atomic():
+                quiz.quiz_topic = new_quiz_topic
+                quiz.save()
+                # 熟悉度排行以題目名稱分組，改名時一併搬移
+                rename_topic(quiz.id, old_quiz_topic, new_quiz_topic)
             return Response({'message': 'Quiz updated successfully'}, status=200)
         except Quiz.DoesNotExist:
             return Response({'error': f'Quiz with ID {quiz_id} not found'}, status=404)
@@ -436,7 +498,7 @@ class AddFavoriteViewSet(APIView):
             user = request.data.get('user_id')  # 從請求中獲取當前使用者
             content = request.data.get('content')
             topic = request.data.get('topic_id')
-            print(f"~~~~~ 使用者: {user} ,回傳內容: {content}  , 使用題目: {topic} ~~~~~")
+            log_sampled(logger, logging.INFO, "收到回傳內容", user_id=user, topic_id=topic, content=truncate(content or '', 100))
             if not user:
                 return Response({'error': 'User is not authenticated'}, status=401)
             if not content:
@@ -495,6 +557,30 @@ class AddFavoriteViewSet(APIView):
         except Exception as e:
             return Response({'error': f'Internal server error: {str(e)}'}, status=500)
 
+def build_chat_payload(user_id, topic_instance, content):
+    """準備傳送給 Flask 的聊天資料：題目內容 + 預算內的最近對話 + 較早對話的摘要（供 AI 思考）"""
+    chat_history, summary = build_chat_context(user_id, topic_instance)
+
+    topic_data = {
+        'id': topic_instance.id,
+        'title': topic_instance.title,
+        'option_A': topic_instance.option_A,
+        'option_B': topic_instance.option_B,
+        'option_C': topic_instance.option_C,
+        'option_D': topic_instance.option_D,
+        'Ai_answer': topic_instance.Ai_answer,
+        'explanation_text': topic_instance.explanation_text
+    }
+
+    return {
+        'user_id': user_id,
+        'topic_id': topic_instance.id,
+        'topic_data': topic_data,
+        'content': content,
+        'chat_history': chat_history,
+        'summary': summary
+    }
+
 class ChatViewSet(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -531,8 +617,6 @@ class ChatViewSet(APIView):
     def post(self, request):
         """處理聊天訊息"""
         try:
-            print(f"~~~~~ Django 收到的請求資料: {request.data} ~~~~~")
-            
             # 檢查必要欄位是否存在
             user_id = request.data.get('user_id')
             topic_id = request.data.get('topic_id')
@@ -569,33 +653,11 @@ class ChatViewSet(APIView):
                 sender='user'
             )
             
-            # 2. 獲取歷史對話記錄用於 AI 思考
-            chat_history = Chat.objects.filter(
-                topic=topic_instance, 
-                deleted_at__isnull=True
-            ).order_by('created_at').values('content', 'sender')
-            
-            # 準備傳送給 Flask 的資料，包含歷史對話
-            topic_data = {
-                'id': topic_instance.id,
-                'title': topic_instance.title,
-                'option_A': topic_instance.option_A,
-                'option_B': topic_instance.option_B,
-                'option_C': topic_instance.option_C,
-                'option_D': topic_instance.option_D,
-                'Ai_answer': topic_instance.Ai_answer,
-                'explanation_text': topic_instance.explanation_text
-            }
-
-            flask_data = {
-                'user_id': user_id,
-                'topic_id': topic_id,
-                'topic_data': topic_data,
-                'content': content,
-                'chat_history': list(chat_history)  # 包含歷史對話供 AI 參考
-            }
+            # 2. 準備傳送給 Flask 的資料，包含歷史對話
+            flask_data = build_chat_payload(user_id, topic_instance, content)
             
-            print(f"~~~~~ 傳送給 Flask 的資料: {flask_data} ~~~~~")
+            log_sampled(logger, logging.INFO, "傳送聊天請求到 Flask", user_id=user_id, topic_id=topic_id,
+                        history=len(flask_data['chat_history']), has_summary=bool(flask_data['summary']))
             
             # 3. 傳給 Flask 做處理
             flask_response = requests.post(
@@ -611,7 +673,6 @@ class ChatViewSet(APIView):
                 }, status=500)
             
             result = flask_response.json()
-            print(f"~~~~~ Flask 回傳的資料: {result} ~~~~~")
             
             # 4. 儲存 AI 回應
             ai_chat = Chat.objects.create(
@@ -637,6 +698,115 @@ class ChatViewSet(APIView):
                 'error': f'Internal server error: {str(e)}'
             }, status=500)
 
+# 串流版聊天：逐 token 轉送 Flask 的回應，串流結束後才寫入 AI 的 Chat 記錄
+# 回傳 application/x-ndjson：
+#   {"type": "user_message", "message": {...}}   用戶訊息已儲存
+#   {"type": "token", "delta": "..."}
+#   {"type": "done", "ai_response": {...}}        AI 回應已儲存
+#   {"type": "error", "error": ...}
+class ChatStreamView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user_id = request.data.get('user_id')
+        topic_id = request.data.get('topic_id')
+        content = request.data.get('content') or request.data.get('message')
+
+        if not user_id:
+            return Response({'error': 'user_id is required'}, status=400)
+        if not topic_id:
+            return Response({'error': 'topic_id is required'}, status=400)
+        if not content:
+            return Response({'error': 'content or message is required'}, status=400)
+
+        try:
+            user_instance = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response({
+                'error': f'User with ID {user_id} not found'
+            }, status=400)
+
+        try:
+            topic_instance = Topic.objects.get(id=topic_id, deleted_at__isnull=True)
+        except Topic.DoesNotExist:
+            return Response({
+                'error': f'Topic with ID {topic_id} not found'
+            }, status=404)
+
+        # 1. 先儲存用戶訊息
+        user_chat = Chat.objects.create(
+            user=user_instance,
+            topic=topic_instance,
+            content=content,
+            sender='user'
+        )
+
+        # 2. 連線到 Flask 串流端點（只等到回應標頭，不等整段生成完成）
+        try:
+            flask_response = requests.post(
+                f'{FLASK_BASE_URL}/api/chat/stream',
+                json=build_chat_payload(user_id, topic_instance, content),
+                stream=True,
+                timeout=(5, 60)  # 連線 5 秒；兩個 token 之間最多等 60 秒
+            )
+        except requests.exceptions.ConnectionError:
+            return Response({
+                'error': 'Cannot connect to Flask service. Make sure it is running on port 5000.'
+            }, status=503)
+
+        if flask_response.status_code != 200:
+            details = flask_response.text
+            flask_response.close()
+            return Response({
+                'error': f'Flask service error: {flask_response.status_code}',
+                'details': details
+            }, status=500)
+
+        def relay():
+            parts = []
+            try:
+                yield json.dumps({
+                    "type": "user_message",
+                    "message": ChatSerializer(user_chat).data
+                }, ensure_ascii=False) + "\n"
+
+                for line in flask_response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line.decode('utf-8'))
+                    event_type = event.get('type')
+
+                    if event_type == 'token':
+                        parts.append(event.get('delta', ''))
+                        yield json.dumps({"type": "token", "delta": event.get('delta', '')}, ensure_ascii=False) + "\n"
+
+                    elif event_type == 'done':
+                        # 3. 串流完成才儲存 AI 回應
+                        ai_chat = Chat.objects.create(
+                            user=user_instance,
+                            topic=topic_instance,
+                            content=event.get('response') or "".join(parts),
+                            sender='ai'
+                        )
+                        yield json.dumps({
+                            "type": "done",
+                            "ai_response": ChatSerializer(ai_chat).data,
+                            "conversation_id": topic_id
+                        }, ensure_ascii=False) + "\n"
+
+                    elif event_type == 'error':
+                        yield json.dumps({"type": "error", "error": event.get('error')}, ensure_ascii=False) + "\n"
+
+            except Exception as e:
+                yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+            finally:
+                flask_response.close()
+
+        response = StreamingHttpResponse(relay(), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 class ChatContentToNoteView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -871,7 +1041,6 @@ class CreateQuizTopicView(APIView):
             #檢查使用者是否有建立過Quiz
             user_quiz = Quiz.objects.filter(user=user, quiz_topic=quiz_topic_name, deleted_at__isnull=True).first()
             if user_quiz:
-                print(f"使用者 {user.username} 已經有 Quiz: {user_quiz.quiz_topic}")
                 return Response({'error': f'Quiz with topic "{quiz_topic_name}" already exists'}, status=400)
 
             # 創建新的 QuizTopic
@@ -894,10 +1063,8 @@ class UserQuizView(APIView):
     # 取得所有 有在收藏的Quiz 
     def get(self, request):
         favorites = UserFavorite.objects.filter(user=request.user)
-        print(f"=== 使用者 {request.user.username} 的收藏數量: {favorites.count()} ===")
         quiz_ids = favorites.values_list('topic__quiz_topic', flat=True).distinct()
         quizzes = Quiz.objects.filter(id__in=quiz_ids, deleted_at__isnull=True).order_by('-created_at')
-        print(f"找到 {quizzes.count()} 個 Quiz")
         serializer = QuizSimplifiedSerializer(quizzes, many=True)
         return Response(serializer.data)
 
@@ -916,34 +1083,19 @@ class RetestView(APIView):
             deleted_at__isnull=True,
             quiz_topic__deleted_at__isnull=True
         )
-        # 資料傳輸給flask - 使用異步調用
-        note_data = NoteSerializer(note).data
-        
-        # 立即返回響應，不等待Flask API
+        # 排入背景工作，由 run_jobs worker 把筆記內容傳給 flask，不在 gunicorn worker 內開執行緒
+        try:
+            job = enqueue("retest", {"note_id": note.id}, user=request.user)
+        except QueueFull:
+            return queue_full_response()
+
         note.is_retake = True
         note.save(update_fields=['is_retake'])
-        
-        # 在背景線程中異步調用Flask API
-        def background_retest():
-            try:
-                response = requests.post(
-                    f'{FLASK_BASE_URL}/api/retest',
-                    json=note_data,
-                    timeout=15  # 15秒超時
-                )
-                if response.status_code == 200:
-                    print(f"背景Flask API調用成功: {response.status_code}")
-                else:
-                    print(f"背景Flask API調用失敗: {response.status_code}")
-            except Exception as e:
-                print(f"背景Flask API調用異常: {str(e)}")
-        
-        # 啟動背景線程
-        threading.Thread(target=background_retest, daemon=True).start()
-        
+
         return Response({
             'message': 'Re-testing initiated successfully', 
             'note_id': note.id,
+            'job_id': job.id,
             'status': 'processing'
         }, status=200)
 
@@ -954,71 +1106,79 @@ class RetestView(APIView):
 class ParseAnswerView(APIView):
     permission_classes = [IsAuthenticated]
     # 輸入要解析的題目&答案
+    # 解析只生成一次並存進 TopicExplanation；已完成直接回傳，生成中則回傳狀態，不會重複呼叫 AI
     def post(self, request):
         topic_id = request.data.get("topic_id")
         if not topic_id:
             return Response({'error': 'topic_id is required'}, status=400)
         topic = get_object_or_404(Topic, id=topic_id, deleted_at__isnull=True)
 
-        title = topic.title
-        Ai_answer = topic.Ai_answer
-        option_A = topic.option_A
-        option_B = topic.option_B
-        option_C = topic.option_C
-        option_D = topic.option_D
-
-        def switch(Ai_answer):
-            if Ai_answer == 'A':
-                return option_A
-            elif Ai_answer == 'B':
-                return option_B
-            elif Ai_answer == 'C':
-                return option_C
-            elif Ai_answer == 'D':
-                return option_D
-            else:
-                return "選項不存在"
+        try:
+            explanation, started = request_explanation(topic, user=request.user)
+        except QueueFull:
+            return queue_full_response()
+        log_event(logger, logging.DEBUG, "題目解析請求", topic_id=topic_id,
+                  status=explanation.status, started=started)
 
-        # 傳給flask處理 解析 - 使用異步調用
         flask_data = {
-            "title": title,
-            "Ai_answer": switch(Ai_answer),
+            "title": topic.title,
+            "Ai_answer": answer_text(topic),
         }
-        print(f"傳送給 Flask 的資料: {flask_data}")
-        
-        # 立即返回基本資料，不等待Flask API
-        basic_response = {
-            "message": "Parsing initiated successfully", 
+        if explanation.status == TopicExplanation.STATUS_READY:
+            return Response({
+                "message": "Parsed answer ready",
+                "data": flask_data,
+                **serialize_explanation(explanation),
+            }, status=200)
+
+        # 生成中（或剛開始生成）時立即返回，結果可由 GET parse_answer/<topic_id>/ 取得
+        return Response({
+            "message": "Parsing initiated successfully" if started else "Parsing in progress",
             "data": flask_data,
-            "status": "processing"
-        }
-        
-        # 在背景線程中異步調用Flask API
-        def background_parse():
-            try:
-                response = requests.post(
-                    f'{FLASK_BASE_URL}/api/parse_answer',
-                    json=flask_data,
-                    timeout=15  # 15秒超時
-                )
-                if response.status_code == 200:
-                    print(f"背景解析API調用成功: {response.status_code}")
-                    # 這裡可以將結果存儲到緩存或資料庫中
-                else:
-                    print(f"背景解析API調用失敗: {response.status_code}")
-            except Exception as e:
-                print(f"背景解析API調用異常: {str(e)}")
-        
-        # 啟動背景線程
-        threading.Thread(target=background_parse, daemon=True).start()
-        
-        return Response(basic_response, status=200)
+            **serialize_explanation(explanation),
+            "status": "processing" if explanation.status == TopicExplanation.STATUS_PENDING else explanation.status,
+        }, status=200)
+
+    def get(self, request, topic_id):
+        explanation = get_object_or_404(
+            TopicExplanation.objects.select_related('topic'),
+            topic_id=topic_id,
+            topic__deleted_at__isnull=True,
+        )
+        data = serialize_explanation(explanation)
+        if explanation.status == TopicExplanation.STATUS_PENDING:
+            data["status"] = "processing"
+        return Response(data, status=200)
         
 # -----------------------------------
 # 目前整合在一起 暫時保留
 # GPT 解析題目
 
 
+# 查詢背景工作狀態（只能查自己建立的工作）
+class JobStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(Job, id=job_id, user=request.user)
+        return Response(serialize_job(job), status=200)
+
+
+# 每日作答統計（讀 AttemptDailyRollup，不掃描 Topic）
+# GET /api/attempts/daily/?quiz_topic_id=12&days=30
+class AttemptDailyStatsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        quiz_topic_id = request.query_params.get("quiz_topic_id")
+        try:
+            days = min(max(int(request.query_params.get("days", 30)), 1), 366)
+            quiz_topic_id = int(quiz_topic_id) if quiz_topic_id else None
+        except ValueError:
+            return Response({"error": "quiz_topic_id 與 days 必須是整數"}, status=400)
+        return Response({"days": days, "results": daily_stats(request.user.id, quiz_topic_id, days)}, status=200)
+
+
 # 取得用戶的所有quiz 和 note
 class UsersQuizAndNote(APIView):
     permission_classes = [IsAuthenticated]
@@ -1068,6 +1228,29 @@ class UsersQuizAndNote(APIView):
         })
     
 # 前端回傳 用戶答案
+def enqueue_familiarity(user, payload):
+    """排入熟悉度計算工作，回傳 job id；佇列已滿時不影響答案提交，只記錄警告"""
+    try:
+        return enqueue("familiarity", {"user_id": user.id, **payload}, user=user, priority=1).id
+    except QueueFull:
+        log_event(logger, logging.WARNING, "熟悉度計算未排入（佇列已滿）", user_id=user.id, payload=payload)
+        return None
+
+
+def dispatch_familiarity(user, payload):
+    """
+    答案寫入的 atomic 區塊結束後呼叫：直接在這個 process 內計算熟悉度，回傳要合併進回應的欄位，
+    gameover 頁面可以直接拿到數值；計算失敗才排入背景工作重試（結果可由 /api/jobs/<id>/ 取得）
+    """
+    try:
+        result = apply_familiarity_submission(user, payload)
+    except Exception as e:
+        log_event(logger, logging.ERROR, "熟悉度計算失敗，改排入背景工作", user_id=user.id, payload=payload, error=str(e))
+        return {"job_id": enqueue_familiarity(user, payload)}
+    log_sampled(logger, logging.INFO, "熟悉度已更新", user_id=user.id, **result)
+    return {"familiarity": result["familiarity"], "status": "completed"}
+
+
 class SubmitAnswerView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -1079,14 +1262,6 @@ class SubmitAnswerView(APIView):
     def post(self, request):
         from django.db import transaction
         
-        # 添加請求調試信息
-        print(f"=== SubmitAnswerView POST 請求調試 ===")
-        print(f"請求方法: {request.method}")
-        print(f"請求標頭: {dict(request.META)}")
-        print(f"請求數據: {request.data}")
-        print(f"用戶: {request.user}")
-        print("=" * 50)
-        
         with transaction.atomic():
             user = request.user
             topic_id = request.data.get("topic")
@@ -1097,73 +1272,35 @@ class SubmitAnswerView(APIView):
             is_test = request.data.get("is_test", False)  # 前端回傳是否為 TEST 模式
             # 移除有問題的token處理，因為我們不需要在這裡分割token
 
-            print(f"=== SubmitAnswerView Debug ===")
-            print(f"topic_id: {topic_id}")
-            print(f"user_answer: {user_answer}")
-            print(f"updates: {updates}")
-            print(f"updates 長度: {len(updates) if updates else 0}")
-            print(f"request.data type: {type(request.data)}")
-            print(f"quiz_topic_id {quiz_topic_id}  ===")
-            print(f"使用者: {user.id}")
-            print(f"題目 ID: {topic_id}")
-            print(f"難度: {difficulty}")
-            print(f"使用者答案: {user_answer}")
+            log_sampled(logger, logging.INFO, "提交答案", user_id=user.id, topic_id=topic_id,
+                        quiz_topic_id=quiz_topic_id, difficulty=difficulty, user_answer=user_answer,
+                        updates=len(updates) if updates else 0, is_test=is_test)
             
             # 處理單一題目更新
             if topic_id and user_answer is not None:
-                print("=== 進入單一題目更新分支 ===")
                 topic = get_object_or_404(Topic, id=topic_id, deleted_at__isnull=True)
                 topic.User_answer = user_answer
                 topic.save()
                 Ai_answer = topic.Ai_answer
+                record_attempts(user.id, topic.quiz_topic_id, Attempt.SOURCE_SINGLE,
+                                [(topic.id, topic.difficulty_id, user_answer == Ai_answer)])
                 
                 # 新增：為單一題目創建熟悉度記錄
                 try:
-                    print(f"=== 為單一題目創建熟悉度記錄 ===")
-                    quiz_topic_id = topic.quiz_topic.id
+                    quiz_topic_id = topic.quiz_topic_id
                     difficulty_name = "beginner"  # 單一題目默認使用 beginner 難度
                     
-                    # 獲取或創建熟悉度記錄
-                    difficulty_level = DifficultyLevels.objects.filter(level_name=difficulty_name).first()
-                    if not difficulty_level:
-                        difficulty_level = DifficultyLevels.objects.filter(level_name="beginner").first()
-                    
-                    # 計算正確性
+                    # 獲取或創建熟悉度記錄（單一題目不計算熟悉度，只累加題數）
                     is_correct = (user_answer == Ai_answer)
-                    correct_answers = 1 if is_correct else 0
-                    total_questions = 1
-                    
-                    uf, created = UserFamiliarity.objects.get_or_create(
-                        user=user,
-                        quiz_topic_id=quiz_topic_id,
-                        defaults={
-                            "difficulty_level": difficulty_level,
-                            "total_questions": total_questions,
-                            "correct_answers": correct_answers,
-                            "weighted_total": Decimal('0.00'),
-                            "weighted_correct": Decimal('0.00'),
-                            "cap_weighted_sum": Decimal('0.00'),
-                            "familiarity": Decimal('0.00'),  # 單一題目初始熟悉度為 0%
-                        }
-                    )
-                    
-                    # 如果記錄已存在，更新統計數據
-                    if not created:
-                        uf.total_questions = F('total_questions') + total_questions
-                        uf.correct_answers = F('correct_answers') + correct_answers
-                        uf.save(update_fields=['total_questions', 'correct_answers', 'updated_at'])
-                        uf.refresh_from_db(fields=['total_questions', 'correct_answers'])
-                    
-                    print(f"單一題目熟悉度記錄 {'創建' if created else '更新'} 成功")
+                    ensure_familiarity_record(user, quiz_topic_id, difficulty_name, 1, 1 if is_correct else 0)
                     
                 except Exception as e:
-                    print(f"為單一題目創建熟悉度記錄失敗: {str(e)}")
+                    logger.error("為單一題目創建熟悉度記錄失敗: %s", e)
                 
                 response = Response({"message": "Answer submitted successfully"}, status=201)
                 return add_cors_headers(response)
 
             elif updates:
-                print("=== 進入 updates 分支 ===")
                 updated_topics = []
                 correct_answers = 0
                 total_questions = len(updates)
@@ -1190,16 +1327,12 @@ class SubmitAnswerView(APIView):
                     # 從第一個 topic 抓取 quiz_topic_id 和 difficulty
                     if quiz_topic_id is None:
                         quiz_topic_id = topic.quiz_topic.id  # 使用正確的關聯字段
-                        print(f"Topic ID: {topic.id}, difficulty object: {topic.difficulty}")
-                        if topic.difficulty:
-                            difficulty_id = topic.difficulty.id
+                        if topic.difficulty_id:
+                            difficulty_id = topic.difficulty_id
                             difficulty_name = difficulty_mapping.get(difficulty_id, "beginner")
-                            print(f"Found difficulty_id: {difficulty_id}, mapped to: {difficulty_name}")
                         else:
                             difficulty_id = 1
                             difficulty_name = "beginner"
-                            print(f"No difficulty found, using default: {difficulty_name}")
-                        print(f"Final values - quiz_topic_id: {quiz_topic_id}, difficulty_name: {difficulty_name}")
                     
                     # 使用從資料庫抓出來的 topic.Ai_answer，而不是 item.get("Ai_answer")
                     if item.get("user_answer") == topic.Ai_answer:
@@ -1210,11 +1343,18 @@ class SubmitAnswerView(APIView):
                         "User_answer": topic.User_answer,
                         "quiz_topic_id": topic.quiz_topic.id,
                         "difficulty": difficulty_name,
-                        "difficulty_id": topic.difficulty.id if topic.difficulty else None,
+                        "difficulty_id": topic.difficulty_id,
                         "title": topic.title,
                         "is_correct": item.get("user_answer") == topic.Ai_answer
                     })
                 
+                # 作答紀錄（同一個交易內一次寫入）
+                record_attempts(
+                    user.id, quiz_topic_id,
+                    Attempt.SOURCE_TEST if is_test or difficulty_id == 5 else Attempt.SOURCE_RUN,
+                    [(t["id"], t["difficulty_id"], t["is_correct"]) for t in updated_topics],
+                )
+                
                 # 準備傳送到熟悉度 API 的資料
                 payload = {
                     "quiz_topic_id": quiz_topic_id,
@@ -1223,10 +1363,7 @@ class SubmitAnswerView(APIView):
                     "correct_answers": correct_answers,
                 }
                 
-                print(f"=== 準備傳送到熟悉度 API 的資料 (updates格式) ===")
-                print(f"Payload: {payload}")
-                print(f"Payload type: {type(payload)}")
-                print(f"Payload keys: {payload.keys()}")
+                log_event(logger, logging.DEBUG, "準備傳送到熟悉度 API 的資料", payload=payload)
                 
                 # 判斷是否為 TEST 模式或 error 難度（id=5），直接回傳，不呼叫API
                 if is_test or difficulty_id == 5:
@@ -1234,36 +1371,10 @@ class SubmitAnswerView(APIView):
                     
                     # 新增：即使不調用API，也要確保熟悉度記錄存在
                     try:
-                        print(f"=== TEST/Error模式：確保熟悉度記錄存在 ===")
-                        # 獲取或創建熟悉度記錄
-                        difficulty_level = DifficultyLevels.objects.filter(level_name=difficulty_name).first()
-                        if not difficulty_level:
-                            difficulty_level = DifficultyLevels.objects.filter(level_name="beginner").first()
-                        
-                        uf, created = UserFamiliarity.objects.get_or_create(
-                            user=user,
-                            quiz_topic_id=quiz_topic_id,
-                            defaults={
-                                "difficulty_level": difficulty_level,
-                                "total_questions": total_questions,
-                                "correct_answers": correct_answers,
-                                "weighted_total": Decimal('0.00'),
-                                "weighted_correct": Decimal('0.00'),
-                                "cap_weighted_sum": Decimal('0.00'),
-                                "familiarity": Decimal('0.00'),  # TEST/Error模式熟悉度為 0%
-                            }
-                        )
-                        
-                        # 如果記錄已存在，更新統計數據
-                        if not created:
-                            uf.total_questions = F('total_questions') + total_questions
-                            uf.correct_answers = F('correct_answers') + correct_answers
-                            uf.save(update_fields=['total_questions', 'correct_answers', 'updated_at'])
-                        
-                        print(f"TEST/Error模式熟悉度記錄 {'創建' if created else '更新'} 成功")
-                        
+                        # 獲取或創建熟悉度記錄（TEST/Error模式熟悉度為 0%，只累加題數）
+                        ensure_familiarity_record(user, quiz_topic_id, difficulty_name, total_questions, correct_answers)
                     except Exception as e:
-                        print(f"TEST/Error模式創建熟悉度記錄失敗: {str(e)}")
+                        logger.error("TEST/Error模式創建熟悉度記錄失敗: %s", e)
                     
                     response = Response({
                         "message": f"Batch answers submitted successfully ({message})",
@@ -1274,108 +1385,14 @@ class SubmitAnswerView(APIView):
                     }, status=201)
                     return response
                 
-                print(f"=== 傳送到熟悉度 API 的資料 ===")
-                print(f"Payload: {payload}")
-                
-                # 獲取當前請求的 Authorization token
-                auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-                headers = {}
-                if auth_header:
-                    headers['Authorization'] = auth_header
-                    print(f"Using Authorization header: {auth_header}")
-                
-                # 優化：改為異步後台處理熟悉度計算，不阻塞遊戲流程
-                # 立即返回響應，讓前端可以跳轉到gameover頁面
-                response = Response({
+                # 熟悉度在離開 atomic 區塊後才計算，結果合併進 body
+                body = {
                     "message": "Batch answers submitted successfully",
                     "total_questions": total_questions,
                     "correct_answers": correct_answers,
-                    "familiarity": "processing",  # 表示正在後台計算中
+                    "familiarity": "processing",  # 計算完成後替換為數值
                     "status": "submitted"
-                }, status=201)
-                
-                # 在後台線程中異步計算熟悉度，不影響用戶體驗
-                def background_familiarity_calculation():
-                    """後台異步計算熟悉度，不阻塞主流程"""
-                    try:
-                        print(f"=== 後台異步調用熟悉度 API ===")
-                        print(f"URL: {DJANGO_BASE_URL}/api/familiarity/")
-                        print(f"Payload: {payload}")
-                        print(f"Headers: {headers}")
-                        
-                        # 後台計算不設超時，讓它慢慢算
-                        familiarity_response = requests.post(
-                            f"{DJANGO_BASE_URL}/api/familiarity/", 
-                            json=payload,
-                            headers=headers
-                            # 移除超時限制，讓熟悉度API有足夠時間計算
-                        )
-                        
-                        print(f"後台熟悉度 API 回應狀態: {familiarity_response.status_code}")
-                        print(f"後台熟悉度 API 回應標頭: {dict(familiarity_response.headers)}")
-                        
-                        if familiarity_response.status_code == 200:
-                            try:
-                                response_data = familiarity_response.json()
-                                data = response_data.get("familiarity", 0)
-                                print(f"後台熟悉度 API 回應內容: {response_data}")
-                                print(f"後台提取的熟悉度值: {data}")
-                            except Exception as parse_error:
-                                print(f"後台解析熟悉度API回應失敗: {str(parse_error)}")
-                                print(f"後台原始回應內容: {familiarity_response.text}")
-                                data = 0
-                        else:
-                            print(f"後台熟悉度 API 返回錯誤狀態碼: {familiarity_response.status_code}")
-                            print(f"後台錯誤回應內容: {familiarity_response.text}")
-                            data = 0
-                            
-                    except requests.exceptions.Timeout:
-                        print("後台熟悉度 API 調用超時（但用戶已跳轉，不影響體驗）")
-                        data = 0
-                    except requests.exceptions.ConnectionError as conn_error:
-                        print(f"後台熟悉度 API 連接錯誤: {str(conn_error)}")
-                        data = 0
-                    except Exception as e:
-                        print(f"後台呼叫熟悉度 API 失敗: {str(e)}")
-                        data = 0
-
-                    # 後台更新熟悉度記錄到資料庫
-                    try:
-                        print(f"=== 後台更新熟悉度記錄 ===")
-                        difficulty_level = DifficultyLevels.objects.filter(level_name=difficulty_name).first()
-                        if not difficulty_level:
-                            difficulty_level = DifficultyLevels.objects.filter(level_name="beginner").first()
-                        
-                        uf, created = UserFamiliarity.objects.get_or_create(
-                            user=user,
-                            quiz_topic_id=quiz_topic_id,
-                            defaults={
-                                "difficulty_level": difficulty_level,
-                                "total_questions": total_questions,
-                                "correct_answers": correct_answers,
-                                "weighted_total": Decimal('0.00'),
-                                "weighted_correct": Decimal('0.00'),
-                                "cap_weighted_sum": Decimal('0.00'),
-                                "familiarity": Decimal(str(data)),  # 使用後台計算的結果
-                            }
-                        )
-                        
-                        # 如果記錄已存在，更新熟悉度
-                        if not created:
-                            uf.familiarity = Decimal(str(data))
-                            uf.save(update_fields=['familiarity', 'updated_at'])
-                        
-                        print(f"後台熟悉度記錄 {'創建' if created else '更新'} 成功: {uf.familiarity}%")
-                        
-                    except Exception as e:
-                        print(f"後台創建熟悉度記錄失敗: {str(e)}")
-                        # 靜默處理錯誤，不影響用戶體驗
-
-                # 啟動後台線程，讓熟悉度計算在背景進行
-                print("啟動後台熟悉度計算線程...")
-                threading.Thread(target=background_familiarity_calculation, daemon=True).start()
-                
-                return response
+                }
             
             # 優化：批量處理陣列格式 [{"id": 276, "user_answer": "A"}]
             elif isinstance(request.data, list):
@@ -1421,7 +1438,7 @@ class SubmitAnswerView(APIView):
                     # 從第一個 topic 抓取 quiz_topic_id 和 difficulty
                     if quiz_topic_id is None:
                         quiz_topic_id = topic.quiz_topic.id
-                        difficulty_id = topic.difficulty.id if topic.difficulty else 1
+                        difficulty_id = topic.difficulty_id or 1
                         difficulty_name = difficulty_mapping.get(difficulty_id, "beginner")
                     
                     # 檢查答案正確性
@@ -1434,6 +1451,7 @@ class SubmitAnswerView(APIView):
                         "User_answer": topic.User_answer,
                         "quiz_topic_id": topic.quiz_topic.id,
                         "difficulty": difficulty_name,
+                        "difficulty_id": topic.difficulty_id,
                         "title": topic.title,
                         "is_correct": item.get("user_answer") == topic.Ai_answer
                     })
@@ -1445,6 +1463,11 @@ class SubmitAnswerView(APIView):
                         ['User_answer'], 
                         batch_size=100
                     )
+                record_attempts(
+                    user.id, quiz_topic_id,
+                    Attempt.SOURCE_TEST if is_test or difficulty_id == 5 else Attempt.SOURCE_RUN,
+                    [(t["id"], t["difficulty_id"], t["is_correct"]) for t in updated_topics],
+                )
                 
                 # 準備傳送到熟悉度 API 的資料
                 payload = {
@@ -1454,10 +1477,7 @@ class SubmitAnswerView(APIView):
                     "correct_answers": correct_answers,
                 }
                 
-                print(f"=== 準備傳送到熟悉度 API 的資料 (List格式) ===")
-                print(f"Payload: {payload}")
-                print(f"Payload type: {type(payload)}")
-                print(f"Payload keys: {payload.keys()}")
+                log_event(logger, logging.DEBUG, "準備傳送到熟悉度 API 的資料", payload=payload)
                 
                 # 判斷是否為 TEST 模式或 error 難度（id=5），直接回傳，不呼叫API
                 if is_test or difficulty_id == 5:
@@ -1465,36 +1485,10 @@ class SubmitAnswerView(APIView):
                     
                     # 新增：即使不調用API，也要確保熟悉度記錄存在
                     try:
-                        print(f"=== TEST/Error模式：確保熟悉度記錄存在 (List格式) ===")
-                        # 獲取或創建熟悉度記錄
-                        difficulty_level = DifficultyLevels.objects.filter(level_name=difficulty_name).first()
-                        if not difficulty_level:
-                            difficulty_level = DifficultyLevels.objects.filter(level_name="beginner").first()
-                        
-                        uf, created = UserFamiliarity.objects.get_or_create(
-                            user=user,
-                            quiz_topic_id=quiz_topic_id,
-                            defaults={
-                                "difficulty_level": difficulty_level,
-                                "total_questions": total_questions,
-                                "correct_answers": correct_answers,
-                                "weighted_total": Decimal('0.00'),
-                                "weighted_correct": Decimal('0.00'),
-                                "cap_weighted_sum": Decimal('0.00'),
-                                "familiarity": Decimal('0.00'),  # TEST/Error模式熟悉度為 0%
-                            }
-                        )
-                        
-                        # 如果記錄已存在，更新統計數據
-                        if not created:
-                            uf.total_questions = F('total_questions') + total_questions
-                            uf.correct_answers = F('correct_answers') + correct_answers
-                            uf.save(update_fields=['total_questions', 'correct_answers', 'updated_at'])
-                        
-                        print(f"TEST/Error模式熟悉度記錄 {'創建' if created else '更新'} 成功 (List格式)")
-                        
+                        # 獲取或創建熟悉度記錄（TEST/Error模式熟悉度為 0%，只累加題數）
+                        ensure_familiarity_record(user, quiz_topic_id, difficulty_name, total_questions, correct_answers)
                     except Exception as e:
-                        print(f"TEST/Error模式創建熟悉度記錄失敗 (List格式): {str(e)}")
+                        logger.error("TEST/Error模式創建熟悉度記錄失敗: %s", e)
                     
                     response = Response({
                         "message": f"Batch answers submitted successfully ({message})",
@@ -1505,104 +1499,24 @@ class SubmitAnswerView(APIView):
                     }, status=201)
                     return response
                 
-                print(f"=== 傳送到熟悉度 API 的資料 (List格式) ===")
-                print(f"Payload: {payload}")
-                
-                # 優化：改為異步後台處理熟悉度計算，不阻塞遊戲流程
-                # 立即返回響應，讓前端可以跳轉到gameover頁面
-                response = Response({
+                # 熟悉度在離開 atomic 區塊後才計算，結果合併進 body
+                body = {
                     "message": "Batch answers submitted successfully",
                     "total_questions": total_questions,
                     "correct_answers": correct_answers,
-                    "familiarity": "processing",  # 表示正在後台計算中
+                    "familiarity": "processing",  # 計算完成後替換為數值
                     "status": "submitted"
-                }, status=201)
-                
-                # 在後台線程中異步計算熟悉度，不影響用戶體驗
-                def background_familiarity_calculation_list():
-                    """後台異步計算熟悉度（List格式），不阻塞主流程"""
-                    try:
-                        print(f"=== 後台異步調用熟悉度 API (List格式) ===")
-                        print(f"URL: {DJANGO_BASE_URL}/api/familiarity/")
-                        print(f"Payload: {payload}")
-                        
-                        # 後台計算不設超時，讓它慢慢算
-                        familiarity_response = requests.post(
-                            f"{DJANGO_BASE_URL}/api/familiarity/", 
-                            json=payload
-                            # 移除超時限制，讓熟悉度API有足夠時間計算
-                        )
-                        
-                        print(f"後台熟悉度 API 回應狀態: {familiarity_response.status_code}")
-                        print(f"後台熟悉度 API 回應標頭: {dict(familiarity_response.headers)}")
-                        
-                        if familiarity_response.status_code == 200:
-                            try:
-                                response_data = familiarity_response.json()
-                                data = response_data.get("familiarity", 0)
-                                print(f"後台熟悉度 API 回應內容: {response_data}")
-                                print(f"後台提取的熟悉度值: {data}")
-                            except Exception as parse_error:
-                                print(f"後台解析熟悉度API回應失敗: {str(parse_error)}")
-                                print(f"後台原始回應內容: {familiarity_response.text}")
-                                data = 0
-                        else:
-                            print(f"後台熟悉度 API 返回錯誤狀態碼: {familiarity_response.status_code}")
-                            print(f"後台錯誤回應內容: {familiarity_response.text}")
-                            data = 0
-                            
-                    except requests.exceptions.Timeout:
-                        print("後台熟悉度 API 調用超時（但用戶已跳轉，不影響體驗）")
-                        data = 0
-                    except requests.exceptions.ConnectionError as conn_error:
-                        print(f"後台熟悉度 API 連接錯誤: {str(conn_error)}")
-                        data = 0
-                    except Exception as e:
-                        print(f"後台呼叫熟悉度 API 失敗: {str(e)}")
-                        data = 0
-
-                    # 後台更新熟悉度記錄到資料庫
-                    try:
-                        print(f"=== 後台更新熟悉度記錄 (List格式) ===")
-                        difficulty_level = DifficultyLevels.objects.filter(level_name=difficulty_name).first()
-                        if not difficulty_level:
-                            difficulty_level = DifficultyLevels.objects.filter(level_name="beginner").first()
-                        
-                        uf, created = UserFamiliarity.objects.get_or_create(
-                            user=user,
-                            quiz_topic_id=quiz_topic_id,
-                            defaults={
-                                "difficulty_level": difficulty_level,
-                                "total_questions": total_questions,
-                                "correct_answers": correct_answers,
-                                "weighted_total": Decimal('0.00'),
-                                "weighted_correct": Decimal('0.00'),
-                                "cap_weighted_sum": Decimal('0.00'),
-                                "familiarity": Decimal(str(data)),  # 使用後台計算的結果
-                            }
-                        )
-                        
-                        # 如果記錄已存在，更新熟悉度
-                        if not created:
-                            uf.familiarity = Decimal(str(data))
-                            uf.save(update_fields=['familiarity', 'updated_at'])
-                        
-                        print(f"後台熟悉度記錄 {'創建' if created else '更新'} 成功: {uf.familiarity}%")
-                        
-                    except Exception as e:
-                        print(f"後台創建熟悉度記錄失敗: {str(e)}")
-                        # 靜默處理錯誤，不影響用戶體驗
-
-                # 啟動後台線程，讓熟悉度計算在背景進行
-                print("啟動後台熟悉度計算線程 (List格式)...")
-                threading.Thread(target=background_familiarity_calculation_list, daemon=True).start()
-                
-                return response
+                }
             
             else:
                 response = Response({"error": "Either 'topic' and 'user_answer' or 'updates' are required"}, status=400)
                 return response
 
+        # 答案已寫入，在 process 內計算熟悉度（不再呼叫自己的 /api/familiarity/）；
+        # 明確在區塊外呼叫而不是 on_commit，外層還有交易（ATOMIC_REQUESTS、測試）時回應一樣帶有熟悉度
+        body.update(dispatch_familiarity(user, payload))
+        return Response(body, status=201)
+
 class NoteEditQuizTopicView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -1624,7 +1538,7 @@ class NoteEditQuizTopicView(APIView):
             note.quiz_topic = new_quiz_topic
             note.save()
 
-            print(f"Updated topics for note {note.id}: {note.quiz_topic} -> {new_quiz_topic}")
+            logger.info("Updated topics for note %s: %s -> %s", note.id, note.quiz_topic, new_quiz_topic)
 
             # 同步更新所有與該 Note 關聯的 Topic 的 topic
             topic = Topic.objects.filter(id=note.topic.id, deleted_at__isnull=True).update(quiz_topic=new_quiz_topic)
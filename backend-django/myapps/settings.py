@@ -141,9 +141,16 @@ if DEBUG:
     LOGGING = {
         'version': 1,
         'disable_existing_loggers': False,
+        'formatters': {
+            'json': {
+                '()': 'myapps.log_utils.JsonFormatter',
+            },
+        },
         'handlers': {
             'console': {
-                'class': 'logging.StreamHandler',
+                # 經由佇列在背景執行緒寫出，請求執行緒不會卡在 stdout
+                'class': 'myapps.log_utils.QueueStreamHandler',
+                'formatter': 'json',
             },
         },
         'root': {
@@ -161,6 +168,11 @@ if DEBUG:
                 'level': 'DEBUG',  # 啟用SQL查詢日誌
                 'propagate': False,
             },
+            'myapps': {
+                'handlers': ['console'],
+                'level': os.getenv('LOG_LEVEL', 'DEBUG'),
+                'propagate': False,
+            },
         },
     }
 else:
@@ -168,9 +180,16 @@ else:
     LOGGING = {
         'version': 1,
         'disable_existing_loggers': False,
+        'formatters': {
+            'json': {
+                '()': 'myapps.log_utils.JsonFormatter',
+            },
+        },
         'handlers': {
             'console': {
-                'class': 'logging.StreamHandler',
+                # 經由佇列在背景執行緒寫出，請求執行緒不會卡在 stdout
+                'class': 'myapps.log_utils.QueueStreamHandler',
+                'formatter': 'json',
             },
         },
         'root': {
@@ -183,6 +202,11 @@ else:
                 'level': 'WARNING',
                 'propagate': False,
             },
+            'myapps': {
+                'handlers': ['console'],
+                'level': os.getenv('LOG_LEVEL', 'INFO'),  # 應用日誌（高流量位置有取樣）
+                'propagate': False,
+            },
         },
     }
 
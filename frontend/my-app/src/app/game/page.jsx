@@ -209,7 +209,8 @@ export default function GamePage() {
       try {
         if (res.ok) {
           const data = await res.json();
-          Familiarity = data.familiarity || 0;
+          // 後端計算失敗改由背景工作處理時，familiarity 會是 "processing"
+          Familiarity = typeof data.familiarity === "number" ? data.familiarity : 0;
         } else {
           console.warn("API失敗，使用默認熟悉度值: 0");
         }
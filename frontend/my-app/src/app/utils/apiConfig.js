@@ -25,8 +25,10 @@ export const API_ENDPOINTS = {
     ADD_FAVORITE: `${BACKEND_API_BASE_URL}/api/add-favorite/`,
     NOTES: `${BACKEND_API_BASE_URL}/api/notes/`,
     QUIZ: `${BACKEND_API_BASE_URL}/api/quiz/`,
+    QUIZ_STREAM: `${BACKEND_API_BASE_URL}/api/quiz/stream/`,
     FAMILIARITY: `${BACKEND_API_BASE_URL}/api/familiarity/`,
     CHAT: `${BACKEND_API_BASE_URL}/api/chat/`,
+    CHAT_STREAM: `${BACKEND_API_BASE_URL}/api/chat/stream/`,
     ECPAY: `${BACKEND_API_BASE_URL}/ecpay/`,
     PAYMENT_STATUS: `${BACKEND_API_BASE_URL}/payment-status/`,
     USERS: `${BACKEND_API_BASE_URL}/users/`,
@@ -35,6 +37,7 @@ export const API_ENDPOINTS = {
   // ML服務API端點
   ML_SERVICE: {
     GENERATE_TOPIC_FROM_NOTE: `${ML_SERVICE_BASE_URL}/api/generate_topic_from_note`,
+    GENERATE_TOPIC_FROM_NOTE_BATCH: `${ML_SERVICE_BASE_URL}/api/generate_topic_from_note/batch`,
   }
 };
 
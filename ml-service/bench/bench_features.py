@@ -0,0 +1,106 @@
+# 內容特徵擷取微基準
+# 比較舊版 analyze_content_complexity（14 次 re.search，各自掃描全文）與 content_features 的單次掃描，
+# 以及批次 API 處理多篇筆記的總耗時。
+#
+# 用法（在 ml-service 目錄下）：
+#   python -m bench.bench_features --chars 10000 --notes 50 --repeat 5
+import argparse
+import random
+import time
+
+from content_features import extract_features, extract_features_batch
+
+SAMPLES = [
+    "光合作用是植物利用光能將二氧化碳和水轉換成葡萄糖的過程",
+    "The mitochondria is the powerhouse of the cell ",
+    "2024年3月15日 期中考範圍 ",
+    "\n- 重點一：細胞膜的結構\n",
+    "\n1. 複習第三章\n",
+    "E = mc^2 (質能等價) ",
+    "為什麼天空是藍色的？",
+    "ひらがなとカタカナの練習 ",
+    "한국어 문법 정리 ",
+    "參考資料 https://example.com/notes?id=42 ",
+    "#生物 #期末 @同學 ",
+    "今天讀書好累😀 ",
+]
+
+
+def legacy_analyze(content):
+    """舊版寫法，僅供比較"""
+    import re
+    return {
+        'has_formulas': bool(re.search(r'[+\-*/=()\[\]{}]', content)),
+        'has_code': bool(re.search(r'(def|class|import|function|var|let|const)', content, re.IGNORECASE)),
+        'has_dates': bool(re.search(r'\d{4}年|\d{1,2}月|\d{1,2}日|\d{4}-\d{1,2}-\d{1,2}', content)),
+        'has_numbers': bool(re.search(r'\d+\.?\d*', content)),
+        'has_questions': bool(re.search(r'[？?]', content)),
+        'has_lists': bool(re.search(r'^\s*[-*•]\s|^\s*\d+\.\s', content, re.MULTILINE)),
+        'has_english': bool(re.search(r'[a-zA-Z]{3,}', content)),
+        'has_japanese': bool(re.search(r'[あ-んア-ン一-龯]', content)),
+        'has_korean': bool(re.search(r'[가-힣]', content)),
+        'has_chinese': bool(re.search(r'[一-鿿]', content)),
+        'has_emoji': bool(re.search(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002600-\U000027BF]', content)),
+        'has_urls': bool(re.search(r'https?://[^\s]+', content)),
+        'has_hashtags': bool(re.search(r'#[^\s]+', content)),
+        'has_mentions': bool(re.search(r'@[^\s]+', content)),
+    }
+
+
+def make_note(rng, chars, mixed):
+    """mixed=False 時只有中文敘述（多數旗標為 False，舊版每個 re.search 都得掃完全文）"""
+    pool = SAMPLES if mixed else SAMPLES[:1]
+    parts = []
+    size = 0
+    while size < chars:
+        piece = rng.choice(pool)
+        parts.append(piece)
+        size += len(piece)
+    return "".join(parts)[:chars]
+
+
+def timed(func, notes, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for note in notes:
+            func(note)
+        elapsed = (time.perf_counter() - start) * 1000 / len(notes)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="內容特徵擷取微基準")
+    parser.add_argument("--chars", type=int, default=10000, help="每篇筆記字數")
+    parser.add_argument("--notes", type=int, default=50, help="筆記篇數")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"筆記長度: {args.chars} 字 x {args.notes} 篇（每篇平均 ms，取 {args.repeat} 輪最快）\n")
+    print(f"{'情境':<10}{'legacy':>10}{'single':>10}{'batch':>10}")
+    print("-" * 40)
+    for label, mixed in (("純中文", False), ("混合內容", True)):
+        notes = [make_note(rng, args.chars, mixed) for _ in range(args.notes)]
+        legacy = timed(legacy_analyze, notes, args.repeat)
+        single = timed(extract_features, notes, args.repeat)
+        batch = min(
+            _batch_once(notes) for _ in range(args.repeat)
+        )
+        print(f"{label:<10}{legacy:>10.3f}{single:>10.3f}{batch:>10.3f}")
+
+    sample = extract_features(make_note(rng, 2000, True))
+    print(f"\n混合內容範例 counts: {sample['counts']}")
+    print("ratios: " + ", ".join(f"{k}={v:.2f}" for k, v in sample['ratios'].items()))
+
+
+def _batch_once(notes):
+    start = time.perf_counter()
+    extract_features_batch(notes)
+    return (time.perf_counter() - start) * 1000 / len(notes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# 關鍵詞擷取吞吐量基準
+# 比較舊版 extract_key_words（每次重建停用詞、以空白切詞、整表排序）與 keyword_engine 的每秒處理篇數，
+# 並印出同一篇中文筆記的擷取結果，方便對照品質。
+#
+# 用法（在 ml-service 目錄下）：
+#   python -m bench.bench_keyword_engine --chars 10000 --notes 50
+#   python -m bench.bench_keyword_engine --idf keyword_idf.json
+import argparse
+import random
+import re
+import time
+
+from keyword_engine import build_idf, extract_keywords, load_idf, load_idf_file
+
+SENTENCES = [
+    "光合作用是植物利用光能將二氧化碳和水轉換成葡萄糖的過程",
+    "葉綠體是進行光合作用的主要場所",
+    "細胞呼吸會分解葡萄糖並釋放能量",
+    "粒線體是細胞呼吸的主要場所",
+    "生態系中的能量沿著食物鏈流動",
+    "Photosynthesis happens in the chloroplast",
+    "今天的筆記整理了期中考的重點",
+]
+
+
+def legacy_extract(content):
+    """舊版寫法（停用詞表縮短），僅供比較"""
+    if not content:
+        return []
+    cleaned = re.sub(r'[^\w\s一-鿿]', ' ', content)
+    words = cleaned.split()
+    stop_words = {
+        '的', '是', '在', '有', '和', '與', '或', '但', '而', '如果', '因為', '所以', '這個', '那個', '這些', '那些',
+        '了', '着', '過', '來', '去', '到', '從', '向', '對', '為', '給', '被', '把', '讓', '使', '得',
+        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+        'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
+        'は', 'が', 'を', 'に', 'へ', 'で', 'から', 'まで', 'より', 'の', 'と', 'や', 'も', 'か', 'ね', 'よ',
+    }
+    filtered_words = []
+    for word in words:
+        if len(word) > 1 and word.lower() not in stop_words:
+            if re.search(r'[a-zA-Z一-鿿]', word):
+                filtered_words.append(word)
+    word_freq = {}
+    for word in filtered_words:
+        word_freq[word] = word_freq.get(word, 0) + 1
+    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+    return [word for word, freq in sorted_words[:3]]
+
+
+def make_note(rng, chars):
+    parts = []
+    size = 0
+    while size < chars:
+        piece = rng.choice(SENTENCES) + rng.choice("，。 \n")
+        parts.append(piece)
+        size += len(piece)
+    return "".join(parts)[:chars]
+
+
+def throughput(func, notes, seconds):
+    """在 seconds 秒內重複處理 notes，回傳每秒篇數"""
+    done = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for note in notes:
+            func(note)
+        done += len(notes)
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="關鍵詞擷取吞吐量基準")
+    parser.add_argument("--chars", default="200,2000,10000", help="逗號分隔的筆記字數")
+    parser.add_argument("--notes", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=1.0, help="每種做法量測的秒數")
+    parser.add_argument("--idf", help="IDF JSON 檔（省略時以產生的筆記自行統計）")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lengths = [int(c) for c in args.chars.split(",")]
+    corpus = [make_note(rng, 300) for _ in range(200)]
+    idf = load_idf_file(args.idf) if args.idf else load_idf(build_idf(corpus))
+
+    print(f"{'字數':>8}{'legacy 篇/秒':>16}{'engine 篇/秒':>16}{'engine+idf 篇/秒':>20}")
+    print("-" * 60)
+    for chars in lengths:
+        notes = [make_note(rng, chars) for _ in range(args.notes)]
+        legacy = throughput(legacy_extract, notes, args.seconds)
+        engine = throughput(lambda n: extract_keywords(n, 3, idf={}), notes, args.seconds)
+        weighted = throughput(lambda n: extract_keywords(n, 3, idf=idf), notes, args.seconds)
+        print(f"{chars:>8}{legacy:>16.0f}{engine:>16.0f}{weighted:>20.0f}")
+
+    sample = make_note(rng, 2000)
+    print(f"\n同一篇 2000 字筆記的結果：")
+    print(f"  legacy    : {legacy_extract(sample)}")
+    print(f"  engine    : {extract_keywords(sample, 3, idf={})}")
+    print(f"  engine+idf: {extract_keywords(sample, 3, idf=idf)}")
+
+
+if __name__ == "__main__":
+    main()
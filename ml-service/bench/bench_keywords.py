@@ -0,0 +1,89 @@
+# 關鍵詞比對微基準
+# 比較備用主題生成的三種做法在長筆記（預設 1 萬字）上的耗時：
+#   any_scan   ：原本的寫法，逐分類 any(keyword in content)，遇到第一個命中的分類就停（沒命中時要掃完全部）
+#   count_scan ：逐關鍵詞 content.count(keyword)，和自動機一樣拿到所有分類的命中數
+#   automaton  ：keyword_matcher 的 Aho–Corasick，一次掃描拿到所有分類分數
+#
+# 用法（在 ml-service 目錄下）：
+#   python -m bench.bench_keywords --chars 10000 --notes 20 --repeat 5
+import argparse
+import random
+import statistics
+import time
+
+from keyword_matcher import KEYWORD_GROUPS, MATCHER, best_category
+
+FILLER = "今天整理了一下上課的重點內容並且把不懂的地方標記起來之後再慢慢複習我們也討論了接下來的安排"
+
+
+def make_note(rng, chars, keyword_rate):
+    """產生指定長度的筆記；keyword_rate 是每個位置插入關鍵詞的機率（0 表示完全沒有命中，即原寫法的最壞情況）"""
+    keywords = [k for _, categories in KEYWORD_GROUPS for words in categories.values() for k in words]
+    parts = []
+    size = 0
+    while size < chars:
+        if keyword_rate and rng.random() < keyword_rate:
+            piece = rng.choice(keywords)
+        else:
+            piece = FILLER[rng.randrange(len(FILLER)):][:rng.randint(4, 16)]
+        parts.append(piece)
+        size += len(piece)
+    return "".join(parts)[:chars].lower()
+
+
+def any_scan(content):
+    for _, categories in KEYWORD_GROUPS:
+        for category, keywords in categories.items():
+            if any(keyword.lower() in content for keyword in keywords):
+                return category
+    return None
+
+
+def count_scan(content):
+    scores = {}
+    for group, categories in KEYWORD_GROUPS:
+        for category, keywords in categories.items():
+            hits = sum(content.count(keyword.lower()) for keyword in keywords)
+            if hits:
+                scores[(group, category)] = hits
+    return scores
+
+
+def timed(func, notes, repeat):
+    """回傳每篇筆記耗時（毫秒）的列表，取 repeat 次中最快的一輪"""
+    best = None
+    for _ in range(repeat):
+        samples = []
+        for note in notes:
+            start = time.perf_counter()
+            func(note)
+            samples.append((time.perf_counter() - start) * 1000)
+        if best is None or sum(samples) < sum(best):
+            best = samples
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="關鍵詞比對微基準")
+    parser.add_argument("--chars", type=int, default=10000, help="每篇筆記字數")
+    parser.add_argument("--notes", type=int, default=20, help="筆記篇數")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"關鍵詞數: {len(MATCHER.keywords)}，筆記長度: {args.chars} 字 x {args.notes} 篇\n")
+    print(f"{'情境':<14}{'做法':<12}{'平均 ms':>10}{'p95 ms':>10}")
+    print("-" * 46)
+
+    for label, rate in (("無命中", 0.0), ("稀疏命中", 0.002), ("密集命中", 0.05)):
+        notes = [make_note(rng, args.chars, rate) for _ in range(args.notes)]
+        for name, func in (("any_scan", any_scan), ("count_scan", count_scan), ("automaton", best_category)):
+            samples = sorted(timed(func, notes, args.repeat))
+            p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+            print(f"{label:<14}{name:<12}{statistics.mean(samples):>10.3f}{p95:>10.3f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# 本機假 OpenAI 服務（壓測用）
+# 實作 chat.completions 協定（含 stream=True 的 SSE 與 include_usage），依 prompt 內容回傳對應格式：
+# 出題 → 題目 JSON 陣列、批次主題生成 → {編號: 主題}、主題生成 / 重新測驗 → 短標題、摘要 → 條列摘要、其他 → 聊天回應。
+# 可設定首 token 延遲分佈、每秒 token 數，以及截斷、JSON 損壞、錯誤回應的機率。
+#
+# 用法：
+#   python -m bench.fake_openai --port 8900 --latency lognormal:600,0.4 --tokens-per-sec 60 --malformed-rate 0.1
+#   OPENAI_API_KEY=sk-fake OPENAI_BASE_URL=http://127.0.0.1:8900/v1 gunicorn -k eventlet -w 1 topic_apps:app
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+CONFIG = {
+    "latency": "fixed:300",      # 首 token 延遲（毫秒）分佈
+    "tokens_per_sec": 80.0,      # 之後每秒輸出的 token 數（0 表示不延遲）
+    "truncate_rate": 0.0,        # 回應被截斷（finish_reason=length）的機率
+    "malformed_rate": 0.0,       # 出題 JSON 被破壞的機率
+    "error_rate": 0.0,           # 直接回 500 的機率
+    "seed": None,
+}
+
+_rng = random.Random()
+_stats = {"requests": 0, "streamed": 0, "truncated": 0, "malformed": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def parse_latency(spec):
+    """
+    延遲分佈字串 → 取樣函式（回傳秒數）
+    fixed:MS / uniform:LO,HI / normal:MEAN,STD / lognormal:MEDIAN,SIGMA
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        lo, hi = values
+        return lambda: _rng.uniform(lo, hi) / 1000
+    if kind == "normal":
+        mean, std = values
+        return lambda: max(0.0, _rng.gauss(mean, std)) / 1000
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: _rng.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError(f"未知的延遲分佈: {spec}")
+
+
+_sample_latency = parse_latency(CONFIG["latency"])
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 2)
+
+
+def split_tokens(text, size=3):
+    """把回應切成 token 大小的片段（中文約 1~2 字一個 token，這裡取 3 字近似）"""
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+# ---------- 依 prompt 產生回應內容 ----------
+
+_QUIZ_COUNT = re.compile(r"生成\s*(\d+)\s*道選擇題")
+_NOTE_ID = re.compile(r"^\s*\[([^\]\n]+)\]\s*$", re.MULTILINE)
+_DIFFICULTIES = ["beginner", "intermediate", "advanced", "master"]
+
+
+def fake_questions(count):
+    questions = []
+    for i in range(count):
+        answer = "ABCD"[_rng.randrange(4)]
+        questions.append({
+            "title": f"壓測題目 {i + 1}：下列哪一個敘述正確？",
+            "option_A": "敘述甲",
+            "option_B": "敘述乙",
+            "option_C": "敘述丙",
+            "option_D": "敘述丁",
+            "Ai_answer": answer,
+            "explanation_text": f"正確答案是 {answer}，這是一段模擬的解析文字，用來產生接近真實長度的輸出。" * 3,
+            "difficulty": _DIFFICULTIES[i % len(_DIFFICULTIES)],
+        })
+    return questions
+
+
+def break_json(text):
+    """隨機製造模型常見的 JSON 錯誤"""
+    damage = _rng.randrange(4)
+    if damage == 0:
+        return "```json\n" + text + "\n```"                      # markdown 標記
+    if damage == 1:
+        return text.replace('",', '"', 1)                         # 少一個逗號
+    if damage == 2:
+        idx = text.find('"option_B": "')
+        return text[:idx + 13] + '"' + text[idx + 13:] if idx >= 0 else text   # 多一個引號
+    return text.rstrip("]\n ") + ",\n]"                           # 尾逗號
+
+
+def build_content(messages):
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+
+    if "Ai_answer" in prompt and "選擇題" in prompt:
+        match = _QUIZ_COUNT.search(prompt)
+        count = int(match.group(1)) if match else 5
+        text = json.dumps(fake_questions(count), ensure_ascii=False, indent=2)
+        if _rng.random() < CONFIG["malformed_rate"]:
+            _count("malformed")
+            text = break_json(text)
+        return text
+    if "批次學習主題生成" in prompt:
+        topics = {note_id: f"壓測主題{note_id}概念練習" for note_id in _NOTE_ID.findall(prompt)}
+        text = json.dumps(topics, ensure_ascii=False)
+        if _rng.random() < CONFIG["malformed_rate"]:
+            _count("malformed")
+            text = "```json\n" + text + "\n```"
+        return text
+    if "學習主題生成" in prompt:
+        return "壓測主題概念練習"
+    if "測驗標題" in prompt:
+        return "壓測筆記重點測驗"
+    if "摘要" in prompt and "新增對話" in prompt:
+        return "- 學生詢問了題目的解題方式\n- 助手說明了正確選項的原因"
+    return "這是本機假服務產生的回應。" * 20
+
+
+# ---------- chat.completions ----------
+
+def _usage(messages, completion):
+    prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+    completion_tokens = estimate_tokens(completion)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _token_delay():
+    rate = CONFIG["tokens_per_sec"]
+    return 1.0 / rate if rate > 0 else 0.0
+
+
+@app.route("/v1/models", methods=["GET"])
+def list_models():
+    return jsonify({"object": "list", "data": [{"id": "gpt-4o", "object": "model", "owned_by": "fake"}]})
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    _count("requests")
+    body = request.get_json(force=True) or {}
+    messages = body.get("messages", [])
+    model = body.get("model", "gpt-4o")
+
+    if _rng.random() < CONFIG["error_rate"]:
+        _count("errors")
+        return jsonify({"error": {"message": "fake server error", "type": "server_error"}}), 500
+
+    content = build_content(messages)
+    finish_reason = "stop"
+    max_tokens = body.get("max_tokens")
+    if max_tokens and estimate_tokens(content) > max_tokens:
+        content = content[:max_tokens * 2]
+        finish_reason = "length"
+    if _rng.random() < CONFIG["truncate_rate"]:
+        _count("truncated")
+        content = content[:int(len(content) * _rng.uniform(0.3, 0.9))]
+        finish_reason = "length"
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    first_token = _sample_latency()
+    pieces = split_tokens(content)
+
+    if body.get("stream"):
+        _count("streamed")
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta, finish=None):
+            return {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+
+        def generate():
+            time.sleep(first_token)
+            yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}), ensure_ascii=False)}\n\n"
+            delay = _token_delay()
+            for piece in pieces:
+                yield f"data: {json.dumps(chunk({'content': piece}), ensure_ascii=False)}\n\n"
+                if delay:
+                    time.sleep(delay)
+            yield f"data: {json.dumps(chunk({}, finish_reason), ensure_ascii=False)}\n\n"
+            if include_usage:
+                usage_chunk = chunk({})
+                usage_chunk["choices"] = []
+                usage_chunk["usage"] = _usage(messages, content)
+                yield f"data: {json.dumps(usage_chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype="text/event-stream")
+
+    time.sleep(first_token + len(pieces) * _token_delay())
+    return jsonify({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": finish_reason,
+        }],
+        "usage": _usage(messages, content),
+    })
+
+
+@app.route("/__stats", methods=["GET"])
+def stats():
+    with _stats_lock:
+        return jsonify(dict(_stats, config=CONFIG))
+
+
+def configure(**overrides):
+    """更新設定（測試程式可直接 import 後呼叫）"""
+    global _sample_latency
+    CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+    _sample_latency = parse_latency(CONFIG["latency"])
+    if CONFIG["seed"] is not None:
+        _rng.seed(CONFIG["seed"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機假 OpenAI chat.completions 服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", help="首 token 延遲分佈，如 fixed:300、uniform:200,800、lognormal:600,0.4")
+    parser.add_argument("--tokens-per-sec", type=float)
+    parser.add_argument("--truncate-rate", type=float)
+    parser.add_argument("--malformed-rate", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    configure(
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        truncate_rate=args.truncate_rate,
+        malformed_rate=args.malformed_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    print(f"🧪 假 OpenAI 服務啟動: http://{args.host}:{args.port}/v1  設定: {CONFIG}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# ml-service 壓測腳本
+# 以固定併發數對各端點送出請求，回報 p50 / p95 / p99 延遲與吞吐量；串流端點另外量首個事件的時間（TTFB）。
+# 搭配 bench.fake_openai 使用，不會花到真的 OpenAI 費用，結果可存成 JSON 作為之後改動的比較基準。
+#
+# 用法：
+#   python -m bench.run_bench --base-url http://127.0.0.1:5000 --concurrency 1,4,16 --requests 50
+#   python -m bench.run_bench --endpoints quiz,chat_stream --output baseline.json
+#   python -m bench.run_bench --compare baseline.json
+import argparse
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+TOPIC_DATA = {
+    "id": 1,
+    "title": "下列何者為質數？",
+    "option_A": "4",
+    "option_B": "6",
+    "option_C": "7",
+    "option_D": "9",
+    "Ai_answer": "C",
+    "explanation_text": "7 只能被 1 和自己整除。",
+}
+
+NOTE_CONTENT = "光合作用是植物利用光能將二氧化碳和水轉換成葡萄糖與氧氣的過程，主要在葉綠體中進行。" * 5
+
+# 端點名稱 → (HTTP 方法, 路徑, 請求內容, 是否為串流)
+ENDPOINTS = {
+    "quiz": ("POST", "/api/quiz", lambda i: {
+        "topic": f"壓測主題{i % 50}", "difficulty": "beginner", "question_count": 10,
+    }, False),
+    "quiz_stream": ("POST", "/api/quiz/stream", lambda i: {
+        "topic": f"壓測主題{i % 50}", "difficulty": "beginner", "question_count": 10,
+    }, True),
+    "chat": ("POST", "/api/chat", lambda i: {
+        "user_id": 1, "topic_id": 1, "topic_data": TOPIC_DATA, "content": "為什麼答案是 C？",
+        "chat_history": [{"sender": "user", "content": "為什麼答案是 C？"}],
+    }, False),
+    "chat_stream": ("POST", "/api/chat/stream", lambda i: {
+        "user_id": 1, "topic_id": 1, "topic_data": TOPIC_DATA, "content": "為什麼答案是 C？",
+        "chat_history": [{"sender": "user", "content": "為什麼答案是 C？"}],
+    }, True),
+    "retest": ("POST", "/api/retest", lambda i: {"content": NOTE_CONTENT}, False),
+    "generate_topic_from_note": ("POST", "/api/generate_topic_from_note", lambda i: {
+        "note_title": "光合作用", "note_content": NOTE_CONTENT,
+    }, False),
+    "generate_topic_from_note_batch": ("POST", "/api/generate_topic_from_note/batch", lambda i: {
+        "notes": [{"id": n, "note_title": f"光合作用{n}", "note_content": NOTE_CONTENT} for n in range(20)],
+    }, False),
+}
+
+DEFAULT_ENDPOINTS = "quiz,chat,retest,generate_topic_from_note"
+
+
+def percentile(sorted_values, pct):
+    """nearest-rank 百分位數"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def one_request(session, base_url, name, i, timeout):
+    method, path, payload, streaming = ENDPOINTS[name]
+    start = time.perf_counter()
+    first_byte = None
+    try:
+        response = session.request(method, base_url + path, json=payload(i), stream=streaming, timeout=timeout)
+        if streaming:
+            for line in response.iter_lines():
+                if line and first_byte is None:
+                    first_byte = time.perf_counter() - start
+        else:
+            response.content
+        ok = response.status_code < 400
+    except requests.RequestException:
+        ok = False
+    return ok, time.perf_counter() - start, first_byte
+
+
+def run_level(base_url, name, concurrency, total, timeout):
+    """以指定併發數送出 total 個請求，回傳統計結果"""
+    sessions = [requests.Session() for _ in range(concurrency)]
+    results = []
+
+    def worker(i):
+        return one_request(sessions[i % concurrency], base_url, name, i, timeout)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(total)))
+    wall = time.perf_counter() - wall_start
+
+    for session in sessions:
+        session.close()
+
+    latencies = sorted(elapsed for ok, elapsed, _ in results if ok)
+    ttfb = sorted(first for ok, _, first in results if ok and first is not None)
+    errors = sum(1 for ok, _, _ in results if not ok)
+    ms = lambda v: round(v * 1000, 1) if v is not None else None
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "ttfb_p50_ms": ms(percentile(ttfb, 50)),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+    }
+
+
+def print_table(rows, baseline=None):
+    header = f"{'endpoint':<26}{'conc':>5}{'reqs':>6}{'err':>5}{'p50':>10}{'p95':>10}{'p99':>10}{'ttfb50':>10}{'rps':>9}"
+    print(header)
+    print("-" * len(header))
+    base = {(r["endpoint"], r["concurrency"]): r for r in (baseline or [])}
+    fmt = lambda v: "-" if v is None else f"{v:.1f}"
+    for r in rows:
+        line = (f"{r['endpoint']:<26}{r['concurrency']:>5}{r['requests']:>6}{r['errors']:>5}"
+                f"{fmt(r['p50_ms']):>10}{fmt(r['p95_ms']):>10}{fmt(r['p99_ms']):>10}"
+                f"{fmt(r['ttfb_p50_ms']):>10}{r['throughput_rps']:>9.2f}")
+        old = base.get((r["endpoint"], r["concurrency"]))
+        if old and old.get("p95_ms") and r["p95_ms"]:
+            change = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            line += f"   p95 {change:+.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ml-service 端點壓測")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--endpoints", default=DEFAULT_ENDPOINTS,
+                        help=f"逗號分隔，可選：{', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗號分隔的併發數")
+    parser.add_argument("--requests", type=int, default=50, help="每個併發等級送出的請求數")
+    parser.add_argument("--warmup", type=int, default=2, help="每個端點正式量測前的暖機請求數")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="結果寫入 JSON 檔")
+    parser.add_argument("--compare", help="與先前輸出的 JSON 比較 p95")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.endpoints.split(",") if n.strip()]
+    unknown = [n for n in names if n not in ENDPOINTS]
+    if unknown:
+        parser.error(f"未知的端點: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    rows = []
+    for name in names:
+        with requests.Session() as session:
+            for i in range(args.warmup):
+                one_request(session, args.base_url, name, i, args.timeout)
+        for concurrency in levels:
+            row = run_level(args.base_url, name, concurrency, max(args.requests, concurrency), args.timeout)
+            rows.append(row)
+            print(f"✅ {name} x{concurrency}: p95={row['p95_ms']}ms rps={row['throughput_rps']} errors={row['errors']}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    print()
+    print_table(rows, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"base_url": args.base_url, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"\n結果已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
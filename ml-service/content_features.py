@@ -0,0 +1,116 @@
+# 筆記內容特徵擷取
+# 原本每個特徵各跑一次 re.search，長筆記會被重複掃描十幾遍。
+# 這裡把所有特徵合成一個預先編譯的正規表示式，finditer 掃一遍，依 lastgroup 分類計數，
+# 同時得到 has_* 旗標、各類出現次數，以及各字元類別佔全文的比例。
+import re
+
+# 順序有意義：前面的分組先搶走字元（網址裡的 / 不算公式符號、日期裡的數字不再算一次數字）。
+# 中文連續字最常見且不會和其他分組衝突，放第一個，引擎在大多數位置第一個分支就成功。
+# 換行單獨一個分組、space 不吃換行：下一行開頭的縮排要留給 list_item 的 ^ 判斷
+_TOKEN = re.compile(
+    r"(?P<cjk>[一-鿿]+)"
+    r"|(?P<url>https?://\S+)"
+    r"|(?P<mention>@\S+)"
+    r"|(?P<hashtag>#\S+)"
+    r"|(?P<list_item>^[^\S\n]*(?:[-*•]|\d+\.)(?=\s))"
+    r"|(?P<newline>\n+)"
+    r"|(?P<space>[^\S\n]+)"
+    r"|(?P<date>\d{4}-\d{1,2}-\d{1,2}|\d{4}年|\d{1,2}[月日])"
+    r"|(?P<number>\d+(?:\.\d+)?)"
+    r"|(?P<latin>[A-Za-z]+)"
+    r"|(?P<kana>[ぁ-んァ-ン]+)"
+    r"|(?P<hangul>[가-힣]+)"
+    r"|(?P<emoji>[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF☀-➿]+)"
+    r"|(?P<symbol>[+\-*/=()\[\]{}]+)"
+    r"|(?P<question>[？?]+)",
+    re.MULTILINE,
+)
+
+_CJK = re.compile(r"[一-鿿]")
+_MAY_CONTAIN_CJK = frozenset({'date', 'url', 'mention', 'hashtag'})
+
+CODE_KEYWORDS = frozenset({'def', 'class', 'import', 'function', 'var', 'let', 'const'})
+
+# 以字元數計算比例的類別；其餘未分類的字元（標點等）歸在 other
+CHAR_CLASSES = ('cjk', 'kana', 'hangul', 'latin', 'digit', 'emoji', 'symbol', 'space', 'other')
+
+# 各分組的字元算進哪個字元類別
+_CHAR_CLASS_OF = {
+    'url': 'other', 'mention': 'other', 'hashtag': 'other', 'list_item': 'other',
+    'date': 'digit', 'number': 'digit', 'latin': 'latin', 'cjk': 'cjk', 'kana': 'kana',
+    'hangul': 'hangul', 'emoji': 'emoji', 'symbol': 'symbol', 'question': 'other', 'space': 'space',
+    'newline': 'space',
+}
+
+
+def extract_features(content):
+    """
+    掃描一遍內容，回傳：
+    - has_*：與舊版 analyze_content_complexity 相同的布林旗標
+    - counts：網址、日期、數字、英文單字、程式關鍵字、清單項目等出現次數
+    - ratios：各字元類別佔全文字數的比例
+    - length：總字數
+    """
+    content = content or ''
+    matches = {name: 0 for name in _CHAR_CLASS_OF}
+    chars = dict.fromkeys(CHAR_CLASSES, 0)
+    english_words = 0
+    code_keywords = 0
+    numbered_items = 0  # 「12. 」這類編號也算數字
+    embedded_cjk = 0    # 被日期、網址、標籤、提及吃掉的中文字（「3月」、「#生物」）
+
+    for m in _TOKEN.finditer(content):
+        group = m.lastgroup
+        size = m.end() - m.start()
+        matches[group] += 1
+        chars[_CHAR_CLASS_OF[group]] += size
+        if group == 'latin':
+            if size >= 3:
+                english_words += 1
+            if size <= 8 and m.group().lower() in CODE_KEYWORDS:
+                code_keywords += 1
+        elif group == 'list_item' and m.group().endswith('.'):
+            numbered_items += 1
+        elif group in _MAY_CONTAIN_CJK and not embedded_cjk and _CJK.search(m.group()):
+            embedded_cjk += 1
+
+    length = len(content)
+    chars['other'] += length - sum(chars.values())
+
+    counts = {
+        'urls': matches['url'],
+        'mentions': matches['mention'],
+        'hashtags': matches['hashtag'],
+        'list_items': matches['list_item'],
+        'dates': matches['date'],
+        'numbers': matches['number'],
+        'english_words': english_words,
+        'code_keywords': code_keywords,
+        'questions': matches['question'],
+        'formula_symbols': chars['symbol'],
+        'emoji': chars['emoji'],
+    }
+    return {
+        'has_formulas': counts['formula_symbols'] > 0,
+        'has_code': code_keywords > 0,
+        'has_dates': counts['dates'] > 0,
+        'has_numbers': counts['numbers'] + counts['dates'] + numbered_items > 0,
+        'has_questions': counts['questions'] > 0,
+        'has_lists': counts['list_items'] > 0,
+        'has_english': english_words > 0,
+        'has_japanese': chars['kana'] > 0,
+        'has_korean': chars['hangul'] > 0,
+        'has_chinese': chars['cjk'] + embedded_cjk > 0,
+        'has_emoji': counts['emoji'] > 0,
+        'has_urls': counts['urls'] > 0,
+        'has_hashtags': counts['hashtags'] > 0,
+        'has_mentions': counts['mentions'] > 0,
+        'counts': counts,
+        'ratios': {name: (value / length if length else 0.0) for name, value in chars.items()},
+        'length': length,
+    }
+
+
+def extract_features_batch(contents):
+    """一次處理多篇筆記，回傳與輸入順序相同的特徵列表"""
+    return [extract_features(content) for content in contents]
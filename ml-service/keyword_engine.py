@@ -0,0 +1,219 @@
+# 關鍵詞擷取
+# - 停用詞在 import 時建成 frozenset，不會每次呼叫都重建
+# - 中日文沒有空白分詞，連續的漢字 / 假名切成相鄰兩字的 bigram，英文等拉丁文字以單字為單位
+# - 以 heapq 取前 k 名，不必排序整個詞頻表；重疊的 bigram（光合 / 合作 / 作用）會併回原本的詞組（光合作用）
+# - 可載入由既有筆記統計出的 IDF 權重，壓低每篇都會出現的詞
+#
+# 建立 IDF（先在 Django 匯出筆記，再於 ml-service 目錄下統計）：
+#   python manage.py export_notes --output notes.jsonl
+#   python -m keyword_engine build-idf notes.jsonl keyword_idf.json
+#   KEYWORD_IDF_PATH=keyword_idf.json gunicorn ...
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+
+from log_utils import log_event
+
+logger = logging.getLogger("ml-service")
+
+# 只分析前面這麼多字，長筆記的耗時有上限
+KEYWORD_MAX_CHARS = int(os.getenv("KEYWORD_MAX_CHARS", "20000"))
+KEYWORD_IDF_PATH = os.getenv("KEYWORD_IDF_PATH", "")
+# bigram 合併後的詞組長度上限
+KEYWORD_MAX_PHRASE = 8
+
+STOP_WORDS = frozenset({
+    # 中文
+    '如果', '因為', '所以', '這個', '那個', '這些', '那些', '非常', '特別', '比較',
+    '我們', '你們', '他們', '她們', '它們', '什麼', '怎麼', '為什麼', '哪裡', '什麼時候', '多少', '幾個',
+    '可以', '就是', '還是', '或是', '以及', '而且', '但是', '然後', '已經', '一個', '一些', '自己', '沒有',
+    # 英文
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
+    'will', 'would', 'could', 'should', 'may', 'might', 'can', 'must', 'shall',
+    'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they',
+    'what', 'when', 'where', 'why', 'how', 'which', 'who', 'whom', 'not', 'from', 'as', 'so', 'if', 'then',
+    # 日文
+    'から', 'まで', 'より', 'です', 'ます', 'である', 'いる', 'ある', 'する', 'なる', 'できる',
+    'これ', 'それ', 'あれ', 'どれ', 'ここ', 'そこ', 'あそこ', 'どこ',
+})
+
+# 含有這些字的 bigram 幾乎都是虛詞組合（「的是」「了一」），不列入候選
+STOP_CHARS = frozenset(
+    '的是在有和與或但而了着著過來去到從向對為給被把讓使得很更最太真好也就都又才'
+    '我你他她它這那其之於以及並且個些麼嗎呢吧啊呀'
+    'はがをにへでのとやもかねよだ'
+)
+
+
+def _char_class(lo, hi, excluded):
+    """lo~hi 範圍扣掉 excluded 後的正規表示式字元類別內容"""
+    parts = []
+    start = lo
+    for ch in sorted(c for c in excluded if lo <= c <= hi):
+        if start < ch:
+            parts.append((start, chr(ord(ch) - 1)))
+        start = chr(ord(ch) + 1)
+    if start <= hi:
+        parts.append((start, hi))
+    return ''.join(a if a == b else f'{a}-{b}' for a, b in parts)
+
+
+# 虛詞字直接排除在字元類別之外：中日文片段在虛詞處就斷開，切 bigram 時不必逐一檢查
+_IDEOGRAPHIC = _char_class('一', '鿿', STOP_CHARS) + _char_class('ぁ', 'ん', STOP_CHARS) + 'ァ-ンー'
+_TOKEN = re.compile(rf"[a-z][a-z0-9'\-]+|[{_IDEOGRAPHIC}]{{2,}}|[가-힣]{{2,}}")
+
+
+def _is_ideographic(term):
+    return '一' <= term[0] <= '鿿' or 'ぁ' <= term[0] <= 'ー'
+
+
+def tokenize(text):
+    """
+    切出候選詞（依出現順序）：
+    - 拉丁文字：小寫單字（至少 2 個字元）
+    - 漢字 / 假名：在虛詞字處斷開，每段切成相鄰兩字的 bigram
+    - 韓文：以空白分隔，整段視為一詞
+    """
+    tokens = []
+    for run in _TOKEN.findall(text[:KEYWORD_MAX_CHARS].lower()):
+        if _is_ideographic(run):
+            tokens.extend([run[i:i + 2] for i in range(len(run) - 1)])
+        else:
+            tokens.append(run)
+    return [t for t in tokens if t not in STOP_WORDS]
+
+
+def _merge_bigrams(candidates, text, counts, k):
+    """
+    候選詞依分數由高到低，處理中日文 bigram 互相重疊的問題：
+    - 某個 bigram 每次出現都緊接在已選詞組前後（且重複出現），就併進該詞組：光合 + 合作 + 作用 → 光合作用
+    - 只是已選詞組旁邊的切分碎片（今天 / 天讀 / 讀書 的「天讀」），直接略過
+    """
+    phrases = []
+    for term, score in candidates:
+        action = 'add'
+        if _is_ideographic(term):
+            for i, (phrase, phrase_score) in enumerate(phrases):
+                if not _is_ideographic(phrase):
+                    continue
+                if phrase.endswith(term[0]):
+                    extended = phrase + term[1]
+                elif phrase.startswith(term[1]):
+                    extended = term[0] + phrase
+                else:
+                    continue
+                hits = text.count(extended)
+                if not hits:
+                    continue
+                # 兩邊每次出現都在延伸後的詞組裡才合併，避免把「葉綠體」和「體葉」黏成「葉綠體葉」
+                if (hits >= 2 and hits >= counts[term] and hits >= text.count(phrase)
+                        and len(extended) <= KEYWORD_MAX_PHRASE):
+                    phrases[i] = (extended, phrase_score)
+                    action = 'merged'
+                else:
+                    action = 'skip'
+                break
+        if action == 'add':
+            if len(phrases) >= k:
+                break
+            phrases.append((term, score))
+    return [phrase for phrase, _ in phrases]
+
+
+def extract_keywords(text, k=3, idf=None):
+    """回傳最多 k 個關鍵詞；idf 為 None 時使用啟動時載入的權重（沒有則只看詞頻）"""
+    if not text:
+        return []
+    idf = DEFAULT_IDF if idf is None else idf
+    counts = Counter(tokenize(text))
+    if not counts:
+        return []
+
+    if idf:
+        weights, unseen = idf['weights'], idf['unseen']
+        scored = ((term, tf * weights.get(term, unseen)) for term, tf in counts.items())
+    else:
+        scored = counts.items()
+    # 多取幾個候選，留給 bigram 合併使用；heapq.nlargest 同分時保留出現順序
+    candidates = heapq.nlargest(k * 4, scored, key=lambda item: item[1])
+    return _merge_bigrams(candidates, text[:KEYWORD_MAX_CHARS].lower(), counts, k)
+
+
+def build_idf(texts):
+    """由多篇文件統計 IDF：回傳 {'documents': N, 'df': {詞: 出現的文件數}}"""
+    df = Counter()
+    documents = 0
+    for text in texts:
+        documents += 1
+        df.update(set(tokenize(text or '')))
+    return {'documents': documents, 'df': dict(df)}
+
+
+def load_idf(data):
+    """
+    把 build_idf 的結果轉成查表用的權重（平滑 IDF）
+    沒統計到的詞給平均權重：跨詞的 bigram 碎片多半也沒統計到，給最高權重反而會把它們推到前面
+    """
+    documents = data.get('documents', 0)
+    if not documents or not data.get('df'):
+        return None
+    weights = {term: math.log((documents + 1) / (count + 1)) + 1 for term, count in data['df'].items()}
+    return {'weights': weights, 'unseen': sum(weights.values()) / len(weights)}
+
+
+def load_idf_file(path):
+    with open(path, encoding='utf-8') as f:
+        return load_idf(json.load(f))
+
+
+DEFAULT_IDF = None
+if KEYWORD_IDF_PATH:
+    try:
+        DEFAULT_IDF = load_idf_file(KEYWORD_IDF_PATH)
+        log_event(logger, logging.INFO, "已載入關鍵詞 IDF", path=KEYWORD_IDF_PATH,
+                  terms=len(DEFAULT_IDF['weights']) if DEFAULT_IDF else 0)
+    except (OSError, ValueError, KeyError) as e:
+        log_event(logger, logging.WARNING, "關鍵詞 IDF 載入失敗，改用純詞頻", path=KEYWORD_IDF_PATH, error=str(e))
+
+
+def _read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line).get('content', '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="關鍵詞擷取工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build-idf", help="由 export_notes 匯出的 JSONL 統計 IDF")
+    build.add_argument("input", help="每行一個 {\"content\": ...} 的 JSONL 檔")
+    build.add_argument("output", help="輸出的 IDF JSON 檔")
+    build.add_argument("--min-df", type=int, default=2, help="出現文件數少於此值的詞不寫入（以平均權重計）")
+    show = sub.add_parser("extract", help="擷取單一文字檔的關鍵詞")
+    show.add_argument("path")
+    show.add_argument("-k", type=int, default=5)
+    show.add_argument("--idf", help="IDF JSON 檔")
+    args = parser.parse_args()
+
+    if args.command == "build-idf":
+        data = build_idf(_read_jsonl(args.input))
+        data['df'] = {term: count for term, count in data['df'].items() if count >= args.min_df}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        print(f"✅ {data['documents']} 篇文件，{len(data['df'])} 個詞，已寫入 {args.output}")
+    else:
+        idf = load_idf_file(args.idf) if args.idf else None
+        with open(args.path, encoding="utf-8") as f:
+            print(extract_keywords(f.read(), args.k, idf=idf or {}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# 備用主題生成用的關鍵詞比對
+# 學科、語言、動漫遊戲、娛樂四組字典在 import 時一次編成 Aho–Corasick 自動機，
+# 掃描筆記一遍就能找出所有分類的命中，不用對每個關鍵詞各做一次 `in`（成本是 關鍵詞數 × 筆記長度）。
+# 命中結果換算成各分類分數，由分數最高者決定主題，而不是看字典裡誰排在前面。
+from collections import deque
+
+SUBJECT_KEYWORDS = {
+    '數學': [
+        '數學', '計算', '公式', '幾何', '代數', '微積分', '統計', '概率', '函數', '方程', '不等式',
+        '三角', '向量', '矩陣', '數列', '極限', '導數', '積分', '微分', '線性', '非線性'
+    ],
+    '物理': [
+        '物理', '力學', '電學', '光學', '熱學', '量子', '相對論', '牛頓', '愛因斯坦', '能量', '動量',
+        '電場', '磁場', '波', '聲', '光', '溫度', '壓力', '密度', '速度', '加速度'
+    ],
+    '化學': [
+        '化學', '分子', '原子', '反應', '元素', '化合物', '離子', '鍵', '酸', '鹼', '氧化', '還原',
+        '催化', '平衡', '速率', '濃度', 'pH值', '有機', '無機', '生物化學'
+    ],
+    '生物': [
+        '生物', '細胞', '基因', '進化', '生態', '解剖', '生理', '遺傳', '免疫', '神經', '循環',
+        '消化', '呼吸', '繁殖', '代謝', '酶', '蛋白質', 'DNA', 'RNA', '染色體'
+    ],
+    '歷史': [
+        '歷史', '古代', '近代', '戰爭', '革命', '文化', '文明', '帝國', '王朝', '政治', '社會',
+        '經濟', '宗教', '哲學', '藝術', '文學', '科學', '技術', '地理', '民族'
+    ],
+    '地理': [
+        '地理', '地形', '氣候', '人口', '經濟', '環境', '自然', '人文', '區域', '國家', '城市',
+        '山脈', '河流', '海洋', '沙漠', '森林', '草原', '資源', '產業', '交通'
+    ],
+    '文學': [
+        '文學', '小說', '詩歌', '散文', '戲劇', '作者', '作品', '風格', '流派', '主題', '情節',
+        '人物', '語言', '修辭', '意象', '象徵', '諷刺', '幽默', '浪漫', '現實'
+    ],
+    '語言': [
+        '語言', '語法', '詞彙', '發音', '翻譯', '寫作', '閱讀', '聽力', '口語', '文法', '句型',
+        '時態', '語態', '語氣', '連接詞', '介詞', '冠詞', '形容詞', '副詞', '動詞'
+    ],
+    '計算機': [
+        '計算機', '程式', '算法', '數據', '網絡', '軟件', '硬體', '編程', '開發', '設計', '測試',
+        '數據庫', '人工智能', '機器學習', '深度學習', '雲計算', '大數據', '區塊鏈', '物聯網'
+    ],
+    '經濟': [
+        '經濟', '市場', '貿易', '金融', '投資', '政策', '貨幣', '銀行', '股票', '債券', '匯率',
+        '通貨膨脹', '失業', 'GDP', '供需', '價格', '成本', '利潤', '競爭', '壟斷'
+    ],
+    '心理學': [
+        '心理', '認知', '行為', '情緒', '人格', '發展', '社會', '臨床', '實驗', '學習', '記憶',
+        '注意力', '思維', '動機', '態度', '價值觀', '群體', '文化', '健康'
+    ],
+    '哲學': [
+        '哲學', '邏輯', '倫理', '美學', '形而上學', '認識論', '存在', '意識', '自由', '正義',
+        '真理', '知識', '理性', '經驗', '懷疑', '辯證', '唯心', '唯物', '實用主義'
+    ]
+}
+
+LANGUAGE_KEYWORDS = {
+    '英文': [
+        'english', '英語', '英文',
+        'grammar', 'vocabulary', 'pronunciation', 'translation', 'writing', 'reading', 'listening', 'speaking',
+        'tense', 'verb', 'noun', 'adjective', 'adverb', 'preposition', 'conjunction', 'article'
+    ],
+    '日文': [
+        '日語', '日文', '日本語', 'ひらがな', 'カタカナ', '漢字', '文法', '語彙', '發音', '翻訳',
+        'writing', 'reading', 'listening', 'speaking', '敬語', '助詞', '動詞', '形容詞', '名詞'
+    ],
+    '韓文': [
+        '韓語', '韓文', '한국어', '한글', '문법', '어휘', '발음', '번역', 'writing', 'reading'
+    ],
+    '法文': [
+        '法語', '法文', 'français', 'francais', 'grammaire', 'vocabulaire', 'prononciation', 'traduction'
+    ],
+    '德文': [
+        '德語', '德文', 'deutsch', 'grammatik', 'wortschatz', 'aussprache', 'übersetzung'
+    ]
+}
+
+ANIME_GAME_KEYWORDS = {
+    '動漫': [
+        '動漫', '動畫', '漫畫', 'anime', 'manga', '二次元', '角色', '劇情', '聲優', 'op', 'ed',
+        '輕小說', '輕小', 'galgame', '視覺小說'
+    ],
+    '遊戲': [
+        '遊戲', 'game', 'rpg', 'mmorpg', 'fps', 'moba', '策略', '動作', '冒險', '解謎', '模擬',
+        '競技', '單機', '網遊', '手遊', '主機', 'pc', 'steam', 'switch', 'ps5', 'xbox'
+    ],
+    '二次元文化': [
+        'cosplay', '同人', '手辦', '模型', '周邊', '應援', '粉絲', '宅', '萌', '燃', '百合', 'bl',
+        '腐女', '蘿莉', '御姐', '正太', '大叔', '傲嬌', '天然', '病嬌', '三無'
+    ]
+}
+
+ENTERTAINMENT_KEYWORDS = {
+    '影視': [
+        '電影', '電視', '劇', '影視', 'movie', 'tv', 'drama', 'series', 'show', 'film', 'cinema',
+        '導演', '演員', '編劇', '製片', '票房', '收視率', '劇情', '特效', '配樂', '剪輯'
+    ],
+    '音樂': [
+        '音樂', '歌曲', '歌手', '樂團', '樂器', '作曲', '作詞', '編曲', 'music', 'song',
+        'pop', 'rock', 'jazz', 'classical', 'electronic', 'hip-hop', 'r&b', 'country', 'folk'
+    ],
+    '藝術': [
+        '藝術', '繪畫', '雕塑', '攝影', '設計', '建築', '時尚', 'art', 'painting', 'sculpture',
+        'photography', 'design', 'architecture', 'fashion', '素描', '水彩', '油畫', '版畫'
+    ]
+}
+
+# 具體作品名：命中時也算進所屬分類的分數，並用來產生「{作品}相關練習」這類主題
+ANIME_TITLES = ['海賊王', '火影', '死神', '進擊的巨人', '鬼滅之刃', '咒術迴戰', '鋼彈', 'eva']
+GAME_TITLES = ['minecraft', 'fortnite', 'lol', 'dota', 'csgo', 'valorant', '原神', '崩壞']
+
+# 分組順序即同分時的優先順序（與原本逐組檢查的順序一致）
+KEYWORD_GROUPS = [
+    ('subject', SUBJECT_KEYWORDS),
+    ('language', LANGUAGE_KEYWORDS),
+    ('anime_game', ANIME_GAME_KEYWORDS),
+    ('entertainment', ENTERTAINMENT_KEYWORDS),
+]
+
+# 單一個中日韓字（如「光」「劇」「萌」）太容易出現在無關的句子裡，命中只算半分
+SINGLE_CHAR_WEIGHT = 0.5
+
+
+def _is_ascii_word(keyword):
+    return keyword.isascii() and any(ch.isalnum() for ch in keyword)
+
+
+def _is_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick 多模式比對
+    patterns：{關鍵詞: [標籤, ...]}，比對時不分大小寫
+    英數關鍵詞（如 op、pc、art）必須以完整單字出現，避免 develop、topic、start 之類的誤判
+    """
+
+    def __init__(self, patterns):
+        self.keywords = []
+        self.labels = []
+        self.weights = []
+        self.word_bounded = []
+        goto = [{}]
+        fail = [0]
+        output = [()]
+
+        for keyword, labels in patterns.items():
+            keyword = keyword.lower()
+            index = len(self.keywords)
+            self.keywords.append(keyword)
+            self.labels.append(tuple(labels))
+            self.weights.append(SINGLE_CHAR_WEIGHT if len(keyword) == 1 else 1.0)
+            self.word_bounded.append(_is_ascii_word(keyword))
+
+            node = 0
+            for ch in keyword:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    output.append(())
+                    goto[node][ch] = nxt
+                node = nxt
+            output[node] = output[node] + (index,)
+
+        # BFS 建立失敗連結，並把失敗節點的輸出併進來（命中較長詞時，其中的較短詞也一起算）
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fail[nxt] = goto[state].get(ch, 0)
+                output[nxt] = output[nxt] + output[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+
+    def iter_matches(self, text):
+        """依出現位置產生 (起點, 終點, 關鍵詞索引)，終點不含；重疊的命中全部回報"""
+        text = text.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        hits = []
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node]:
+                hits.append((pos, output[node]))
+
+        # 熱迴圈只記錄位置，邊界檢查留到這裡（命中數遠少於字數）
+        length = len(text)
+        for pos, indexes in hits:
+            end = pos + 1
+            for index in indexes:
+                start = end - len(self.keywords[index])
+                if self.word_bounded[index] and (
+                    (start > 0 and _is_word_char(text[start - 1])) or
+                    (end < length and _is_word_char(text[end]))
+                ):
+                    continue
+                yield start, end, index
+
+    def count(self, text):
+        """回傳 {標籤: 分數}；每次命中依關鍵詞權重加分"""
+        scores = {}
+        for _, _, index in self.iter_matches(text):
+            weight = self.weights[index]
+            for label in self.labels[index]:
+                scores[label] = scores.get(label, 0) + weight
+        return scores
+
+
+def _build_patterns():
+    patterns = {}
+
+    def add(keyword, label):
+        labels = patterns.setdefault(keyword.lower(), [])
+        if label not in labels:
+            labels.append(label)
+
+    for group, categories in KEYWORD_GROUPS:
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                add(keyword, (group, category))
+    for title in ANIME_TITLES:
+        add(title, ('anime_game', '動漫'))
+        add(title, ('anime_title', title))
+    for title in GAME_TITLES:
+        add(title, ('anime_game', '遊戲'))
+        add(title, ('game_title', title))
+    return patterns
+
+
+# 同分時依字典原本的排列順序決定
+CATEGORY_ORDER = {
+    (group, category): rank
+    for rank, (group, category) in enumerate(
+        (group, category) for group, categories in KEYWORD_GROUPS for category in categories
+    )
+}
+TITLE_ORDER = {title: rank for rank, title in enumerate(ANIME_TITLES + GAME_TITLES)}
+
+MATCHER = KeywordAutomaton(_build_patterns())
+
+
+def score_categories(text):
+    """
+    掃描一次文字，回傳 (分類分數, 作品分數)
+    - 分類分數：{(組別, 分類): 分數}，組別為 subject / language / anime_game / entertainment
+    - 作品分數：{('anime_title' 或 'game_title', 作品名): 分數}
+    """
+    categories = {}
+    titles = {}
+    for label, score in MATCHER.count(text).items():
+        if label[0] in _TITLE_GROUPS.values():
+            titles[label] = score
+        else:
+            categories[label] = score
+    return categories, titles
+
+
+_TITLE_GROUPS = {('anime_game', '動漫'): 'anime_title', ('anime_game', '遊戲'): 'game_title'}
+
+
+def best_category(text):
+    """
+    回傳 ((組別, 分類), 作品名)；沒有任何命中時回傳 (None, None)
+    作品名只在分類是動漫 / 遊戲且有命中對應作品時才有值
+    """
+    categories, titles = score_categories(text)
+    if not categories:
+        return None, None
+    label = min(categories, key=lambda k: (-categories[k], CATEGORY_ORDER[k]))
+    title_group = _TITLE_GROUPS.get(label)
+    candidates = [k for k in titles if k[0] == title_group]
+    if not candidates:
+        return label, None
+    best = min(candidates, key=lambda k: (-titles[k], TITLE_ORDER[k[1]]))
+    return label, best[1]
@@ -0,0 +1,156 @@
+# 結構化日誌工具
+# - setup_logging：啟動時呼叫一次，root logger 改走下面的佇列 handler
+# - QueueStreamHandler：請求執行緒只把 record 丟進佇列，由背景執行緒寫到 stdout，不會卡在 I/O 上；
+#   佇列滿時直接丟棄並計數，絕不阻塞請求
+# - JsonFormatter：每筆日誌輸出一行 JSON（時間、等級、logger、訊息與額外欄位）
+# - log_event / log_sampled：附帶欄位記錄；欄位會先遮蔽敏感值並截斷過長內容，高流量位置可依比例取樣
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.05"))  # 高流量位置預設只記錄 5%
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+SENSITIVE_KEYS = (
+    "password", "passwd", "token", "secret", "authorization", "cookie",
+    "api_key", "apikey", "hash_key", "hash_iv", "csrf", "session",
+)
+
+
+def _is_sensitive(key):
+    key = str(key).lower()
+    return any(word in key for word in SENSITIVE_KEYS)
+
+
+def truncate(value, limit=None):
+    """字串化並截斷過長內容"""
+    limit = limit or LOG_MAX_FIELD_CHARS
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}…(+{len(text) - limit} chars)"
+
+
+def redact(value, depth=0):
+    """遞迴遮蔽敏感欄位（密碼、token、Cookie 等），並截斷過長字串"""
+    if depth > 4:
+        return truncate(value)
+    if isinstance(value, dict):
+        return {
+            str(k): "***" if _is_sensitive(k) else redact(v, depth + 1)
+            for k, v in list(value.items())[:50]
+        }
+    if isinstance(value, (list, tuple)):
+        items = [redact(v, depth + 1) for v in value[:20]]
+        if len(value) > 20:
+            items.append(f"…(+{len(value) - 20} items)")
+        return items
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return truncate(value)
+
+
+def log_event(logger, level, message, **fields):
+    """記錄一筆結構化日誌；等級未啟用時完全不處理欄位"""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"fields": redact(fields)})
+
+
+def log_sampled(logger, level, message, rate=None, **fields):
+    """高流量位置使用：只有 rate 比例的呼叫會真的記錄（WARNING 以上不取樣）"""
+    if level < logging.WARNING and random.random() >= (LOG_SAMPLE_RATE if rate is None else rate):
+        return
+    log_event(logger, level, message, sampled=level < logging.WARNING, **fields)
+
+
+class JsonFormatter(logging.Formatter):
+    """一筆日誌一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueStreamHandler(logging.Handler):
+    """
+    非阻塞的 stdout handler
+    formatter 套用在背景寫出的 StreamHandler 上，格式化也不佔用請求執行緒
+    """
+
+    def __init__(self, maxsize=None):
+        super().__init__()
+        self.queue = queue.Queue(maxsize or LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self._target = logging.StreamHandler(sys.stdout)
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        self._target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        # gunicorn fork 之後背景執行緒不會跟著過去，依 pid 重新啟動
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self._listener = logging.handlers.QueueListener(self.queue, self._target)
+            self._listener.start()
+            self._pid = pid
+            atexit.register(self._listener.stop)
+
+    def prepare(self, record):
+        # 只把訊息與例外轉成字串（跨執行緒安全），其餘格式化交給背景執行緒
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+def setup_logging(level=None):
+    """設定 root logger：JSON 格式、經由佇列非阻塞輸出；重複呼叫不會重複加 handler"""
+    root = logging.getLogger()
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    if not any(isinstance(h, QueueStreamHandler) for h in root.handlers):
+        handler = QueueStreamHandler()
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
+    # 第三方套件的連線細節不需要
+    for name in ("httpx", "httpcore", "openai", "urllib3"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    return root
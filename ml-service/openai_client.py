@@ -0,0 +1,108 @@
+# OpenAI 共用客戶端
+# 每個 worker 行程只建立一個 OpenAI 客戶端（第一次使用時才建立），
+# 所有請求共用同一個 keep-alive 連線池，不再每次重新 TLS 握手。
+#
+# gunicorn 的 eventlet worker 會在載入 app 前 monkey patch socket / threading，
+# httpx 的同步傳輸層與這裡的 Lock 都會自動變成 green 版本，不需特別處理。
+import os
+import threading
+
+from openai import OpenAI, DefaultHttpxClient
+import httpx
+
+PLACEHOLDER_API_KEY = 'your-api-key-here'
+
+# 連線池設定
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+
+# 各端點的逾時（秒）與重試次數
+ENDPOINT_SETTINGS = {
+    "quiz": {"timeout": float(os.getenv("OPENAI_TIMEOUT_QUIZ", "25")), "max_retries": 1},
+    "chat": {"timeout": float(os.getenv("OPENAI_TIMEOUT_CHAT", "30")), "max_retries": 2},
+    "retest": {"timeout": float(os.getenv("OPENAI_TIMEOUT_RETEST", "20")), "max_retries": 2},
+    "parse_answer": {"timeout": float(os.getenv("OPENAI_TIMEOUT_PARSE_ANSWER", "30")), "max_retries": 2},
+    "topic": {"timeout": float(os.getenv("OPENAI_TIMEOUT_TOPIC", "15")), "max_retries": 2},
+    "summary": {"timeout": float(os.getenv("OPENAI_TIMEOUT_SUMMARY", "20")), "max_retries": 1},
+}
+
+_client = None
+_client_pid = None
+_endpoint_clients = {}
+_lock = threading.Lock()
+
+
+def get_api_key():
+    return os.getenv('OPENAI_API_KEY', '').strip()
+
+
+def has_api_key():
+    """是否有可用的 API Key（未設定或仍是範本值都視為沒有）"""
+    api_key = get_api_key()
+    return bool(api_key) and api_key != PLACEHOLDER_API_KEY
+
+
+def _build_client():
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(60.0, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+    return OpenAI(api_key=get_api_key(), http_client=http_client, max_retries=2)
+
+
+def get_openai_client(endpoint=None):
+    """
+    取得共用的 OpenAI 客戶端
+    - endpoint：ENDPOINT_SETTINGS 的鍵，會套用該端點的逾時與重試設定（共用同一個連線池）
+    - fork 之後的子行程會自動建立自己的連線池
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                _client = _build_client()
+                _client_pid = pid
+                _endpoint_clients.clear()
+
+    if endpoint is None:
+        return _client
+
+    client = _endpoint_clients.get(endpoint)
+    if client is None:
+        with _lock:
+            client = _endpoint_clients.get(endpoint)
+            if client is None:
+                client = _client.with_options(**ENDPOINT_SETTINGS[endpoint])
+                _endpoint_clients[endpoint] = client
+    return client
+
+
+def validate_api_key(check_remote=None):
+    """
+    啟動時檢查 API Key，回傳 (是否可用, 訊息)
+    - 預設只檢查格式；OPENAI_VALIDATE_ON_STARTUP=1 時會實際呼叫一次 models.list()
+    """
+    if not has_api_key():
+        return False, "OPENAI_API_KEY 未設定，將使用模擬資料"
+
+    if not get_api_key().startswith("sk-") and not os.getenv("OPENAI_BASE_URL"):
+        return False, "OPENAI_API_KEY 格式不正確（應以 sk- 開頭）"
+
+    if check_remote is None:
+        check_remote = os.getenv("OPENAI_VALIDATE_ON_STARTUP", "0") == "1"
+
+    if check_remote:
+        try:
+            get_openai_client().with_options(timeout=10, max_retries=0).models.list()
+        except Exception as e:
+            return False, f"OPENAI_API_KEY 驗證失敗: {str(e)}"
+
+    return True, "OPENAI_API_KEY 已設定"
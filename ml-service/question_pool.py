@@ -0,0 +1,185 @@
+# 熱門主題題庫池
+# 追蹤各 (主題, 難度) 的請求頻率，為熱門組合預先生成並驗證好題目，
+# /api/quiz 可以直接從池中取題，池子在背景自動補充。
+# 記憶體以題目 JSON 大小估算，超過上限時淘汰最久沒被使用的組合（LRU）。
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("ml-service.question_pool")
+
+MOCK_TITLE = "伺服器維修中"
+VALID_ANSWERS = ("A", "B", "C", "D")
+
+
+def is_valid_question(q):
+    """只收正常生成的題目：排除模擬題、缺選項或答案不合法的題目"""
+    if not isinstance(q, dict):
+        return False
+    if not q.get("title") or q.get("title") == MOCK_TITLE:
+        return False
+    if q.get("Ai_answer") not in VALID_ANSWERS:
+        return False
+    return all(q.get(f"option_{opt}") for opt in VALID_ANSWERS)
+
+
+class QuestionPool:
+    """
+    - record_request：記錄一次請求，分數以半衰期 decay（越近的請求權重越高）
+    - take：池中題數足夠時取出（每題只發一次），不足回傳 None
+    - maybe_refill：熱門且存量低於目標時，排入背景補題
+    """
+
+    def __init__(self, generator, *, max_bytes=5 * 1024 * 1024, target_per_key=20,
+                 refill_batch=10, hot_threshold=3.0, half_life=1800.0,
+                 max_tracked_keys=5000, refill_workers=1):
+        self.generator = generator
+        self.max_bytes = max_bytes
+        self.target_per_key = target_per_key
+        self.refill_batch = refill_batch
+        self.hot_threshold = hot_threshold
+        self.half_life = half_life
+        self.max_tracked_keys = max_tracked_keys
+
+        self._lock = threading.Lock()
+        self._reservoirs = OrderedDict()  # key -> deque[(question, size)]，順序即 LRU
+        self._bytes = {}                  # key -> 該組合佔用的位元組
+        self._total_bytes = 0
+        self._scores = {}                 # key -> (分數, 最後更新時間)
+        self._refilling = set()
+        self._executor = ThreadPoolExecutor(max_workers=refill_workers)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(topic, difficulty):
+        return (str(topic).strip().casefold(), difficulty)
+
+    def _decayed(self, key, now):
+        score, updated = self._scores.get(key, (0.0, now))
+        return score * math.pow(0.5, (now - updated) / self.half_life)
+
+    def record_request(self, topic, difficulty):
+        key = self.make_key(topic, difficulty)
+        now = time.monotonic()
+        with self._lock:
+            self._scores[key] = (self._decayed(key, now) + 1.0, now)
+            if len(self._scores) > self.max_tracked_keys:
+                self._prune_scores(now)
+
+    def _prune_scores(self, now):
+        # 只保留分數較高的一半，避免冷門主題無限累積
+        ranked = sorted(self._scores, key=lambda k: self._decayed(k, now), reverse=True)
+        for key in ranked[self.max_tracked_keys // 2:]:
+            del self._scores[key]
+
+    def is_hot(self, topic, difficulty):
+        key = self.make_key(topic, difficulty)
+        with self._lock:
+            return self._decayed(key, time.monotonic()) >= self.hot_threshold
+
+    def take(self, topic, difficulty, count):
+        key = self.make_key(topic, difficulty)
+        with self._lock:
+            reservoir = self._reservoirs.get(key)
+            if not reservoir or len(reservoir) < count:
+                self.misses += 1
+                return None
+
+            questions = []
+            for _ in range(count):
+                q, size = reservoir.popleft()
+                self._bytes[key] -= size
+                self._total_bytes -= size
+                questions.append(dict(q))
+            self._reservoirs.move_to_end(key)
+            self.hits += 1
+            return questions
+
+    def maybe_refill(self, topic, difficulty):
+        key = self.make_key(topic, difficulty)
+        with self._lock:
+            if key in self._refilling:
+                return False
+            if self._decayed(key, time.monotonic()) < self.hot_threshold:
+                return False
+            reservoir = self._reservoirs.get(key)
+            if reservoir is not None and len(reservoir) >= self.target_per_key:
+                return False
+            self._refilling.add(key)
+
+        self._executor.submit(self._refill, key, topic, difficulty)
+        return True
+
+    def _refill(self, key, topic, difficulty):
+        try:
+            questions = self.generator(topic, difficulty, self.refill_batch)
+            self.add(topic, difficulty, questions)
+        except Exception as e:
+            logger.error("題庫池補題失敗 %s: %s", key, e)
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def add(self, topic, difficulty, questions):
+        """把題目放入池中，回傳實際收下的題數"""
+        key = self.make_key(topic, difficulty)
+        accepted = 0
+        with self._lock:
+            reservoir = self._reservoirs.setdefault(key, deque())
+            self._bytes.setdefault(key, 0)
+            for q in questions or []:
+                if not is_valid_question(q):
+                    continue
+                size = len(json.dumps(q, ensure_ascii=False).encode("utf-8"))
+                reservoir.append((dict(q), size))
+                self._bytes[key] += size
+                self._total_bytes += size
+                accepted += 1
+            self._reservoirs.move_to_end(key)
+            self._evict(protect=key)
+        return accepted
+
+    def _evict(self, protect=None):
+        # 超過記憶體上限時，從最久沒使用的組合開始整組淘汰
+        while self._total_bytes > self.max_bytes and self._reservoirs:
+            oldest = next(iter(self._reservoirs))
+            if oldest == protect:
+                if len(self._reservoirs) == 1:
+                    # 只剩剛補的這組，改從它最舊的題目丟起
+                    reservoir = self._reservoirs[oldest]
+                    while self._total_bytes > self.max_bytes and reservoir:
+                        _, size = reservoir.popleft()
+                        self._bytes[oldest] -= size
+                        self._total_bytes -= size
+                    return
+                self._reservoirs.move_to_end(oldest)
+                continue
+            self._reservoirs.pop(oldest)
+            self._total_bytes -= self._bytes.pop(oldest, 0)
+            self.evictions += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "keys": len(self._reservoirs),
+                "questions": sum(len(r) for r in self._reservoirs.values()),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refilling": len(self._refilling),
+                "hot_keys": sorted(
+                    ({"topic": k[0], "difficulty": k[1], "score": round(self._decayed(k, now), 2)}
+                     for k in self._scores if self._decayed(k, now) >= self.hot_threshold),
+                    key=lambda item: item["score"], reverse=True
+                )[:20],
+            }
@@ -0,0 +1,187 @@
+# AI 結果快取
+# 筆記內容沒變就不必再花 token 重新生成主題 / 測驗標題。
+# 鍵是「命名空間 + prompt 版本 + 正規化內容的 sha256」：改 prompt 時調高版本號，舊結果自然失效。
+# 後端可替換：
+#   - memory：單一 process 內的 LRU（條目數上限 + TTL），開發環境或單 worker 使用
+#   - redis：多個 worker / 多台機器共用；淘汰交給 Redis 的 maxmemory-policy（建議 allkeys-lru），TTL 用 EX
+# 後端出錯時一律當作未命中、照常呼叫 AI，快取壞掉不會讓功能跟著壞掉。
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from log_utils import log_event
+
+logger = logging.getLogger("ml-service.result_cache")
+
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")  # memory / redis / none
+RESULT_CACHE_REDIS_URL = os.getenv("RESULT_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "5000"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "604800"))  # 預設 7 天
+
+
+def normalize_content(text):
+    """全形半形統一（NFKC）、去除頭尾與連續空白，只差排版的內容視為相同"""
+    text = unicodedata.normalize("NFKC", str(text or ""))
+    return " ".join(text.split())
+
+
+def make_key(namespace, version, *parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(normalize_content(part).encode("utf-8"))
+        digest.update(b"\x00")  # 分隔各部分，避免 ("ab", "c") 與 ("a", "bc") 相撞
+    return f"{namespace}:{version}:{digest.hexdigest()}"
+
+
+class MemoryBackend:
+    """process 內的 LRU + TTL"""
+
+    name = "memory"
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, 到期時間)，順序即 LRU
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class RedisBackend:
+    """多 worker 共用；值以 JSON 儲存"""
+
+    name = "redis"
+
+    def __init__(self, url=RESULT_CACHE_REDIS_URL, prefix="ml-cache:"):
+        import redis  # 選用套件，只有設定 RESULT_CACHE_BACKEND=redis 才需要安裝
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def ping(self):
+        self._client.ping()
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        self._client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=ttl)
+
+    def stats(self):
+        info = self._client.info("memory")
+        return {
+            "used_memory": info.get("used_memory"),
+            "maxmemory": info.get("maxmemory"),
+            "maxmemory_policy": info.get("maxmemory_policy"),
+        }
+
+
+class ResultCache:
+    """
+    用法：
+        value, cached = result_cache.get_or_compute("topic", "v1", (title, content), compute)
+    compute 回傳 None 表示這次結果不該快取（例如走了備用邏輯），下次仍會重新呼叫
+    """
+
+    def __init__(self, backend, ttl=RESULT_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counters = {}  # namespace -> {"hits", "misses", "stores", "errors"}
+
+    def _count(self, namespace, field):
+        with self._lock:
+            counters = self._counters.setdefault(namespace, {"hits": 0, "misses": 0, "stores": 0, "errors": 0})
+            counters[field] += 1
+
+    def get(self, namespace, version, parts):
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(make_key(namespace, version, *parts))
+        except Exception as e:
+            self._count(namespace, "errors")
+            log_event(logger, logging.WARNING, "快取讀取失敗", backend=self.backend.name, error=str(e))
+            return None
+        self._count(namespace, "hits" if value is not None else "misses")
+        return value
+
+    def set(self, namespace, version, parts, value, ttl=None):
+        if self.backend is None or value is None:
+            return
+        try:
+            self.backend.set(make_key(namespace, version, *parts), value, ttl or self.ttl)
+            self._count(namespace, "stores")
+        except Exception as e:
+            self._count(namespace, "errors")
+            log_event(logger, logging.WARNING, "快取寫入失敗", backend=self.backend.name, error=str(e))
+
+    def get_or_compute(self, namespace, version, parts, compute, ttl=None):
+        """回傳 (結果, 是否來自快取)"""
+        value = self.get(namespace, version, parts)
+        if value is not None:
+            return value, True
+        value = compute()
+        self.set(namespace, version, parts, value, ttl)
+        return value, False
+
+    def stats(self):
+        with self._lock:
+            counters = {name: dict(c) for name, c in self._counters.items()}
+        for c in counters.values():
+            lookups = c["hits"] + c["misses"]
+            c["hit_rate"] = round(c["hits"] / lookups, 3) if lookups else None
+        backend_stats = {}
+        if self.backend is not None:
+            try:
+                backend_stats = self.backend.stats()
+            except Exception as e:
+                backend_stats = {"error": str(e)}
+        return {
+            "backend": self.backend.name if self.backend is not None else "none",
+            "ttl": self.ttl,
+            "namespaces": counters,
+            **backend_stats,
+        }
+
+
+def create_result_cache():
+    """依 RESULT_CACHE_BACKEND 建立快取；redis 無法使用時退回 process 內快取"""
+    if RESULT_CACHE_BACKEND == "none":
+        return ResultCache(None)
+    if RESULT_CACHE_BACKEND == "redis":
+        try:
+            backend = RedisBackend()
+            backend.ping()
+            return ResultCache(backend)
+        except Exception as e:
+            log_event(logger, logging.WARNING, "Redis 快取無法使用，改用 process 內快取", error=str(e))
+    return ResultCache(MemoryBackend())
@@ -0,0 +1,157 @@
+# 模型輸出的增量 JSON 解析器
+# 模型回傳的是題目物件組成的 JSON 陣列，但常夾雜 markdown 標記、被截斷或有個別字元錯誤。
+# 這裡逐字掃描，每當頂層的一個物件以 } 結束就立刻解析產出，
+# 單一物件壞掉只會丟掉那一題，其他題目照常保留。
+import json
+import re
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_OBJECT_BOUNDARY = re.compile(r"\}\s*,\s*\{")
+
+
+def _loads(text):
+    """解析單一物件；失敗時做簡單修補（尾逗號、字串內換行）後再試一次"""
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text), strict=False)
+    except json.JSONDecodeError:
+        return None
+
+
+def _split_objects(text):
+    """
+    壞掉的引號會讓掃描器誤判字串範圍，把相鄰幾題黏成一段；
+    依 "}, {" 邊界切開後逐段解析，回傳 (救回的物件, 失敗段數)
+    """
+    parts = _OBJECT_BOUNDARY.split(text)
+    if len(parts) < 2:
+        return [], 1
+    objects = []
+    failed = 0
+    for i, part in enumerate(parts):
+        if i > 0:
+            part = "{" + part
+        if i < len(parts) - 1:
+            part = part + "}"
+        obj = _loads(part)
+        if obj is None:
+            failed += 1
+        else:
+            objects.append(obj)
+    return objects, failed
+
+
+class QuestionStreamParser:
+    """
+    用法：
+        parser = QuestionStreamParser()
+        for chunk in stream:
+            for obj in parser.feed(chunk):
+                ...
+        for obj in parser.close():
+            ...
+        parser.recovered / parser.failed
+    """
+
+    def __init__(self, is_complete=None):
+        # is_complete：判斷截斷後補齊的物件是否仍可用（預設只要是 dict 就收）
+        self.is_complete = is_complete or (lambda obj: isinstance(obj, dict))
+        self.recovered = 0
+        self.failed = 0
+        self._buf = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        """餵入一段文字，回傳這段文字中完成的物件"""
+        objects = []
+        for ch in chunk:
+            if self._depth == 0:
+                # 物件之外的內容（[、逗號、```json、說明文字）全部略過
+                if ch == "{":
+                    self._buf = ["{"]
+                    self._depth = 1
+                    self._in_string = False
+                    self._escape = False
+                continue
+
+            self._buf.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_text("".join(self._buf), objects)
+                    self._buf = []
+        return objects
+
+    def close(self):
+        """輸出結束：嘗試補齊被截斷的最後一個物件"""
+        objects = []
+        if self._depth > 0 and self._buf:
+            text = "".join(self._buf)
+            if self._in_string:
+                text += '"'
+            obj = _loads(text + "}" * self._depth)
+            if obj is not None and self.is_complete(obj):
+                self._emit(obj, objects)
+            else:
+                # 截斷前可能還黏著幾題完整的題目
+                salvaged, failed = _split_objects(text)
+                for item in salvaged:
+                    if self.is_complete(item):
+                        self._emit(item, objects)
+                    else:
+                        failed += 1
+                self.failed += failed
+        self._buf = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        return objects
+
+    def _emit_text(self, text, objects):
+        obj = _loads(text)
+        if obj is not None:
+            self._emit(obj, objects)
+            return
+        salvaged, failed = _split_objects(text)
+        self.failed += failed
+        for item in salvaged:
+            self._emit(item, objects)
+
+    def _emit(self, obj, objects):
+        # 模型偶爾會包一層 {"questions": [...]}，展開成一題一題
+        if isinstance(obj, dict) and "title" not in obj:
+            nested = [v for v in obj.values() if isinstance(v, list)]
+            items = [item for value in nested for item in value if isinstance(item, dict)]
+            if items:
+                self.recovered += len(items)
+                objects.extend(items)
+                return
+        self.recovered += 1
+        objects.append(obj)
+
+
+def salvage_objects(text, is_complete=None):
+    """一次解析整段文字，回傳 (物件列表, parser)，parser 上有 recovered / failed 統計"""
+    parser = QuestionStreamParser(is_complete=is_complete)
+    objects = parser.feed(text)
+    objects.extend(parser.close())
+    return objects, parser
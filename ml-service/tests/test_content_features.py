@@ -0,0 +1,63 @@
+# content_features.extract_features 與舊版 analyze_content_complexity（各自 re.search）的旗標比對
+#   python -m unittest discover -s tests   （在 ml-service 目錄下）
+import random
+import re
+import unittest
+
+from content_features import extract_features
+
+# 舊版寫法（baseline 的 analyze_content_complexity）
+LEGACY = {
+    'has_dates': re.compile(r'\d{4}年|\d{1,2}月|\d{1,2}日|\d{4}-\d{1,2}-\d{1,2}'),
+    'has_numbers': re.compile(r'\d+\.?\d*'),
+    'has_questions': re.compile(r'[？?]'),
+    'has_lists': re.compile(r'^\s*[-*•]\s|^\s*\d+\.\s', re.MULTILINE),
+    'has_korean': re.compile(r'[가-힣]'),
+    'has_chinese': re.compile(r'[一-鿿]'),
+    'has_urls': re.compile(r'https?://[^\s]+'),
+    'has_hashtags': re.compile(r'#[^\s]+'),
+    'has_mentions': re.compile(r'@[^\s]+'),
+}
+
+# 片段之間可直接相連；英文字直接黏著網址（"foohttps://"）時新版不視為網址，片段因此都以空白結尾
+FRAGMENTS = [
+    "光合作用是植物利用光能的過程", "The mitochondria is the powerhouse ", "2024年3月15日 期中考 ",
+    "\n- 重點一：細胞膜\n", "\n  - 縮排的項目\n", "\n    1. 第一\n", "\n\t* tab 項目", "\n• 圓點",
+    "E = mc^2 (質能) ", "為什麼？", "한국어 문법 ", "參考 https://example.com/a-b ", "#生物 @同學 ",
+    "1.5 公斤 ", "3月", "\n", "  ", "-", "foo ", "12. ", "https://zh.wikipedia.org/wiki/光合 ",
+]
+
+
+class ExtractFeaturesParityTest(unittest.TestCase):
+    def assertParity(self, content):
+        features = extract_features(content)
+        for flag, pattern in LEGACY.items():
+            self.assertEqual(features[flag], bool(pattern.search(content)), f"{flag}: {content!r}")
+
+    def test_indented_list_items_after_first_line(self):
+        for content in ("foo\n  - item", "數學筆記\n    1. 第一", "x\n\n\t* b", "標題\n• 圓點"):
+            features = extract_features(content)
+            self.assertTrue(features['has_lists'], content)
+            self.assertEqual(features['counts']['list_items'], 1, content)
+
+    def test_bullets_are_not_formulas(self):
+        self.assertFalse(extract_features("foo\n  - item")['has_formulas'])
+        self.assertFalse(extract_features("- 第一\n- 第二")['has_formulas'])
+        self.assertTrue(extract_features("a - b = c")['has_formulas'])
+
+    def test_not_a_list(self):
+        for content in ("1.5 公斤", "a-b", "第-1 名", "x\n-1"):
+            self.assertFalse(extract_features(content)['has_lists'], content)
+
+    def test_random_notes_match_legacy_flags(self):
+        rng = random.Random(0)
+        for _ in range(5000):
+            self.assertParity("".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 8))))
+
+    def test_space_ratio_counts_newlines(self):
+        features = extract_features("ab\n\ncd  ")
+        self.assertAlmostEqual(features['ratios']['space'], 4 / 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+# keyword_matcher 的 Aho–Corasick 自動機與舊版逐分類 any(keyword in content) 的比對
+#   python -m unittest discover -s tests   （在 ml-service 目錄下）
+import random
+import unittest
+
+from keyword_matcher import (
+    ANIME_TITLES, GAME_TITLES, KEYWORD_GROUPS, MATCHER, SINGLE_CHAR_WEIGHT, best_category, score_categories,
+)
+
+FILLER = "今天整理了一下上課的重點內容並且把不懂的地方標記起來之後再慢慢複習我們也討論了接下來的安排"
+KEYWORDS = [k for _, categories in KEYWORD_GROUPS for words in categories.values() for k in words]
+
+
+def legacy_first_category(content):
+    """舊版寫法：依字典順序，第一個有任何關鍵詞出現的分類"""
+    content = content.lower()
+    for group, categories in KEYWORD_GROUPS:
+        for category, keywords in categories.items():
+            if any(keyword.lower() in content for keyword in keywords):
+                return group, category
+    return None
+
+
+def legacy_hit_categories(content):
+    """舊版 any(...) 會命中的所有分類；作品名也算進動漫 / 遊戲"""
+    content = content.lower()
+    hits = {
+        (group, category)
+        for group, categories in KEYWORD_GROUPS
+        for category, keywords in categories.items()
+        if any(keyword.lower() in content for keyword in keywords)
+    }
+    if any(title in content for title in ANIME_TITLES):
+        hits.add(('anime_game', '動漫'))
+    if any(title in content for title in GAME_TITLES):
+        hits.add(('anime_game', '遊戲'))
+    return hits
+
+
+def naive_scores(content):
+    """逐關鍵詞找出所有（可重疊的）出現位置，套用相同的權重與英數單字邊界"""
+    content = content.lower()
+    scores = {}
+    for index, keyword in enumerate(MATCHER.keywords):
+        start = content.find(keyword)
+        while start != -1:
+            end = start + len(keyword)
+            bounded = not MATCHER.word_bounded[index] or not (
+                (start > 0 and content[start - 1].isascii() and content[start - 1].isalnum()) or
+                (end < len(content) and content[end].isascii() and content[end].isalnum())
+            )
+            if bounded:
+                for label in MATCHER.labels[index]:
+                    scores[label] = scores.get(label, 0) + MATCHER.weights[index]
+            start = content.find(keyword, start + 1)
+    return scores
+
+
+def make_note(rng, pieces, keywords):
+    return "".join(
+        rng.choice(keywords) if rng.random() < 0.3 else FILLER[rng.randrange(len(FILLER)):][:rng.randint(1, 8)]
+        for _ in range(pieces)
+    )
+
+
+class KeywordAutomatonTest(unittest.TestCase):
+    def test_scores_match_naive_counting(self):
+        rng = random.Random(0)
+        keywords = KEYWORDS + ANIME_TITLES + GAME_TITLES + [" op ", "develop", "Topic", "PC", "art."]
+        for _ in range(500):
+            note = make_note(rng, rng.randint(0, 30), keywords)
+            self.assertEqual(MATCHER.count(note), naive_scores(note), note)
+
+    def test_hit_categories_match_legacy_any(self):
+        # 中日韓關鍵詞沒有單字邊界的限制，命中的分類集合應與舊寫法完全相同
+        rng = random.Random(1)
+        keywords = [k for k in KEYWORDS if not k.isascii()]
+        for _ in range(500):
+            note = make_note(rng, rng.randint(0, 20), keywords)
+            categories, _ = score_categories(note)
+            self.assertEqual(set(categories), legacy_hit_categories(note), note)
+
+    def test_single_category_matches_legacy(self):
+        # 英數關鍵詞的差異是刻意的（舊寫法 "pop" 會命中 "op"），見 test_ascii_keywords_need_word_boundaries
+        for _, categories in KEYWORD_GROUPS:
+            for category, keywords in categories.items():
+                for keyword in (k for k in keywords if not k.isascii()):
+                    note = f"今天複習{keyword}的重點"
+                    if len(score_categories(note)[0]) == 1:
+                        self.assertEqual(best_category(note)[0], legacy_first_category(note), note)
+
+    def test_no_hits(self):
+        self.assertEqual(best_category(FILLER), (None, None))
+        self.assertEqual(best_category(""), (None, None))
+        self.assertIsNone(legacy_first_category(FILLER))
+
+    def test_highest_score_wins_over_dictionary_order(self):
+        note = "數學課後又談到力學、電學與光學"
+        self.assertEqual(legacy_first_category(note), ('subject', '數學'))
+        self.assertEqual(best_category(note), (('subject', '物理'), None))
+
+    def test_tie_falls_back_to_dictionary_order(self):
+        self.assertEqual(best_category("力學與代數"), (('subject', '數學'), None))
+
+    def test_single_character_counts_half(self):
+        self.assertEqual(MATCHER.count("光")[('subject', '物理')], SINGLE_CHAR_WEIGHT)
+
+    def test_ascii_keywords_need_word_boundaries(self):
+        self.assertEqual(MATCHER.count("develop the topic, start"), {})
+        self.assertEqual(MATCHER.count("op"), {('anime_game', '動漫'): 1.0})
+        self.assertEqual(MATCHER.count("我的PC壞了"), {('anime_game', '遊戲'): 1.0})
+        self.assertEqual(MATCHER.count("我的PC壞了"), MATCHER.count("我的 pc 壞了"))
+
+    def test_titles_count_toward_category(self):
+        label, title = best_category("週末一直在玩原神，原神的劇情")
+        self.assertEqual(label, ('anime_game', '遊戲'))
+        self.assertEqual(title, '原神')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+# question_pool.QuestionPool：依位元組數的 LRU 淘汰、請求熱度的半衰期 decay 與背景補題
+#   python -m unittest discover -s tests   （在 ml-service 目錄下）
+import json
+import unittest
+from unittest import mock
+
+import question_pool
+from question_pool import MOCK_TITLE, QuestionPool
+
+
+def make_question(i):
+    return {
+        "title": f"第 {i:04d} 題", "option_A": "甲", "option_B": "乙", "option_C": "丙", "option_D": "丁",
+        "Ai_answer": "A",
+    }
+
+
+SIZE = len(json.dumps(make_question(0), ensure_ascii=False).encode("utf-8"))
+
+
+class ImmediateExecutor:
+    """補題直接在呼叫的執行緒內完成；hold=True 時先記下，等測試呼叫 run()"""
+
+    def __init__(self, hold=False):
+        self.hold = hold
+        self.pending = []
+
+    def submit(self, func, *args):
+        if self.hold:
+            self.pending.append((func, args))
+        else:
+            func(*args)
+
+    def run(self):
+        for func, args in self.pending:
+            func(*args)
+        self.pending = []
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class QuestionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(question_pool.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.generated = []
+
+    def generator(self, topic, difficulty, count):
+        self.generated.append((topic, difficulty, count))
+        start = len(self.generated) * 100
+        return [make_question(start + i) for i in range(count)]
+
+    def pool(self, **kwargs):
+        pool = QuestionPool(self.generator, **kwargs)
+        pool._executor.shutdown()
+        pool._executor = ImmediateExecutor()
+        return pool
+
+    def test_add_filters_invalid_questions(self):
+        pool = self.pool()
+        questions = [make_question(1), dict(make_question(2), title=MOCK_TITLE), dict(make_question(3), Ai_answer="E"),
+                     dict(make_question(4), option_C=""), "not a dict"]
+        self.assertEqual(pool.add("光合作用", "beginner", questions), 1)
+        self.assertEqual(pool.stats()["bytes"], SIZE)
+
+    def test_take_hands_out_each_question_once(self):
+        pool = self.pool()
+        pool.add(" Photosynthesis ", "beginner", [make_question(i) for i in range(3)])
+        self.assertIsNone(pool.take("photosynthesis", "beginner", 4))
+        self.assertEqual([q["title"] for q in pool.take("photosynthesis", "beginner", 2)], ["第 0000 題", "第 0001 題"])
+        self.assertEqual([q["title"] for q in pool.take("PHOTOSYNTHESIS", "beginner", 1)], ["第 0002 題"])
+        self.assertIsNone(pool.take("photosynthesis", "beginner", 1))
+        stats = pool.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["bytes"]), (2, 2, 0))
+
+    def test_evicts_least_recently_used_key_by_size(self):
+        pool = self.pool(max_bytes=SIZE * 6)
+        for topic in ("甲", "乙", "丙"):
+            pool.add(topic, "beginner", [make_question(i) for i in range(2)])
+        pool.take("甲", "beginner", 1)  # 甲 變成最近使用，乙 最久沒用
+        pool.add("丁", "beginner", [make_question(i) for i in range(2)])
+        stats = pool.stats()
+        self.assertEqual((stats["keys"], stats["evictions"]), (3, 1))
+        self.assertLessEqual(stats["bytes"], SIZE * 6)
+        self.assertIsNone(pool.take("乙", "beginner", 1))
+        for topic in ("甲", "丙", "丁"):
+            self.assertIsNotNone(pool.take(topic, "beginner", 1), topic)
+
+    def test_new_key_is_not_evicted_by_its_own_refill(self):
+        pool = self.pool(max_bytes=SIZE * 4)
+        pool.add("甲", "beginner", [make_question(i) for i in range(3)])
+        pool.add("乙", "beginner", [make_question(i) for i in range(3)])
+        self.assertIsNone(pool.take("甲", "beginner", 1))
+        self.assertEqual(len(pool.take("乙", "beginner", 3)), 3)
+
+    def test_single_oversized_key_drops_its_oldest_questions(self):
+        pool = self.pool(max_bytes=SIZE * 3)
+        pool.add("甲", "beginner", [make_question(i) for i in range(5)])
+        stats = pool.stats()
+        self.assertEqual((stats["questions"], stats["bytes"], stats["evictions"]), (3, SIZE * 3, 0))
+        self.assertEqual(pool.take("甲", "beginner", 3)[0]["title"], "第 0002 題")
+
+    def test_popularity_decays_with_half_life(self):
+        pool = self.pool(hot_threshold=3.0, half_life=100.0)
+        for _ in range(4):
+            pool.record_request("光合作用", "beginner")
+        self.assertTrue(pool.is_hot("光合作用", "beginner"))
+        self.clock.now += 100  # 4 → 2
+        self.assertFalse(pool.is_hot("光合作用", "beginner"))
+        pool.record_request("光合作用", "beginner")  # 2 + 1
+        self.assertTrue(pool.is_hot("光合作用", "beginner"))
+        self.assertAlmostEqual(pool.stats()["hot_keys"][0]["score"], 3.0)
+
+    def test_hot_keys_are_ordered_by_decayed_score(self):
+        pool = self.pool(hot_threshold=1.0, half_life=100.0)
+        for _ in range(8):
+            pool.record_request("舊的熱門", "beginner")
+        self.clock.now += 300  # 8 → 1
+        for _ in range(3):
+            pool.record_request("最近", "beginner")
+        for _ in range(2):
+            pool.record_request("次之", "beginner")
+        self.assertEqual([(k["topic"], k["score"]) for k in pool.stats()["hot_keys"]],
+                         [("最近", 3.0), ("次之", 2.0), ("舊的熱門", 1.0)])
+
+    def test_prune_keeps_the_higher_decayed_scores(self):
+        pool = self.pool(max_tracked_keys=4, half_life=100.0)
+        for topic, count in (("舊0", 40), ("舊1", 10), ("舊2", 1), ("舊3", 1)):
+            for _ in range(count):
+                pool.record_request(topic, "beginner")
+        self.clock.now += 500  # 40 → 1.25，10 → 0.3125，1 → 0.03125
+        pool.record_request("新", "beginner")  # 第 5 個 key，只留分數較高的一半
+        self.assertEqual(set(pool._scores), {("舊0", "beginner"), ("新", "beginner")})
+
+    def test_refill_only_for_hot_keys_below_target(self):
+        pool = self.pool(hot_threshold=2.0, target_per_key=5, refill_batch=4)
+        pool.record_request("光合作用", "beginner")
+        self.assertFalse(pool.maybe_refill("光合作用", "beginner"))
+        pool.record_request("光合作用", "beginner")
+        self.assertTrue(pool.maybe_refill("光合作用", "beginner"))
+        self.assertEqual(self.generated, [("光合作用", "beginner", 4)])
+        self.assertTrue(pool.maybe_refill("光合作用", "beginner"))
+        self.assertEqual(pool.stats()["questions"], 8)
+        self.assertFalse(pool.maybe_refill("光合作用", "beginner"))  # 已達目標
+        self.assertEqual(len(self.generated), 2)
+
+    def test_refill_is_not_scheduled_twice(self):
+        pool = self.pool(hot_threshold=1.0)
+        pool._executor = ImmediateExecutor(hold=True)
+        pool.record_request("光合作用", "beginner")
+        self.assertTrue(pool.maybe_refill("光合作用", "beginner"))
+        self.assertFalse(pool.maybe_refill("光合作用", "beginner"))
+        self.assertEqual(pool.stats()["refilling"], 1)
+        pool._executor.run()
+        self.assertEqual(pool.stats()["refilling"], 0)
+
+    def test_failed_refill_can_be_retried(self):
+        pool = QuestionPool(mock.Mock(side_effect=RuntimeError("OpenAI 逾時")), hot_threshold=1.0)
+        pool._executor.shutdown()
+        pool._executor = ImmediateExecutor()
+        pool.record_request("光合作用", "beginner")
+        self.assertTrue(pool.maybe_refill("光合作用", "beginner"))
+        self.assertEqual(pool.stats()["refilling"], 0)
+        self.assertTrue(pool.maybe_refill("光合作用", "beginner"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+# result_cache：鍵的正規化、process 內 LRU / TTL 淘汰、後端出錯與 Redis 無法使用時的退回
+#   python -m unittest discover -s tests   （在 ml-service 目錄下）
+import unittest
+from unittest import mock
+
+import result_cache
+from result_cache import MemoryBackend, ResultCache, create_result_cache, make_key
+
+
+class BrokenBackend:
+    name = "broken"
+
+    def get(self, key):
+        raise ConnectionError("redis down")
+
+    def set(self, key, value, ttl):
+        raise ConnectionError("redis down")
+
+    def stats(self):
+        raise ConnectionError("redis down")
+
+
+class MakeKeyTest(unittest.TestCase):
+    def test_layout_only_differences_share_a_key(self):
+        self.assertEqual(make_key("topic", "v1", "光合作用", "  葉綠體\n\n吸收　光能 "),
+                         make_key("topic", "v1", "光合作用", "葉綠體 吸收 光能"))
+        # NFKC：全形英數與半形相同
+        self.assertEqual(make_key("topic", "v1", "ＡＢＣ１２３"), make_key("topic", "v1", "ABC123"))
+        self.assertEqual(make_key("topic", "v1", None), make_key("topic", "v1", ""))
+
+    def test_parts_namespace_and_version_are_separated(self):
+        keys = {
+            make_key("topic", "v1", "ab", "c"),
+            make_key("topic", "v1", "a", "bc"),
+            make_key("topic", "v2", "ab", "c"),
+            make_key("retest", "v1", "ab", "c"),
+            make_key("topic", "v1", "abc"),
+        }
+        self.assertEqual(len(keys), 5)
+        self.assertRegex(make_key("topic", "v1", "x"), r"^topic:v1:[0-9a-f]{64}$")
+
+
+class MemoryBackendTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        backend = MemoryBackend(max_entries=3)
+        for key in "abc":
+            backend.set(key, key.upper(), ttl=60)
+        self.assertEqual(backend.get("a"), "A")  # a 變成最近使用
+        backend.set("d", "D", ttl=60)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual([backend.get(key) for key in "acd"], ["A", "C", "D"])
+        backend.set("a", "A2", ttl=60)  # 覆寫不算新條目
+        self.assertEqual(backend.stats(), {"entries": 3, "max_entries": 3, "evictions": 1})
+
+    def test_ttl_expiry(self):
+        backend = MemoryBackend()
+        with mock.patch.object(result_cache.time, "monotonic", return_value=1000.0):
+            backend.set("short", 1, ttl=10)
+            backend.set("long", 2, ttl=100)
+        with mock.patch.object(result_cache.time, "monotonic", return_value=1009.9):
+            self.assertEqual(backend.get("short"), 1)
+        with mock.patch.object(result_cache.time, "monotonic", return_value=1010.0):
+            self.assertIsNone(backend.get("short"))
+            self.assertEqual(backend.get("long"), 2)
+        self.assertEqual(backend.stats()["entries"], 1)
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_get_or_compute(self):
+        cache = ResultCache(MemoryBackend())
+        compute = mock.Mock(return_value="光合作用練習")
+        self.assertEqual(cache.get_or_compute("topic", "v1", ("標題", "內容"), compute), ("光合作用練習", False))
+        self.assertEqual(cache.get_or_compute("topic", "v1", ("標題", " 內容 "), compute), ("光合作用練習", True))
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(cache.get_or_compute("topic", "v2", ("標題", "內容"), compute), ("光合作用練習", False))
+        stats = cache.stats()["namespaces"]["topic"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["stores"], stats["hit_rate"]), (1, 2, 2, 0.333))
+
+    def test_none_is_not_cached(self):
+        cache = ResultCache(MemoryBackend())
+        compute = mock.Mock(return_value=None)
+        cache.get_or_compute("topic", "v1", ("x",), compute)
+        cache.get_or_compute("topic", "v1", ("x",), compute)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_backend_errors_are_misses(self):
+        cache = ResultCache(BrokenBackend())
+        value, cached = cache.get_or_compute("topic", "v1", ("x",), lambda: "主題")
+        self.assertEqual((value, cached), ("主題", False))
+        stats = cache.stats()
+        self.assertEqual(stats["namespaces"]["topic"]["errors"], 2)
+        self.assertEqual(stats["error"], "redis down")
+
+    def test_disabled_cache(self):
+        cache = ResultCache(None)
+        compute = mock.Mock(return_value="主題")
+        cache.get_or_compute("topic", "v1", ("x",), compute)
+        cache.get_or_compute("topic", "v1", ("x",), compute)
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(cache.stats()["backend"], "none")
+
+
+class CreateResultCacheTest(unittest.TestCase):
+    def create(self, backend_name, redis_backend=None):
+        patches = [mock.patch.object(result_cache, "RESULT_CACHE_BACKEND", backend_name)]
+        if redis_backend is not None:
+            patches.append(mock.patch.object(result_cache, "RedisBackend", redis_backend))
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return create_result_cache()
+
+    def test_redis_unreachable_falls_back_to_memory(self):
+        redis_backend = mock.Mock()
+        redis_backend.return_value.ping.side_effect = ConnectionError("refused")
+        self.assertIsInstance(self.create("redis", redis_backend).backend, MemoryBackend)
+
+    def test_redis_not_installed_falls_back_to_memory(self):
+        self.assertIsInstance(self.create("redis", mock.Mock(side_effect=ImportError("redis"))).backend, MemoryBackend)
+
+    def test_redis_backend_is_used_when_reachable(self):
+        redis_backend = mock.Mock()
+        self.assertIs(self.create("redis", redis_backend).backend, redis_backend.return_value)
+
+    def test_backend_none(self):
+        self.assertIsNone(self.create("none").backend)
+
+    def test_backend_memory(self):
+        self.assertIsInstance(self.create("memory").backend, MemoryBackend)
+
+
+class FakeRedis:
+    """data：key -> (bytes, ex)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data[key][0] if key in self.data else None
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value.encode("utf-8"), ex)
+
+
+class RedisBackendTest(unittest.TestCase):
+    def test_values_round_trip_as_json_with_ttl(self):
+        # 不需要真的 Redis：略過 __init__ 的連線，直接換上假的 client
+        backend = result_cache.RedisBackend.__new__(result_cache.RedisBackend)
+        backend.prefix = "ml-cache:"
+        backend._client = client = FakeRedis()
+
+        cache = ResultCache(backend, ttl=3600)
+        cache.set("topic", "v1", ("光合作用",), {"topic": "光反應練習"})
+        key = "ml-cache:" + make_key("topic", "v1", "光合作用")
+        self.assertEqual(client.data[key][1], 3600)
+        self.assertEqual(cache.get("topic", "v1", ("光合作用",)), {"topic": "光反應練習"})
+        self.assertIsNone(cache.get("topic", "v1", ("其他",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+# stream_parser.QuestionStreamParser：模型輸出被截斷、夾雜 markdown 或個別物件壞掉時能救回多少題
+#   python -m unittest discover -s tests   （在 ml-service 目錄下）
+import json
+import unittest
+
+from stream_parser import QuestionStreamParser, salvage_objects
+
+
+def make_question(i):
+    return {
+        "title": f"第 {i} 題：光合作用的產物是什麼？",
+        "option_A": "氧氣", "option_B": "氮氣", "option_C": "氦氣", "option_D": "氬氣",
+        "Ai_answer": "A",
+        "explanation_text": "答案是 A，{\"括號\"} 與 [方括號] 都在字串裡",
+    }
+
+
+# 與 topic_apps.is_complete_question 相同的條件（import topic_apps 需要 Flask 與 OpenAI 設定）
+def is_complete(q):
+    return isinstance(q, dict) and bool(q.get("title")) and q.get("Ai_answer") in ("A", "B", "C", "D") \
+        and all(q.get(f"option_{opt}") for opt in ("A", "B", "C", "D"))
+
+
+QUESTIONS = [make_question(i) for i in range(1, 4)]
+ARRAY = json.dumps(QUESTIONS, ensure_ascii=False, indent=2)
+
+
+def feed_in_chunks(text, size):
+    parser = QuestionStreamParser(is_complete=is_complete)
+    objects = []
+    for start in range(0, len(text), size):
+        objects.extend(parser.feed(text[start:start + size]))
+    objects.extend(parser.close())
+    return objects, parser
+
+
+class QuestionStreamParserTest(unittest.TestCase):
+    def test_markdown_wrapped_array(self):
+        objects, parser = salvage_objects(f"以下是題目：\n```json\n{ARRAY}\n```\n祝學習愉快！", is_complete)
+        self.assertEqual(objects, QUESTIONS)
+        self.assertEqual((parser.recovered, parser.failed), (3, 0))
+
+    def test_chunked_feed_matches_whole_text(self):
+        for size in (1, 2, 3, 7, 64):
+            objects, parser = feed_in_chunks(ARRAY, size)
+            self.assertEqual(objects, QUESTIONS, size)
+            self.assertEqual((parser.recovered, parser.failed), (3, 0), size)
+
+    def test_objects_are_emitted_as_soon_as_they_close(self):
+        parser = QuestionStreamParser(is_complete=is_complete)
+        first = json.dumps(QUESTIONS[0], ensure_ascii=False)
+        self.assertEqual(parser.feed("[" + first[:-1]), [])
+        self.assertEqual(parser.feed("}, "), [QUESTIONS[0]])
+
+    def test_truncated_output_keeps_complete_questions(self):
+        # 在每個位置截斷：前面完整的題目一定保留，最後一題只有補齊後仍完整才收
+        for cut in range(len(ARRAY)):
+            objects, parser = salvage_objects(ARRAY[:cut], is_complete)
+            closed = ARRAY[:cut].count("\n  }")
+            self.assertEqual(objects[:closed], QUESTIONS[:closed], cut)
+            self.assertLessEqual(len(objects), closed + 1, cut)
+            for obj in objects:
+                self.assertTrue(is_complete(obj), cut)
+
+    def test_truncated_inside_last_string_is_closed(self):
+        text = ARRAY[:ARRAY.rindex("答案是 A")] + "答案是"
+        objects, _ = salvage_objects(text, is_complete)
+        self.assertEqual(len(objects), 3)
+        self.assertEqual(objects[2]["explanation_text"], "答案是")
+
+    def test_incomplete_truncated_question_is_dropped(self):
+        text = ARRAY[:ARRAY.rindex('"option_C"')]
+        objects, parser = salvage_objects(text, is_complete)
+        self.assertEqual(objects, QUESTIONS[:2])
+        self.assertEqual((parser.recovered, parser.failed), (2, 1))
+
+    def test_broken_object_only_loses_that_question(self):
+        text = '[{"title": "a", "Ai_answer": "A"}, {"title": "b" "Ai_answer": "B"}, {"title": "c"}]'
+        objects, parser = salvage_objects(text)
+        self.assertEqual(objects, [{"title": "a", "Ai_answer": "A"}, {"title": "c"}])
+        self.assertEqual((parser.recovered, parser.failed), (2, 1))
+
+    def test_unbalanced_quote_is_split_at_object_boundary(self):
+        # 多出來的引號讓掃描器把前兩題黏在一起；依 }, { 切開後只丟掉壞掉的那一題
+        text = '[{"title": "a", "note": "he said "hi" ok"}, {"title": "b"}, {"title": "c"}]'
+        objects, parser = salvage_objects(text)
+        self.assertEqual(objects, [{"title": "b"}, {"title": "c"}])
+        self.assertEqual(parser.failed, 1)
+
+    def test_trailing_comma_is_repaired(self):
+        objects, parser = salvage_objects('[{"title": "a", "Ai_answer": "A",},]')
+        self.assertEqual(objects, [{"title": "a", "Ai_answer": "A"}])
+        self.assertEqual(parser.failed, 0)
+
+    def test_wrapped_questions_are_flattened(self):
+        text = json.dumps({"questions": QUESTIONS}, ensure_ascii=False)
+        objects, parser = salvage_objects(text, is_complete)
+        self.assertEqual(objects, QUESTIONS)
+        self.assertEqual(parser.recovered, 3)
+
+    def test_close_resets_state(self):
+        parser = QuestionStreamParser()
+        parser.feed('{"title": "a", "x": "unterminated')
+        parser.close()
+        self.assertEqual(parser.feed('{"title": "b"}'), [{"title": "b"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# 批次主題生成（/api/generate_topic_from_note/batch）與單篇主題生成的快取互不共用
+#   python -m unittest discover -s tests   （在 ml-service 目錄下）
+import unittest
+from unittest import mock
+
+import topic_apps
+from result_cache import MemoryBackend, ResultCache
+
+NOTE = {"id": 1, "note_title": "光合作用", "note_content": "葉綠體" * 1000}
+
+
+class TopicBatchCacheTest(unittest.TestCase):
+    def setUp(self):
+        cache = ResultCache(MemoryBackend())
+        for patcher in (
+            mock.patch.object(topic_apps, "result_cache", cache),
+            mock.patch.object(topic_apps, "has_api_key", return_value=True),
+            mock.patch.object(topic_apps, "generate_topics_batch", return_value=({"1": "葉綠體與光反應"}, 1)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cache = cache
+        self.client = topic_apps.app.test_client()
+
+    def post(self):
+        response = self.client.post("/api/generate_topic_from_note/batch", json={"notes": [NOTE]})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_single_note_cache_is_not_used(self):
+        self.cache.set("topic", topic_apps.TOPIC_PROMPT_VERSION, (NOTE["note_title"], NOTE["note_content"]), "單篇主題")
+        body = self.post()
+        self.assertEqual(body["results"], [{"id": 1, "topic": "葉綠體與光反應", "is_fallback": False}])
+        self.assertEqual(body["model_calls"], 1)
+
+    def test_batch_results_stay_in_their_own_namespace(self):
+        self.post()
+        self.assertIsNone(self.cache.get("topic", topic_apps.TOPIC_PROMPT_VERSION,
+                                         (NOTE["note_title"], NOTE["note_content"])))
+        self.assertEqual(self.cache.get("topic_batch", topic_apps.TOPIC_BATCH_PROMPT_VERSION,
+                                        topic_apps.topic_batch_cache_parts(NOTE)), "葉綠體與光反應")
+
+        # 第二次直接命中，不再呼叫模型
+        topic_apps.generate_topics_batch.reset_mock()
+        body = self.post()
+        self.assertEqual((body["results"][0]["topic"], body["model_calls"]), ("葉綠體與光反應", 0))
+        topic_apps.generate_topics_batch.assert_not_called()
+
+    def test_key_uses_the_truncated_content(self):
+        longer = dict(NOTE, note_content=NOTE["note_content"] + "後面模型看不到的內容")
+        self.assertEqual(topic_apps.topic_batch_cache_parts(longer), topic_apps.topic_batch_cache_parts(NOTE))
+
+
+if __name__ == "__main__":
+    unittest.main()
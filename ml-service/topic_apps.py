@@ -1,12 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-# 更新 OpenAI 導入方式
-from openai import OpenAI
+# 共用的 OpenAI 客戶端（連線池、逾時與重試設定）
+from openai_client import get_openai_client, has_api_key, validate_api_key
+from question_pool import QuestionPool
+from result_cache import create_result_cache
+from stream_parser import QuestionStreamParser
+from keyword_matcher import best_category
+from content_features import extract_features
+from keyword_engine import extract_keywords
+from log_utils import setup_logging, log_event, log_sampled, truncate
 import os , requests
+import logging
 import json
 from dotenv import load_dotenv  
 import re
 import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
 
@@ -19,15 +29,47 @@ DJANGO_BASE_URL = os.getenv("DJANGO_BASE_URL", "https://aaron-website.onrender.c
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://aaron-website9.vercel.app")
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "https://aaron-website9.vercel.app,https://aaron-website.onrender.com").split(",")
 
+# 分批生成題目設定
+QUIZ_BATCH_SIZE = 5  # 每批題數
+QUIZ_BATCH_CONCURRENCY = int(os.getenv("QUIZ_BATCH_CONCURRENCY", "4"))  # 同時進行的批次上限
+QUIZ_BATCH_TIMEOUT = float(os.getenv("QUIZ_BATCH_TIMEOUT", "25"))  # 單批期限（秒），需小於 gunicorn 的 30 秒超時
+
+# 批次主題生成：每次模型呼叫打包幾篇筆記、同時進行的呼叫數、單篇放進 prompt 的字數上限
+TOPIC_BATCH_MAX_NOTES = int(os.getenv("TOPIC_BATCH_MAX_NOTES", "100"))
+TOPIC_BATCH_PACK_SIZE = int(os.getenv("TOPIC_BATCH_PACK_SIZE", "10"))
+TOPIC_BATCH_CONCURRENCY = int(os.getenv("TOPIC_BATCH_CONCURRENCY", "4"))
+TOPIC_BATCH_NOTE_CHARS = int(os.getenv("TOPIC_BATCH_NOTE_CHARS", "1500"))
+TOPIC_BATCH_TIMEOUT = float(os.getenv("TOPIC_BATCH_TIMEOUT", "25"))
+QUIZ_MISSING_RETRIES = int(os.getenv("QUIZ_MISSING_RETRIES", "1"))  # 解析後缺題時，補生成缺少題數的次數
+QUIZ_MIN_RETRY_SECONDS = 8  # 剩餘時間少於此秒數就不再補生成
+
+# 聊天滾動摘要長度上限（字）
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "600"))
+
+VALID_DIFFICULTIES = ['beginner', 'intermediate', 'advanced', 'master', 'test']
+
+# 熱門主題題庫池設定
+QUESTION_POOL_ENABLED = os.getenv("QUESTION_POOL_ENABLED", "1") == "1"
+QUESTION_POOL_MAX_BYTES = int(os.getenv("QUESTION_POOL_MAX_BYTES", str(5 * 1024 * 1024)))
+QUESTION_POOL_TARGET = int(os.getenv("QUESTION_POOL_TARGET", "20"))  # 每個熱門組合的目標存量
+QUESTION_POOL_HOT_THRESHOLD = float(os.getenv("QUESTION_POOL_HOT_THRESHOLD", "3"))  # 半小時內約幾次請求算熱門
+
+setup_logging()
+logger = logging.getLogger("ml-service")
+
 app = Flask(__name__)
 
 # 配置CORS，允許前端和後端跨域調用
 CORS(app, origins=ALLOWED_ORIGINS, supports_credentials=True)
 
+# 啟動時檢查 OpenAI API Key（客戶端本身在第一次使用時才建立）
+OPENAI_KEY_OK, OPENAI_KEY_MESSAGE = validate_api_key()
+logger.log(logging.INFO if OPENAI_KEY_OK else logging.WARNING, OPENAI_KEY_MESSAGE)
+
 
 @app.route("/health", methods=["GET"])
 def health():
-    return {"status": "ok"}, 200
+    return {"status": "ok", "openai_key": OPENAI_KEY_OK}, 200
 
 
 def shuffle_options(q):
@@ -70,14 +112,10 @@ def generate_mock_questions(topic, count):
 
 def generate_questions_with_ai(topic, difficulty, count):
     """使用 AI 生成題目，分批生成以確保穩定性"""
-    print(f"=== 開始生成題目 ===")
-    print(f"主題: {topic}, 難度: {difficulty}, 總數量: {count}")
+    log_event(logger, logging.INFO, "開始生成題目", topic=topic, difficulty=difficulty, count=count)
 
     # 檢查 API Key
-    api_key = os.getenv('OPENAI_API_KEY', 'your-api-key-here')
-    
-
-    if api_key == 'your-api-key-here' or not api_key:
+    if not has_api_key():
         return generate_mock_questions(topic, count)
 
     # 如果題目數量 <= 5，直接生成
@@ -85,16 +123,36 @@ def generate_questions_with_ai(topic, difficulty, count):
         return generate_single_batch(topic, difficulty, count)
     
     # 如果題目數量 > 5，分批生成
-    print(f"題目數量 {count} > 5，採用分批生成策略")
     return generate_multiple_batches(topic, difficulty, count)
 
-def generate_single_batch(topic, difficulty, count):
-    """生成單批題目（1-5題）"""
-    print(f"=== 單批生成 {count} 題 ===")
-    
-    # 使用新版 OpenAI 客戶端
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
+question_pool = QuestionPool(
+    generate_questions_with_ai,
+    max_bytes=QUESTION_POOL_MAX_BYTES,
+    target_per_key=QUESTION_POOL_TARGET,
+    hot_threshold=QUESTION_POOL_HOT_THRESHOLD,
+)
+
+# 主題 / 測驗標題的結果快取；修改對應 prompt 時要調高版本號，讓舊結果失效
+result_cache = create_result_cache()
+TOPIC_PROMPT_VERSION = "v1"
+# 批次主題用的是另一個 prompt（build_topic_batch_prompt），內容也截到 TOPIC_BATCH_NOTE_CHARS，與單篇的結果分開快取
+TOPIC_BATCH_PROMPT_VERSION = "v1"
+RETEST_PROMPT_VERSION = "v1"
+
+def take_pooled_questions(topic, difficulty, count):
+    """記錄請求頻率並嘗試從題庫池取題，取不到回傳 None；熱門組合會在背景補題"""
+    if not QUESTION_POOL_ENABLED or not has_api_key():
+        return None
+
+    question_pool.record_request(topic, difficulty)
+    questions = question_pool.take(topic, difficulty, count)
+    question_pool.maybe_refill(topic, difficulty)
+    if questions is not None:
+        log_sampled(logger, logging.INFO, "題庫池命中", topic=topic, difficulty=difficulty, count=count)
+    return questions
+
+def build_quiz_prompt(topic, difficulty, count):
+    """出題提示詞"""
     prompt = f"""
     你是一個全知的ai，你精通各式各樣的領域。你擅於根據人們給你的主題及難度，生成出與該主題、難度相符的選擇題，提意必須清楚、完整、、邏輯嚴謹、無語病。在你把題目跟選項生成前請你先思考題目及選項是否正確，你習慣先將題目出完後再思考選項怎麼出適合，選項(A/B/C/D)中必有且只有一個正確答案，必須將正確答案隨機分配到(A/B/C/D)四個選項。
     請根據以下條件生成 {count} 道選擇題：
@@ -178,130 +236,150 @@ def generate_single_batch(topic, difficulty, count):
     - advanced: 3
     - master: 4
     """
+    return prompt
 
-
+def stream_single_batch(topic, difficulty, count, timeout=None):
+    """
+    以串流方式呼叫模型生成一批題目，每當一題的 JSON 物件結束就立即產出格式化後的題目
+    產生器結束後可從回傳的 parser 取得 recovered / failed 統計
+    """
+    # 使用共用的 OpenAI 客戶端
+    client = get_openai_client("quiz")
+    parser = QuestionStreamParser(is_complete=is_complete_question)
+
+    stream = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "你是一個題目生成助手，請根據使用者的需求生成題目。"},
+            {"role": "user", "content": build_quiz_prompt(topic, difficulty, count)}
+        ],
+        temperature=0.8,  # 適中溫度，保持創意性
+        max_tokens=4000,  # 限制長度，提升生成速度
+        timeout=timeout,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    total_tokens = None
+    finish_reason = None
     try:
-        # 使用新版 API 語法
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "你是一個題目生成助手，請根據使用者的需求生成題目。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.8,  # 適中溫度，保持創意性
-            max_tokens=4000   # 限制長度，提升生成速度
-        )
-
-        ai_response = response.choices[0].message.content
-        print(f"=== OpenAI API 回應詳情 ===")
-        print(f"使用的 tokens: {response.usage.total_tokens if hasattr(response, 'usage') else '未知'}")
-        print(f"完成原因: {response.choices[0].finish_reason if hasattr(response.choices[0], 'finish_reason') else '未知'}")
-        print(f"回應長度: {len(ai_response)} 字元")
-        print(f"AI 回應: {ai_response}")
-        print(f"===+++++++++++++++++++===")
-        return parse_ai_response(ai_response, count)
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                total_tokens = chunk.usage.total_tokens
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            for q in parser.feed(choice.delta.content or ""):
+                yield format_question(q)
+        for q in parser.close():
+            yield format_question(q)
+    finally:
+        stream.close()
+        log_event(logger, logging.INFO if not parser.failed else logging.WARNING, "OpenAI 串流結束",
+                  tokens=total_tokens, finish_reason=finish_reason,
+                  recovered=parser.recovered, failed=parser.failed)
+
+def generate_single_batch(topic, difficulty, count, timeout=None):
+    """
+    生成單批題目（1-5題），timeout 為整批的期限（秒）
+    串流解析時能救回幾題就保留幾題，只針對缺少的題數補生成一次，仍不足才用模擬題目補齊
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    questions = []
 
-    except Exception as e:
-        print(f"❌ OpenAI API 錯誤: {str(e)}")
-        print(f"錯誤類型: {type(e).__name__}")
-        return generate_mock_questions(topic, count)
+    for attempt in range(1 + QUIZ_MISSING_RETRIES):
+        missing = count - len(questions)
+        if missing <= 0:
+            break
 
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining < QUIZ_MIN_RETRY_SECONDS and attempt > 0:
+                log_event(logger, logging.WARNING, "剩餘時間不足，不再補生成", remaining=round(remaining, 1), missing=missing)
+                break
 
-def parse_ai_response(ai_text, count=1):
-    """解析 AI 回應格式化為標準格式"""
-    try:
-        # 先印出 AI 的原始回應來除錯
-        print(f"AI 原始回應: {ai_text}")
-        print(f"回應長度: {len(ai_text)} 字元")
-
-        # 移除 markdown code block 標記
-        ai_text = re.sub(r"^```json\s*|```$", "", ai_text.strip(), flags=re.MULTILINE)
-
-        # 嘗試直接解析 JSON
-        questions = json.loads(ai_text)
-        print(f"解析出的題目數量: {len(questions)} , 內容: {questions}")
-        # 驗證格式並補充缺失欄位
-        formatted_questions = []
-        for q in questions:
-            # 處理 difficulty_id 轉換
-            difficulty_id = q.get("difficulty_id", 1)
-            if isinstance(difficulty_id, str):
-                difficulty_mapping = {
-                    'beginner': 1,
-                    'intermediate': 2,
-                    'advanced': 3,
-                    'master': 4
-                }
-                difficulty_id = difficulty_mapping.get(difficulty_id, 1)
-            
-            formatted_q = {
-            "title": q.get("title", "預設題目"),
-            "option_A": q.get("option_A", "選項A"),
-            "option_B": q.get("option_B", "選項B"),
-            "option_C": q.get("option_C", "選項C"),
-            "option_D": q.get("option_D", "選項D"),
-            "User_answer": "",  # 預設空值
-            "explanation_text": q.get("explanation_text", "這是題目的解析"),
-            "Ai_answer": q.get("Ai_answer", "A"),
-            "difficulty_id": difficulty_id
-            }
-            shuffle_options(formatted_q)
-            ai_ans = formatted_q["Ai_answer"]
-            formatted_q["explanation_text"] = re.sub(r"(答案是\s*[ABCD])", f"答案是 {ai_ans}", formatted_q["explanation_text"])
-            formatted_q["explanation_text"] = re.sub(r"(即選項\s*[ABCD])", f"即選項 {ai_ans}", formatted_q["explanation_text"])
-            formatted_questions.append(formatted_q)
-            print(f"格式化後的題目formatted_questions: {formatted_questions}")
-        return formatted_questions
-
-    except json.JSONDecodeError as e:
-        # 如果解析失敗，回傳模擬資料
-        print(f"JSON 解析錯誤: {str(e)}")
-        print(f"無法解析的內容: {ai_text[:200]}...")  # 只顯示前200字元
-        return generate_mock_questions("解析失敗", count)
+        try:
+            for q in stream_single_batch(topic, difficulty, missing, timeout=remaining):
+                questions.append(q)
+                if len(questions) >= count:
+                    break
+        except Exception as e:
+            log_event(logger, logging.ERROR, "OpenAI API 錯誤", error=str(e), error_type=type(e).__name__)
+
+        if len(questions) < count:
+            log_event(logger, logging.WARNING, "批次題數不足", attempt=attempt + 1, got=len(questions), expected=count)
+
+    missing = count - len(questions)
+    if missing > 0:
+        questions.extend(generate_mock_questions(topic, missing))
+    return questions[:count]
+
+
+def format_question(q):
+    """驗證格式並補充缺失欄位，隨機打亂選項"""
+    # 處理 difficulty_id 轉換
+    difficulty_id = q.get("difficulty_id", 1)
+    if isinstance(difficulty_id, str):
+        difficulty_mapping = {
+            'beginner': 1,
+            'intermediate': 2,
+            'advanced': 3,
+            'master': 4
+        }
+        difficulty_id = difficulty_mapping.get(difficulty_id, 1)
+
+    formatted_q = {
+        "title": q.get("title", "預設題目"),
+        "option_A": q.get("option_A", "選項A"),
+        "option_B": q.get("option_B", "選項B"),
+        "option_C": q.get("option_C", "選項C"),
+        "option_D": q.get("option_D", "選項D"),
+        "User_answer": "",  # 預設空值
+        "explanation_text": q.get("explanation_text", "這是題目的解析"),
+        "Ai_answer": q.get("Ai_answer", "A"),
+        "difficulty_id": difficulty_id
+    }
+    if formatted_q["Ai_answer"] not in ("A", "B", "C", "D"):
+        formatted_q["Ai_answer"] = "A"
+    shuffle_options(formatted_q)
+    ai_ans = formatted_q["Ai_answer"]
+    formatted_q["explanation_text"] = re.sub(r"(答案是\s*[ABCD])", f"答案是 {ai_ans}", formatted_q["explanation_text"])
+    formatted_q["explanation_text"] = re.sub(r"(即選項\s*[ABCD])", f"即選項 {ai_ans}", formatted_q["explanation_text"])
+    return formatted_q
+
+def is_complete_question(q):
+    """被截斷後補齊的物件，至少要有題目、四個選項與答案才算可用"""
+    return isinstance(q, dict) and bool(q.get("title")) and q.get("Ai_answer") in ("A", "B", "C", "D") \
+        and all(q.get(f"option_{opt}") for opt in ("A", "B", "C", "D"))
 
 @app.route('/api/quiz', methods=['POST'])
 def create_quiz():
     """使用 AI 生成題目"""
     try:
         data = request.json
-        print(f"=== Flask 接收到的請求 ===")
-        print(f"完整請求數據: {data}")
-        print(f"請求來源: {request.headers.get('User-Agent', 'Unknown')}")
-        
-        # 檢查字符編碼
-        topic_raw = data.get('topic', '')
-        print(f"原始 topic: {repr(topic_raw)}")
-        print(f"topic 類型: {type(topic_raw)}")
-        print(f"topic 編碼: {topic_raw.encode('utf-8') if isinstance(topic_raw, str) else 'N/A'}")
-        print("=" * 50)
-        
-        # 強制輸出到控制台
-        import sys
-        sys.stdout.flush()
-        
         topic = data.get('topic', '')
         difficulty = data.get('difficulty', 'test')
         question_count = data.get('question_count', 1)
-        
-        print(f"解析的參數:")
-        print(f"  topic: {topic}")
-        print(f"  difficulty: {difficulty}")
-        print(f"  question_count: {question_count}")
-        print("=" * 50)
+
+        log_sampled(logger, logging.INFO, "收到出題請求", topic=topic, difficulty=difficulty,
+                    question_count=question_count, user_agent=request.headers.get('User-Agent', 'Unknown'))
 
         # 驗證難度等級
-        valid_difficulties = ['beginner', 'intermediate', 'advanced', 'master', 'test']
-        if difficulty not in valid_difficulties:
+        if difficulty not in VALID_DIFFICULTIES:
             return jsonify({
-                "error": f"Invalid difficulty level. Valid options are: {', '.join(valid_difficulties)}"
+                "error": f"Invalid difficulty level. Valid options are: {', '.join(VALID_DIFFICULTIES)}"
             }), 400
 
         if not topic:
             return jsonify({"error": "Topic is required"}), 400
         
-        # 呼叫 AI 生成題目
-        generated_questions = generate_questions_with_ai(topic, difficulty, question_count)
-        print(f"生成的題目數量: {len(generated_questions)}, 內容: {generated_questions}")
+        # 熱門主題優先從題庫池取題，不足時才呼叫 AI 生成
+        generated_questions = take_pooled_questions(topic, difficulty, question_count)
+        if generated_questions is None:
+            generated_questions = generate_questions_with_ai(topic, difficulty, question_count)
+        log_event(logger, logging.DEBUG, "生成的題目", count=len(generated_questions), questions=generated_questions)
         # 直接返回生成的題目，讓 Django 處理儲存
         return jsonify({
             "quiz_topic": topic,
@@ -312,6 +390,16 @@ def create_quiz():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/quiz/pool', methods=['GET'])
+def quiz_pool_stats():
+    """題庫池狀態（命中率、存量、熱門主題）"""
+    return jsonify(question_pool.stats()), 200
+
+@app.route('/api/cache/stats', methods=['GET'])
+def result_cache_stats():
+    """AI 結果快取的命中率與後端狀態"""
+    return jsonify(result_cache.stats()), 200
+
 @app.route('/api/quiz_list', methods=['GET'])
 def get_quiz():
     """從 Django API 獲取 quiz 和相關的 topic 數據"""
@@ -356,6 +444,47 @@ def get_quiz_alt():
         return jsonify({"error": f"Error: {str(e)}"}), 500
 
 
+def build_chat_messages(topic_data, chat_history, content, summary=''):
+    """構建對話上下文：系統提示（含題目）+ 先前對話摘要 + 歷史對話 + 當前用戶訊息"""
+    messages = [
+        {
+            "role": "system", 
+            "content": "你是一個有用的學習助手，專門協助學生理解題目和相關知識。請用繁體中文回答，並根據對話歷史提供連貫的回應。"
+            "這是題目的敘述與選項：\n"
+            f"題目: {topic_data.get('title', '未知題目')}\n"
+            f"選項:\n"
+            f"A. {topic_data.get('option_A', '未知選項')}\n"
+            f"B. {topic_data.get('option_B', '未知選項')}\n"
+            f"C. {topic_data.get('option_C', '未知選項')}\n"
+            f"D. {topic_data.get('option_D', '未知選項')}\n"
+            f"AI 答案: {topic_data.get('Ai_answer', '未知答案')}\n"
+            f"解釋: {topic_data.get('explanation_text', '未知解釋')}\n"
+        }
+    ]
+
+    # 較早的對話已由 Django 折疊成摘要
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"先前對話摘要：\n{summary}"
+        })
+
+    # 添加歷史對話
+    for chat in chat_history[:-1]:  # 排除最後一條（當前用戶訊息）
+        role = "user" if chat['sender'] == 'user' else "assistant"
+        messages.append({
+            "role": role,
+            "content": chat['content']
+        })
+
+    # 添加當前用戶訊息
+    messages.append({
+        "role": "user",
+        "content": content
+    })
+    return messages
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat_with_ai():
     """處理 AI 聊天請求，支援歷史對話"""
@@ -366,19 +495,16 @@ def chat_with_ai():
         content = data.get('content')
         topic_data = data.get('topic_data', {})
         chat_history = data.get('chat_history', [])
+        summary = data.get('summary', '')
 
         if not topic_id or not user_id or not content:
             return jsonify({"error": "topic_id, user_id, and content are required"}), 400
 
-        print(f"=== 處理聊天請求 ===")
-        print(f"用戶ID: {user_id}, 主題ID: {topic_id}")
-        print(f"用戶訊息: {content}")
-        print(f"歷史對話數量: {len(chat_history)}")
+        log_sampled(logger, logging.INFO, "處理聊天請求", user_id=user_id, topic_id=topic_id,
+                    content=truncate(content, 100), history=len(chat_history))
 
         # 檢查 API Key
-        api_key = os.getenv('OPENAI_API_KEY', 'your-api-key-here')
-
-        if api_key == 'your-api-key-here' or not api_key:
+        if not has_api_key():
             # 使用假資料回應
             mock_response = {
                 "topic_id": topic_id,
@@ -390,40 +516,8 @@ def chat_with_ai():
 
         # 使用真實 OpenAI API
         try:
-            client = OpenAI(api_key=api_key)
-            
-            # 構建對話上下文
-            messages = [
-                {
-                    "role": "system", 
-                    "content": "你是一個有用的學習助手，專門協助學生理解題目和相關知識。請用繁體中文回答，並根據對話歷史提供連貫的回應。"
-                    "這是題目的敘述與選項：\n"
-                    f"題目: {topic_data.get('title', '未知題目')}\n"
-                    f"選項:\n"
-                    f"A. {topic_data.get('option_A', '未知選項')}\n"
-                    f"B. {topic_data.get('option_B', '未知選項')}\n"
-                    f"C. {topic_data.get('option_C', '未知選項')}\n"
-                    f"D. {topic_data.get('option_D', '未知選項')}\n"
-                    f"AI 答案: {topic_data.get('Ai_answer', '未知答案')}\n"
-                    f"解釋: {topic_data.get('explanation_text', '未知解釋')}\n"
-                }
-            ]
-            
-            # 添加歷史對話
-            for chat in chat_history[:-1]:  # 排除最後一條（當前用戶訊息）
-                role = "user" if chat['sender'] == 'user' else "assistant"
-                messages.append({
-                    "role": role,
-                    "content": chat['content']
-                })
-            
-            # 添加當前用戶訊息
-            messages.append({
-                "role": "user",
-                "content": content
-            })
-            
-            print(f"發送給 OpenAI 的訊息數量: {len(messages)}")
+            client = get_openai_client("chat")
+            messages = build_chat_messages(topic_data, chat_history, content, summary)
             
             response = client.chat.completions.create(
                 model="gpt-4o",
@@ -443,7 +537,7 @@ def chat_with_ai():
             }), 200
             
         except Exception as e:
-            print(f"❌ OpenAI API 錯誤: {str(e)}")
+            log_event(logger, logging.ERROR, "OpenAI API 錯誤", endpoint="chat", error=str(e))
             # 如果 API 失敗，回退到智能假資料
             smart_mock_response = generate_smart_response(content, chat_history)
             return jsonify({
@@ -458,6 +552,141 @@ def chat_with_ai():
         return jsonify({"error": str(e)}), 500
 
 
+def iter_text_chunks(text, size=8):
+    """把整段文字切成小段，模擬逐字輸出（假資料與備援回應使用）"""
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+# 串流版聊天，回傳 application/x-ndjson，每一行一個事件：
+#   {"type": "start", "topic_id": ..., "user_id": ...}
+#   {"type": "token", "delta": "..."}                 模型每產生一段就推送
+#   {"type": "done", "response": 完整回應, "tokens_used": N}
+#   {"type": "error", "error": ..., "response": 已產生的部分}
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_with_ai_stream():
+    """處理 AI 聊天請求，逐 token 串流回應"""
+    data = request.json or {}
+    topic_id = data.get('topic_id')
+    user_id = data.get('user_id')
+    content = data.get('content')
+    topic_data = data.get('topic_data', {})
+    chat_history = data.get('chat_history', [])
+    summary = data.get('summary', '')
+
+    if not topic_id or not user_id or not content:
+        return jsonify({"error": "topic_id, user_id, and content are required"}), 400
+
+    def generate():
+        yield ndjson_line({"type": "start", "topic_id": topic_id, "user_id": user_id})
+
+        if not has_api_key():
+            mock_text = f"這是針對您的問題「{content}」的 AI 回應。基於您的對話歷史，我理解您想了解更多相關內容。"
+            for delta in iter_text_chunks(mock_text):
+                yield ndjson_line({"type": "token", "delta": delta})
+            yield ndjson_line({"type": "done", "response": mock_text, "tokens_used": 0})
+            return
+
+        parts = []
+        tokens_used = 0
+        try:
+            client = get_openai_client("chat")
+            stream = client.chat.completions.create(
+                model="gpt-4o",
+                messages=build_chat_messages(topic_data, chat_history, content, summary),
+                temperature=0.7,
+                max_tokens=500,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if chunk.usage:
+                    tokens_used = chunk.usage.total_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield ndjson_line({"type": "token", "delta": delta})
+        except Exception as e:
+            log_event(logger, logging.ERROR, "OpenAI API 串流錯誤", endpoint="chat_stream", error=str(e), sent=len(parts))
+            if parts:
+                # 已經送出部分內容，無法再換成備援回應
+                yield ndjson_line({"type": "error", "error": str(e), "response": "".join(parts)})
+                return
+            # 尚未輸出任何內容，回退到智能假資料
+            fallback = generate_smart_response(content, chat_history)
+            for delta in iter_text_chunks(fallback):
+                yield ndjson_line({"type": "token", "delta": delta})
+            yield ndjson_line({
+                "type": "done",
+                "response": fallback,
+                "tokens_used": 0,
+                "note": "使用本地回應（OpenAI API 不可用）"
+            })
+            return
+
+        yield ndjson_line({"type": "done", "response": "".join(parts), "tokens_used": tokens_used})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def summarize_chat_turns(summary, turns):
+    """把舊摘要與新一段對話濃縮成新的摘要（增量更新，不重讀整段歷史）"""
+    transcript = "\n".join(
+        f"{'學生' if t.get('sender') == 'user' else '助手'}: {t.get('content', '')}" for t in turns
+    )
+
+    if not has_api_key():
+        # 模擬資料：保留舊摘要，接上每則新訊息的開頭
+        lines = [summary] if summary else []
+        lines.extend(
+            f"{'學生' if t.get('sender') == 'user' else '助手'}: {t.get('content', '')[:40]}" for t in turns
+        )
+        return "\n".join(lines)[-CHAT_SUMMARY_MAX_CHARS:]
+
+    client = get_openai_client("summary")
+    prompt = f"""
+    以下是一段學習對話的既有摘要，以及之後新增的對話。
+    請把新增對話的重點併入摘要，輸出更新後的完整摘要。
+    - 保留學生的疑問、已經解釋過的觀念與結論
+    - 使用繁體中文，條列式，不超過 {CHAT_SUMMARY_MAX_CHARS} 字
+    - 只輸出摘要內容，不要其他說明
+
+    既有摘要：
+    {summary or "（無）"}
+
+    新增對話：
+    {transcript}
+    """
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.3,
+        max_tokens=400
+    )
+    return response.choices[0].message.content.strip()
+
+@app.route('/api/chat/summarize', methods=['POST'])
+def summarize_chat():
+    """Django 折疊舊對話時呼叫：回傳合併後的滾動摘要"""
+    data = request.json or {}
+    summary = data.get('summary', '')
+    turns = data.get('turns', [])
+
+    if not turns:
+        return jsonify({"summary": summary}), 200
+
+    try:
+        return jsonify({"summary": summarize_chat_turns(summary, turns)}), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, "對話摘要錯誤", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
 def generate_smart_response(user_content, chat_history):
     """基於用戶輸入和歷史生成智能假回應"""
     # 分析用戶問題類型
@@ -489,44 +718,45 @@ def generate_smart_response(user_content, chat_history):
 
 # GPT統整note content 資料
 
+def generate_retest_title(content):
+    """呼叫 AI 把筆記整理成測驗標題；失敗時丟出例外，沒有內容時回傳 None（兩者都不會被快取）"""
+    client = get_openai_client("retest")
+    prompt = f"""
+    1. 分析文章內容，提取關鍵主題。
+    2. 根據主題，設計一個測驗標題。
+    3. 測驗標題需簡短、清晰、有吸引力，且字數不超過30字。
+    4. 只輸出測驗標題，不需要多餘解釋。
+    需整理內容：{content}
+
+    請直接回傳整理後的內容，不要使用任何格式標記。
+    """
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.8
+    )
+
+    processed_content = response.choices[0].message.content.strip()
+    log_event(logger, logging.DEBUG, "GPT 彙整結果", content=processed_content)
+    return processed_content or None
+
 def parse_note_content(content):
-    print("----content內容------")
-    print(content)
-    print("----content內容------")
-    api_key = os.getenv('OPENAI_API_KEY', '')
-    if api_key == '' or not api_key:
-        print("API key is missing.")
+    log_event(logger, logging.DEBUG, "整理筆記內容", content=content)
+    if not has_api_key():
+        logger.warning("API key is missing.")
         return content  # 直接返回原始內容
 
-    print("~~~~~~~~~~~~~~~~~")
     try:
-        client = OpenAI(api_key=api_key)
-        prompt = f"""
-        1. 分析文章內容，提取關鍵主題。
-        2. 根據主題，設計一個測驗標題。
-        3. 測驗標題需簡短、清晰、有吸引力，且字數不超過30字。
-        4. 只輸出測驗標題，不需要多餘解釋。
-        需整理內容：{content}
-
-        請直接回傳整理後的內容，不要使用任何格式標記。
-        """
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.8
+        # 同一篇筆記重複重新測驗時直接回傳上次的標題，不再花 token
+        title, _ = result_cache.get_or_compute(
+            "retest", RETEST_PROMPT_VERSION, (content,), lambda: generate_retest_title(content)
         )
-        
-        processed_content = response.choices[0].message.content.strip()
-        print("----以下GPT彙整content內容----")
-        print(processed_content)
-        print("----以上GPT彙整content內容 END------")
-
-        return processed_content  # 返回處理後的純文字內容
+        return title or content  # 返回處理後的純文字內容
         
     except Exception as e:
-        print(f"GPT 處理錯誤: {str(e)}")
+        log_event(logger, logging.ERROR, "GPT 處理錯誤", endpoint="retest", error=str(e))
         return content  # 如果出錯，返回原始內容
 
 
@@ -552,28 +782,26 @@ def retest():
 # -----------------------------------
 @app.route('/api/parse_answer', methods=['POST'])
 def parse_answer():
-    print("=== 開始解析答案 ===")
     data = request.json
     title = data.get('title')
     Ai_answer = data.get('Ai_answer')
-    print(f"接收到 {title} {Ai_answer}")
+    log_event(logger, logging.INFO, "開始解析答案", title=truncate(title or '', 100), Ai_answer=Ai_answer)
     if not title or not Ai_answer:
         return jsonify({"error": "Title and AI answer are required"}), 400
 
     # Call OpenAI API to parse the question
-    api_key = os.getenv('OPENAI_API_KEY', '')
-    if not api_key:
+    if not has_api_key():
         return jsonify({"error": "API key is missing"}), 400
 
     try:
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client("parse_answer")
         prompt = f"""
         你是一個題目解析專家，請根據以下內容進行詳細解釋：
         題目:{title},解答:{Ai_answer}
         直接回傳整理後的內容，不要使用任何格式標記。
         """
         response = client.chat.completions.create(
-            model="gpt-4.0",
+            model="gpt-4o",
             messages=[
                 {
                     "role": "user", 
@@ -596,20 +824,68 @@ def parse_answer():
 # 目前整合在一起 暫時保留
 # GPT 解析題目
 
-# 移除 SocketIO 相關函數
-# @socketio.on('generate_quiz')
-# def handle_generate_quiz(data):
-#     topic = data.get('topic')
-#     difficulty = data.get('difficulty')
-#     count = data.get('question_count', 1)
-#     batch_size = data.get('batch_size', 3)
-#     total = count
-#     while total > 0:
-#         curr_batch = min(batch_size, total)
-#         batch_questions = _generate_questions_batch(topic, difficulty, curr_batch)
-#         emit('quiz_batch', batch_questions)  # 推送一批題目給前端
-#         total -= curr_batch
-#     emit('quiz_done', {'message': 'All questions generated.'})
+def ndjson_line(event):
+    """把事件轉成一行 NDJSON"""
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def iter_quiz_questions(topic, difficulty, count):
+    """依批次完成順序逐批產出 (批次序號, 題目列表)，沒有 API Key 時直接回傳模擬題目"""
+    if not has_api_key():
+        yield 0, generate_mock_questions(topic, count)
+        return
+
+    pooled = take_pooled_questions(topic, difficulty, count)
+    if pooled is not None:
+        yield 0, pooled
+        return
+
+    yield from iter_question_batches(topic, difficulty, count)
+
+# 串流版出題（取代原本的 SocketIO handle_generate_quiz）
+# 回傳 application/x-ndjson，每一行一個事件：
+#   {"type": "start", "quiz_topic": ..., "total": N}
+#   {"type": "question", "index": i, "batch": b, "question": {...}}   每批解析完立即推送
+#   {"type": "done", "count": N}
+@app.route('/api/quiz/stream', methods=['POST'])
+def create_quiz_stream():
+    """使用 AI 生成題目，每批完成就以串流推送，不需等待全部題目"""
+    data = request.json or {}
+    topic = data.get('topic', '')
+    difficulty = data.get('difficulty', 'test')
+
+    try:
+        question_count = int(data.get('question_count', 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "question_count must be an integer"}), 400
+
+    if difficulty not in VALID_DIFFICULTIES:
+        return jsonify({
+            "error": f"Invalid difficulty level. Valid options are: {', '.join(VALID_DIFFICULTIES)}"
+        }), 400
+
+    if not topic:
+        return jsonify({"error": "Topic is required"}), 400
+
+    def generate():
+        yield ndjson_line({"type": "start", "quiz_topic": topic, "total": question_count})
+        index = 0
+        try:
+            for batch_num, batch_questions in iter_quiz_questions(topic, difficulty, question_count):
+                for q in batch_questions:
+                    if index >= question_count:
+                        break
+                    yield ndjson_line({"type": "question", "index": index, "batch": batch_num, "question": q})
+                    index += 1
+        except Exception as e:
+            yield ndjson_line({"type": "error", "error": str(e), "count": index})
+            return
+        yield ndjson_line({"type": "done", "count": index})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.route('/api/generate_topic_from_note', methods=['POST'])
 def generate_topic_from_note():
@@ -618,9 +894,8 @@ def generate_topic_from_note():
         # 檢查認證（可選，因為這是內部服務）
         auth_header = request.headers.get('Authorization')
         if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            # 這裡可以添加token驗證邏輯
-            print(f"收到認證token: {token[:10]}...")
+            # 這裡可以添加token驗證邏輯（不要把 token 寫進日誌）
+            pass
         
         data = request.json
         note_content = data.get('note_content', '')
@@ -634,9 +909,7 @@ def generate_topic_from_note():
             return jsonify({"success": False, "message": "筆記內容過長，請縮短後再試"}), 400
         
         # 檢查 API Key
-        api_key = os.getenv('OPENAI_API_KEY', 'your-api-key-here')
-        
-        if api_key == 'your-api-key-here' or not api_key:
+        if not has_api_key():
             # 如果沒有API Key，使用改進的備用邏輯
             fallback_topic = generate_enhanced_fallback_topic_from_note(note_content, note_title)
             return jsonify({
@@ -646,8 +919,19 @@ def generate_topic_from_note():
                 "is_fallback": True
             })
         
+        # 筆記沒改過就直接用上次 AI 生成的主題
+        cached_topic = result_cache.get("topic", TOPIC_PROMPT_VERSION, (note_title, note_content))
+        if cached_topic:
+            return jsonify({
+                "success": True,
+                "topic": cached_topic,
+                "message": "成功生成主題",
+                "is_fallback": False,
+                "cached": True
+            })
+        
         # 使用 OpenAI API 生成主題
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client("topic")
         
         # 改進的AI提示詞
         prompt = f"""
@@ -723,7 +1007,7 @@ def generate_topic_from_note():
         # 改進的AI回應清理邏輯
         topic = clean_ai_response(ai_response)
         
-        if not topic or len(topic) > 25 or len(topic) < 3:
+        if not is_valid_topic(topic):
             # 如果AI生成的主題無效，使用改進的備用邏輯
             fallback_topic = generate_enhanced_fallback_topic_from_note(note_content, note_title)
             return jsonify({
@@ -733,15 +1017,17 @@ def generate_topic_from_note():
                 "is_fallback": True
             })
         
+        result_cache.set("topic", TOPIC_PROMPT_VERSION, (note_title, note_content), topic)
         return jsonify({
             "success": True,
             "topic": topic,
             "message": "成功生成主題",
-            "is_fallback": False
+            "is_fallback": False,
+            "cached": False
         })
         
     except Exception as e:
-        print(f"生成主題時發生錯誤: {str(e)}")
+        log_event(logger, logging.ERROR, "生成主題時發生錯誤", error=str(e))
         
         # 發生錯誤時使用改進的備用邏輯
         try:
@@ -753,7 +1039,7 @@ def generate_topic_from_note():
                 "is_fallback": True
             })
         except Exception as fallback_error:
-            print(f"改進的備用邏輯也失敗: {str(fallback_error)}")
+            log_event(logger, logging.ERROR, "改進的備用邏輯也失敗", error=str(fallback_error))
             return jsonify({
                 "success": False,
                 "message": f"生成主題失敗: {str(e)}"
@@ -794,6 +1080,20 @@ def clean_ai_response(ai_response):
     
     return cleaned
 
+# 語言 / 娛樂分類對應的主題名稱
+LANGUAGE_TOPICS = {
+    '英文': "英文語法練習",
+    '日文': "日語基礎練習",
+    '韓文': "韓語基礎練習",
+    '法文': "法語基礎練習",
+    '德文': "德語基礎練習",
+}
+ENTERTAINMENT_TOPICS = {
+    '影視': "影視作品練習",
+    '音樂': "音樂欣賞練習",
+    '藝術': "藝術鑑賞練習",
+}
+
 def generate_enhanced_fallback_topic_from_note(note_content, note_title=''):
     """改進的備用主題生成邏輯"""
     if not note_content and not note_title:
@@ -803,173 +1103,35 @@ def generate_enhanced_fallback_topic_from_note(note_content, note_title=''):
     primary_text = note_title if note_title else note_content
     content = str(primary_text).lower()
     
-    # 擴展的學科關鍵詞映射
-    subject_keywords = {
-        '數學': [
-            '數學', '計算', '公式', '幾何', '代數', '微積分', '統計', '概率', '函數', '方程', '不等式',
-            '三角', '向量', '矩陣', '數列', '極限', '導數', '積分', '微分', '線性', '非線性'
-        ],
-        '物理': [
-            '物理', '力學', '電學', '光學', '熱學', '量子', '相對論', '牛頓', '愛因斯坦', '能量', '動量',
-            '電場', '磁場', '波', '聲', '光', '溫度', '壓力', '密度', '速度', '加速度'
-        ],
-        '化學': [
-            '化學', '分子', '原子', '反應', '元素', '化合物', '離子', '鍵', '酸', '鹼', '氧化', '還原',
-            '催化', '平衡', '速率', '濃度', 'pH值', '有機', '無機', '生物化學'
-        ],
-        '生物': [
-            '生物', '細胞', '基因', '進化', '生態', '解剖', '生理', '遺傳', '免疫', '神經', '循環',
-            '消化', '呼吸', '繁殖', '代謝', '酶', '蛋白質', 'DNA', 'RNA', '染色體'
-        ],
-        '歷史': [
-            '歷史', '古代', '近代', '戰爭', '革命', '文化', '文明', '帝國', '王朝', '政治', '社會',
-            '經濟', '宗教', '哲學', '藝術', '文學', '科學', '技術', '地理', '民族'
-        ],
-        '地理': [
-            '地理', '地形', '氣候', '人口', '經濟', '環境', '自然', '人文', '區域', '國家', '城市',
-            '山脈', '河流', '海洋', '沙漠', '森林', '草原', '資源', '產業', '交通'
-        ],
-        '文學': [
-            '文學', '小說', '詩歌', '散文', '戲劇', '作者', '作品', '風格', '流派', '主題', '情節',
-            '人物', '語言', '修辭', '意象', '象徵', '諷刺', '幽默', '浪漫', '現實'
-        ],
-        '語言': [
-            '語言', '語法', '詞彙', '發音', '翻譯', '寫作', '閱讀', '聽力', '口語', '文法', '句型',
-            '時態', '語態', '語氣', '連接詞', '介詞', '冠詞', '形容詞', '副詞', '動詞'
-        ],
-        '計算機': [
-            '計算機', '程式', '算法', '數據', '網絡', '軟件', '硬體', '編程', '開發', '設計', '測試',
-            '數據庫', '人工智能', '機器學習', '深度學習', '雲計算', '大數據', '區塊鏈', '物聯網'
-        ],
-        '經濟': [
-            '經濟', '市場', '貿易', '金融', '投資', '政策', '貨幣', '銀行', '股票', '債券', '匯率',
-            '通貨膨脹', '失業', 'GDP', '供需', '價格', '成本', '利潤', '競爭', '壟斷'
-        ],
-        '心理學': [
-            '心理', '認知', '行為', '情緒', '人格', '發展', '社會', '臨床', '實驗', '學習', '記憶',
-            '注意力', '思維', '動機', '態度', '價值觀', '群體', '文化', '健康'
-        ],
-        '哲學': [
-            '哲學', '邏輯', '倫理', '美學', '形而上學', '認識論', '存在', '意識', '自由', '正義',
-            '真理', '知識', '理性', '經驗', '懷疑', '辯證', '唯心', '唯物', '實用主義'
-        ]
-    }
-    
-    # 新增：語言學習關鍵詞
-    language_keywords = {
-        '英文': [
-            'english', 'english', '英語', '英文', '英語', 'english', 'english', 'english', 'english', 'english',
-            'grammar', 'vocabulary', 'pronunciation', 'translation', 'writing', 'reading', 'listening', 'speaking',
-            'tense', 'verb', 'noun', 'adjective', 'adverb', 'preposition', 'conjunction', 'article'
-        ],
-        '日文': [
-            '日語', '日文', '日本語', 'ひらがな', 'カタカナ', '漢字', '文法', '語彙', '發音', '翻訳',
-            'writing', 'reading', 'listening', 'speaking', '敬語', '助詞', '動詞', '形容詞', '名詞'
-        ],
-        '韓文': [
-            '韓語', '韓文', '한국어', '한글', '문법', '어휘', '발음', '번역', 'writing', 'reading'
-        ],
-        '法文': [
-            '法語', '法文', 'français', 'francais', 'grammaire', 'vocabulaire', 'prononciation', 'traduction'
-        ],
-        '德文': [
-            '德語', '德文', 'deutsch', 'grammatik', 'wortschatz', 'aussprache', 'übersetzung'
-        ]
-    }
-    
-    # 新增：動漫遊戲關鍵詞
-    anime_game_keywords = {
-        '動漫': [
-            '動漫', '動畫', '漫畫', 'anime', 'manga', '二次元', '角色', '劇情', '聲優', 'op', 'ed',
-            '輕小說', '輕小', 'galgame', '視覺小說', '視覺小說', '視覺小說', '視覺小說'
-        ],
-        '遊戲': [
-            '遊戲', 'game', 'rpg', 'mmorpg', 'fps', 'moba', '策略', '動作', '冒險', '解謎', '模擬',
-            '競技', '單機', '網遊', '手遊', '主機', 'pc', 'steam', 'switch', 'ps5', 'xbox'
-        ],
-        '二次元文化': [
-            'cosplay', '同人', '手辦', '模型', '周邊', '應援', '粉絲', '宅', '萌', '燃', '百合', 'bl',
-            '腐女', '蘿莉', '御姐', '正太', '大叔', '傲嬌', '天然', '病嬌', '三無'
-        ]
-    }
-    
-    # 新增：娛樂文化關鍵詞
-    entertainment_keywords = {
-        '影視': [
-            '電影', '電視', '劇', '影視', 'movie', 'tv', 'drama', 'series', 'show', 'film', 'cinema',
-            '導演', '演員', '編劇', '製片', '票房', '收視率', '劇情', '特效', '配樂', '剪輯'
-        ],
-        '音樂': [
-            '音樂', '歌曲', '歌手', '樂團', '樂器', '作曲', '作詞', '編曲', '音樂', 'music', 'song',
-            'pop', 'rock', 'jazz', 'classical', 'electronic', 'hip-hop', 'r&b', 'country', 'folk'
-        ],
-        '藝術': [
-            '藝術', '繪畫', '雕塑', '攝影', '設計', '建築', '時尚', 'art', 'painting', 'sculpture',
-            'photography', 'design', 'architecture', 'fashion', '素描', '水彩', '油畫', '版畫'
-        ]
-    }
+    # 所有關鍵詞字典已在 import 時編成自動機，掃描一遍取得各分類分數，取最高分者
+    label, title = best_category(content)
+    group, category = label if label else (None, None)
     
-    # 檢查內容中是否包含學科關鍵詞
-    for subject, keywords in subject_keywords.items():
-        if any(keyword in content for keyword in keywords):
-            # 根據內容長度和複雜度選擇合適的後綴
-            if len(content) > 500:
-                return f"{subject}進階練習"
-            elif len(content) > 200:
-                return f"{subject}綜合練習"
-            else:
-                return f"{subject}基礎練習"
+    if group == 'subject':
+        # 根據內容長度和複雜度選擇合適的後綴
+        if len(content) > 500:
+            return f"{category}進階練習"
+        elif len(content) > 200:
+            return f"{category}綜合練習"
+        else:
+            return f"{category}基礎練習"
     
-    # 檢查語言學習內容
-    for language, keywords in language_keywords.items():
-        if any(keyword in content for keyword in keywords):
-            # 檢測主要語言
-            if language == '英文' and any(word in content for word in ['english', 'grammar', 'vocabulary']):
-                return "英文語法練習"
-            elif language == '英文':
-                return "英文語法練習"
-            elif language == '日文':
-                return "日語基礎練習"
-            elif language == '韓文':
-                return "韓語基礎練習"
-            elif language == '法文':
-                return "法語基礎練習"
-            elif language == '德文':
-                return "德語基礎練習"
+    if group == 'language':
+        return LANGUAGE_TOPICS[category]
     
-    # 檢查動漫遊戲內容
-    for category, keywords in anime_game_keywords.items():
-        if any(keyword in content for keyword in keywords):
-            if category == '動漫':
-                # 嘗試識別具體作品
-                anime_titles = ['海賊王', '火影', '死神', '進擊的巨人', '鬼滅之刃', '咒術迴戰', '鋼彈', 'eva']
-                for title in anime_titles:
-                    if title in content:
-                        return f"{title}相關練習"
-                return "動漫知識練習"
-            elif category == '遊戲':
-                # 嘗試識別具體遊戲
-                game_titles = ['minecraft', 'fortnite', 'lol', 'dota', 'csgo', 'valorant', '原神', '崩壞']
-                for title in game_titles:
-                    if title in content:
-                        return f"{title}遊戲練習"
-                return "遊戲策略練習"
-            elif category == '二次元文化':
-                return "二次元文化練習"
+    if group == 'anime_game':
+        if category == '動漫':
+            return f"{title}相關練習" if title else "動漫知識練習"
+        elif category == '遊戲':
+            return f"{title}遊戲練習" if title else "遊戲策略練習"
+        return "二次元文化練習"
     
-    # 檢查娛樂文化內容
-    for category, keywords in entertainment_keywords.items():
-        if any(keyword in content for keyword in keywords):
-            if category == '影視':
-                return "影視作品練習"
-            elif category == '音樂':
-                return "音樂欣賞練習"
-            elif category == '藝術':
-                return "藝術鑑賞練習"
+    if group == 'entertainment':
+        return ENTERTAINMENT_TOPICS[category]
     
     # 智能內容分析（優先分析標題，如果沒有標題則分析內容）
     analysis_content = note_title if note_title else note_content
-    content_analysis = analyze_content_complexity(analysis_content)
+    content_analysis = extract_features(analysis_content)
     
     # 根據內容特徵生成主題
     if content_analysis['has_formulas']:
@@ -990,7 +1152,7 @@ def generate_enhanced_fallback_topic_from_note(note_content, note_title=''):
         return "日語基礎練習"
     
     # 提取關鍵詞生成主題（優先從標題提取，如果沒有標題則從內容提取）
-    key_words = extract_key_words(analysis_content)
+    key_words = extract_keywords(analysis_content, 2)
     if key_words:
         if len(key_words) == 1:
             return f"{key_words[0]}相關練習"
@@ -999,123 +1161,247 @@ def generate_enhanced_fallback_topic_from_note(note_content, note_title=''):
     
     return "綜合知識練習"
 
-def analyze_content_complexity(content):
-    """分析內容複雜度和特徵"""
-    analysis = {
-        'has_formulas': bool(re.search(r'[+\-*/=()\[\]{}]', content)),
-        'has_code': bool(re.search(r'(def|class|import|function|var|let|const)', content, re.IGNORECASE)),
-        'has_dates': bool(re.search(r'\d{4}年|\d{1,2}月|\d{1,2}日|\d{4}-\d{1,2}-\d{1,2}', content)),
-        'has_numbers': bool(re.search(r'\d+\.?\d*', content)),
-        'has_questions': bool(re.search(r'[？?]', content)),
-        'has_lists': bool(re.search(r'^\s*[-*•]\s|^\s*\d+\.\s', content, re.MULTILINE)),
-        'has_english': bool(re.search(r'[a-zA-Z]{3,}', content)),  # 檢測英文單詞
-        'has_japanese': bool(re.search(r'[あ-んア-ン一-龯]', content)),  # 檢測日文字符
-        'has_korean': bool(re.search(r'[가-힣]', content)),  # 檢測韓文字符
-        'has_chinese': bool(re.search(r'[\u4e00-\u9fff]', content)),  # 檢測中文字符
-        'has_emoji': bool(re.search(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002600-\U000027BF]', content)),  # 檢測emoji
-        'has_urls': bool(re.search(r'https?://[^\s]+', content)),  # 檢測URL
-        'has_hashtags': bool(re.search(r'#[^\s]+', content)),  # 檢測標籤
-        'has_mentions': bool(re.search(r'@[^\s]+', content))  # 檢測提及
-    }
-    return analysis
+def is_valid_topic(topic):
+    return bool(topic) and 3 <= len(topic) <= 25
+
+def topic_batch_cache_parts(note):
+    """批次主題的快取鍵：模型實際看到的標題與截斷後的內容"""
+    return (note['note_title'], note['note_content'][:TOPIC_BATCH_NOTE_CHARS])
+
+def build_topic_batch_prompt(notes):
+    """把多篇筆記打包成一個 prompt，要求以 JSON 物件回傳 {筆記編號: 主題}"""
+    sections = []
+    for note in notes:
+        content = note['note_content'][:TOPIC_BATCH_NOTE_CHARS]
+        sections.append(f"[{note['id']}]\n標題：{note['note_title']}\n內容：{content}")
+    joined = "\n\n".join(sections)
+    return f"""
+        你是一個專業的批次學習主題生成專家。以下有 {len(notes)} 篇筆記，每篇以 [編號] 開頭。
+        請為每篇筆記各生成一個適合製作練習題的主題名稱：
+        1. 優先分析筆記標題，結合內容找出核心概念
+        2. 主題名稱簡潔明了，控制在5-15個字之間，優先使用繁體中文
+        3. 避免過於籠統、抽象或主觀的名稱
+
+        {joined}
+
+        請只回傳一個 JSON 物件，鍵是筆記編號（字串），值是主題名稱，例如 {{"1": "光合作用概念練習"}}。
+        不要加任何其他內容、格式標記或解釋。
+        """
 
-def extract_key_words(content):
-    """提取內容中的關鍵詞，支持多語言"""
-    if not content:
-        return []
-    
-    # 移除標點符號和特殊字符，但保留中文字符
-    cleaned = re.sub(r'[^\w\s\u4e00-\u9fff]', ' ', content)
-    
-    # 分割成單詞
-    words = cleaned.split()
-    
-    # 多語言停用詞
-    stop_words = {
-        # 中文停用詞
-        '的', '是', '在', '有', '和', '與', '或', '但', '而', '如果', '因為', '所以', '這個', '那個', '這些', '那些',
-        '了', '着', '過', '來', '去', '到', '從', '向', '對', '為', '給', '被', '把', '讓', '使', '得',
-        '很', '非常', '特別', '比較', '更', '最', '太', '真', '好', '壞', '大', '小', '高', '低', '長', '短',
-        '我', '你', '他', '她', '它', '我們', '你們', '他們', '她們', '它們',
-        '什麼', '怎麼', '為什麼', '哪裡', '什麼時候', '多少', '幾個',
-        
-        # 英文停用詞
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-        'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
-        'will', 'would', 'could', 'should', 'may', 'might', 'can', 'must', 'shall',
-        'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they',
-        'what', 'when', 'where', 'why', 'how', 'which', 'who', 'whom',
-        
-        # 日文停用詞
-        'は', 'が', 'を', 'に', 'へ', 'で', 'から', 'まで', 'より', 'の', 'と', 'や', 'も', 'か', 'ね', 'よ',
-        'です', 'ます', 'だ', 'である', 'いる', 'ある', 'する', 'なる', 'できる', '見る', '聞く',
-        'これ', 'それ', 'あれ', 'どれ', 'ここ', 'そこ', 'あそこ', 'どこ',
-        
-        # 通用停用詞
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'
-    }
-    
-    # 過濾短詞和常見詞
-    filtered_words = []
-    for word in words:
-        word_lower = word.lower()
-        # 保留長度大於1的詞，且不在停用詞列表中
-        if len(word) > 1 and word_lower not in stop_words:
-            # 檢查是否包含有效字符（至少包含一個字母或中文字符）
-            if re.search(r'[a-zA-Z\u4e00-\u9fff]', word):
-                filtered_words.append(word)
-    
-    # 按頻率排序
-    word_freq = {}
-    for word in filtered_words:
-        word_freq[word] = word_freq.get(word, 0) + 1
-    
-    # 返回頻率最高的3個詞（增加數量以提供更多選擇）
-    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-    return [word for word, freq in sorted_words[:3]]
+def parse_topic_batch_response(text):
+    """解析 {編號: 主題} 或 [{"id": ..., "topic": ...}]，回傳 {編號字串: 主題}"""
+    text = (text or '').strip()
+    if text.startswith('```'):
+        text = text.strip('`')
+        text = text[text.find('\n') + 1:] if '\n' in text else text
+    start = min((i for i in (text.find('{'), text.find('[')) if i >= 0), default=-1)
+    if start < 0:
+        return {}
+    try:
+        data, _ = json.JSONDecoder(strict=False).raw_decode(text[start:])
+    except json.JSONDecodeError:
+        return {}
+    if isinstance(data, dict):
+        return {str(k): str(v) for k, v in data.items() if isinstance(v, (str, int, float))}
+    if isinstance(data, list):
+        return {
+            str(item.get('id')): str(item.get('topic', ''))
+            for item in data if isinstance(item, dict) and 'id' in item
+        }
+    return {}
+
+def generate_topic_pack(notes):
+    """一次模型呼叫處理一包筆記，回傳 {編號字串: 清理後的主題}（無效的主題不列入）"""
+    client = get_openai_client("topic")
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "你是一個學習主題生成助手，請根據每篇筆記內容生成合適的練習題主題。只回傳 JSON。"},
+            {"role": "user", "content": build_topic_batch_prompt(notes)}
+        ],
+        temperature=0.3,
+        max_tokens=40 * len(notes) + 50,  # 每篇主題約 20~30 token，加上 JSON 的標點
+        timeout=TOPIC_BATCH_TIMEOUT,
+    )
+    topics = parse_topic_batch_response(response.choices[0].message.content)
+    expected = {note['id'] for note in notes}
+    cleaned = {}
+    for note_id, topic in topics.items():
+        topic = clean_ai_response(topic)
+        if note_id in expected and is_valid_topic(topic):
+            cleaned[note_id] = topic
+    return cleaned
+
+def generate_topics_batch(notes):
+    """
+    notes：[{'id': 字串, 'note_title': ..., 'note_content': ...}]
+    每 TOPIC_BATCH_PACK_SIZE 篇打包成一次模型呼叫，最多 TOPIC_BATCH_CONCURRENCY 個同時進行；
+    回傳 ({編號: 主題}, 模型呼叫次數)。失敗、逾時或沒有對應結果的筆記不在回傳內，由呼叫端改用備用邏輯
+    """
+    packs = [notes[i:i + TOPIC_BATCH_PACK_SIZE] for i in range(0, len(notes), TOPIC_BATCH_PACK_SIZE)]
+    workers = max(1, min(TOPIC_BATCH_CONCURRENCY, len(packs)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {executor.submit(generate_topic_pack, pack): n for n, pack in enumerate(packs)}
+    topics = {}
+    try:
+        # 整個請求共用一個期限；排隊中的包也算在內，避免超過 gunicorn 的超時
+        done, not_done = wait(futures, timeout=TOPIC_BATCH_TIMEOUT)
+        for future in done:
+            try:
+                topics.update(future.result())
+            except Exception as e:
+                log_event(logger, logging.ERROR, "批次主題生成失敗", pack=futures[future] + 1, error=str(e))
+        if not_done:
+            log_event(logger, logging.WARNING, "批次主題生成逾時", packs=len(not_done), timeout=TOPIC_BATCH_TIMEOUT)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return topics, len(packs)
+
+@app.route('/api/generate_topic_from_note/batch', methods=['POST'])
+def generate_topic_from_note_batch():
+    """
+    批次為多篇筆記生成主題
+    請求：{"notes": [{"id": 1, "note_title": "...", "note_content": "..."}, ...]}
+    回應：results 與輸入順序相同，每篇 {"id", "topic", "is_fallback"}；AI 沒給出有效主題的筆記各自改用備用邏輯
+    """
+    data = request.get_json(silent=True) or {}
+    raw_notes = data.get('notes')
+    if not isinstance(raw_notes, list) or not raw_notes:
+        return jsonify({"success": False, "message": "notes 必須是非空陣列"}), 400
+    if len(raw_notes) > TOPIC_BATCH_MAX_NOTES:
+        return jsonify({"success": False, "message": f"一次最多 {TOPIC_BATCH_MAX_NOTES} 篇筆記"}), 400
+
+    notes = []
+    seen = set()
+    for index, item in enumerate(raw_notes):
+        item = item if isinstance(item, dict) else {}
+        note_id = str(item.get('id', index))
+        if note_id in seen:
+            return jsonify({"success": False, "message": f"筆記編號重複: {note_id}"}), 400
+        seen.add(note_id)
+        notes.append({
+            'id': note_id,
+            'raw_id': item.get('id', index),
+            'note_title': str(item.get('note_title') or ''),
+            'note_content': str(item.get('note_content') or ''),
+        })
+
+    # 空白筆記不必送給 AI；快取裡已有主題的筆記也不必
+    candidates = [n for n in notes if n['note_content'].strip() or n['note_title'].strip()]
+    topics = {}
+    model_calls = 0
+    start = time.perf_counter()
+    if has_api_key() and candidates:
+        to_generate = []
+        for note in candidates:
+            cached_topic = result_cache.get("topic_batch", TOPIC_BATCH_PROMPT_VERSION, topic_batch_cache_parts(note))
+            if cached_topic:
+                topics[note['id']] = cached_topic
+            else:
+                to_generate.append(note)
+        if to_generate:
+            generated, model_calls = generate_topics_batch(to_generate)
+            for note in to_generate:
+                if note['id'] in generated:
+                    result_cache.set("topic_batch", TOPIC_BATCH_PROMPT_VERSION, topic_batch_cache_parts(note),
+                                     generated[note['id']])
+            topics.update(generated)
+
+    results = []
+    for note in notes:
+        topic = topics.get(note['id'])
+        is_fallback = topic is None
+        if is_fallback:
+            topic = generate_enhanced_fallback_topic_from_note(note['note_content'], note['note_title'])
+        results.append({"id": note['raw_id'], "topic": topic, "is_fallback": is_fallback})
+
+    fallback_count = sum(1 for r in results if r['is_fallback'])
+    log_event(logger, logging.INFO, "批次主題生成完成", notes=len(notes), model_calls=model_calls,
+              fallback=fallback_count, elapsed_ms=round((time.perf_counter() - start) * 1000))
+    return jsonify({
+        "success": True,
+        "results": results,
+        "model_calls": model_calls,
+        "fallback_count": fallback_count,
+    })
+
+def split_batches(count, batch_size=QUIZ_BATCH_SIZE):
+    """把題數切成每批最多 batch_size 題的列表，例如 12 -> [5, 5, 2]"""
+    sizes = []
+    remaining = count
+    while remaining > 0:
+        sizes.append(min(batch_size, remaining))
+        remaining -= batch_size
+    return sizes
+
+def iter_question_batches(topic, difficulty, count):
+    """
+    並行生成各批題目，依「完成順序」逐批產出 (批次序號, 題目列表)
+    - 同時進行的批次數由 QUIZ_BATCH_CONCURRENCY 控制
+    - 每批從開始執行起算 QUIZ_BATCH_TIMEOUT 秒，逾時或失敗的批次各自以模擬題目補上
+    """
+    sizes = split_batches(count)
+    workers = max(1, min(QUIZ_BATCH_CONCURRENCY, len(sizes)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    started_at = {}
+
+    def _run(batch_num, batch_size):
+        started_at[batch_num] = time.monotonic()
+        return generate_single_batch(topic, difficulty, batch_size, timeout=QUIZ_BATCH_TIMEOUT)
+
+    futures = {executor.submit(_run, i, size): i for i, size in enumerate(sizes)}
+    pending = set(futures)
+
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                batch_num = futures[future]
+                batch_size = sizes[batch_num]
+                try:
+                    batch_questions = future.result()
+                except Exception as e:
+                    log_event(logger, logging.ERROR, "批次生成異常", batch=batch_num + 1, error=str(e))
+                    batch_questions = None
+
+                if not batch_questions or len(batch_questions) != batch_size:
+                    log_event(logger, logging.WARNING, "批次生成失敗或數量不符", batch=batch_num + 1,
+                              got=len(batch_questions or []), expected=batch_size)
+                    # 如果某批失敗，生成模擬題目填充
+                    batch_questions = generate_mock_questions(topic, batch_size)
+                yield batch_num, batch_questions
+
+            # 檢查已開始執行但超過期限的批次，不再等待，直接以模擬題目補上
+            now = time.monotonic()
+            for future in list(pending):
+                batch_num = futures[future]
+                begin = started_at.get(batch_num)
+                if begin is not None and now - begin > QUIZ_BATCH_TIMEOUT:
+                    log_event(logger, logging.WARNING, "批次超過期限，改用模擬題目", batch=batch_num + 1, timeout=QUIZ_BATCH_TIMEOUT)
+                    pending.discard(future)
+                    future.cancel()
+                    yield batch_num, generate_mock_questions(topic, sizes[batch_num])
+    finally:
+        # 不等待逾時的批次結束，避免拖住請求
+        executor.shutdown(wait=False, cancel_futures=True)
 
 def generate_multiple_batches(topic, difficulty, count):
-    """分批生成大量題目（>5題）"""
-    print(f"=== 分批生成 {count} 題 ===")
-    
+    """分批生成大量題目（>5題），各批並行生成後依批次順序合併"""
+    sizes = split_batches(count)
+    log_event(logger, logging.INFO, "分批生成", count=count, batches=len(sizes), concurrency=QUIZ_BATCH_CONCURRENCY)
+
+    batches = [None] * len(sizes)
+    for batch_num, batch_questions in iter_question_batches(topic, difficulty, count):
+        batches[batch_num] = batch_questions
+
     all_questions = []
-    batch_size = 5  # 每批5題
-    
-    # 計算需要多少批
-    num_batches = (count + batch_size - 1) // batch_size  # 向上取整
-    
-    for batch_num in range(num_batches):
-        # 計算當前批次的題目數量
-        current_batch_size = min(batch_size, count - batch_num * batch_size)
-        
-        print(f"=== 生成第 {batch_num + 1}/{num_batches} 批，{current_batch_size} 題 ===")
-        
-        try:
-            # 生成當前批次的題目
-            batch_questions = generate_single_batch(topic, difficulty, current_batch_size)
-            
-            if batch_questions and len(batch_questions) == current_batch_size:
-                all_questions.extend(batch_questions)
-                print(f"✅ 第 {batch_num + 1} 批生成成功，{len(batch_questions)} 題")
-            else:
-                print(f"❌ 第 {batch_num + 1} 批生成失敗或數量不符")
-                # 如果某批失敗，生成模擬題目填充
-                mock_questions = generate_mock_questions(topic, current_batch_size)
-                all_questions.extend(mock_questions)
-                
-        except Exception as e:
-            print(f"❌ 第 {batch_num + 1} 批生成異常: {str(e)}")
-            # 生成模擬題目填充
-            mock_questions = generate_mock_questions(topic, current_batch_size)
-            all_questions.extend(mock_questions)
-    
-    print(f"=== 分批生成完成 ===")
-    print(f"總計生成: {len(all_questions)} 題")
-    print(f"期望數量: {count} 題")
-    
+    for batch_questions in batches:
+        all_questions.extend(batch_questions or [])
+
     # 確保返回的題目數量正確
     if len(all_questions) != count:
-        print(f"⚠️ 警告：實際生成 {len(all_questions)} 題，期望 {count} 題")
+        log_event(logger, logging.WARNING, "分批生成題數不符", got=len(all_questions), expected=count)
         # 如果數量不足，用模擬題目補充
         while len(all_questions) < count:
             mock_question = generate_mock_questions(topic, 1)[0]
@@ -1131,13 +1417,8 @@ if __name__ == "__main__":
     host = os.getenv("FLASK_HOST", "0.0.0.0")
     port = int(os.getenv("FLASK_PORT", "5000"))
     
-    print(f"=== ML服務啟動 ===")
-    print(f"環境: {'開發' if debug_mode else '生產'}")
-    print(f"主機: {host}")
-    print(f"端口: {port}")
-    print(f"允許的來源: {ALLOWED_ORIGINS}")
-    print(f"Django後端URL: {DJANGO_BASE_URL}")
-    print(f"前端URL: {FRONTEND_URL}")
+    log_event(logger, logging.INFO, "ML服務啟動", env='開發' if debug_mode else '生產', host=host, port=port,
+              allowed_origins=ALLOWED_ORIGINS, django_base_url=DJANGO_BASE_URL, frontend_url=FRONTEND_URL)
     
     # 啟動Flask應用
     app.run(debug=debug_mode, port=port, host=host)